@@ -6,6 +6,7 @@ Basado en agente-plastico, adaptado para predicción de demanda hospitalaria
 """
 import os
 import logging
+from datetime import date
 from flask import Flask, render_template, request, jsonify, session
 from flask_cors import CORS
 from database import get_connection
@@ -16,8 +17,15 @@ from db_utils import (
     get_all_hospitales_ranking,
     get_predicciones_producto_mes,
     get_predicciones_proximas,
-    get_resumen_producto
+    get_resumen_producto,
+    get_competencia_producto
 )
+from copilot_tools import build_tools, run_tool_chat
+from brands import OWN_MANUFACTURER
+from context_cache import cached_reader, context_cache
+from change_feed import change_feed, PREDICTION_RUN, MODEL_PUBLISHED, ORDERS_CHANGED
+from prediction_store import PREDICTIONS_SOURCE
+from model_service import ModelHolder, MicroBatcher
 import config
 import pandas as pd
 
@@ -50,32 +58,75 @@ if config.USE_VERTEX_AI:
     try:
         vertexai.init(project=config.GOOGLE_CLOUD_PROJECT, location=config.VERTEX_AI_LOCATION)
         model = GenerativeModel(config.GEMINI_MODEL)
+        tool_model = GenerativeModel(config.GEMINI_MODEL, tools=build_tools()) if config.COPILOT_MODE == 'tools' else None
         logger.info(f"Vertex AI inicializado: {config.GOOGLE_CLOUD_PROJECT} en {config.VERTEX_AI_LOCATION}")
     except Exception as e:
         logger.error(f"Error inicializando Vertex AI: {e}")
         model = None
+        tool_model = None
 else:
     try:
         genai.configure(api_key=config.GEMINI_API_KEY)
         model = genai.GenerativeModel(config.GEMINI_MODEL)
+        tool_model = genai.GenerativeModel(config.GEMINI_MODEL, tools=build_tools()) if config.COPILOT_MODE == 'tools' else None
         logger.info(f"Gemini API configurado con modelo: {config.GEMINI_MODEL}")
     except Exception as e:
         logger.error(f"Error configurando Gemini API: {e}")
         model = None
+        tool_model = None
 
-# Diccionario para almacenar sesiones de chat por usuario
+logger.info(f"Modo de contexto del co-piloto: {config.COPILOT_MODE}")
+
+# Modelo de demanda vigente del registro (se recarga en caliente, ver model_service.py)
+model_holder = ModelHolder()
+forecast_batcher = MicroBatcher(model_holder)
+
+# Lectores de contexto que dependen de ordenes_compra (no de predicciones_demanda)
+ORDER_READERS = {'competencia'}
+
+
+def _on_prediction_run(payload):
+    """Nuevas predicciones: invalidación por hospital/producto desde ejecuciones_prediccion"""
+    if payload.get('id') is None:
+        # Reemplazo completo sin ejecución registrada
+        context_cache.invalidate()
+    else:
+        context_cache.sync(force=True)
+
+
+def _on_orders_changed(payload):
+    """Órdenes cargadas: solo las entradas de competencia de los hospitales/productos recalculados"""
+    context_cache.invalidate(payload.get('hospitales'), payload.get('productos'), names=ORDER_READERS)
+
+
+# Canal de cambios de la BD (ver change_feed.py): cada worker invalida o recarga solo lo afectado
+change_feed.subscribe(PREDICTION_RUN, _on_prediction_run, catch_up=lambda: context_cache.sync(force=True))
+change_feed.subscribe(MODEL_PUBLISHED, lambda payload: model_holder.refresh_in_background(),
+                      catch_up=model_holder.refresh_in_background)
+change_feed.subscribe(ORDERS_CHANGED, _on_orders_changed,
+                      catch_up=lambda: context_cache.invalidate(names=ORDER_READERS))
+
+
+@app.before_request
+def _start_change_feed():
+    """Listener del canal en cada worker (perezoso: también tras el fork de Gunicorn)"""
+    change_feed.ensure_started()
+
+# Diccionarios para almacenar sesiones de chat por usuario (uno por modo)
 chat_sessions = {}
+tool_chat_sessions = {}
 
-def get_chat_session(user_id):
+def get_chat_session(user_id, use_tools=False):
     """Obtiene o crea una sesión de chat para un usuario"""
-    if user_id not in chat_sessions:
-        chat_sessions[user_id] = model.start_chat()
+    sessions, chat_model = (tool_chat_sessions, tool_model) if use_tools else (chat_sessions, model)
+    if user_id not in sessions:
+        sessions[user_id] = chat_model.start_chat()
         # Enviar system prompt como primer mensaje
         try:
-            chat_sessions[user_id].send_message(config.SYSTEM_PROMPT)
+            sessions[user_id].send_message(config.SYSTEM_PROMPT)
         except Exception as e:
             logger.error(f"Error enviando system prompt: {e}")
-    return chat_sessions[user_id]
+    return sessions[user_id]
 
 def get_context_for_query(query):
     """
@@ -88,6 +139,7 @@ def get_context_for_query(query):
         'predicciones_detalle': pd.DataFrame(),
         'ranking_hospitales': pd.DataFrame(),
         'resumen': {},
+        'competencia': pd.DataFrame(),
         'tipo_consulta': 'general'
     }
     
@@ -118,22 +170,42 @@ def get_context_for_query(query):
             hospital_detectado = "Hospital Barros Luco-Trudeau"
             context['tipo_consulta'] = 'hospital_especifico'
         
+        # Detectar si pregunta por COMPETENCIA (marcas/fabricantes en las órdenes de compra)
+        pregunta_competencia = any(word in query_lower for word in [
+            'competencia', 'competidor', 'marca', 'fabricante', 'participación', 'participacion',
+            'market share', 'share'
+        ])
+        
+        # CONSULTA 0: Participación por fabricante, una sola lectura sobre competencia_mensual
+        if pregunta_competencia:
+            context['competencia'] = cached_reader(
+                'competencia', get_competencia_producto,
+                producto=producto_detectado, hospital=hospital_detectado, meses=config.COMPETENCIA_MESES
+            )
+            logger.info(f"Contexto de competencia: {len(context['competencia'])} fabricantes")
+        
         # CONSULTA 1: Si pregunta por un producto específico
         if producto_detectado:
             # Obtener ranking completo de hospitales para ese producto
-            context['ranking_hospitales'] = get_all_hospitales_ranking(producto=producto_detectado)
+            context['ranking_hospitales'] = cached_reader(
+                'ranking_hospitales', get_all_hospitales_ranking, producto=producto_detectado
+            )
             
             # Obtener predicciones detalladas del próximo mes
-            context['predicciones_detalle'] = get_predicciones_proximas(dias=90, producto=producto_detectado)
+            context['predicciones_detalle'] = cached_reader(
+                'predicciones_proximas', get_predicciones_proximas, producto=producto_detectado, dias=90
+            )
             
             # Obtener resumen estadístico
-            context['resumen'] = get_resumen_producto(producto_detectado)
+            context['resumen'] = cached_reader('resumen_producto', get_resumen_producto, producto=producto_detectado)
             
             logger.info(f"Contexto para {producto_detectado}: {len(context['ranking_hospitales'])} hospitales, {len(context['predicciones_detalle'])} predicciones")
         
         # CONSULTA 2: Si pregunta por un hospital específico
         elif hospital_detectado:
-            context['predicciones_detalle'] = get_predicciones_hospital(hospital_detectado)
+            context['predicciones_detalle'] = cached_reader(
+                'predicciones_hospital', get_predicciones_hospital, hospital=hospital_detectado
+            )
             logger.info(f"Contexto para {hospital_detectado}: {len(context['predicciones_detalle'])} predicciones")
         
         # CONSULTA 3: Pregunta general (traer datos de TODOS los productos/hospitales)
@@ -141,10 +213,10 @@ def get_context_for_query(query):
             # Si menciona palabras como "qué", "cuál", "necesitar", traer ranking general
             if any(word in query_lower for word in ['qué', 'que', 'cuál', 'cual', 'necesitar', 'demandar', 'comprar']):
                 # Traer ranking de hospitales por demanda total
-                context['ranking_hospitales'] = get_all_hospitales_ranking()
+                context['ranking_hospitales'] = cached_reader('ranking_hospitales', get_all_hospitales_ranking)
                 
                 # Traer todas las predicciones próximas
-                context['predicciones_detalle'] = get_predicciones_proximas(dias=90)
+                context['predicciones_detalle'] = cached_reader('predicciones_proximas', get_predicciones_proximas, dias=90)
                 
                 logger.info(f"Contexto general: {len(context['ranking_hospitales'])} hospitales, {len(context['predicciones_detalle'])} predicciones")
         
@@ -187,14 +259,33 @@ def build_context_string(context):
             parts.append(f"\n  🏥 {hospital}:")
             for _, pred in hospital_preds.iterrows():
                 fecha = pred['fecha_prediccion'].strftime('%Y-%m') if hasattr(pred['fecha_prediccion'], 'strftime') else str(pred['fecha_prediccion'])
+                intervalo = ""
+                if pd.notna(pred.get('demanda_inferior')) and pd.notna(pred.get('demanda_superior')):
+                    intervalo = f", rango {int(pred['demanda_inferior'])}-{int(pred['demanda_superior'])}"
                 parts.append(
                     f"     • {pred['producto']}: {int(pred['demanda_estimada'])} unidades "
-                    f"({fecha})"
+                    f"({fecha}{intervalo})"
                 )
         
         parts.append("")
     
-    # 3. Resumen estadístico (si existe)
+    # 3. Participación de mercado por fabricante (si existe)
+    if isinstance(context.get('competencia'), pd.DataFrame) and not context['competencia'].empty:
+        parts.append(f"🥊 PARTICIPACIÓN DE MERCADO POR FABRICANTE (órdenes de compra, últimos {config.COMPETENCIA_MESES} meses):")
+        
+        for producto, filas in context['competencia'].groupby('producto', sort=False):
+            parts.append(f"\n  📦 {producto}:")
+            for _, row in filas.head(8).iterrows():
+                propio = " (propio)" if row['fabricante'] == OWN_MANUFACTURER else ""
+                parts.append(
+                    f"     • {row['fabricante']}{propio}: {row['participacion_cantidad']}% de las unidades, "
+                    f"{row['participacion_monto']}% del monto "
+                    f"({int(row['ordenes'])} órdenes; marcas: {row['marcas']})"
+                )
+        
+        parts.append("")
+    
+    # 4. Resumen estadístico (si existe)
     if context['resumen']:
         parts.append("📈 RESUMEN ESTADÍSTICO:")
         res = context['resumen']
@@ -206,7 +297,7 @@ def build_context_string(context):
             parts.append(f"  • Demanda promedio por hospital: {int(res['demanda_promedio'])} unidades")
         parts.append("")
     
-    # 4. Instrucción para el agente
+    # 5. Instrucción para el agente
     if parts:
         parts.append("⚠️ IMPORTANTE: Usa SOLO estos datos reales de la base de datos para responder.")
         parts.append("Menciona números específicos, hospitales y fechas exactas de las predicciones.\n")
@@ -236,26 +327,32 @@ def chat():
         
         logger.info(f"Query de usuario {user_id}: {user_query}")
         
-        # Obtener contexto relevante de la base de datos
-        context = get_context_for_query(user_query)
-        context_string = build_context_string(context)
-        
-        # Construir mensaje completo con contexto
-        full_message = f"{context_string}\n\nPREGUNTA DEL USUARIO:\n{user_query}" if context_string else user_query
-        
-        # Obtener o crear sesión de chat
-        chat_session = get_chat_session(user_id)
+        generation_config = {
+            'temperature': config.GEMINI_TEMPERATURE,
+            'max_output_tokens': config.GEMINI_MAX_TOKENS,
+        }
         
-        # Enviar mensaje al modelo
-        response = chat_session.send_message(
-            full_message,
-            generation_config={
-                'temperature': config.GEMINI_TEMPERATURE,
-                'max_output_tokens': config.GEMINI_MAX_TOKENS,
-            }
-        )
+        if config.COPILOT_MODE == 'tools' and tool_model is not None:
+            # Modo herramientas: Gemini solicita solo los datos que necesita
+            chat_session = get_chat_session(user_id, use_tools=True)
+            response_text, tool_log = run_tool_chat(chat_session, user_query, generation_config)
+            context_used = any(not call['error'] for call in tool_log)
+        else:
+            # Obtener contexto relevante de la base de datos
+            context = get_context_for_query(user_query)
+            context_string = build_context_string(context)
+            
+            # Construir mensaje completo con contexto
+            full_message = f"{context_string}\n\nPREGUNTA DEL USUARIO:\n{user_query}" if context_string else user_query
+            
+            # Obtener o crear sesión de chat
+            chat_session = get_chat_session(user_id)
+            
+            # Enviar mensaje al modelo
+            response = chat_session.send_message(full_message, generation_config=generation_config)
+            response_text = response.text
+            context_used = bool(context_string)
         
-        response_text = response.text
         logger.info(f"Respuesta generada para {user_id}: {response_text[:100]}...")
         
         # Registrar la consulta en la base de datos
@@ -266,7 +363,7 @@ def chat():
         
         return jsonify({
             'response': response_text,
-            'context_used': bool(context_string)
+            'context_used': context_used
         })
         
     except Exception as e:
@@ -295,6 +392,68 @@ def get_predictions():
         logger.error(f"Error obteniendo predicciones: {e}")
         return jsonify({'error': str(e)}), 500
 
+def _parse_forecast_items():
+    """
+    Lee las consultas de /api/forecast (query string o JSON)
+
+    Returns:
+        Lista de (hospital, producto, fecha ISO)
+
+    Raises:
+        ValueError: Si faltan campos, la fecha no es YYYY-MM-DD o hay demasiadas filas
+    """
+    if request.method == 'GET':
+        raw_items = [request.args]
+    else:
+        body = request.get_json(silent=True) or {}
+        raw_items = body.get('items', [body]) if isinstance(body, dict) else body
+        if not isinstance(raw_items, list):
+            raise ValueError("'items' debe ser una lista")
+
+    if len(raw_items) > config.FORECAST_MAX_ITEMS:
+        raise ValueError(f"Máximo {config.FORECAST_MAX_ITEMS} filas por consulta")
+
+    items = []
+    for item in raw_items:
+        if not isinstance(item, dict):
+            raise ValueError("Cada fila debe ser un objeto {hospital, producto, fecha}")
+        hospital, producto, fecha = item.get('hospital'), item.get('producto'), item.get('fecha')
+        if not hospital or not producto or not fecha:
+            raise ValueError("Debe especificar hospital, producto y fecha")
+        # Validación barata; la fecha se pasa como string para aprovechar la cache del predictor
+        date.fromisoformat(str(fecha))
+        items.append((hospital, producto, str(fecha)))
+    return items
+
+@app.route('/api/forecast', methods=['GET', 'POST'])
+def forecast():
+    """
+    Predicción en línea para cualquier hospital, producto y fecha
+
+    Usa el modelo vigente en memoria (no la tabla predicciones_demanda); las
+    consultas concurrentes se agrupan en una evaluación vectorizada.
+    """
+    try:
+        items = _parse_forecast_items()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        run_id, rows = forecast_batcher.forecast(items)
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error en forecast: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    predictions = [
+        {'hospital': hospital, 'producto': producto, 'fecha_prediccion': fecha, **row}
+        for (hospital, producto, fecha), row in zip(items, rows)
+    ]
+    if request.method == 'GET':
+        return jsonify({'run_id': run_id, **predictions[0]})
+    return jsonify({'run_id': run_id, 'predictions': predictions})
+
 @app.route('/api/hospitals', methods=['GET'])
 def get_hospitals():
     """Lista todos los hospitales en el sistema"""
@@ -302,11 +461,15 @@ def get_hospitals():
         conn = get_connection()
         cursor = conn.cursor()
         
-        cursor.execute("""
-            SELECT DISTINCT hospital, COUNT(*) as num_predicciones
-            FROM predicciones_demanda
-            GROUP BY hospital
-            ORDER BY num_predicciones DESC
+        cursor.execute(f"""
+            SELECT h.nombre, p.num_predicciones
+            FROM (
+                SELECT hospital_id, COUNT(*) as num_predicciones
+                FROM {PREDICTIONS_SOURCE}
+                GROUP BY hospital_id
+            ) p
+            JOIN hospitales h ON h.id = p.hospital_id
+            ORDER BY p.num_predicciones DESC
         """)
         
         hospitals = [{'nombre': row[0], 'predicciones': row[1]} for row in cursor.fetchall()]
@@ -361,11 +524,11 @@ def get_stats():
         stats = {}
         
         # Total de predicciones
-        cursor.execute("SELECT COUNT(*) FROM predicciones_demanda")
+        cursor.execute(f"SELECT COUNT(*) FROM {PREDICTIONS_SOURCE}")
         stats['total_predicciones'] = cursor.fetchone()[0]
         
         # Total de hospitales
-        cursor.execute("SELECT COUNT(DISTINCT hospital) FROM predicciones_demanda")
+        cursor.execute(f"SELECT COUNT(DISTINCT hospital_id) FROM {PREDICTIONS_SOURCE}")
         stats['total_hospitales'] = cursor.fetchone()[0]
         
         # Total de productos
@@ -400,7 +563,10 @@ def health():
             'status': 'healthy',
             'service': config.AGENT_NAME,
             'vertex_ai': True,
-            'database': True
+            'database': True,
+            'model': model_holder.status(),
+            'context_cache': context_cache.status(),
+            'change_feed': change_feed.status()
         })
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -412,6 +578,8 @@ def health():
 if __name__ == '__main__':
     logger.info(f"Iniciando {config.AGENT_NAME}")
     logger.info(f"Ambiente: {config.FLASK_ENV}")
+    model_holder.ensure_started()
+    change_feed.ensure_started()
     app.run(
         host=config.FLASK_HOST,
         port=config.FLASK_PORT,
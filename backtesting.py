@@ -0,0 +1,303 @@
+"""
+Backtesting con origen móvil (rolling origin)
+
+Cada fold entrena con los meses anteriores a un corte y evalúa los
+`horizon_months` meses siguientes, igual que en producción: nunca hay datos
+futuros en el entrenamiento. Los folds corren en paralelo entre procesos.
+
+- Las features se construyen una sola vez sobre los datos ordenados por fecha:
+  el entrenamiento de cada fold es un prefijo de filas y el test un rango, así
+  que los folds comparten la misma matriz (joblib la pasa por memmap).
+- Cada fold se guarda en cache bajo una huella de sus datos (filas con fecha
+  anterior al fin del fold) y del modelo: con un watermark nuevo solo se
+  recalculan los folds cuyos datos cambiaron (normalmente los más recientes).
+"""
+import hashlib
+import json
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+import logging
+
+from estimators import ESTIMATORS, get_estimator, parse_estimator_params
+from predictor import DemandPredictor, MODELS_DIR
+from series_predictor import SeriesDemandPredictor, DEFAULT_ALPHA
+
+logger = logging.getLogger(__name__)
+
+# Cache de resultados por fold
+BACKTEST_DIR = os.path.join(MODELS_DIR, 'backtests')
+
+# Cambia al modificar cómo se calculan los folds (invalida la cache)
+CACHE_VERSION = 1
+
+DATA_COLUMNS = ['fecha_orden', 'hospital', 'producto_estandarizado', 'cantidad']
+
+
+def rolling_origin_folds(fechas, n_folds=6, horizon_months=3, step_months=1, min_train_months=6):
+    """
+    Calcula los cortes de los folds
+
+    El último fold evalúa los últimos `horizon_months` meses con datos; cada
+    fold anterior retrocede `step_months`. Se descartan folds con menos de
+    `min_train_months` meses de entrenamiento.
+
+    Args:
+        fechas: Fechas de los datos
+        n_folds: Máximo de folds
+        horizon_months: Meses evaluados por fold
+        step_months: Separación entre cortes consecutivos
+        min_train_months: Historia mínima de entrenamiento
+
+    Returns:
+        Lista de (corte, fin) como pd.Timestamp: train = fecha < corte,
+        test = corte <= fecha < fin
+    """
+    fechas = pd.to_datetime(pd.Series(fechas))
+    primer_mes = fechas.min().to_period('M')
+    fin = (fechas.max().to_period('M') + 1)
+
+    folds = []
+    for k in range(n_folds):
+        corte = fin - horizon_months - k * step_months
+        if (corte - primer_mes).n < min_train_months:
+            break
+        folds.append((corte.to_timestamp(), (corte + horizon_months).to_timestamp()))
+    return folds[::-1]
+
+
+def _row_hashes(data):
+    """Hash uint64 por fila (independiente del índice)"""
+    return pd.util.hash_pandas_object(data[DATA_COLUMNS], index=False).to_numpy(dtype=np.uint64)
+
+
+def _fold_key(model_key, corte, fin, n_rows, digest):
+    payload = json.dumps([CACHE_VERSION, model_key, str(corte), str(fin), int(n_rows), int(digest)], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _fold_metrics(y_true, y_pred):
+    """MAE, RMSE, MAPE (solo filas con demanda > 0) y R²"""
+    err = y_pred - y_true
+    nonzero = y_true != 0
+    ss_tot = float(((y_true - y_true.mean()) ** 2).sum()) if len(y_true) else 0.0
+    return {
+        'mae': float(np.abs(err).mean()) if len(err) else float('nan'),
+        'rmse': float(np.sqrt((err ** 2).mean())) if len(err) else float('nan'),
+        'mape': float(100 * np.abs(err[nonzero] / y_true[nonzero]).mean()) if nonzero.any() else float('nan'),
+        'r2': 1 - float((err ** 2).sum()) / ss_tot if ss_tot > 0 else float('nan'),
+        'n_test': int(len(y_true))
+    }
+
+
+def _run_fold(model_type, model_params, features, y, series_ids, n_series, n_train, n_end):
+    """
+    Entrena con las filas [0, n_train) y predice [n_train, n_end)
+
+    Args:
+        model_type: 'global' o 'series'
+        model_params: Parámetros del modelo (ej. alpha, o estimator/estimator_params para 'global')
+        features: CSR (global) o matriz de diseño (series) de todas las filas
+        y: Target de todas las filas
+        series_ids: Serie de cada fila (solo 'series')
+        n_series: Total de series (solo 'series')
+
+    Returns:
+        Predicciones (no negativas) para las filas de test
+    """
+    if model_type == 'series':
+        predictor = SeriesDemandPredictor(n_jobs=1, **model_params)
+        coefs, _ = predictor._fit_series(features[:n_train], y[:n_train], series_ids[:n_train], n_series)
+        pred = np.einsum('ij,ij->i', features[n_train:n_end], coefs[series_ids[n_train:n_end]])
+    else:
+        backend = get_estimator(model_params.get('estimator', 'linear'), **model_params.get('estimator_params', {}))
+        if backend.sufficient_stats:
+            coef, intercept = backend.solve(DemandPredictor._compute_stats(features[:n_train], y[:n_train]))
+            pred = features[n_train:n_end] @ coef + intercept
+        else:
+            pred = backend.fit(features[:n_train], y[:n_train]).predict(features[n_train:n_end])
+    return np.maximum(0, pred)
+
+
+def run_backtest(historical_data, model_type='global', model_params=None, n_folds=6, horizon_months=3,
+                 step_months=1, min_train_months=6, n_jobs=-1, watermark=None,
+                 cache_dir=BACKTEST_DIR, use_cache=True):
+    """
+    Ejecuta el backtesting de origen móvil
+
+    Args:
+        historical_data: DataFrame [fecha_orden, hospital, producto_estandarizado, cantidad]
+        model_type: 'global' (DemandPredictor) o 'series' (SeriesDemandPredictor)
+        model_params: Parámetros extra del modelo (ej. {'alpha': 1.0} para 'series',
+            {'estimator': 'hgb', 'estimator_params': {...}} para 'global')
+        n_folds, horizon_months, step_months, min_train_months: ver rolling_origin_folds
+        n_jobs: Procesos para los folds (-1 = todos los cores)
+        watermark: Watermark de los datos (se registra en la cache y el resultado)
+        cache_dir: Directorio de la cache por fold
+        use_cache: Si es False recalcula todos los folds
+
+    Returns:
+        dict con 'global' (MAE, RMSE, MAPE, R²), 'folds' (métricas por fold),
+        'series' (DataFrame de métricas por hospital × producto),
+        'predictions' (DataFrame de predicciones de test), 'n_cached', 'n_computed'
+    """
+    model_params = dict(model_params or {})
+    if model_type == 'series':
+        model_params.setdefault('alpha', DEFAULT_ALPHA)
+    model_key = [model_type, sorted(model_params.items())]
+
+    folds = rolling_origin_folds(historical_data['fecha_orden'], n_folds, horizon_months,
+                                 step_months, min_train_months)
+    if not folds:
+        raise ValueError(f"Historia insuficiente para backtesting (mínimo {min_train_months} meses + horizonte).")
+
+    # Ordenar una vez por fecha: train de cada fold = prefijo, test = rango
+    fechas = pd.to_datetime(historical_data['fecha_orden']).to_numpy()
+    order = np.argsort(fechas, kind='stable')
+    fechas = fechas[order]
+    data = historical_data.iloc[order]
+    y = data['cantidad'].to_numpy(dtype=np.float64)
+    bounds = [(int(np.searchsorted(fechas, np.datetime64(corte))), int(np.searchsorted(fechas, np.datetime64(fin))))
+              for corte, fin in folds]
+
+    # Huella por fold: suma (mod 2^64) de hashes de las filas con fecha < fin
+    prefix = np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(_row_hashes(data), dtype=np.uint64)])
+    keys = [_fold_key(model_key, corte, fin, n_end, prefix[n_end])
+            for (corte, fin), (_, n_end) in zip(folds, bounds)]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    cached = {}
+    if use_cache:
+        for i, key in enumerate(keys):
+            path = os.path.join(cache_dir, f'{key}.joblib')
+            if os.path.exists(path):
+                cached[i] = joblib.load(path)
+
+    pending = [i for i in range(len(folds)) if i not in cached]
+    if pending:
+        # Features de todas las filas una sola vez (vocabulario completo: las
+        # categorías sin filas de entrenamiento quedan con coeficiente 0 / modelo agrupado)
+        series_ids, n_series = None, None
+        if model_type == 'series':
+            builder = SeriesDemandPredictor(**model_params)
+            series_ids, n_series = builder._index_series(data)
+            features = builder._series_design(data['fecha_orden'])
+        else:
+            features, _ = DemandPredictor()._prepare_features(data, fit_encoders=True)
+
+        logger.info(f"🔁 Backtesting: {len(pending)} folds a calcular, {len(cached)} en cache "
+                    f"(n_jobs={effective_n_jobs(n_jobs)})")
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_run_fold)(model_type, model_params, features, y, series_ids, n_series, *bounds[i])
+            for i in pending
+        )
+        for i, pred in zip(pending, results):
+            n_train, n_end = bounds[i]
+            test = data.iloc[n_train:n_end][DATA_COLUMNS].reset_index(drop=True)
+            test['prediccion'] = pred
+            cached[i] = {'predictions': test, 'n_train': n_train, 'watermark': watermark}
+            joblib.dump(cached[i], os.path.join(cache_dir, f'{keys[i]}.joblib'))
+
+    fold_rows = []
+    frames = []
+    for i, (corte, fin) in enumerate(folds):
+        test = cached[i]['predictions'].assign(corte=corte)
+        frames.append(test)
+        fold_rows.append({
+            'corte': corte, 'fin': fin, 'n_train': cached[i]['n_train'],
+            'cached': i not in pending,
+            **_fold_metrics(test['cantidad'].to_numpy(dtype=np.float64), test['prediccion'].to_numpy())
+        })
+
+    predictions = pd.concat(frames, ignore_index=True)
+    y_true = predictions['cantidad'].to_numpy(dtype=np.float64)
+    y_pred = predictions['prediccion'].to_numpy()
+
+    result = {
+        'model_type': model_type,
+        'watermark': watermark,
+        'global': _fold_metrics(y_true, y_pred),
+        'folds': fold_rows,
+        'series': series_metrics(predictions),
+        'predictions': predictions,
+        'n_cached': len(folds) - len(pending),
+        'n_computed': len(pending)
+    }
+
+    g = result['global']
+    logger.info(f"✅ Backtesting ({len(folds)} folds): MAE {g['mae']:.1f}, RMSE {g['rmse']:.1f}, "
+                f"MAPE {g['mape']:.1f}%, R² {g['r2']:.3f}")
+    return result
+
+
+def series_metrics(predictions):
+    """
+    Métricas por hospital × producto sobre todas las predicciones de test
+
+    Args:
+        predictions: DataFrame con [hospital, producto_estandarizado, cantidad, prediccion]
+
+    Returns:
+        DataFrame [hospital, producto_estandarizado, n, mae, rmse, mape]
+    """
+    y_true = predictions['cantidad'].to_numpy(dtype=np.float64)
+    err = predictions['prediccion'].to_numpy() - y_true
+    nonzero = y_true != 0
+    ape = np.full(len(err), np.nan)
+    ape[nonzero] = 100 * np.abs(err[nonzero] / y_true[nonzero])
+
+    grouped = pd.DataFrame({
+        'hospital': predictions['hospital'],
+        'producto_estandarizado': predictions['producto_estandarizado'],
+        'abs_err': np.abs(err),
+        'sq_err': err ** 2,
+        'ape': ape,
+    }).groupby(['hospital', 'producto_estandarizado'], observed=True, sort=False)
+
+    metrics = grouped.agg(n=('abs_err', 'size'), mae=('abs_err', 'mean'),
+                          mse=('sq_err', 'mean'), mape=('ape', 'mean')).reset_index()
+    metrics['rmse'] = np.sqrt(metrics.pop('mse'))
+    return metrics[['hospital', 'producto_estandarizado', 'n', 'mae', 'rmse', 'mape']]
+
+
+if __name__ == "__main__":
+    import argparse
+    from train_model import get_data_watermark, load_historical_data, load_snapshot_data
+
+    parser = argparse.ArgumentParser(description="Backtesting de origen móvil del modelo de demanda")
+    parser.add_argument('--model', choices=['global', 'series'], default='global')
+    parser.add_argument('--estimator', choices=list(ESTIMATORS), default='linear',
+                        help='Backend del modelo global (ver estimators.py)')
+    parser.add_argument('--estimator-param', action='append', metavar='CLAVE=VALOR',
+                        help='Parámetro del backend, repetible (ej. alpha=10, n_threads=8)')
+    parser.add_argument('--folds', type=int, default=6)
+    parser.add_argument('--horizon', type=int, default=3, help='Meses evaluados por fold')
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--snapshot', action='store_true', help='Sincroniza el snapshot local y lee desde él')
+    parser.add_argument('--snapshot-version', metavar='VERSION',
+                        help='Lee una versión registrada del snapshot, sin tocar la BD')
+    args = parser.parse_args()
+
+    model_params = None
+    if args.model == 'global':
+        model_params = {'estimator': args.estimator, 'estimator_params': parse_estimator_params(args.estimator_param)}
+
+    if args.snapshot or args.snapshot_version:
+        data, watermark, _ = load_snapshot_data(version=args.snapshot_version, sync=args.snapshot)
+    else:
+        watermark = get_data_watermark()
+        data = load_historical_data(until=watermark)
+    result = run_backtest(data, model_type=args.model,
+                          model_params=model_params, n_folds=args.folds, horizon_months=args.horizon, n_jobs=args.n_jobs,
+                          watermark=watermark, use_cache=not args.no_cache)
+
+    print(f"\n{'corte':<12} {'n_train':>9} {'n_test':>8} {'MAE':>9} {'RMSE':>9} {'MAPE %':>8} cache")
+    for fold in result['folds']:
+        print(f"{fold['corte']:%Y-%m-%d}   {fold['n_train']:>9} {fold['n_test']:>8} {fold['mae']:>9.1f} "
+              f"{fold['rmse']:>9.1f} {fold['mape']:>8.1f} {'✓' if fold['cached'] else ''}")
+    print("\nPeores series (MAE):")
+    print(result['series'].nlargest(10, 'mae').to_string(index=False))
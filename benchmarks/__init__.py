@@ -0,0 +1,6 @@
+"""
+Benchmarks de rendimiento del Agente Capstone
+
+Ejecutar desde la raíz del repositorio, por ejemplo:
+    python -m benchmarks.bench_copilot_context
+"""
@@ -0,0 +1,179 @@
+"""
+Benchmark: contexto por palabras clave vs recuperación por herramientas
+
+Compara, para un conjunto de preguntas, el camino actual
+(get_context_for_query + build_context_string) contra el modo 'tools'
+(copilot_tools.run_tool_chat) en:
+- Tokens de prompt enviados a Gemini
+- Latencia de extremo a extremo
+
+Sin --live solo se mide el lado del servidor (consultas a BD y tamaño del
+contexto, con tokens estimados como caracteres / 4). En el modo 'tools' la
+estimación ejecuta las llamadas típicas de cada pregunta (TYPICAL_TOOL_CALLS)
+y suma las dos rondas: pregunta + declaraciones, y de nuevo el historial con
+las llamadas y sus resultados acotados (_cap_result). Con --live se llama a
+Gemini y se usan los conteos reales de usage_metadata.
+
+Uso:
+    python -m benchmarks.bench_copilot_context [--live] [--repeat 3] [--json salida.json]
+"""
+import argparse
+import json
+import statistics
+import time
+
+import config
+from app import get_context_for_query, build_context_string, model, tool_model
+from copilot_tools import execute_tool, get_function_declarations, run_tool_chat
+
+QUERIES = list(config.QUICK_QUESTIONS) + [
+    "¿Cuál es la demanda estimada de guantes médicos?",
+    "¿Qué hospitales tienen mayor demanda de insumos?",
+    "¿Cuánto comprará el Hospital del Salvador el próximo mes?",
+]
+
+# Llamadas que el modelo hace típicamente para cada pregunta (estimación sin --live)
+TYPICAL_TOOL_CALLS = {
+    "¿Qué hospitales necesitarán apósitos este mes?": [
+        ('get_predicciones_proximas', {'dias': 30, 'producto': 'APOSITOS'})],
+    "Muestra tendencias de guantes médicos en hospitales grandes": [
+        ('get_ranking_hospitales', {'producto': 'GUANTES_MEDICOS'}),
+        ('get_resumen_producto', {'producto': 'GUANTES_MEDICOS'})],
+    "¿Dónde están las mejores oportunidades en la Región Metropolitana?": [
+        ('get_ranking_hospitales', {})],
+    "Identifica hospitales con compras recurrentes de productos Solventum": [
+        ('get_ranking_hospitales', {})],
+    "¿Qué productos de la competencia están ganando mercado?": [
+        ('get_competencia_producto', {})],
+    "Muestra predicciones para el próximo trimestre": [
+        ('get_predicciones_proximas', {'dias': 90})],
+    "¿Cuál es la demanda estimada de guantes médicos?": [
+        ('get_resumen_producto', {'producto': 'GUANTES_MEDICOS'})],
+    "¿Qué hospitales tienen mayor demanda de insumos?": [
+        ('get_ranking_hospitales', {})],
+    "¿Cuánto comprará el Hospital del Salvador el próximo mes?": [
+        ('get_predicciones_hospital', {'hospital': 'HOSPITAL DEL SALVADOR'})],
+}
+DEFAULT_TOOL_CALLS = [('get_predicciones_proximas', {})]
+
+GENERATION_CONFIG = {
+    'temperature': 0.0,
+    'max_output_tokens': config.GEMINI_MAX_TOKENS,
+}
+
+
+def estimate_tokens(text):
+    """Estimación gruesa de tokens (~4 caracteres por token)"""
+    return len(text) // 4
+
+
+def prompt_tokens(response):
+    """Tokens de prompt reportados por Gemini (None si el SDK no los expone)"""
+    usage = getattr(response, 'usage_metadata', None)
+    return getattr(usage, 'prompt_token_count', None) if usage else None
+
+
+def run_context_mode(query, live):
+    """Ejecuta el camino actual y retorna métricas"""
+    t0 = time.perf_counter()
+    context = get_context_for_query(query)
+    context_string = build_context_string(context)
+    full_message = f"{context_string}\n\nPREGUNTA DEL USUARIO:\n{query}" if context_string else query
+    t_context = time.perf_counter() - t0
+
+    result = {
+        'context_ms': t_context * 1000,
+        'prompt_chars': len(full_message),
+        'prompt_tokens': estimate_tokens(full_message),
+    }
+
+    if live:
+        response = model.start_chat().send_message(full_message, generation_config=GENERATION_CONFIG)
+        result['e2e_ms'] = (time.perf_counter() - t0) * 1000
+        result['prompt_tokens'] = prompt_tokens(response) or result['prompt_tokens']
+
+    return result
+
+
+def run_tools_mode(query, live):
+    """Ejecuta el modo herramientas y retorna métricas"""
+    declarations = json.dumps(get_function_declarations(), ensure_ascii=False)
+
+    # Segunda ronda: se reenvía el historial con las llamadas y sus resultados
+    t0 = time.perf_counter()
+    calls = TYPICAL_TOOL_CALLS.get(query, DEFAULT_TOOL_CALLS)
+    payloads = json.dumps([{'name': name, 'args': args, 'response': execute_tool(name, args)}
+                           for name, args in calls], ensure_ascii=False)
+    first_round = query + declarations
+    result = {
+        'context_ms': (time.perf_counter() - t0) * 1000,
+        'prompt_chars': 2 * len(first_round) + len(payloads),
+        'prompt_tokens': 2 * estimate_tokens(first_round) + estimate_tokens(payloads),
+    }
+
+    if live:
+        chat_session = tool_model.start_chat()
+
+        # Registrar cada ronda: el historial se reenvía en cada llamada a Gemini
+        responses = []
+        send_message = chat_session.send_message
+
+        def recording_send(*a, **kw):
+            response = send_message(*a, **kw)
+            responses.append(response)
+            return response
+
+        chat_session.send_message = recording_send
+
+        t0 = time.perf_counter()
+        _, tool_log = run_tool_chat(chat_session, query, GENERATION_CONFIG)
+        result['e2e_ms'] = (time.perf_counter() - t0) * 1000
+        result['tool_calls'] = len(tool_log)
+        total = sum(prompt_tokens(r) or 0 for r in responses)
+        result['prompt_tokens'] = total or result['prompt_tokens']
+
+    return result
+
+
+def summarize(rows, key):
+    values = [r[key] for r in rows if r.get(key) is not None]
+    if not values:
+        return '-'
+    return f"{statistics.median(values):8.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--live', action='store_true', help='Llamar a Gemini y medir latencia real')
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por pregunta')
+    parser.add_argument('--json', help='Guardar resultados detallados en este archivo')
+    args = parser.parse_args()
+
+    if args.live and (model is None or tool_model is None):
+        raise SystemExit("--live requiere Gemini configurado y COPILOT_MODE=tools")
+
+    results = {'context': [], 'tools': []}
+    for query in QUERIES:
+        for _ in range(args.repeat):
+            results['context'].append({'query': query, **run_context_mode(query, args.live)})
+            results['tools'].append({'query': query, **run_tools_mode(query, args.live)})
+
+    print("\n" + "=" * 80)
+    print("  BENCHMARK CONTEXTO DEL CO-PILOTO (medianas)")
+    print("=" * 80)
+    print(f"{'Modo':<10} {'contexto ms':>12} {'prompt tokens':>14} {'e2e ms':>10}")
+    for mode, rows in results.items():
+        print(f"{mode:<10} {summarize(rows, 'context_ms'):>12} "
+              f"{summarize(rows, 'prompt_tokens'):>14} {summarize(rows, 'e2e_ms'):>10}")
+    if not args.live:
+        print("\nℹ️  Sin --live los tokens del modo 'tools' se estiman con las llamadas de TYPICAL_TOOL_CALLS"
+              " (dos rondas, resultados acotados incluidos); el modelo puede hacer más rondas en la ejecución real.")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
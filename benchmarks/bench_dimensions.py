@@ -0,0 +1,240 @@
+"""
+Benchmark: predicciones con hospital/producto en texto vs ids de dimensiones
+
+Crea dos copias sintéticas de predicciones_demanda con los mismos datos:
+
+- texto: hospital VARCHAR(500) / producto VARCHAR(200) con los índices
+  anteriores (hospital), (producto), (hospital, producto), (fecha)
+- ids: hospital_id INTEGER / producto_id SMALLINT contra dimensiones, con los
+  índices de dimensions.py (hospital_id, fecha), (producto_id, hospital_id,
+  fecha), (fecha)
+
+y compara el tamaño de tabla e índices y el tiempo (mediana de --repeat
+corridas) de las consultas agregadas de db_utils / app.py: las de texto
+agrupan por nombre, las de ids agrupan por id y unen los nombres solo para
+las filas retornadas.
+
+Uso:
+    python -m benchmarks.bench_dimensions --setup [--rows 5000000] [--hospitals 3000] [--products 300]
+    python -m benchmarks.bench_dimensions [--repeat 5]
+"""
+import argparse
+import statistics
+import time
+
+from psycopg2 import sql
+
+from database import get_connection
+
+PREFIX = 'bench_dim'
+
+SETUP_QUERY = """
+DROP TABLE IF EXISTS {texto}, {ids}, {hospitales}, {productos};
+
+CREATE TABLE {texto} AS
+SELECT
+    g AS id,
+    'HOSPITAL CLINICO REGIONAL DR. GUILLERMO GRANT BENAVENTE SERVICIO DE SALUD '
+        || lpad((g %% %(hospitals)s)::text, 5, '0') AS hospital,
+    'PRODUCTO_ESTANDARIZADO_' || lpad(((g / %(hospitals)s) %% %(products)s)::text, 4, '0') AS producto,
+    (DATE '2025-01-01' + ((g / (%(hospitals)s * %(products)s)) %% 24) * INTERVAL '1 month')::date AS fecha_prediccion,
+    (random() * 1000)::int AS demanda_estimada,
+    (random() * 100)::numeric(5, 2) AS confidence_score
+FROM generate_series(0, %(rows)s - 1) AS g;
+
+CREATE TABLE {hospitales} (id SERIAL PRIMARY KEY, nombre VARCHAR(500) UNIQUE NOT NULL);
+CREATE TABLE {productos} (id SMALLSERIAL PRIMARY KEY, codigo VARCHAR(200) UNIQUE NOT NULL);
+INSERT INTO {hospitales} (nombre) SELECT DISTINCT hospital FROM {texto} ORDER BY 1;
+INSERT INTO {productos} (codigo) SELECT DISTINCT producto FROM {texto} ORDER BY 1;
+
+CREATE TABLE {ids} AS
+SELECT t.id, h.id AS hospital_id, p.id::smallint AS producto_id,
+       t.fecha_prediccion, t.demanda_estimada, t.confidence_score
+FROM {texto} t
+JOIN {hospitales} h ON h.nombre = t.hospital
+JOIN {productos} p ON p.codigo = t.producto;
+
+CREATE INDEX {texto_hospital} ON {texto}(hospital);
+CREATE INDEX {texto_producto} ON {texto}(producto);
+CREATE INDEX {texto_fecha} ON {texto}(fecha_prediccion);
+CREATE INDEX {texto_serie} ON {texto}(hospital, producto);
+CREATE INDEX {ids_hospital} ON {ids}(hospital_id, fecha_prediccion);
+CREATE INDEX {ids_serie} ON {ids}(producto_id, hospital_id, fecha_prediccion);
+CREATE INDEX {ids_fecha} ON {ids}(fecha_prediccion);
+ANALYZE {texto};
+ANALYZE {ids};
+ANALYZE {hospitales};
+ANALYZE {productos};
+"""
+
+# Consulta -> (texto, ids)
+QUERIES = {
+    'top_demanda_producto': ("""
+        SELECT hospital, producto, SUM(demanda_estimada) AS demanda_total
+        FROM {texto}
+        WHERE producto = %(producto)s
+        GROUP BY hospital, producto
+        ORDER BY demanda_total DESC
+        LIMIT 5
+    """, """
+        WITH top AS (
+            SELECT hospital_id, producto_id, SUM(demanda_estimada) AS demanda_total
+            FROM {ids}
+            WHERE producto_id = (SELECT id FROM {productos} WHERE codigo = %(producto)s)
+            GROUP BY hospital_id, producto_id
+            ORDER BY demanda_total DESC
+            LIMIT 5
+        )
+        SELECT h.nombre AS hospital, p.codigo AS producto, t.demanda_total
+        FROM top t
+        JOIN {hospitales} h ON h.id = t.hospital_id
+        JOIN {productos} p ON p.id = t.producto_id
+        ORDER BY t.demanda_total DESC
+    """),
+    'ranking_hospitales': ("""
+        SELECT hospital, SUM(demanda_estimada) AS demanda_total, COUNT(*) AS num_predicciones,
+               AVG(confidence_score) AS confidence_promedio
+        FROM {texto}
+        GROUP BY hospital
+        ORDER BY demanda_total DESC
+        LIMIT 20
+    """, """
+        WITH ranking AS (
+            SELECT hospital_id, SUM(demanda_estimada) AS demanda_total, COUNT(*) AS num_predicciones,
+                   AVG(confidence_score) AS confidence_promedio
+            FROM {ids}
+            GROUP BY hospital_id
+            ORDER BY demanda_total DESC
+            LIMIT 20
+        )
+        SELECT h.nombre AS hospital, r.demanda_total, r.num_predicciones, r.confidence_promedio
+        FROM ranking r
+        JOIN {hospitales} h ON h.id = r.hospital_id
+        ORDER BY r.demanda_total DESC
+    """),
+    'resumen_producto': ("""
+        SELECT COUNT(DISTINCT hospital), SUM(demanda_estimada), AVG(demanda_estimada),
+               MIN(fecha_prediccion), MAX(fecha_prediccion), AVG(confidence_score)
+        FROM {texto}
+        WHERE producto = %(producto)s
+    """, """
+        SELECT COUNT(DISTINCT hospital_id), SUM(demanda_estimada), AVG(demanda_estimada),
+               MIN(fecha_prediccion), MAX(fecha_prediccion), AVG(confidence_score)
+        FROM {ids}
+        WHERE producto_id = (SELECT id FROM {productos} WHERE codigo = %(producto)s)
+    """),
+    'hospitales_api': ("""
+        SELECT hospital, COUNT(*) AS num_predicciones
+        FROM {texto}
+        GROUP BY hospital
+        ORDER BY num_predicciones DESC
+    """, """
+        SELECT h.nombre, p.num_predicciones
+        FROM (SELECT hospital_id, COUNT(*) AS num_predicciones FROM {ids} GROUP BY hospital_id) p
+        JOIN {hospitales} h ON h.id = p.hospital_id
+        ORDER BY p.num_predicciones DESC
+    """),
+}
+
+SIZES_QUERY = """
+SELECT c.relname, pg_relation_size(c.oid), COALESCE(SUM(pg_relation_size(x.indexrelid)), 0)
+FROM pg_class c
+LEFT JOIN pg_index x ON x.indrelid = c.oid
+WHERE c.relname = ANY(%s)
+GROUP BY c.relname, c.oid
+"""
+
+
+def _identifiers():
+    names = {key: f'{PREFIX}_{key}' for key in ('texto', 'ids', 'hospitales', 'productos')}
+    names.update({f'{table}_{index}': f'{PREFIX}_{table}_{index}'
+                  for table, indexes in [('texto', ['hospital', 'producto', 'fecha', 'serie']),
+                                         ('ids', ['hospital', 'serie', 'fecha'])]
+                  for index in indexes})
+    return names
+
+
+def _format(query):
+    return sql.SQL(query).format(**{key: sql.Identifier(name) for key, name in _identifiers().items()})
+
+
+def setup_tables(rows, hospitals, products):
+    """Crea las tablas sintéticas (texto, ids y dimensiones)"""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            t0 = time.perf_counter()
+            cursor.execute(_format(SETUP_QUERY), {'rows': rows, 'hospitals': hospitals, 'products': products})
+        conn.commit()
+        print(f"✅ {rows:,} predicciones ({hospitals:,} hospitales × {products:,} productos) "
+              f"en {time.perf_counter() - t0:.1f}s")
+    finally:
+        conn.close()
+
+
+def run(repeat):
+    """
+    Tamaños y tiempos de las consultas en ambas versiones
+
+    Returns:
+        (dict tabla -> (MB tabla, MB índices), lista de (consulta, ms texto, ms ids))
+    """
+    names = _identifiers()
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SIZES_QUERY, (list(names.values()),))
+            sizes = {name: (table / 1e6, indexes / 1e6) for name, table, indexes in cursor.fetchall()}
+            cursor.execute(_format("SELECT producto FROM {texto} LIMIT 1"))
+            params = {'producto': cursor.fetchone()[0]}
+
+            timings = []
+            for name, variants in QUERIES.items():
+                medians = []
+                for query in variants:
+                    statement = _format(query)
+                    cursor.execute(statement, params)  # calentamiento
+                    cursor.fetchall()
+                    runs = []
+                    for _ in range(repeat):
+                        t0 = time.perf_counter()
+                        cursor.execute(statement, params)
+                        cursor.fetchall()
+                        runs.append((time.perf_counter() - t0) * 1000)
+                    medians.append(statistics.median(runs))
+                timings.append((name, *medians))
+    finally:
+        conn.close()
+    return sizes, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--setup', action='store_true', help='Crear las tablas sintéticas y salir')
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--hospitals', type=int, default=3000)
+    parser.add_argument('--products', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.setup:
+        setup_tables(args.rows, args.hospitals, args.products)
+        return
+
+    sizes, timings = run(args.repeat)
+    names = _identifiers()
+
+    print("\n" + "=" * 72)
+    print("  PREDICCIONES: HOSPITAL/PRODUCTO EN TEXTO vs IDS DE DIMENSIONES")
+    print("=" * 72)
+    print(f"{'Tabla':<12} {'tabla MB':>10} {'índices MB':>12}")
+    for key in ('texto', 'ids', 'hospitales', 'productos'):
+        table_mb, index_mb = sizes.get(names[key], (0.0, 0.0))
+        print(f"{key:<12} {table_mb:>10,.1f} {index_mb:>12,.1f}")
+    print(f"\n{'Consulta':<22} {'texto ms':>10} {'ids ms':>10} {'speedup':>8}")
+    for name, texto_ms, ids_ms in timings:
+        print(f"{name:<22} {texto_ms:>10,.1f} {ids_ms:>10,.1f} {texto_ms / ids_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark: estandarización semántica con cache de embeddings (semantic_standardizer.py)
+
+Genera descripciones estilo ChileCompra con una fracción configurable de
+textos distintos y mide, con el modelo MiniLM en CPU:
+
+- pasada en frío: cache vacío, se codifica cada texto distinto una vez
+- pasada en caliente: mismo lote, todo sale del cache memory-mapped
+- textos codificados por segundo según batch size y número de hilos
+
+El cache se crea en un directorio temporal (no toca EMBEDDING_CACHE_DIR).
+
+Uso:
+    python -m benchmarks.bench_embedding_cache [--rows 200000] [--unique 0.05]
+                                               [--batch-size 32 64 128] [--threads 1 4]
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from benchmarks.bench_standardizer import make_catalog, make_descriptions
+from semantic_standardizer import EmbeddingStandardizer, SentenceEncoder
+
+
+def run(catalog, descriptions, batch_size, threads):
+    """Tiempos en frío / en caliente con un cache nuevo"""
+    cache_dir = tempfile.mkdtemp(prefix='bench_embeddings_')
+    try:
+        standardizer = EmbeddingStandardizer(SentenceEncoder(batch_size=batch_size, threads=threads),
+                                             cache_dir=cache_dir).fit(catalog)
+        encoded_fit = standardizer.cache.misses
+
+        t0 = time.perf_counter()
+        standardizer.classify(descriptions)
+        cold_s = time.perf_counter() - t0
+        encoded = standardizer.cache.misses - encoded_fit
+
+        t0 = time.perf_counter()
+        standardizer.classify(descriptions)
+        warm_s = time.perf_counter() - t0
+        stats = standardizer.cache.stats()
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return {'cold_s': cold_s, 'warm_s': warm_s, 'encoded': encoded, 'mb': stats['mb']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--unique', type=float, default=0.05, help='Fracción de descripciones distintas')
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[32, 64, 128])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    catalog = make_catalog(categories=20, products=100)
+    descriptions = make_descriptions(catalog, args.rows, args.unique)
+
+    results = []
+    for threads in args.threads:
+        for batch_size in args.batch_size:
+            print(f"⏳ batch {batch_size}, {threads} hilos...")
+            results.append((batch_size, threads, run(catalog, descriptions, batch_size, threads)))
+
+    print("\n" + "=" * 88)
+    print(f"  EMBEDDINGS ({args.rows:,} filas, {args.unique:.0%} distintas)")
+    print("=" * 88)
+    print(f"{'Batch':>6} {'Hilos':>6} {'codificados':>12} {'textos/s':>10} {'frío s':>8} {'caliente s':>11} "
+          f"{'filas/s caliente':>17} {'cache MB':>9}")
+    for batch_size, threads, r in results:
+        print(f"{batch_size:>6} {threads:>6} {r['encoded']:>12,} {r['encoded'] / r['cold_s']:>10,.0f} "
+              f"{r['cold_s']:>8.1f} {r['warm_s']:>11.2f} {args.rows / r['warm_s']:>17,.0f} {r['mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark: backends de estimación de DemandPredictor (estimators.py)
+
+Para cada backend mide, sobre series sintéticas con tendencia y estacionalidad
+propias por hospital × producto:
+- fit: tiempo de train() (split temporal + modelo final)
+- predict: filas/s de predict_batch y celdas/s de forecast_cube (12 meses)
+- memoria: RSS peak del proceso
+- precisión: MAE / RMSE / R² del backtesting de origen móvil
+
+Cada backend corre en un subproceso nuevo para que el RSS peak no se contamine.
+
+Uso:
+    python -m benchmarks.bench_estimators [--hospitals 1000] [--products 200] [--months 36]
+                                          [--estimators linear ridge hgb] [--threads 4]
+                                          [--folds 3] [--n-jobs 1]
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from backtesting import run_backtest
+from benchmarks.bench_series import synthetic_series
+from estimators import ESTIMATORS
+from predictor import DemandPredictor
+
+PREDICT_ROWS = 1_000_000
+
+
+def run_estimator(estimator, args):
+    """Entrena, predice y hace backtesting con un backend (se ejecuta en el subproceso)"""
+    params = {'n_threads': args.threads} if estimator == 'hgb' else {}
+    df = synthetic_series(args.hospitals, args.products, args.months)
+
+    predictor = DemandPredictor(estimator=estimator, estimator_params=params)
+    t0 = time.perf_counter()
+    metrics = predictor.train(df)
+    fit_seconds = time.perf_counter() - t0
+
+    rows = df.sample(min(PREDICT_ROWS, len(df)), random_state=0)
+    frame = pd.DataFrame({
+        'hospital': rows['hospital'].astype(str).to_numpy(),
+        'producto_estandarizado': rows['producto_estandarizado'].astype(str).to_numpy(),
+        'fecha_prediccion': (rows['fecha_orden'] + pd.DateOffset(years=1)).to_numpy(),
+    })
+    t0 = time.perf_counter()
+    predictor.predict_batch(frame)
+    batch_rate = len(frame) / (time.perf_counter() - t0)
+
+    fechas = pd.date_range(df['fecha_orden'].max() + pd.DateOffset(months=1), periods=12, freq='MS')
+    t0 = time.perf_counter()
+    cube = predictor.forecast_cube(predictor.hospital_categories, predictor.producto_categories, fechas)
+    cube_rate = cube.size / (time.perf_counter() - t0)
+
+    backtest = run_backtest(
+        df, model_params={'estimator': estimator, 'estimator_params': params}, n_folds=args.folds,
+        n_jobs=args.n_jobs, cache_dir=tempfile.mkdtemp(prefix='bench_estimators_'), use_cache=False
+    )['global']
+
+    return {
+        'estimator': estimator,
+        'rows': len(df),
+        'fit_s': fit_seconds,
+        'test_mae': metrics['test_mae'],
+        'batch_rows_s': batch_rate,
+        'cube_cells_s': cube_rate,
+        # ru_maxrss está en KB en Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'bt_mae': backtest['mae'],
+        'bt_rmse': backtest['rmse'],
+        'bt_r2': backtest['r2'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hospitals', type=int, default=1000)
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--months', type=int, default=36)
+    parser.add_argument('--estimators', nargs='+', default=list(ESTIMATORS), choices=list(ESTIMATORS))
+    parser.add_argument('--threads', type=int, default=None, help='Hilos OpenMP de hgb (default: todos)')
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--n-jobs', type=int, default=1, help='Procesos del backtesting')
+    parser.add_argument('--child', choices=list(ESTIMATORS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_estimator(args.child, args)))
+        return
+
+    forwarded = ['--hospitals', str(args.hospitals), '--products', str(args.products),
+                 '--months', str(args.months), '--folds', str(args.folds), '--n-jobs', str(args.n_jobs)]
+    if args.threads:
+        forwarded += ['--threads', str(args.threads)]
+
+    results = []
+    for estimator in args.estimators:
+        print(f"⏳ Backend {estimator}...")
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_estimators', *forwarded, '--child', estimator],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print("\n" + "=" * 100)
+    print(f"  BACKENDS DE ESTIMACIÓN ({results[0]['rows']:,} filas)")
+    print("=" * 100)
+    print(f"{'Backend':<8} {'fit s':>8} {'batch filas/s':>14} {'cubo celdas/s':>14} {'RSS MB':>8} "
+          f"{'MAE test':>9} {'MAE bt':>8} {'RMSE bt':>8} {'R² bt':>7}")
+    for r in results:
+        print(f"{r['estimator']:<8} {r['fit_s']:>8.1f} {r['batch_rows_s']:>14,.0f} {r['cube_cells_s']:>14,.0f} "
+              f"{r['peak_rss_mb']:>8.0f} {r['test_mae']:>9.1f} {r['bt_mae']:>8.1f} {r['bt_rmse']:>8.1f} "
+              f"{r['bt_r2']:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark: pipeline de features dispersa vs one-hot densa
+
+Genera un dataset sintético (por defecto 10M filas, 3.000 organismos y 300
+productos) y mide tiempo y memoria peak (tracemalloc) de:
+- DemandPredictor._prepare_features (CSR, sin copiar ni mutar la entrada)
+- La implementación densa anterior (OneHotEncoder + np.column_stack), sobre una
+  muestra de --legacy-rows filas y extrapolada linealmente a N filas
+- Opcionalmente (--fit) el entrenamiento y predict_batch completos sobre CSR
+
+Uso:
+    python -m benchmarks.bench_features [--rows 10000000] [--hospitals 3000]
+                                        [--products 300] [--legacy-rows 100000] [--fit]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import OneHotEncoder
+
+from predictor import DemandPredictor
+
+
+def synthetic_orders(n_rows, n_hospitals, n_products, seed=42):
+    """Dataset sintético con strings categóricos y fechas como objetos date (igual que psycopg2)"""
+    rng = np.random.default_rng(seed)
+    hospitales = pd.Categorical.from_codes(
+        rng.integers(0, n_hospitals, n_rows), [f'Hospital {i:05d}' for i in range(n_hospitals)]
+    )
+    productos = pd.Categorical.from_codes(
+        rng.integers(0, n_products, n_rows), [f'PRODUCTO_{i:04d}' for i in range(n_products)]
+    )
+    fechas_unicas = pd.date_range('2020-01-01', '2025-12-31', freq='D')
+    fechas = np.asarray(fechas_unicas.date, dtype=object)[rng.integers(0, len(fechas_unicas), n_rows)]
+    return pd.DataFrame({
+        'fecha_orden': fechas,
+        'hospital': hospitales,
+        'producto_estandarizado': productos,
+        'cantidad': rng.integers(1, 1000, n_rows).astype(np.int32),
+    })
+
+
+def legacy_prepare_features(df, fecha_referencia):
+    """Implementación densa original (copiada para comparar)"""
+    df = df.copy()
+    df['dias_desde_inicio'] = (pd.to_datetime(df['fecha_orden']) - fecha_referencia).dt.days
+    df['mes'] = pd.to_datetime(df['fecha_orden']).dt.month
+    df['mes_sin'] = np.sin(2 * np.pi * df['mes'] / 12)
+    df['mes_cos'] = np.cos(2 * np.pi * df['mes'] / 12)
+    hospital_encoded = OneHotEncoder(sparse_output=False, handle_unknown='ignore').fit_transform(
+        df[['hospital']].astype(str))
+    producto_encoded = OneHotEncoder(sparse_output=False, handle_unknown='ignore').fit_transform(
+        df[['producto_estandarizado']].astype(str))
+    return np.column_stack([
+        df['dias_desde_inicio'].values, df['mes_sin'].values, df['mes_cos'].values,
+        hospital_encoded, producto_encoded
+    ])
+
+
+def measure(fn):
+    """Ejecuta fn midiendo tiempo y memoria peak asignada durante la llamada"""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--hospitals', type=int, default=3000)
+    parser.add_argument('--products', type=int, default=300)
+    parser.add_argument('--legacy-rows', type=int, default=100_000)
+    parser.add_argument('--fit', action='store_true', help='Medir también train() y predict_batch()')
+    args = parser.parse_args()
+
+    print(f"📦 Generando {args.rows:,} filas sintéticas...")
+    df = synthetic_orders(args.rows, args.hospitals, args.products)
+    n_cols = 3 + args.hospitals + args.products
+
+    predictor = DemandPredictor()
+    (X, _), t_new, peak_new = measure(lambda: predictor._prepare_features(df, fit_encoders=True))
+    x_bytes = X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+
+    # Segunda pasada: fechas ya en cache
+    _, t_cached, _ = measure(lambda: predictor._prepare_features(df, fit_encoders=False))
+
+    sample = df.head(args.legacy_rows)
+    _, t_legacy, peak_legacy = measure(
+        lambda: legacy_prepare_features(sample, predictor.fecha_referencia))
+    scale = args.rows / len(sample)
+
+    print("\n" + "=" * 80)
+    print(f"  FEATURES: {args.rows:,} filas × {n_cols:,} columnas")
+    print("=" * 80)
+    print(f"  CSR (nuevo):           {t_new:8.2f} s   peak {peak_new / 1e9:8.2f} GB   X {x_bytes / 1e9:.2f} GB")
+    print(f"  CSR (fechas en cache): {t_cached:8.2f} s")
+    print(f"  Densa (legacy, {len(sample):,} filas): {t_legacy:8.2f} s   peak {peak_legacy / 1e9:8.2f} GB")
+    print(f"  Densa extrapolada:     {t_legacy * scale:8.2f} s   peak {peak_legacy * scale / 1e9:8.2f} GB"
+          f"   X {args.rows * n_cols * 8 / 1e9:.1f} GB")
+
+    if args.fit:
+        _, t_fit, peak_fit = measure(lambda: predictor.train(df))
+        grid = pd.DataFrame({
+            'hospital': df['hospital'].head(1_000_000),
+            'producto_estandarizado': df['producto_estandarizado'].head(1_000_000),
+            'fecha_prediccion': pd.Timestamp('2026-03-01'),
+        })
+        _, t_pred, _ = measure(lambda: predictor.predict_batch(grid))
+        print(f"  train():               {t_fit:8.2f} s   peak {peak_fit / 1e9:8.2f} GB")
+        print(f"  predict_batch(1M):     {t_pred:8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
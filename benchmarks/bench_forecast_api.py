@@ -0,0 +1,122 @@
+"""
+Benchmark: predicción en línea (/api/forecast)
+
+Compara, con un modelo entrenado sobre series sintéticas:
+- dataframe: una fila por llamada vía DataFrame + _prepare_features (camino anterior de predict)
+- escalar: forecast_points con un punto (búsqueda de coeficientes por índice)
+- micro-batch: MicroBatcher con N hilos concurrentes (como workers gthread de Gunicorn);
+  cada hilo simula --io-us de E/S de red por request (sleep, libera el GIL)
+
+Uso:
+    python -m benchmarks.bench_forecast_api [--hospitals 3000] [--products 300] [--months 24]
+                                            [--model global|series] [--threads 1 8 32]
+                                            [--requests 20000] [--window-ms 2] [--io-us 200]
+"""
+import argparse
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_series import synthetic_series
+from model_registry import ModelRegistry
+from model_service import ModelHolder, MicroBatcher
+from predictor import DemandPredictor
+from series_predictor import SeriesDemandPredictor
+
+
+def random_queries(n, n_hospitals, n_products, seed=0):
+    """Consultas al azar, con fechas dentro de un horizonte de ~3 años"""
+    rng = np.random.default_rng(seed)
+    fechas = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 1095, n), unit='D')
+    return list(zip(
+        [f'Hospital {i:05d}' for i in rng.integers(0, n_hospitals, n)],
+        [f'PRODUCTO_{i:04d}' for i in rng.integers(0, n_products, n)],
+        [str(f.date()) for f in fechas],
+    ))
+
+
+def bench_dataframe(predictor, queries):
+    t0 = time.perf_counter()
+    for hospital, producto, fecha in queries:
+        predictor._predict_frame(pd.DataFrame({
+            'hospital': [hospital],
+            'producto_estandarizado': [producto],
+            'fecha_prediccion': [pd.to_datetime(fecha)]
+        }))
+    return time.perf_counter() - t0
+
+
+def bench_scalar(predictor, queries):
+    t0 = time.perf_counter()
+    for hospital, producto, fecha in queries:
+        predictor.forecast_points([hospital], [producto], [fecha])
+    return time.perf_counter() - t0
+
+
+def bench_batcher(batcher, queries, n_threads, io_seconds):
+    """Cada hilo envía su parte de las consultas una a una; retorna (segundos, latencias)"""
+    latencies = [[] for _ in range(n_threads)]
+
+    def worker(k):
+        for query in queries[k::n_threads]:
+            time.sleep(io_seconds)
+            t0 = time.perf_counter()
+            batcher.forecast([query])
+            latencies[k].append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(n_threads)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0, np.concatenate([np.asarray(l) for l in latencies])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hospitals', type=int, default=3000)
+    parser.add_argument('--products', type=int, default=300)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--model', choices=['global', 'series'], default='global')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--window-ms', type=float, default=2.0)
+    parser.add_argument('--io-us', type=float, default=200.0, help='E/S simulada por request (µs)')
+    args = parser.parse_args()
+
+    df = synthetic_series(args.hospitals, args.products, args.months)
+    predictor = SeriesDemandPredictor() if args.model == 'series' else DemandPredictor()
+    predictor.train(df)
+    print(f"📦 Modelo {type(predictor).__name__}: {args.hospitals:,} hospitales × {args.products:,} productos")
+
+    queries = random_queries(args.requests, args.hospitals, args.products)
+    n_legacy = min(len(queries), 2000)
+    rows = [
+        ('dataframe', bench_dataframe(predictor, queries[:n_legacy]) / n_legacy, None),
+        ('escalar', bench_scalar(predictor, queries) / len(queries), None),
+    ]
+
+    registry = ModelRegistry(root=tempfile.mkdtemp(prefix='bench_forecast_'), store=None)
+    registry.register(predictor)
+    for n_threads in args.threads:
+        batcher = MicroBatcher(ModelHolder(registry=registry, hot_reload=False), window_ms=args.window_ms)
+        seconds, latencies = bench_batcher(batcher, queries, n_threads, args.io_us / 1e6)
+        rows.append((f'micro-batch {n_threads} hilos', seconds / len(queries),
+                     (np.percentile(latencies, 99), batcher.status()['rows_per_batch'])))
+
+    print("\n" + "=" * 80)
+    print("  PREDICCIÓN EN LÍNEA")
+    print("=" * 80)
+    print(f"{'Camino':<24} {'µs/pred':>10} {'QPS':>10} {'p99 ms':>8} {'filas/lote':>11}")
+    for name, seconds, extra in rows:
+        p99, per_batch = extra if extra else (None, None)
+        print(f"{name:<24} {seconds * 1e6:>10.1f} {1 / seconds:>10,.0f} "
+              f"{'' if p99 is None else f'{p99 * 1000:.2f}':>8} {'' if per_batch is None else per_batch:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark: forecast_cube (broadcasting) vs predict_batch (filas + features)
+
+Entrena un DemandPredictor sobre datos sintéticos y genera la grilla completa
+hospital × producto × mes con ambos métodos, verificando que coincidan. También
+mide la grilla con intervalos de predicción y confianza por celda.
+
+Uso:
+    python -m benchmarks.bench_forecast_cube [--hospitals 3000] [--products 300] [--months 12]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_features import synthetic_orders
+from predictor import DemandPredictor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hospitals', type=int, default=3000)
+    parser.add_argument('--products', type=int, default=300)
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--train-rows', type=int, default=500_000)
+    args = parser.parse_args()
+
+    data = synthetic_orders(args.train_rows, args.hospitals, args.products)
+    predictor = DemandPredictor()
+    predictor.train(data)
+
+    hospitales = list(predictor.hospital_categories)
+    productos = list(predictor.producto_categories)
+    fechas = list(pd.date_range('2026-01-01', periods=args.months, freq='MS'))
+    n_cells = len(hospitales) * len(productos) * len(fechas)
+
+    t0 = time.perf_counter()
+    cube = predictor.forecast_cube(hospitales, productos, fechas)
+    t_cube = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    frame = predictor.forecast_cube(hospitales, productos, fechas, as_frame=True)
+    t_frame = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    frame_intervals = predictor.forecast_cube(hospitales, productos, fechas, as_frame=True, intervals=True)
+    t_intervals = time.perf_counter() - t0
+
+    # predict_batch: construir las filas como lo hacía generate_predictions
+    t0 = time.perf_counter()
+    grid = pd.DataFrame({
+        'hospital': np.repeat(np.asarray(hospitales, dtype=object), len(productos) * len(fechas)),
+        'producto_estandarizado': np.tile(np.repeat(np.asarray(productos, dtype=object), len(fechas)), len(hospitales)),
+        'fecha_prediccion': np.tile(pd.DatetimeIndex(fechas).to_numpy(), len(hospitales) * len(productos)),
+    })
+    batch = predictor.predict_batch(grid)
+    t_batch = time.perf_counter() - t0
+
+    max_diff = np.abs(frame['demanda_estimada'].to_numpy() - batch['demanda_estimada'].to_numpy()).max()
+
+    print("\n" + "=" * 80)
+    print(f"  GRILLA: {len(hospitales):,} hospitales × {len(productos):,} productos × {len(fechas)} meses"
+          f" = {n_cells:,} celdas")
+    print("=" * 80)
+    print(f"  predict_batch:              {t_batch:8.3f} s")
+    print(f"  forecast_cube (ndarray):    {t_cube:8.3f} s   ({t_batch / t_cube:,.0f}x)")
+    print(f"  forecast_cube (formato largo): {t_frame:5.3f} s   ({t_batch / t_frame:,.0f}x)")
+    print(f"  forecast_cube + intervalos:  {t_intervals:7.3f} s   ({t_batch / t_intervals:,.0f}x)")
+    print(f"  Diferencia máxima vs predict_batch: {max_diff} unidades")
+    print(f"  Confianza promedio por celda: {frame_intervals['confidence_score'].mean():.1f}%")
+    print(f"  Shape del cubo: {cube.shape}")
+
+
+if __name__ == "__main__":
+    main()
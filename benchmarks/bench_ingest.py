@@ -0,0 +1,152 @@
+"""
+Benchmark: ingesta masiva de órdenes de compra (ingest.py)
+
+Genera una exportación sintética con el formato de los datos abiertos de
+ChileCompra (CSV latin-1 separado por ';', opcionalmente dentro de un ZIP) con
+una fracción de filas inválidas y de orden_id repetidos, y mide filas/s y RSS
+peak de ingest_files para cada número de workers:
+
+- dry-run (default): lectura + parseo + validación + serialización para COPY
+- --db: además COPY a staging y upsert en una tabla de benchmark creada con
+  LIKE ordenes_compra (no toca ordenes_compra)
+
+Cada configuración corre en un subproceso nuevo para que el RSS peak no se contamine.
+
+Uso:
+    python -m benchmarks.bench_ingest [--rows 2000000] [--workers 1 2 4 8] [--zip]
+                                      [--invalid 0.01] [--duplicates 0.02] [--db]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from ingest import ingest_files
+
+BENCH_TABLE = 'ordenes_compra_ingest_bench'
+
+HEADER = ['Codigo', 'IDItem', 'FechaEnvio', 'OrganismoPublico', 'EspecificacionComprador',
+          'cantidad', 'UnidadMedida', 'totalLineaNeto']
+
+
+def write_export(path, rows, invalid, duplicates, seed=0):
+    """Escribe la exportación sintética por partes (sin armarla completa en memoria)"""
+    rng = np.random.default_rng(seed)
+    part = 500_000
+    with open(path, 'w', encoding='latin-1', newline='') as f:
+        f.write(';'.join(HEADER) + '\n')
+        for start in range(0, rows, part):
+            n = min(part, rows - start)
+            ids = np.arange(start, start + n)
+            # Duplicados: la fila repite el código de una anterior
+            dup = rng.random(n) < duplicates
+            ids[dup] = rng.integers(0, start + 1, dup.sum())
+            df = pd.DataFrame({
+                'Codigo': pd.Series(ids // 4).map('{:d}-SE24'.format),
+                'IDItem': ids % 4 + 1,
+                'FechaEnvio': (pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 2190, n), unit='D'))
+                              .strftime('%Y-%m-%d %H:%M:%S'),
+                'OrganismoPublico': pd.Series(rng.integers(0, 3000, n)).map('Hospital Público N° {:05d}'.format),
+                'EspecificacionComprador': pd.Series(rng.integers(0, 20000, n)).map('APÓSITO TRANSPARENTE {:d} 10X12CM'.format),
+                'cantidad': rng.integers(1, 1000, n).astype(str),
+                'UnidadMedida': 'Unidad',
+                'totalLineaNeto': pd.Series(rng.random(n) * 1e6).map('{:.2f}'.format).str.replace('.', ',', regex=False),
+            })
+            bad = rng.random(n) < invalid
+            df.loc[bad, 'cantidad'] = 'N/A'
+            df.to_csv(f, sep=';', header=False, index=False)
+
+
+def run_config(args):
+    """Ingesta con un número de workers (se ejecuta en el subproceso)"""
+    report = ingest_files([args.path], workers=args.child, dry_run=not args.db,
+                          table=BENCH_TABLE, chunk_mb=args.chunk_mb)
+    # ru_maxrss está en KB en Linux; incluye solo el proceso principal
+    report['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    report['children_peak_rss_mb'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return report
+
+
+def setup_table():
+    from database import get_connection
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    cursor.execute(f"CREATE TABLE {BENCH_TABLE} (LIKE ordenes_compra INCLUDING ALL)")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 4])
+    parser.add_argument('--invalid', type=float, default=0.01, help='Fracción de filas inválidas')
+    parser.add_argument('--duplicates', type=float, default=0.02, help='Fracción de orden_id repetidos')
+    parser.add_argument('--chunk-mb', type=float, default=None)
+    parser.add_argument('--zip', action='store_true', help='Comprimir la exportación en un ZIP')
+    parser.add_argument('--db', action='store_true', help=f'Cargar en {BENCH_TABLE} (COPY + upsert)')
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--generate', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_config(args), default=str))
+        return
+    if args.generate:
+        write_export(args.path, args.rows, args.invalid, args.duplicates)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='bench_ingest_')
+    path = os.path.join(workdir, 'ordenes.csv')
+    print(f"⏳ Generando {args.rows:,} filas...")
+    # En un subproceso: ru_maxrss del padre se hereda en los subprocesos de medición
+    subprocess.run([sys.executable, '-m', 'benchmarks.bench_ingest', '--generate', '--path', path,
+                    '--rows', str(args.rows), '--invalid', str(args.invalid), '--duplicates', str(args.duplicates)],
+                   check=True)
+    if args.zip:
+        with zipfile.ZipFile(path + '.zip', 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.write(path, 'ordenes.csv')
+        os.remove(path)
+        path += '.zip'
+    size_mb = os.path.getsize(path) / 1e6
+
+    results = []
+    for workers in sorted(set(args.workers)):
+        if args.db:
+            setup_table()
+        print(f"⏳ {workers} workers...")
+        forwarded = ['--path', path, '--child', str(workers)]
+        if args.db:
+            forwarded.append('--db')
+        if args.chunk_mb:
+            forwarded += ['--chunk-mb', str(args.chunk_mb)]
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_ingest', *forwarded],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results.append((workers, json.loads(output.strip().splitlines()[-1])))
+
+    print("\n" + "=" * 100)
+    print(f"  INGESTA ({args.rows:,} filas, {size_mb:,.0f} MB{' zip' if args.zip else ''}, "
+          f"{'COPY + upsert' if args.db else 'dry-run'})")
+    print("=" * 100)
+    print(f"{'Workers':>7} {'total s':>8} {'filas/s':>12} {'parseo filas/s':>15} {'upsert s':>9} "
+          f"{'rechaz.':>9} {'duplic.':>9} {'RSS MB':>7} {'RSS worker':>10}")
+    for workers, r in results:
+        print(f"{workers:>7} {r['total_s']:>8.1f} {r['rows_per_s']:>12,.0f} {r['parse_rows_per_s']:>15,.0f} "
+              f"{r.get('upsert_s', 0):>9.1f} {r['rejected']:>9,} {r['duplicates']:>9,} "
+              f"{r['peak_rss_mb']:>7.0f} {r['children_peak_rss_mb']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
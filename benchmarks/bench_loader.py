@@ -0,0 +1,155 @@
+"""
+Benchmark: carga de datos de entrenamiento (SELECT completo vs agregado en SQL vs snapshot)
+
+Compara tiempo de carga y memoria peak (RSS) del proceso para:
+- legacy: SELECT de todas las órdenes con pd.read_sql_query (camino anterior)
+- aggregated: data_loader.load_training_aggregates (SUM por serie × mes en
+  PostgreSQL, cursor del servidor, categóricos y enteros reducidos)
+- sync: sincronización del snapshot local (snapshot.py) desde la tabla; la
+  primera vez es completa, las siguientes solo leen filas modificadas
+- snapshot: snapshot.load_snapshot_aggregates (Arrow IPC memory-mapped, solo
+  las columnas del entrenamiento, sin tocar la BD)
+
+Cada modo corre en un subproceso nuevo para que el RSS peak no se contamine.
+Con --setup se crea y puebla una tabla sintética (por defecto 50M filas) con
+generate_series, sin pasar los datos por Python.
+
+Uso:
+    python -m benchmarks.bench_loader --setup [--rows 50000000] [--hospitals 3000] [--products 300]
+    python -m benchmarks.bench_loader [--table ordenes_compra_bench] [--modes legacy aggregated sync snapshot]
+                                      [--snapshot-dir /tmp/snapshot_bench]
+"""
+import argparse
+import json
+import resource
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from psycopg2 import sql
+
+from database import get_connection
+from data_loader import load_training_aggregates
+from snapshot import Snapshot, load_snapshot_aggregates
+
+MODES = ['legacy', 'aggregated', 'sync', 'snapshot']
+
+LEGACY_QUERY = """
+SELECT fecha_orden, nombre_organismo AS hospital, producto_estandarizado, cantidad
+FROM {table}
+WHERE fecha_orden IS NOT NULL
+  AND producto_estandarizado IS NOT NULL
+ORDER BY fecha_orden
+"""
+
+SETUP_QUERY = """
+DROP TABLE IF EXISTS {table};
+CREATE TABLE {table} AS
+SELECT
+    g AS id,
+    'OC-' || g AS orden_id,
+    DATE '2020-01-01' + (random() * 2190)::int AS fecha_orden,
+    'Hospital ' || lpad((random() * %(hospitals)s)::int::text, 5, '0') AS nombre_organismo,
+    NULL::text AS descripcion_item,
+    'PRODUCTO_' || lpad((random() * %(products)s)::int::text, 4, '0') AS producto_estandarizado,
+    1 + (random() * 999)::int AS cantidad,
+    'UNIDAD' AS unidad_medida,
+    (random() * 1000000)::numeric(15, 2) AS monto_total,
+    TIMESTAMP '2020-01-01' + g * INTERVAL '1 second' AS created_at,
+    TIMESTAMP '2020-01-01' + g * INTERVAL '1 second' AS updated_at
+FROM generate_series(1, %(rows)s) AS g;
+ANALYZE {table};
+"""
+
+
+def setup_table(table, rows, hospitals, products):
+    """Crea la tabla sintética del benchmark"""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            t0 = time.perf_counter()
+            cursor.execute(
+                sql.SQL(SETUP_QUERY).format(table=sql.Identifier(table)),
+                {'rows': rows, 'hospitals': hospitals - 1, 'products': products - 1}
+            )
+        conn.commit()
+        print(f"✅ {table}: {rows:,} filas creadas en {time.perf_counter() - t0:.1f}s")
+    finally:
+        conn.close()
+
+
+def run_mode(mode, table, snapshot_dir):
+    """Carga los datos con un modo y retorna métricas (se ejecuta en el subproceso)"""
+    t0 = time.perf_counter()
+    if mode == 'sync':
+        meta = Snapshot(root=snapshot_dir, table=table).sync()
+        df = pd.DataFrame(index=range(meta['changed_rows'] if meta else 0))
+    elif mode == 'snapshot':
+        df = load_snapshot_aggregates(snapshot=Snapshot(root=snapshot_dir, table=table))
+    elif mode == 'legacy':
+        conn = get_connection()
+        try:
+            query = sql.SQL(LEGACY_QUERY).format(table=sql.Identifier(table)).as_string(conn)
+            df = pd.read_sql_query(query, conn)
+        finally:
+            conn.close()
+    else:
+        df = load_training_aggregates(table=table)
+    elapsed = time.perf_counter() - t0
+
+    return {
+        'mode': mode,
+        'rows': len(df),
+        'seconds': elapsed,
+        'frame_mb': df.memory_usage(deep=True).sum() / 1e6,
+        # ru_maxrss está en KB en Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--table', default='ordenes_compra_bench')
+    parser.add_argument('--setup', action='store_true', help='Crear la tabla sintética y salir')
+    parser.add_argument('--rows', type=int, default=50_000_000)
+    parser.add_argument('--hospitals', type=int, default=3000)
+    parser.add_argument('--products', type=int, default=300)
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('--snapshot-dir', default=None, help='Directorio del snapshot (default: temporal por tabla)')
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    snapshot_dir = args.snapshot_dir or os.path.join(tempfile.gettempdir(), f'snapshot_{args.table}')
+
+    if args.setup:
+        setup_table(args.table, args.rows, args.hospitals, args.products)
+        return
+
+    if args.child:
+        print(json.dumps(run_mode(args.child, args.table, snapshot_dir)))
+        return
+
+    results = []
+    for mode in args.modes:
+        print(f"⏳ Modo {mode}...")
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_loader', '--table', args.table,
+             '--snapshot-dir', snapshot_dir, '--child', mode],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print("\n" + "=" * 80)
+    print(f"  CARGA DE DATOS DE ENTRENAMIENTO ({args.table})")
+    print("=" * 80)
+    print(f"{'Modo':<12} {'filas':>14} {'tiempo s':>10} {'DataFrame MB':>14} {'RSS peak MB':>12}")
+    for r in results:
+        print(f"{r['mode']:<12} {r['rows']:>14,} {r['seconds']:>10.1f} "
+              f"{r['frame_mb']:>14.1f} {r['peak_rss_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
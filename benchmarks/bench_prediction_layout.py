@@ -0,0 +1,249 @@
+"""
+Benchmark: predicciones en filas (predicciones_demanda) vs por serie (predicciones_series)
+
+Crea una tabla sintética con el formato de filas (nombres + ids, intervalo,
+confianza y created_at por fila, con los índices de dimensions.py) y su
+versión empaquetada (una fila por serie con el horizonte en arreglos) más una
+vista con las mismas columnas sobre desempacar_serie, y compara:
+
+- tamaño de tabla, índices y total
+- tiempo (mediana de --repeat corridas) de las consultas de db_utils sobre la
+  tabla de filas y sobre la vista: scan completo agregado por producto,
+  ranking de hospitales de un producto, próximos N meses y resumen de producto
+
+Requiere las funciones de prediction_store.py (python setup_database.py o
+db_utils.create_tables). Las tablas sintéticas usan sus propias dimensiones.
+
+Uso:
+    python -m benchmarks.bench_prediction_layout --setup [--hospitals 1000] [--products 200] [--months 12]
+    python -m benchmarks.bench_prediction_layout [--repeat 5]
+"""
+import argparse
+import statistics
+import time
+
+from psycopg2 import sql
+
+from database import get_connection
+
+PREFIX = 'bench_layout'
+
+SETUP_QUERY = """
+DROP VIEW IF EXISTS {vista};
+DROP TABLE IF EXISTS {filas}, {series}, {hospitales}, {productos};
+
+CREATE TABLE {hospitales} (id SERIAL PRIMARY KEY, nombre VARCHAR(500) UNIQUE NOT NULL);
+CREATE TABLE {productos} (id SMALLSERIAL PRIMARY KEY, codigo VARCHAR(200) UNIQUE NOT NULL);
+INSERT INTO {hospitales} (nombre)
+SELECT 'HOSPITAL CLINICO REGIONAL DR. GUILLERMO GRANT BENAVENTE SERVICIO DE SALUD ' || lpad(g::text, 5, '0')
+FROM generate_series(1, %(hospitals)s) AS g;
+INSERT INTO {productos} (codigo)
+SELECT 'PRODUCTO_ESTANDARIZADO_' || lpad(g::text, 4, '0') FROM generate_series(1, %(products)s) AS g;
+
+CREATE TABLE {filas} AS
+SELECT
+    row_number() OVER ()::integer AS id,
+    hospital, producto, hospital_id, producto_id, fecha_prediccion,
+    d AS demanda_estimada,
+    (d * 0.8)::int AS demanda_inferior,
+    (d * 1.2)::int AS demanda_superior,
+    confidence_score,
+    created_at
+FROM (
+    SELECT
+        h.nombre AS hospital,
+        p.codigo AS producto,
+        h.id AS hospital_id,
+        p.id AS producto_id,
+        (DATE '2025-01-01' + m * INTERVAL '1 month')::date AS fecha_prediccion,
+        (random() * 1000)::int AS d,
+        (50 + random() * 50)::numeric(5, 2) AS confidence_score,
+        TIMESTAMP '2025-01-01' AS created_at
+    FROM {hospitales} h
+    CROSS JOIN {productos} p
+    CROSS JOIN generate_series(0, %(months)s - 1) AS m
+) AS g;
+CREATE INDEX {filas_hospital} ON {filas}(hospital_id, fecha_prediccion);
+CREATE INDEX {filas_serie} ON {filas}(producto_id, hospital_id, fecha_prediccion);
+CREATE INDEX {filas_fecha} ON {filas}(fecha_prediccion);
+
+CREATE TABLE {series} (
+    producto_id SMALLINT NOT NULL,
+    hospital_id INTEGER NOT NULL,
+    ejecucion_id INTEGER,
+    fecha_inicio DATE NOT NULL,
+    demanda INTEGER[] NOT NULL,
+    demanda_inferior INTEGER[],
+    demanda_superior INTEGER[],
+    confianza SMALLINT[],
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (producto_id, hospital_id)
+);
+INSERT INTO {series} (producto_id, hospital_id, fecha_inicio, demanda, demanda_inferior, demanda_superior,
+                      confianza, created_at)
+SELECT producto_id, hospital_id, MIN(fecha_prediccion),
+       array_agg(demanda_estimada ORDER BY fecha_prediccion),
+       array_agg(demanda_inferior ORDER BY fecha_prediccion),
+       array_agg(demanda_superior ORDER BY fecha_prediccion),
+       array_agg(round(confidence_score * 100)::smallint ORDER BY fecha_prediccion),
+       MAX(created_at)
+FROM {filas}
+GROUP BY producto_id, hospital_id;
+CREATE INDEX {series_hospital} ON {series}(hospital_id);
+
+CREATE VIEW {vista} AS
+SELECT NULL::integer AS id, h.nombre AS hospital, p.codigo AS producto,
+       u.fecha_prediccion, u.demanda_estimada, u.demanda_inferior, u.demanda_superior, u.confidence_score,
+       s.created_at, s.hospital_id, s.producto_id, s.ejecucion_id
+FROM {series} s
+LEFT JOIN {hospitales} h ON h.id = s.hospital_id
+LEFT JOIN {productos} p ON p.id = s.producto_id
+CROSS JOIN LATERAL desempacar_serie(
+    s.fecha_inicio, s.demanda, s.demanda_inferior, s.demanda_superior, s.confianza
+) AS u;
+
+ANALYZE {hospitales};
+ANALYZE {productos};
+ANALYZE {filas};
+ANALYZE {series};
+"""
+
+# Consultas con la forma de db_utils; {fuente} es la tabla de filas o la vista
+QUERIES = {
+    'scan_por_producto': """
+        SELECT producto_id, SUM(demanda_estimada), AVG(confidence_score)
+        FROM {fuente}
+        GROUP BY producto_id
+    """,
+    'ranking_hospitales': """
+        WITH ranking AS (
+            SELECT hospital_id, SUM(demanda_estimada) AS demanda_total, COUNT(*) AS num_predicciones,
+                   AVG(confidence_score) AS confidence_promedio
+            FROM {fuente}
+            WHERE producto_id = (SELECT id FROM {productos} WHERE codigo = %(producto)s)
+            GROUP BY hospital_id
+            ORDER BY demanda_total DESC
+            LIMIT 20
+        )
+        SELECT h.nombre AS hospital, r.demanda_total, r.num_predicciones, r.confidence_promedio
+        FROM ranking r
+        JOIN {hospitales} h ON h.id = r.hospital_id
+        ORDER BY r.demanda_total DESC
+    """,
+    'proximos_meses': """
+        SELECT hospital, producto, fecha_prediccion, demanda_estimada, demanda_inferior, demanda_superior,
+               confidence_score
+        FROM {fuente}
+        WHERE fecha_prediccion <= DATE '2025-03-01'
+          AND producto_id = (SELECT id FROM {productos} WHERE codigo = %(producto)s)
+        ORDER BY fecha_prediccion, hospital
+    """,
+    'resumen_producto': """
+        SELECT COUNT(DISTINCT hospital_id), SUM(demanda_estimada), AVG(demanda_estimada),
+               MIN(fecha_prediccion), MAX(fecha_prediccion), AVG(confidence_score)
+        FROM {fuente}
+        WHERE producto_id = (SELECT id FROM {productos} WHERE codigo = %(producto)s)
+    """,
+}
+
+SIZES_QUERY = """
+SELECT relname, pg_relation_size(oid), pg_indexes_size(oid), pg_total_relation_size(oid), reltuples::bigint
+FROM pg_class
+WHERE relname = ANY(%s) AND relkind = 'r'
+"""
+
+
+def _identifiers():
+    return {key: f'{PREFIX}_{key}' for key in ('filas', 'series', 'vista', 'hospitales', 'productos',
+                                               'filas_hospital', 'filas_serie', 'filas_fecha',
+                                               'series_hospital')}
+
+
+def _format(query, **extra):
+    identifiers = {key: sql.Identifier(name) for key, name in _identifiers().items()}
+    identifiers.update({key: sql.Identifier(name) for key, name in extra.items()})
+    return sql.SQL(query).format(**identifiers)
+
+
+def setup_tables(hospitals, products, months):
+    """Crea las tablas sintéticas en ambos formatos"""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            t0 = time.perf_counter()
+            cursor.execute(_format(SETUP_QUERY),
+                           {'hospitals': hospitals, 'products': products, 'months': months})
+        conn.commit()
+        print(f"✅ {hospitals * products:,} series × {months} meses = {hospitals * products * months:,} filas "
+              f"en {time.perf_counter() - t0:.1f}s")
+    finally:
+        conn.close()
+
+
+def run(repeat):
+    """
+    Tamaños y tiempos de las consultas sobre la tabla de filas y la vista
+
+    Returns:
+        (dict tabla -> (MB tabla, MB índices, MB total, filas), lista de (consulta, ms filas, ms series))
+    """
+    names = _identifiers()
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SIZES_QUERY, ([names['filas'], names['series']],))
+            sizes = {name: (table / 1e6, indexes / 1e6, total / 1e6, rows)
+                     for name, table, indexes, total, rows in cursor.fetchall()}
+            cursor.execute(_format("SELECT codigo FROM {productos} ORDER BY id LIMIT 1"))
+            params = {'producto': cursor.fetchone()[0]}
+
+            timings = []
+            for name, query in QUERIES.items():
+                medians = []
+                for source in (names['filas'], names['vista']):
+                    statement = _format(query, fuente=source)
+                    cursor.execute(statement, params)  # calentamiento
+                    cursor.fetchall()
+                    runs = []
+                    for _ in range(repeat):
+                        t0 = time.perf_counter()
+                        cursor.execute(statement, params)
+                        cursor.fetchall()
+                        runs.append((time.perf_counter() - t0) * 1000)
+                    medians.append(statistics.median(runs))
+                timings.append((name, *medians))
+    finally:
+        conn.close()
+    return sizes, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--setup', action='store_true', help='Crear las tablas sintéticas y salir')
+    parser.add_argument('--hospitals', type=int, default=1000)
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--months', type=int, default=12, help='Horizonte en meses')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.setup:
+        setup_tables(args.hospitals, args.products, args.months)
+        return
+
+    sizes, timings = run(args.repeat)
+    names = _identifiers()
+
+    print("\n" + "=" * 80)
+    print("  PREDICCIONES: UNA FILA POR MES vs UNA FILA POR SERIE")
+    print("=" * 80)
+    print(f"{'Formato':<10} {'filas':>12} {'tabla MB':>10} {'índices MB':>12} {'total MB':>10}")
+    for label, key in (('filas', 'filas'), ('series', 'series')):
+        table_mb, index_mb, total_mb, rows = sizes.get(names[key], (0.0, 0.0, 0.0, 0))
+        print(f"{label:<10} {rows:>12,} {table_mb:>10,.1f} {index_mb:>12,.1f} {total_mb:>10,.1f}")
+    print(f"\n{'Consulta':<22} {'filas ms':>10} {'series ms':>10} {'speedup':>8}")
+    for name, rows_ms, series_ms in timings:
+        print(f"{name:<22} {rows_ms:>10,.1f} {series_ms:>10,.1f} {rows_ms / series_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: modelo por serie en paralelo (escalamiento por cores)
+
+Genera series mensuales sintéticas con tendencia y estacionalidad propias por
+hospital × producto y mide el tiempo de SeriesDemandPredictor.train() con
+distintos n_jobs, junto al error de test del modelo global como referencia.
+
+Uso:
+    python -m benchmarks.bench_series [--hospitals 3000] [--products 300] [--months 36]
+                                      [--jobs 1 4 16] [--chunk 2000]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from predictor import DemandPredictor
+from series_predictor import SeriesDemandPredictor
+
+
+def synthetic_series(n_hospitals, n_products, n_months, seed=42):
+    """Demanda mensual con nivel, tendencia y amplitud estacional distintos por serie"""
+    rng = np.random.default_rng(seed)
+    n_series = n_hospitals * n_products
+    meses = pd.date_range('2022-01-01', periods=n_months, freq='MS')
+
+    nivel = rng.gamma(2.0, 50.0, n_series)
+    tendencia = rng.normal(0, 0.15, n_series) * nivel
+    amplitud = rng.uniform(0, 0.4, n_series) * nivel
+    fase = rng.uniform(0, 2 * np.pi, n_series)
+
+    t = (meses - pd.Timestamp('2024-01-01')).days.to_numpy() / 365.25
+    angulo = 2 * np.pi * meses.month.to_numpy() / 12
+    demanda = (nivel[:, None] + tendencia[:, None] * t[None, :]
+               + amplitud[:, None] * np.sin(angulo[None, :] + fase[:, None]))
+    demanda += rng.normal(0, 0.1, demanda.shape) * nivel[:, None]
+
+    series = np.repeat(np.arange(n_series), n_months)
+    return pd.DataFrame({
+        'fecha_orden': np.tile(meses.to_numpy(), n_series),
+        'hospital': pd.Categorical.from_codes(
+            series // n_products, [f'Hospital {i:05d}' for i in range(n_hospitals)]),
+        'producto_estandarizado': pd.Categorical.from_codes(
+            series % n_products, [f'PRODUCTO_{i:04d}' for i in range(n_products)]),
+        'cantidad': np.maximum(0, demanda.ravel()).round().astype(np.int32),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hospitals', type=int, default=3000)
+    parser.add_argument('--products', type=int, default=300)
+    parser.add_argument('--months', type=int, default=36)
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--chunk', type=int, default=2000, help='Series por tarea del pool')
+    parser.add_argument('--skip-global', action='store_true', help='No entrenar el modelo global de referencia')
+    args = parser.parse_args()
+
+    df = synthetic_series(args.hospitals, args.products, args.months)
+    print(f"📦 {args.hospitals * args.products:,} series × {args.months} meses = {len(df):,} filas "
+          f"({os.cpu_count()} cores disponibles)")
+
+    rows = []
+    for n_jobs in args.jobs:
+        predictor = SeriesDemandPredictor(n_jobs=n_jobs, series_per_chunk=args.chunk)
+        t0 = time.perf_counter()
+        metrics = predictor.train(df)
+        rows.append((f'series n_jobs={n_jobs}', time.perf_counter() - t0, metrics['test_mae']))
+
+    if not args.skip_global:
+        t0 = time.perf_counter()
+        metrics = DemandPredictor().train(df)
+        rows.append(('global (1 core)', time.perf_counter() - t0, metrics['test_mae']))
+
+    base = rows[0][1]
+    print("\n" + "=" * 80)
+    print("  MODELO POR SERIE - ESCALAMIENTO")
+    print("=" * 80)
+    print(f"{'Modelo':<24} {'train() s':>10} {'speedup':>9} {'MAE test':>10}")
+    for name, seconds, mae in rows:
+        print(f"{name:<24} {seconds:>10.2f} {base / seconds:>8.1f}x {mae:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
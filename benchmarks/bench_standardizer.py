@@ -0,0 +1,104 @@
+"""
+Benchmark: estandarización de productos por reglas (standardizer.py)
+
+Genera un catálogo sintético (categorías con un sustantivo ancla y productos
+con palabras clave, algunas con tildes o de varias palabras) y descripciones
+estilo ChileCompra (mayúsculas/minúsculas, tildes, medidas '5 X 5,7 CMS',
+marcas y ruido), con una fracción configurable de descripciones distintas, y
+mide descripciones/minuto en un solo core:
+
+- normalización sola (normalize_descriptions sobre todas las filas)
+- classify completo (normalización + matcher + puntaje, deduplicando)
+
+Uso:
+    python -m benchmarks.bench_standardizer [--rows 2000000] [--unique 0.05 0.5 1.0]
+                                            [--categories 40] [--products 400] [--batch-size 50000]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from standardizer import ProductStandardizer, normalize_descriptions
+
+NOUNS = ['apósito', 'guante', 'jeringa', 'sonda', 'catéter', 'gasa', 'venda', 'mascarilla', 'bisturí', 'sutura',
+         'cánula', 'electrodo', 'tubo', 'bolsa', 'aguja', 'compresa', 'esponja', 'férula', 'cinta', 'parche']
+NOISE = ['3M', 'CAJA', 'X', '100', 'UNIDADES', 'TALLA', 'M', 'L', 'ADULTO', 'PEDIATRICO', 'ESTANDAR', 'DESECHABLE',
+         'REF', 'CODIGO', 'MARCA', 'GENERICO', 'PACK', 'ROLLO', 'HOSPITALARIO', 'USO', 'CLINICO']
+
+
+def make_catalog(categories, products, seed=0):
+    """Catálogo sintético: el ancla de cada producto es el sustantivo de su categoría"""
+    rng = np.random.default_rng(seed)
+    nouns = [NOUNS[i % len(NOUNS)] + ('' if i < len(NOUNS) else f'{i}') for i in range(categories)]
+    vocabulary = [f'atributo{i}' for i in range(products * 2)] + ['sin látex', 'alta absorción', 'estéril']
+    rows = []
+    for p in range(products):
+        c = p % categories
+        keywords = [nouns[c]] + list(rng.choice(vocabulary, size=rng.integers(2, 6), replace=False))
+        rows.append({'codigo_producto': f'P{p:05d}', 'categoria': f'CAT_{c:03d}', 'palabras_clave': keywords})
+    return pd.DataFrame(rows)
+
+
+def make_descriptions(catalog, rows, unique, seed=0):
+    """Descripciones con ~unique*rows textos distintos (70% mencionan un producto del catálogo)"""
+    rng = np.random.default_rng(seed)
+    n_unique = max(1, int(rows * unique))
+    product = rng.integers(0, len(catalog), n_unique)
+    known = rng.random(n_unique) < 0.7
+    keywords = catalog['palabras_clave'].to_numpy()
+    texts = []
+    for i in range(n_unique):
+        words = list(rng.choice(NOISE, size=rng.integers(2, 6)))
+        if known[i]:
+            kws = keywords[product[i]]
+            words += [kws[0]] + list(rng.choice(kws[1:], size=rng.integers(1, len(kws))))
+        words.append(f'{rng.integers(1, 30)} X {rng.integers(1, 30)},{rng.integers(0, 9)} CMS')
+        rng.shuffle(words)
+        text = ' '.join(words)
+        texts.append(text.upper() if rng.random() < 0.5 else text)
+    return pd.Series(np.asarray(texts, dtype=object)[rng.integers(0, n_unique, rows)], dtype=object)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--unique', type=float, nargs='+', default=[0.05, 0.5, 1.0],
+                        help='Fracción de descripciones distintas')
+    parser.add_argument('--categories', type=int, default=40)
+    parser.add_argument('--products', type=int, default=400)
+    parser.add_argument('--batch-size', type=int, default=None)
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.categories, args.products)
+    t0 = time.perf_counter()
+    standardizer = ProductStandardizer(catalog)
+    compile_s = time.perf_counter() - t0
+
+    results = []
+    for unique in args.unique:
+        print(f"⏳ {args.rows:,} descripciones, {unique:.0%} distintas...")
+        descriptions = make_descriptions(catalog, args.rows, unique)
+
+        t0 = time.perf_counter()
+        normalize_descriptions(descriptions)
+        normalize_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        result = standardizer.classify(descriptions, batch_size=args.batch_size)
+        classify_s = time.perf_counter() - t0
+        results.append((unique, normalize_s, classify_s, result['producto_estandarizado'].notna().mean()))
+
+    print("\n" + "=" * 80)
+    print(f"  ESTANDARIZACIÓN ({args.rows:,} filas, {len(catalog)} productos, "
+          f"{len(standardizer.keywords)} palabras clave, compilación {compile_s * 1000:.0f} ms)")
+    print("=" * 80)
+    print(f"{'Distintas':>9} {'normalizar s':>13} {'classify s':>11} {'desc/min':>14} {'clasificadas':>13}")
+    for unique, normalize_s, classify_s, coverage in results:
+        print(f"{unique:>9.0%} {normalize_s:>13.2f} {classify_s:>11.2f} "
+              f"{args.rows / classify_s * 60:>14,.0f} {coverage:>13.1%}")
+
+
+if __name__ == "__main__":
+    main()
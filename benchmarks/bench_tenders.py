@@ -0,0 +1,170 @@
+"""
+Benchmark: extracción de bases de licitación en PDF (tenders.py)
+
+Genera PDFs sintéticos estilo Mercado Público (portada con código y fecha
+de publicación, páginas de texto y tablas de ítems con bordes que cruzan
+páginas, descripciones de varias líneas y cantidades '1.200') y mide, sin
+tocar la BD (dry run):
+
+- páginas/s en frío según el número de workers y páginas por tarea
+- páginas/s en caliente: mismo directorio, todo sale del cache por página
+- memoria peak del proceso principal y de los workers
+
+Los PDFs y el cache se crean en un directorio temporal.
+
+Uso:
+    python -m benchmarks.bench_tenders [--documents 4] [--pages 300]
+                                       [--workers 1 4] [--pages-per-task 8]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_standardizer import NOUNS, NOISE
+from tenders import extract_tenders
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+COLUMNS = [('N°', 40), ('Descripción', 300), ('Cantidad', 80), ('Unidad', 90)]
+ROW_HEIGHT = 18
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)').encode('latin-1')
+
+
+def _text(x, y, text, size=9):
+    return b'BT /F1 %d Tf %d %d Td (%s) Tj ET\n' % (size, x, y, _escape(text))
+
+
+def _table(rows, top):
+    """Tabla con bordes (una línea por fila y por columna) para la estrategia 'lines' de pdfplumber"""
+    left = 40
+    right = left + sum(width for _, width in COLUMNS)
+    bottom = top - ROW_HEIGHT * len(rows)
+    ops = [b'0.5 w\n']
+    for i in range(len(rows) + 1):
+        y = top - ROW_HEIGHT * i
+        ops.append(b'%d %d m %d %d l S\n' % (left, y, right, y))
+    x = left
+    for _, width in COLUMNS + [('', 0)]:
+        ops.append(b'%d %d m %d %d l S\n' % (x, top, x, bottom))
+        x += width
+    for i, row in enumerate(rows):
+        x = left
+        for cell, (_, width) in zip(row, COLUMNS):
+            ops.append(_text(x + 3, top - ROW_HEIGHT * (i + 1) + 5, cell[:width // 5]))
+            x += width
+    return b''.join(ops)
+
+
+def _write_pdf(path, contents):
+    """PDF mínimo: una página por stream de contenido, fuente Helvetica WinAnsi"""
+    n = len(contents)
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % (4 + 2 * i) for i in range(n)), n),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+    ]
+    for i, content in enumerate(contents):
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> '
+                       b'/Contents %d 0 R >>' % (PAGE_WIDTH, PAGE_HEIGHT, 5 + 2 * i))
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content))
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4\n')
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+        xref = f.tell()
+        f.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b'%010d 00000 n \n' % offset)
+        f.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+
+
+def make_tender_pdf(path, pages, seed=0):
+    """
+    Bases sintéticas: portada, luego bloques de páginas de texto y de tablas de ítems
+
+    Returns:
+        Número de líneas de ítems escritas
+    """
+    rng = np.random.default_rng(seed)
+    code = f"{rng.integers(1000, 9999999)}-{rng.integers(1, 999)}-LP{rng.integers(20, 26)}"
+    contents = [_text(40, 780, f"BASES ADMINISTRATIVAS Y TECNICAS - LICITACION {code}", 12) +
+                _text(40, 760, f"Fecha de publicación: {rng.integers(1, 28):02d}-{rng.integers(1, 12):02d}-2025")]
+    item = 0
+    for page in range(1, pages):
+        if page % 5 == 0:
+            lines = [' '.join(rng.choice(NOISE, size=12)) for _ in range(40)]
+            contents.append(b''.join(_text(40, 780 - 18 * i, line) for i, line in enumerate(lines)))
+            continue
+        rows = [] if page % 5 != 1 else [[name for name, _ in COLUMNS]]
+        while len(rows) < 38:
+            item += 1
+            words = [rng.choice(NOUNS)] + list(rng.choice(NOISE, size=rng.integers(2, 6)))
+            quantity = int(rng.integers(1, 20000))
+            rows.append([str(item), ' '.join(words).upper(), f"{quantity:,}".replace(',', '.'),
+                         str(rng.choice(['UNIDAD', 'CAJA', 'PAR', 'ROLLO']))])
+            if rng.random() < 0.1:
+                rows.append(['', 'ESTERIL USO CLINICO', '', ''])
+        contents.append(_table(rows, 780))
+    _write_pdf(path, contents)
+    return item
+
+
+def run(directory, cache_dir, workers, pages_per_task):
+    """Pasada en frío (cache vacío) y en caliente"""
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    cold = extract_tenders([directory], workers=workers, pages_per_task=pages_per_task, cache_dir=cache_dir,
+                           dry_run=True)
+    warm = extract_tenders([directory], workers=workers, pages_per_task=pages_per_task, cache_dir=cache_dir,
+                           dry_run=True)
+    return cold, warm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=4)
+    parser.add_argument('--pages', type=int, default=300, help='Páginas por documento')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--pages-per-task', type=int, nargs='+', default=[8])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_tenders_')
+    try:
+        directory = os.path.join(workdir, 'pdf')
+        os.makedirs(directory)
+        items = sum(make_tender_pdf(os.path.join(directory, f'bases_{i:03d}.pdf'), args.pages, seed=i)
+                    for i in range(args.documents))
+        size_mb = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / 1e6
+
+        results = []
+        for workers in args.workers:
+            for pages_per_task in args.pages_per_task:
+                print(f"⏳ {workers} workers, {pages_per_task} páginas por tarea...")
+                t0 = time.perf_counter()
+                cold, warm = run(directory, os.path.join(workdir, 'cache'), workers, pages_per_task)
+                results.append((workers, pages_per_task, cold, warm))
+                print(f"   {time.perf_counter() - t0:.1f}s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("\n" + "=" * 96)
+    print(f"  BASES DE LICITACIÓN ({args.documents} documentos × {args.pages} páginas, {size_mb:.1f} MB, "
+          f"{items:,} ítems escritos)")
+    print("=" * 96)
+    print(f"{'Workers':>7} {'pág/tarea':>9} {'líneas':>8} {'frío s':>8} {'pág/s frío':>11} "
+          f"{'caliente s':>11} {'pág/s caliente':>15} {'MB principal':>13} {'MB worker':>10}")
+    for workers, pages_per_task, cold, warm in results:
+        print(f"{workers:>7} {pages_per_task:>9} {cold['items']:>8,} {cold['total_s']:>8.1f} "
+              f"{cold['pages_per_s']:>11,.1f} {warm['total_s']:>11.2f} {warm['pages_per_s']:>15,.0f} "
+              f"{cold['main_peak_mb']:>13,.0f} {cold['worker_peak_mb']:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Marcas y Competencia en Órdenes de Compra
+
+Detecta la marca (y su fabricante) mencionada en descripcion_item con un
+léxico compilado una vez: los alias se normalizan igual que las descripciones
+(standardizer.normalize_descriptions) y cada token distinto del lote se busca
+en un único lookup hash; los alias de varias palabras ('SMITH & NEPHEW',
+'STERI-STRIP') se unen en un token antes de separar. Si una descripción
+menciona varias marcas gana la primera.
+
+La marca se guarda una vez por descripción distinta (descripciones.marca,
+ver descriptions.py) y se agrega en competencia_mensual:
+
+    (producto, mes, hospital, marca) -> fabricante, órdenes, cantidad, monto
+
+La tabla se mantiene por cortes hospital × mes: ingest.py recalcula los cortes
+que tocó cada carga (valores nuevos y anteriores de las órdenes) y
+`python brands.py refresh` los de las órdenes modificadas desde el último
+refresco. La participación de mercado de un producto (get_competencia_producto
+en db_utils) es así una sola consulta sobre la llave primaria.
+"""
+import datetime
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from psycopg2.extras import execute_values
+
+import config
+from change_feed import ORDERS_CHANGED, publish
+from database import get_connection
+from standardizer import normalize_descriptions, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Marca de las órdenes sin marca detectada (cuentan en el total de participación)
+UNBRANDED = 'SIN MARCA'
+
+# Fabricante -> marcas -> alias (el nombre de la marca también es alias)
+BRAND_LEXICON = {
+    'SOLVENTUM': {
+        'TEGADERM': [], 'STERI-STRIP': ['STERISTRIP'], 'MICROPORE': [], 'TRANSPORE': [], 'DURAPORE': [],
+        'CAVILON': [], 'IOBAN': [], 'COBAN': [], 'MEDIPORE': [], '3M': ['SOLVENTUM'],
+    },
+    'SMITH & NEPHEW': {
+        'OPSITE': [], 'ALLEVYN': [], 'ACTICOAT': [], 'INTRASITE': [], 'IODOSORB': [],
+        'SMITH & NEPHEW': ['SMITH NEPHEW', 'SMITH AND NEPHEW'],
+    },
+    'CONVATEC': {'DUODERM': [], 'AQUACEL': [], 'VARIHESIVE': [], 'CONVATEC': []},
+    'MÖLNLYCKE': {
+        'MEPILEX': [], 'MEPITEL': [], 'MEPORE': [], 'MESORB': [], 'BIOGEL': [], 'MÖLNLYCKE': ['MOLNLYCKE'],
+    },
+    'ANSELL': {'GAMMEX': [], 'MICROFLEX': [], 'TOUCHNTUFF': ["TOUCH N TUFF"], 'ANSELL': []},
+    'KIMBERLY-CLARK': {'HALYARD': [], 'KIMTECH': [], 'KIMBERLY-CLARK': ['KIMBERLY CLARK']},
+    'TOP GLOVE': {'TOP GLOVE': ['TOPGLOVE']},
+    'ETHICON': {'VICRYL': [], 'PROLENE': [], 'MONOCRYL': [], 'ETHILON': [], 'ETHICON': []},
+    'COVIDIEN': {'POLYSORB': [], 'MONOSOF': [], 'COVIDIEN': [], 'MEDTRONIC': []},
+    'B. BRAUN': {'ASKINA': [], 'SAFIL': [], 'DAFILON': [], 'MONOSYN': [], 'B. BRAUN': ['BBRAUN']},
+    'HARTMANN': {'HYDROFILM': [], 'HYDROCOLL': [], 'PERMAFOAM': [], 'ZETUVIT': [], 'HARTMANN': []},
+    'COLOPLAST': {'BIATAIN': [], 'COMFEEL': [], 'COLOPLAST': []},
+}
+
+# Fabricante propio (el resto es competencia)
+OWN_MANUFACTURER = 'SOLVENTUM'
+
+CREATE_AFFECTED = """
+CREATE TEMP TABLE IF NOT EXISTS competencia_cortes (
+    hospital VARCHAR(500),
+    mes DATE,
+    PRIMARY KEY (hospital, mes)
+) ON COMMIT DROP
+"""
+
+# Agregado de los cortes hospital × mes en competencia_cortes (se borran y se recalculan)
+DELETE_SLICES = """
+DELETE FROM competencia_mensual c
+USING competencia_cortes a
+WHERE c.hospital = a.hospital AND c.mes = a.mes
+"""
+
+INSERT_SLICES = """
+INSERT INTO competencia_mensual (producto, mes, hospital, marca, fabricante, ordenes, cantidad, monto)
+SELECT o.producto_estandarizado,
+       a.mes,
+       a.hospital,
+       COALESCE(d.marca, %(sin_marca)s),
+       COALESCE(d.fabricante, %(sin_marca)s),
+       COUNT(*),
+       COALESCE(SUM(o.cantidad), 0),
+       COALESCE(SUM(o.monto_total), 0)
+FROM competencia_cortes a
+JOIN ordenes_compra o
+  ON o.nombre_organismo = a.hospital
+ AND o.fecha_orden >= a.mes
+ AND o.fecha_orden < a.mes + INTERVAL '1 month'
+LEFT JOIN descripciones d ON d.id = o.descripcion_id
+WHERE o.producto_estandarizado IS NOT NULL
+GROUP BY 1, 2, 3, 4, 5
+"""
+
+CHANGED_SLICES = """
+INSERT INTO competencia_cortes (hospital, mes)
+SELECT DISTINCT nombre_organismo, date_trunc('month', fecha_orden)::date
+FROM ordenes_compra
+WHERE COALESCE(updated_at, created_at) > %(since)s
+  AND COALESCE(updated_at, created_at) <= %(until)s
+  AND nombre_organismo IS NOT NULL
+  AND fecha_orden IS NOT NULL
+ON CONFLICT DO NOTHING
+"""
+
+ALL_SLICES = """
+INSERT INTO competencia_cortes (hospital, mes)
+SELECT DISTINCT nombre_organismo, date_trunc('month', fecha_orden)::date
+FROM ordenes_compra
+WHERE nombre_organismo IS NOT NULL
+  AND fecha_orden IS NOT NULL
+"""
+
+# Watermark de cambios de ordenes_compra: solo refresh() lo avanza (las cargas
+# de ingest.py recalculan sus cortes pero no cubren las órdenes modificadas por
+# otros procesos, ej. standardizer.py backfill o descriptions.py standardize)
+WATERMARK_QUERY = "SELECT MAX(COALESCE(updated_at, created_at)) FROM ordenes_compra"
+
+LAST_REFRESH_QUERY = """
+SELECT watermark
+FROM refrescos_competencia
+ORDER BY id DESC
+LIMIT 1
+"""
+
+INSERT_REFRESH_QUERY = """
+INSERT INTO refrescos_competencia (watermark, modo, cortes)
+VALUES (%s, %s, %s)
+"""
+
+# Hospitales y productos de los cortes recalculados (evento para los workers de la app)
+AFFECTED_SCOPE = """
+SELECT ARRAY(SELECT DISTINCT hospital FROM competencia_cortes),
+       ARRAY(SELECT DISTINCT m.producto
+             FROM competencia_mensual m
+             JOIN competencia_cortes c ON c.hospital = m.hospital AND c.mes = m.mes)
+"""
+
+PENDING_DESCRIPTIONS_QUERY = """
+SELECT id, texto_normalizado
+FROM descripciones
+WHERE id > %(last_id)s
+  {pending}
+ORDER BY id
+LIMIT %(limit)s
+"""
+
+UPDATE_BRANDS = """
+UPDATE descripciones AS d
+SET marca = v.marca, fabricante = v.fabricante, marca_detectada_en = CURRENT_TIMESTAMP
+FROM (VALUES %s) AS v(id, marca, fabricante)
+WHERE d.id = v.id
+"""
+
+
+class BrandExtractor:
+    """Detector de marcas por léxico (lookup hash de tokens distintos)"""
+
+    def __init__(self, lexicon=None):
+        """
+        Args:
+            lexicon: {fabricante: {marca: [alias, ...]}} (default: BRAND_LEXICON)
+        """
+        lexicon = BRAND_LEXICON if lexicon is None else lexicon
+        aliases, marcas, fabricantes = [], [], []
+        for fabricante, brands in lexicon.items():
+            for marca, extra in brands.items():
+                for alias in [marca] + list(extra):
+                    aliases.append(alias)
+                    marcas.append(marca)
+                    fabricantes.append(fabricante)
+
+        normalized = normalize_descriptions(aliases).to_pylist()
+        self.phrases = sorted({alias for alias in normalized if ' ' in alias}, key=len, reverse=True)
+        tokens = [alias.replace(' ', '_') for alias in normalized]
+        # Un alias repetido queda con la primera marca del léxico
+        first = pd.Series(range(len(tokens))).groupby(pd.Series(tokens)).min()
+        self._aliases = pa.array(first.index.tolist(), type=pa.string())
+        self._brand_of_alias = first.to_numpy()
+        self.marcas = np.asarray(marcas + [None], dtype=object)
+        self.fabricantes = np.asarray(fabricantes + [None], dtype=object)
+
+    def _extract_unique(self, texts):
+        """Índice de alias (en el orden del léxico) de la primera marca de cada texto, -1 sin marca"""
+        parents, vocabulary, indices = tokenize(normalize_descriptions(texts), self.phrases)
+        position = pc.fill_null(pc.index_in(vocabulary, value_set=self._aliases), -1).to_numpy()
+        brand = np.where(position >= 0, self._brand_of_alias[position], -1)[indices]
+        hit = np.flatnonzero(brand >= 0)
+        result = np.full(len(texts), -1, dtype=np.int64)
+        # parents viene ordenado: el primer índice de cada descripción es su primera marca
+        rows, first = np.unique(parents[hit], return_index=True)
+        result[rows] = brand[hit[first]]
+        return result
+
+    def extract(self, descriptions):
+        """
+        Marca y fabricante de cada descripción
+
+        Args:
+            descriptions: Series / lista de strings
+
+        Returns:
+            DataFrame [marca, fabricante] alineado con la entrada (None sin marca)
+        """
+        values = descriptions if isinstance(descriptions, pd.Series) else pd.Series(descriptions, dtype=object)
+        codes, uniques = pd.factorize(values)
+        brand = np.append(self._extract_unique(np.asarray(uniques, dtype=object)), -1)[codes]
+        return pd.DataFrame({
+            'marca': pd.Series(self.marcas[brand], index=values.index, dtype=object),
+            'fabricante': pd.Series(self.fabricantes[brand], index=values.index, dtype=object),
+        })
+
+
+def refresh_slices(cursor):
+    """Recalcula competencia_mensual para los cortes de competencia_cortes; retorna los cortes"""
+    cursor.execute("SELECT COUNT(*) FROM competencia_cortes")
+    slices = cursor.fetchone()[0]
+    if slices:
+        cursor.execute("ANALYZE competencia_cortes")
+        cursor.execute(DELETE_SLICES)
+        cursor.execute(INSERT_SLICES, {'sin_marca': UNBRANDED})
+    return slices
+
+
+def publish_slices(cursor, source, full=False):
+    """
+    Publica ORDERS_CHANGED con el alcance de los cortes recalculados (en la transacción de quien llama)
+
+    Args:
+        cursor: Cursor de la transacción que recalculó competencia_mensual
+        source: Proceso que escribió ('ingest', 'brands')
+        full: Se reconstruyó toda la tabla (alcance completo)
+    """
+    hospitales = productos = None
+    if not full:
+        cursor.execute(AFFECTED_SCOPE)
+        hospitales, productos = cursor.fetchone()
+        if not hospitales:
+            return
+    publish(cursor, ORDERS_CHANGED, source=source, hospitales=hospitales, productos=productos)
+
+
+def refresh(full=False):
+    """
+    Mantiene competencia_mensual
+
+    Args:
+        full: Reconstruir todos los cortes (default: solo los de órdenes modificadas
+            desde el último refresco)
+
+    Returns:
+        dict con cortes hospital × mes recalculados y segundos
+    """
+    t0 = time.perf_counter()
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(CREATE_AFFECTED)
+        # Antes de juntar los cortes: las órdenes escritas después quedan para el próximo refresco
+        cursor.execute(WATERMARK_QUERY)
+        watermark = cursor.fetchone()[0]
+        if full:
+            cursor.execute("TRUNCATE competencia_mensual")
+            cursor.execute(ALL_SLICES)
+        else:
+            cursor.execute(LAST_REFRESH_QUERY)
+            last = cursor.fetchone()
+            since = last[0] if last is not None and last[0] is not None else datetime.datetime.min
+            if watermark is not None:
+                cursor.execute(CHANGED_SLICES, {'since': since, 'until': watermark})
+        slices = refresh_slices(cursor)
+        cursor.execute(INSERT_REFRESH_QUERY, (watermark, 'full' if full else 'incremental', slices))
+        publish_slices(cursor, 'brands', full=full)
+        conn.commit()
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return {'slices': slices, 'seconds': time.perf_counter() - t0}
+
+
+def tag_descriptions(extractor=None, batch_size=None, reprocess=False):
+    """
+    Detecta la marca de cada descripción distinta una vez (descripciones.marca)
+
+    Args:
+        extractor: BrandExtractor (default: léxico BRAND_LEXICON)
+        batch_size: Descripciones por lote (default: STANDARDIZER_BATCH_SIZE)
+        reprocess: Volver a procesar también las ya etiquetadas (ej. tras cambiar el léxico)
+
+    Returns:
+        dict con descripciones procesadas y con marca
+    """
+    extractor = extractor or BrandExtractor()
+    batch_size = batch_size or config.STANDARDIZER_BATCH_SIZE
+    query = PENDING_DESCRIPTIONS_QUERY.format(pending='' if reprocess else 'AND marca_detectada_en IS NULL')
+    stats = {'descriptions': 0, 'branded': 0}
+    last_id = 0
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        while True:
+            cursor.execute(query, {'last_id': last_id, 'limit': batch_size})
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            ids, textos = zip(*rows)
+            last_id = ids[-1]
+            brands = extractor.extract(list(textos))
+            execute_values(cursor, UPDATE_BRANDS, list(zip(ids, brands['marca'], brands['fabricante'])),
+                           page_size=10000)
+            conn.commit()
+            stats['descriptions'] += len(rows)
+            stats['branded'] += int(brands['marca'].notna().sum())
+        cursor.close()
+    finally:
+        conn.close()
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Marcas en órdenes de compra y agregado de competencia")
+    parser.add_argument('command', choices=['extract', 'tag', 'refresh'])
+    parser.add_argument('texts', nargs='*', help='Descripciones (extract)')
+    parser.add_argument('--full', action='store_true', help='refresh: reconstruir competencia_mensual completa')
+    parser.add_argument('--reprocess', action='store_true', help='tag: volver a etiquetar todas las descripciones')
+    args = parser.parse_args()
+
+    if args.command == 'extract':
+        result = BrandExtractor().extract(args.texts)
+        result.insert(0, 'descripcion', args.texts)
+        print(result.to_string(index=False))
+    elif args.command == 'tag':
+        stats = tag_descriptions(reprocess=args.reprocess)
+        print(f"🏷️  {stats['descriptions']:,} descripciones, {stats['branded']:,} con marca")
+        # Las marcas nuevas cambian cortes de cualquier hospital y mes
+        stats = refresh(full=True)
+        print(f"✅ competencia_mensual reconstruida: {stats['slices']:,} cortes en {stats['seconds']:.1f}s")
+    else:
+        stats = refresh(full=args.full)
+        print(f"✅ {stats['slices']:,} cortes hospital × mes recalculados en {stats['seconds']:.1f}s")
@@ -0,0 +1,325 @@
+"""
+Canal de Cambios de la BD (LISTEN/NOTIFY) para los Workers de la App
+
+Los procesos que escriben en PostgreSQL publican un evento con NOTIFY en
+CHANGE_FEED_CHANNEL dentro de su propia transacción, así el evento solo se
+entrega si el commit se hizo:
+
+- prediction_run: train_model reemplazó predicciones (id de ejecuciones_prediccion)
+- model_published: train_model registró un modelo nuevo (run_id)
+- orders_changed: ingest.py / brands.py recalcularon cortes de competencia_mensual
+  (hospitales y productos afectados)
+
+Cada worker de la app tiene un hilo que escucha el canal con una conexión
+propia y llama a los handlers suscritos para invalidar o recargar solo el
+estado afectado (cache de contexto, modelo en memoria).
+
+Fallback por polling: mientras el canal está conectado, los pollers
+existentes (ContextCache.sync, ModelHolder) revisan solo cada
+CHANGE_FEED_FALLBACK_SECONDS; si la conexión se cae vuelven a su intervalo
+normal, y al reconectar se ejecuta el catch-up de cada suscripción porque los
+eventos emitidos sin nadie escuchando se pierden.
+
+El lag de propagación (envío del evento -> estado actualizado en el worker) se
+mide por tipo de evento con el reloj del publicador y del worker (asume
+relojes sincronizados por NTP) y se reporta en /health.
+"""
+import json
+import os
+import select
+import threading
+import time
+from collections import deque
+
+import logging
+
+import psycopg2.extensions
+from psycopg2 import sql
+
+import config
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+PREDICTION_RUN = 'prediction_run'
+MODEL_PUBLISHED = 'model_published'
+ORDERS_CHANGED = 'orders_changed'
+
+# NOTIFY acepta payloads de menos de 8000 bytes
+MAX_PAYLOAD_BYTES = 7900
+
+# Lags recientes por evento para percentiles
+LAG_WINDOW = 256
+
+
+def _encode(event, payload):
+    """JSON del evento; si no cabe, las listas se reemplazan por None (= alcance completo)"""
+    message = {'event': event, 'sent_at': time.time(), 'pid': os.getpid(), **payload}
+    body = json.dumps(message, default=str)
+    if len(body.encode('utf-8')) > MAX_PAYLOAD_BYTES:
+        message.update({key: None for key, value in payload.items() if isinstance(value, (list, tuple))})
+        body = json.dumps(message, default=str)
+    return body
+
+
+def publish(cursor, event, **payload):
+    """
+    Publica un evento dentro de la transacción de quien escribe
+
+    Se entrega a los listeners al hacer commit (y no se entrega si hay rollback).
+
+    Args:
+        cursor: Cursor psycopg2 de la transacción
+        event: PREDICTION_RUN, MODEL_PUBLISHED u ORDERS_CHANGED
+        **payload: Datos del evento serializables a JSON (listas de hospitales /
+            productos se reducen a None si el mensaje excede el límite de NOTIFY)
+    """
+    if not config.CHANGE_FEED_ENABLED:
+        return
+    cursor.execute("SELECT pg_notify(%s, %s)", (config.CHANGE_FEED_CHANNEL, _encode(event, payload)))
+
+
+def publish_now(event, **payload):
+    """
+    Publica un evento en una conexión propia (para escrituras fuera de la BD, ej. el registro de modelos)
+
+    Un error solo se registra: los workers lo recogen con el polling de fallback.
+    """
+    if not config.CHANGE_FEED_ENABLED:
+        return
+    try:
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            publish(cursor, event, **payload)
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning(f"⚠️  No se pudo publicar {event} en el canal de cambios: {e}")
+
+
+class _LagStats:
+    """Eventos recibidos y lag de propagación (ms) de un tipo de evento"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.last_ms = None
+        self.max_ms = 0.0
+        self.recent = deque(maxlen=LAG_WINDOW)
+
+    def add(self, lag_ms):
+        self.count += 1
+        self.last_ms = lag_ms
+        self.max_ms = max(self.max_ms, lag_ms)
+        self.recent.append(lag_ms)
+
+    def summary(self):
+        recent = sorted(self.recent)
+        pick = lambda q: round(recent[min(len(recent) - 1, int(q * len(recent)))], 1) if recent else None
+        return {
+            'events': self.count,
+            'handler_errors': self.errors,
+            'last_lag_ms': round(self.last_ms, 1) if self.last_ms is not None else None,
+            'p50_lag_ms': pick(0.5),
+            'p95_lag_ms': pick(0.95),
+            'max_lag_ms': round(self.max_ms, 1),
+        }
+
+
+class ChangeFeed:
+    """Listener del canal de cambios: un hilo daemon por proceso"""
+
+    def __init__(self, channel=None, enabled=None, keepalive_seconds=None, reconnect_max_seconds=None):
+        """
+        Args:
+            channel: Canal de NOTIFY (default: CHANGE_FEED_CHANNEL)
+            enabled: Iniciar el listener (default: CHANGE_FEED_ENABLED)
+            keepalive_seconds: Sin eventos, cada cuánto se verifica la conexión (default: CHANGE_FEED_KEEPALIVE_SECONDS)
+            reconnect_max_seconds: Espera máxima entre reintentos de conexión (default: CHANGE_FEED_RECONNECT_MAX_SECONDS)
+        """
+        self.channel = channel or config.CHANGE_FEED_CHANNEL
+        self.enabled = config.CHANGE_FEED_ENABLED if enabled is None else enabled
+        self.keepalive_seconds = (config.CHANGE_FEED_KEEPALIVE_SECONDS if keepalive_seconds is None
+                                  else keepalive_seconds)
+        self.reconnect_max_seconds = (config.CHANGE_FEED_RECONNECT_MAX_SECONDS if reconnect_max_seconds is None
+                                      else reconnect_max_seconds)
+
+        self._subscriptions = {}  # evento -> [(handler, catch_up)]
+        self._stats = {}
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.connected = False
+        self.reconnects = 0
+        self.catch_ups = 0
+        self.last_event_at = None
+        self.last_error = None
+
+    def subscribe(self, event, handler, catch_up=None):
+        """
+        Registra un handler para un tipo de evento
+
+        Args:
+            event: Tipo de evento
+            handler: Función(payload dict); corre en el hilo del listener, debe ser rápida
+            catch_up: Función sin argumentos que re-sincroniza el estado sin evento
+                (se llama al reconectar, cuando pudieron perderse eventos)
+        """
+        self._subscriptions.setdefault(event, []).append((handler, catch_up))
+        self._stats.setdefault(event, _LagStats())
+
+    def ensure_started(self):
+        """Inicia el hilo del listener en este proceso (idempotente y seguro tras un fork)"""
+        if self._pid == os.getpid() or not self.enabled:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.connected = False
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+            self._thread.start()
+            logger.info(f"📡 Canal de cambios '{self.channel}' (pid {self._pid})")
+
+    def stop(self):
+        """Detiene el listener"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def is_live(self):
+        """True si el listener de este proceso está conectado (los pollers pueden espaciar sus revisiones)"""
+        return self.connected and self._pid == os.getpid()
+
+    def _run(self):
+        """Ciclo del listener: conecta, escucha y reintenta con backoff exponencial"""
+        backoff = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = get_connection()
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cursor = conn.cursor()
+                cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                self.connected = True
+                self.last_error = None
+                backoff = 1.0
+                # Eventos emitidos sin nadie escuchando (arranque o caída) se perdieron
+                self._catch_up()
+                self._listen(conn, cursor)
+            except Exception as e:
+                # Se registra al caer la conexión o al primer intento, no en cada reintento
+                if self.connected or self.last_error is None:
+                    logger.warning(f"⚠️  Canal de cambios no disponible ({e}); polling de fallback activo")
+                self.last_error = str(e)
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            if self._stop.wait(backoff):
+                return
+            self.reconnects += 1
+            backoff = min(backoff * 2, self.reconnect_max_seconds)
+
+    def _listen(self, conn, cursor):
+        while not self._stop.is_set():
+            if select.select([conn], [], [], self.keepalive_seconds) == ([], [], []):
+                # Sin eventos: una consulta trivial detecta una conexión muerta
+                cursor.execute("SELECT 1")
+                continue
+            conn.poll()
+            while conn.notifies:
+                self._dispatch(conn.notifies.pop(0).payload)
+
+    def _dispatch(self, body):
+        """Llama a los handlers del evento y registra su lag"""
+        try:
+            payload = json.loads(body)
+            event = payload['event']
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"⚠️  Evento de cambios inválido: {body[:200]!r}")
+            return
+        subscriptions = self._subscriptions.get(event)
+        if not subscriptions:
+            return
+        stats = self._stats[event]
+        for handler, _ in subscriptions:
+            try:
+                handler(payload)
+            except Exception as e:
+                stats.errors += 1
+                logger.warning(f"⚠️  Error aplicando {event}: {e}")
+        self.last_event_at = time.time()
+        stats.add(max(0.0, (self.last_event_at - float(payload.get('sent_at', self.last_event_at))) * 1000))
+        logger.info(f"📡 {event} aplicado (lag {stats.last_ms:.0f} ms)")
+
+    def _catch_up(self):
+        """Re-sincroniza todo el estado suscrito (al conectar o reconectar)"""
+        self.catch_ups += 1
+        for event, subscriptions in self._subscriptions.items():
+            for _, catch_up in subscriptions:
+                if catch_up is None:
+                    continue
+                try:
+                    catch_up()
+                except Exception as e:
+                    logger.warning(f"⚠️  Error re-sincronizando {event}: {e}")
+
+    def status(self):
+        """Estado del listener y lag por evento para /health"""
+        return {
+            'enabled': self.enabled,
+            'channel': self.channel,
+            'connected': self.is_live(),
+            'pid': os.getpid(),
+            'reconnects': self.reconnects,
+            'catch_ups': self.catch_ups,
+            'last_event_at': self.last_event_at,
+            'last_error': self.last_error,
+            'events': {event: stats.summary() for event, stats in self._stats.items()},
+        }
+
+
+def fallback_interval(seconds):
+    """Intervalo de un poller: el normal sin canal, CHANGE_FEED_FALLBACK_SECONDS con el canal conectado"""
+    if change_feed.is_live():
+        return max(seconds, config.CHANGE_FEED_FALLBACK_SECONDS)
+    return seconds
+
+
+# Listener del proceso; la app registra sus handlers (ver app.py)
+change_feed = ChangeFeed()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Canal de cambios LISTEN/NOTIFY")
+    parser.add_argument('command', choices=['listen', 'publish'])
+    parser.add_argument('--event', default=PREDICTION_RUN, help='publish: tipo de evento')
+    parser.add_argument('--payload', default='{}', help='publish: datos del evento en JSON')
+    args = parser.parse_args()
+
+    if args.command == 'publish':
+        publish_now(args.event, **json.loads(args.payload))
+        print(f"✅ {args.event} publicado en '{config.CHANGE_FEED_CHANNEL}'")
+    else:
+        for event in (PREDICTION_RUN, MODEL_PUBLISHED, ORDERS_CHANGED):
+            change_feed.subscribe(event, lambda payload: print(json.dumps(payload, ensure_ascii=False)))
+        change_feed.ensure_started()
+        try:
+            while True:
+                time.sleep(60)
+                print(json.dumps(change_feed.status()['events'], indent=2))
+        except KeyboardInterrupt:
+            change_feed.stop()
@@ -22,6 +22,77 @@ GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash-exp')
 GEMINI_TEMPERATURE = float(os.getenv('GEMINI_TEMPERATURE', '0.7'))
 GEMINI_MAX_TOKENS = int(os.getenv('GEMINI_MAX_TOKENS', '2048'))
 
+# Modo de recuperación de contexto del co-piloto:
+#   'context' -> reglas por palabras clave + tablas de contexto en el prompt (get_context_for_query)
+#   'tools'   -> Gemini solicita los datos vía function calling (copilot_tools.py)
+COPILOT_MODE = os.getenv('COPILOT_MODE', 'context').lower()
+
+# Límites aplicados en el servidor a las herramientas del modo 'tools'
+COPILOT_TOOL_MAX_ROWS = int(os.getenv('COPILOT_TOOL_MAX_ROWS', '50'))
+COPILOT_TOOL_MAX_CHARS = int(os.getenv('COPILOT_TOOL_MAX_CHARS', '8000'))
+COPILOT_MAX_TOOL_CALLS = int(os.getenv('COPILOT_MAX_TOOL_CALLS', '5'))
+
+# Registro de modelos versionados y sincronización opcional con un object store:
+#   ''                   -> solo registro local
+#   'gs://bucket/prefijo' -> Google Cloud Storage
+#   'gcs'                -> bucket GCS_BUCKET_NAME con prefijo 'models/registry'
+#   otra ruta            -> directorio local que hace de object store
+MODEL_REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR', os.path.join(os.path.dirname(__file__), 'models', 'registry'))
+MODEL_STORE_URI = os.getenv('MODEL_STORE_URI', '')
+
+# Snapshot columnar local de ordenes_compra (Arrow IPC por mes, ver snapshot.py)
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(os.path.dirname(__file__), 'data', 'snapshot'))
+
+# Pipeline de entrenamiento por etapas: checkpoints y reportes por run (ver pipeline.py)
+PIPELINE_DIR = os.getenv('PIPELINE_DIR', os.path.join(os.path.dirname(__file__), 'models', 'pipeline'))
+PIPELINE_MAX_WORKERS = int(os.getenv('PIPELINE_MAX_WORKERS', '4'))
+
+# Scheduler de entrenamiento (scheduler.py). Un advisory lock de PostgreSQL con
+# FORECAST_LOCK_KEY evita que dos procesos (scheduler en otro nodo o un
+# train_model.py manual) reemplacen predicciones_demanda al mismo tiempo.
+FORECAST_LOCK_KEY = int(os.getenv('FORECAST_LOCK_KEY', '7301041'))
+SCHEDULER_INTERVAL_MINUTES = float(os.getenv('SCHEDULER_INTERVAL_MINUTES', '1440'))  # desde el último forecast exitoso
+SCHEDULER_MIN_NEW_ORDERS = int(os.getenv('SCHEDULER_MIN_NEW_ORDERS', '500'))  # órdenes pendientes que adelantan el run (0 = desactivado)
+SCHEDULER_MIN_GAP_MINUTES = float(os.getenv('SCHEDULER_MIN_GAP_MINUTES', '30'))  # separación mínima para el disparo por volumen
+SCHEDULER_POLL_SECONDS = float(os.getenv('SCHEDULER_POLL_SECONDS', '60'))
+SCHEDULER_BACKOFF_SECONDS = float(os.getenv('SCHEDULER_BACKOFF_SECONDS', '60'))
+SCHEDULER_BACKOFF_MAX_SECONDS = float(os.getenv('SCHEDULER_BACKOFF_MAX_SECONDS', '3600'))
+SCHEDULER_METRICS_PORT = int(os.getenv('SCHEDULER_METRICS_PORT', '9108'))  # 0 = sin endpoint de métricas
+
+# Ingesta masiva de órdenes de ChileCompra (ingest.py): procesos de parseo y MB por bloque
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', str(os.cpu_count() or 4)))
+INGEST_CHUNK_MB = float(os.getenv('INGEST_CHUNK_MB', '8'))
+INGEST_DESCRIPTION_CACHE = int(os.getenv('INGEST_DESCRIPTION_CACHE', '500000'))  # descripciones distintas memorizadas por worker
+
+# Estandarización de productos por palabras clave (standardizer.py)
+STANDARDIZER_MIN_SCORE = int(os.getenv('STANDARDIZER_MIN_SCORE', '1'))  # palabras clave mínimas del producto ganador
+STANDARDIZER_BATCH_SIZE = int(os.getenv('STANDARDIZER_BATCH_SIZE', '50000'))
+
+# Participación de mercado por fabricante (brands.py / competencia_mensual): ventana del chat
+COMPETENCIA_MESES = int(os.getenv('COMPETENCIA_MESES', '12'))
+
+# Estandarización semántica (semantic_standardizer.py): modelo en CPU y cache de embeddings
+SEMANTIC_EMBEDDING_MODEL = os.getenv('SEMANTIC_EMBEDDING_MODEL', 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', str(os.cpu_count() or 4)))
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', os.path.join(os.path.dirname(__file__), 'models', 'embeddings'))
+EMBEDDING_MIN_SIMILARITY = float(os.getenv('EMBEDDING_MIN_SIMILARITY', '0.5'))  # coseno mínimo al centroide
+EMBEDDING_LABELED_SAMPLE = int(os.getenv('EMBEDDING_LABELED_SAMPLE', '200'))  # descripciones etiquetadas por categoría para centroides
+
+# Extracción de bases de licitación en PDF (tenders.py): procesos, páginas por tarea y cache por página
+TENDER_WORKERS = int(os.getenv('TENDER_WORKERS', str(os.cpu_count() or 4)))
+TENDER_PAGES_PER_TASK = int(os.getenv('TENDER_PAGES_PER_TASK', '8'))
+TENDER_CACHE_DIR = os.getenv('TENDER_CACHE_DIR', os.path.join(os.path.dirname(__file__), 'models', 'tenders'))
+
+# Recarga en caliente del modelo en la app: cada worker revisa LATEST cada N segundos
+MODEL_HOT_RELOAD = os.getenv('MODEL_HOT_RELOAD', 'True').lower() == 'true'
+MODEL_POLL_SECONDS = float(os.getenv('MODEL_POLL_SECONDS', '30'))
+
+# /api/forecast: micro-batching de consultas concurrentes y límite de filas por request
+FORECAST_BATCH_WINDOW_MS = float(os.getenv('FORECAST_BATCH_WINDOW_MS', '2'))
+FORECAST_MAX_BATCH = int(os.getenv('FORECAST_MAX_BATCH', '4096'))
+FORECAST_MAX_ITEMS = int(os.getenv('FORECAST_MAX_ITEMS', '1000'))
+
 # Configuración de embeddings
 EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-004')
 
@@ -174,6 +245,27 @@ SESSION_TYPE = 'filesystem'
 CACHE_TYPE = 'simple'
 CACHE_DEFAULT_TIMEOUT = 300  # 5 minutos
 
+# Cache de fragmentos de contexto del co-piloto (ver context_cache.py); 0 entradas la desactiva
+CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv('CONTEXT_CACHE_MAX_ENTRIES', '1024'))
+CONTEXT_CACHE_CHECK_SECONDS = float(os.getenv('CONTEXT_CACHE_CHECK_SECONDS', '5'))
+
+# Canal de cambios LISTEN/NOTIFY (change_feed.py): con el listener conectado los pollers
+# (cache de contexto, recarga de modelo) solo revisan cada CHANGE_FEED_FALLBACK_SECONDS
+CHANGE_FEED_ENABLED = os.getenv('CHANGE_FEED_ENABLED', 'True').lower() == 'true'
+CHANGE_FEED_CHANNEL = os.getenv('CHANGE_FEED_CHANNEL', 'solventum_cambios')
+CHANGE_FEED_FALLBACK_SECONDS = float(os.getenv('CHANGE_FEED_FALLBACK_SECONDS', '300'))
+CHANGE_FEED_KEEPALIVE_SECONDS = float(os.getenv('CHANGE_FEED_KEEPALIVE_SECONDS', '30'))
+CHANGE_FEED_RECONNECT_MAX_SECONDS = float(os.getenv('CHANGE_FEED_RECONNECT_MAX_SECONDS', '60'))
+
+# Re-forecast incremental: sobre esta fracción de series modificadas se recalcula toda la grilla
+PREDICTIONS_FULL_REFRESH_FRACTION = float(os.getenv('PREDICTIONS_FULL_REFRESH_FRACTION', '0.5'))
+
+# Almacenamiento de predicciones (ver prediction_store.py):
+#   'filas'  -> predicciones_demanda, una fila por hospital × producto × mes
+#   'series' -> predicciones_series, una fila por serie con el horizonte en arreglos
+#               (los lectores usan la vista predicciones_demanda_series)
+PREDICTIONS_LAYOUT = os.getenv('PREDICTIONS_LAYOUT', 'filas').lower()
+
 # Límites de rate limiting
 RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True') == 'True'
 RATE_LIMIT_DEFAULT = os.getenv('RATE_LIMIT_DEFAULT', '100 per hour')
@@ -0,0 +1,222 @@
+"""
+Cache de Fragmentos de Contexto del Co-piloto
+
+Los lectores de db_utils que arman el contexto del chat (rankings, resúmenes,
+predicciones por hospital o producto) se consultan una y otra vez con los
+mismos argumentos, mientras predicciones_demanda cambia a lo más una vez por
+ejecución de train_model. Cada entrada se guarda con etiquetas del hospital
+y/o producto que cubre:
+
+- ('hospital', h) / ('producto', p): se descarta solo si se recalculó una
+  serie de ese hospital o producto
+- ALL: agregados sobre todas las series, se descarta con cualquier cambio
+
+Cada proceso (worker de Gunicorn) revisa ejecuciones_prediccion cada
+CONTEXT_CACHE_CHECK_SECONDS y aplica las invalidaciones de las ejecuciones
+nuevas (ver dirty_series.py); un refresco completo vacía la cache. Con el
+canal de cambios conectado (change_feed.py) la revisión la dispara el evento
+de la ejecución y el polling queda como fallback. El TTL
+(CACHE_DEFAULT_TIMEOUT) acota igual la antigüedad de las consultas que
+dependen de la fecha actual.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import logging
+
+import config
+from change_feed import fallback_interval
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+ALL = ('*',)
+
+NEW_RUNS_QUERY = """
+SELECT id, hospitales, productos
+FROM ejecuciones_prediccion
+WHERE id > %s
+ORDER BY id
+"""
+
+
+def tags_for(hospital=None, producto=None):
+    """Etiquetas de una entrada según el hospital y/o producto que filtra"""
+    tags = set()
+    if hospital:
+        tags.add(('hospital', hospital))
+    if producto:
+        tags.add(('producto', producto))
+    return frozenset(tags) or frozenset([ALL])
+
+
+class ContextCache:
+    """Cache LRU con TTL e invalidación por hospital/producto"""
+
+    def __init__(self, ttl=None, check_seconds=None, max_entries=None):
+        """
+        Args:
+            ttl: Segundos de vida de una entrada (default: CACHE_DEFAULT_TIMEOUT)
+            check_seconds: Intervalo de revisión de ejecuciones_prediccion (default: CONTEXT_CACHE_CHECK_SECONDS)
+            max_entries: Entradas máximas (default: CONTEXT_CACHE_MAX_ENTRIES; 0 desactiva la cache)
+        """
+        self.ttl = config.CACHE_DEFAULT_TIMEOUT if ttl is None else ttl
+        self.check_seconds = config.CONTEXT_CACHE_CHECK_SECONDS if check_seconds is None else check_seconds
+        self.max_entries = config.CONTEXT_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expira, tags, valor)
+        self._last_run_id = None
+        self._next_check = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def get(self, key, tags, compute):
+        """
+        Valor en cache o compute() si no está o expiró
+
+        Args:
+            key: Clave hashable (ej. ('ranking', producto, limit))
+            tags: Etiquetas de tags_for()
+            compute: Función sin argumentos que consulta la BD
+        """
+        if self.max_entries <= 0:
+            return compute()
+        self.sync()
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, tags, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, hospitales=None, productos=None, names=None):
+        """
+        Descarta las entradas afectadas por series recalculadas
+
+        Args:
+            hospitales: Hospitales recalculados (None junto con productos=None = todo)
+            productos: Productos recalculados
+            names: Solo entradas de estos lectores (nombre de cached_reader; None = todos)
+
+        Returns:
+            Número de entradas descartadas
+        """
+        with self._lock:
+            if hospitales is None and productos is None:
+                if names is None:
+                    stale = list(self._entries)
+                else:
+                    stale = [key for key in self._entries if key[0] in names]
+            else:
+                touched = {('hospital', h) for h in hospitales or ()} | {('producto', p) for p in productos or ()}
+                if not touched:
+                    return 0
+                touched.add(ALL)
+                stale = [key for key, (_, tags, _) in self._entries.items()
+                         if tags & touched and (names is None or key[0] in names)]
+            for key in stale:
+                del self._entries[key]
+            n = len(stale)
+            self.evicted += n
+        return n
+
+    def sync(self, force=False):
+        """
+        Aplica las invalidaciones de ejecuciones de predicción nuevas
+
+        Args:
+            force: Revisar ya (evento del canal de cambios); si no, a lo más cada
+                check_seconds, o CHANGE_FEED_FALLBACK_SECONDS con el canal conectado
+        """
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return
+        if not self._sync_lock.acquire(blocking=force):
+            return
+        try:
+            self._next_check = now + fallback_interval(self.check_seconds)
+            self._apply_new_runs()
+        finally:
+            self._sync_lock.release()
+
+    def _apply_new_runs(self):
+        try:
+            conn = get_connection()
+            try:
+                cursor = conn.cursor()
+                if self._last_run_id is None:
+                    # Primera revisión del proceso: la cache está vacía, solo se fija el punto de partida
+                    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM ejecuciones_prediccion")
+                    self._last_run_id = cursor.fetchone()[0]
+                    rows = []
+                else:
+                    cursor.execute(NEW_RUNS_QUERY, (self._last_run_id,))
+                    rows = cursor.fetchall()
+                cursor.close()
+            finally:
+                conn.close()
+        except Exception as e:
+            # Sin registro de ejecuciones no se puede invalidar con precisión: se vacía
+            logger.warning(f"⚠️  No se pudo revisar ejecuciones_prediccion ({e}); se vacía la cache de contexto")
+            self.invalidate()
+            return
+
+        for run_id, hospitales, productos in rows:
+            n = self.invalidate(hospitales, productos)
+            self._last_run_id = run_id
+            scope = 'completa' if hospitales is None else f"{len(set(hospitales))} hospitales, {len(set(productos))} productos"
+            logger.info(f"♻️  Ejecución de predicción {run_id} ({scope}): {n} entradas de contexto descartadas")
+
+    def status(self):
+        """Contadores para /health"""
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            'entries': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'evicted': self.evicted,
+            'last_prediction_run': self._last_run_id,
+        }
+
+
+# Cache del proceso, compartida por get_context_for_query y las herramientas del co-piloto
+context_cache = ContextCache()
+
+
+def cached_reader(name, reader, hospital=None, producto=None, **kwargs):
+    """
+    Llama a un lector de db_utils a través de la cache
+
+    Args:
+        name: Nombre del lector (parte de la clave)
+        reader: Función de db_utils
+        hospital: Hospital filtrado (se pasa al lector si no es None)
+        producto: Producto filtrado (se pasa al lector si no es None)
+        **kwargs: Resto de argumentos del lector
+    """
+    args = dict(kwargs)
+    if hospital is not None:
+        args['hospital'] = hospital
+    if producto is not None:
+        args['producto'] = producto
+    key = (name, tuple(sorted(args.items())))
+    return context_cache.get(key, tags_for(hospital, producto), lambda: reader(**args))
@@ -0,0 +1,407 @@
+"""
+Modo de recuperación por herramientas (function calling) para el co-piloto
+
+En lugar de adivinar la intención con reglas por palabras clave y volcar tablas
+completas en el prompt, los lectores de db_utils se declaran como funciones de
+Gemini. El modelo solicita solo los datos que necesita y el servidor valida los
+argumentos y acota el tamaño de cada resultado antes de devolverlo.
+"""
+import json
+import logging
+import re
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+import config
+from context_cache import cached_reader
+from db_utils import (
+    get_predicciones_hospital,
+    get_all_hospitales_ranking,
+    get_predicciones_proximas,
+    get_resumen_producto,
+    get_competencia_producto
+)
+
+logger = logging.getLogger(__name__)
+
+# Código de producto estandarizado (ej: APOSITOS, GUANTES_MEDICOS)
+PRODUCTO_PATTERN = re.compile(r'^[A-Z0-9_]{2,200}$')
+
+# Respuesta a las llamadas pendientes al agotar las rondas de herramientas
+TOOL_LIMIT_RESULT = {
+    'error': 'Se alcanzó el máximo de consultas: responde con los datos ya obtenidos, sin llamar más herramientas'
+}
+
+# Respuesta al usuario si el modelo insiste en llamar herramientas tras el límite
+TOOL_LIMIT_FALLBACK = (
+    "No pude completar la consulta con los datos disponibles. "
+    "Intenta con una pregunta más específica (producto, hospital o período)."
+)
+
+
+class ToolArgumentError(ValueError):
+    """Argumentos inválidos en una llamada a herramienta solicitada por el modelo"""
+
+
+def _tool_predicciones_hospital(hospital, producto=None):
+    return cached_reader('predicciones_hospital', get_predicciones_hospital, hospital=hospital, producto=producto)
+
+
+def _tool_ranking_hospitales(producto=None, limit=10):
+    return cached_reader('ranking_hospitales', get_all_hospitales_ranking, producto=producto, limit=limit)
+
+
+def _tool_predicciones_proximas(dias=90, producto=None, limit=20):
+    return cached_reader('predicciones_proximas', get_predicciones_proximas, producto=producto, dias=dias, limit=limit)
+
+
+def _tool_resumen_producto(producto):
+    return cached_reader('resumen_producto', get_resumen_producto, producto=producto)
+
+
+def _tool_competencia_producto(producto=None, hospital=None, meses=config.COMPETENCIA_MESES):
+    return cached_reader('competencia', get_competencia_producto, producto=producto, hospital=hospital, meses=meses)
+
+
+# Especificación de cada herramienta: declaración JSON-schema para Gemini + handler.
+# Los límites (maxLength, minimum, maximum) se vuelven a validar en el servidor.
+TOOL_SPECS = {
+    'get_predicciones_hospital': {
+        'description': 'Predicciones de demanda más recientes para un hospital, '
+                       'opcionalmente filtradas por producto.',
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'hospital': {'type': 'string', 'maxLength': 500,
+                             'description': 'Nombre exacto del hospital u organismo'},
+                'producto': {'type': 'string', 'maxLength': 200,
+                             'description': 'Código de producto estandarizado (ej: APOSITOS)'}
+            },
+            'required': ['hospital']
+        },
+        'handler': _tool_predicciones_hospital
+    },
+    'get_ranking_hospitales': {
+        'description': 'Ranking de hospitales por demanda total estimada, '
+                       'opcionalmente para un producto.',
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'producto': {'type': 'string', 'maxLength': 200,
+                             'description': 'Código de producto estandarizado'},
+                'limit': {'type': 'integer', 'minimum': 1, 'maximum': 50,
+                          'description': 'Cantidad de hospitales a retornar'}
+            }
+        },
+        'handler': _tool_ranking_hospitales
+    },
+    'get_predicciones_proximas': {
+        'description': 'Predicciones para los próximos N días, ordenadas por fecha, '
+                       'opcionalmente para un producto.',
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'dias': {'type': 'integer', 'minimum': 1, 'maximum': 365,
+                         'description': 'Horizonte en días hacia adelante'},
+                'producto': {'type': 'string', 'maxLength': 200,
+                             'description': 'Código de producto estandarizado'},
+                'limit': {'type': 'integer', 'minimum': 1, 'maximum': 50,
+                          'description': 'Cantidad máxima de filas'}
+            }
+        },
+        'handler': _tool_predicciones_proximas
+    },
+    'get_resumen_producto': {
+        'description': 'Resumen agregado de predicciones para un producto: hospitales, '
+                       'demanda total y promedio, rango de fechas y confianza.',
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'producto': {'type': 'string', 'maxLength': 200,
+                             'description': 'Código de producto estandarizado'}
+            },
+            'required': ['producto']
+        },
+        'handler': _tool_resumen_producto
+    },
+    'get_competencia_producto': {
+        'description': 'Participación de mercado por fabricante/marca en las órdenes de compra '
+                       'de los últimos N meses, opcionalmente para un producto y un hospital.',
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'producto': {'type': 'string', 'maxLength': 200,
+                             'description': 'Código de producto estandarizado'},
+                'hospital': {'type': 'string', 'maxLength': 500,
+                             'description': 'Nombre exacto del hospital u organismo'},
+                'meses': {'type': 'integer', 'minimum': 1, 'maximum': 60,
+                          'description': 'Meses hacia atrás desde el mes actual'}
+            }
+        },
+        'handler': _tool_competencia_producto
+    }
+}
+
+
+def get_function_declarations():
+    """
+    Retorna las declaraciones de funciones en formato JSON-schema
+
+    Returns:
+        Lista de dicts {name, description, parameters}
+    """
+    declarations = []
+    for name, spec in TOOL_SPECS.items():
+        # Gemini no acepta maxLength/minimum/maximum en el schema: se validan en el servidor
+        properties = {
+            prop: {k: v for k, v in prop_spec.items() if k in ('type', 'description')}
+            for prop, prop_spec in spec['parameters']['properties'].items()
+        }
+        parameters = {'type': 'object', 'properties': properties}
+        if spec['parameters'].get('required'):
+            parameters['required'] = list(spec['parameters']['required'])
+        declarations.append({
+            'name': name,
+            'description': spec['description'],
+            'parameters': parameters
+        })
+    return declarations
+
+
+def build_tools():
+    """
+    Construye el objeto `tools` para el SDK activo (Vertex AI o Gemini API)
+
+    Returns:
+        Lista de tools lista para pasar a GenerativeModel(..., tools=...)
+    """
+    declarations = get_function_declarations()
+    if config.USE_VERTEX_AI:
+        from vertexai.preview.generative_models import FunctionDeclaration, Tool
+        return [Tool(function_declarations=[FunctionDeclaration(**d) for d in declarations])]
+    return [{'function_declarations': declarations}]
+
+
+def validate_args(name, args):
+    """
+    Valida y normaliza los argumentos de una llamada a herramienta
+
+    Args:
+        name: Nombre de la herramienta
+        args: Dict de argumentos entregados por el modelo
+
+    Returns:
+        Dict con argumentos validados
+
+    Raises:
+        ToolArgumentError: si la herramienta no existe o los argumentos no cumplen el schema
+    """
+    if name not in TOOL_SPECS:
+        raise ToolArgumentError(f"Herramienta desconocida: {name}")
+
+    schema = TOOL_SPECS[name]['parameters']
+    properties = schema['properties']
+    args = dict(args or {})
+
+    unknown = set(args) - set(properties)
+    if unknown:
+        raise ToolArgumentError(f"Argumentos no permitidos: {sorted(unknown)}")
+
+    for required in schema.get('required', []):
+        if args.get(required) in (None, ''):
+            raise ToolArgumentError(f"Falta argumento requerido: {required}")
+
+    clean = {}
+    for key, value in args.items():
+        if value is None:
+            continue
+        prop = properties[key]
+        if prop['type'] == 'integer':
+            # Gemini entrega números como float (ej: 10.0)
+            try:
+                as_float = float(value)
+            except (TypeError, ValueError):
+                raise ToolArgumentError(f"{key} debe ser entero")
+            if not as_float.is_integer():
+                raise ToolArgumentError(f"{key} debe ser entero")
+            value = int(as_float)
+            if value < prop.get('minimum', value) or value > prop.get('maximum', value):
+                raise ToolArgumentError(
+                    f"{key} fuera de rango [{prop.get('minimum')}, {prop.get('maximum')}]"
+                )
+        elif prop['type'] == 'string':
+            if not isinstance(value, str):
+                raise ToolArgumentError(f"{key} debe ser texto")
+            value = value.strip()
+            if len(value) > prop.get('maxLength', len(value)):
+                raise ToolArgumentError(f"{key} excede {prop['maxLength']} caracteres")
+            if key == 'producto':
+                value = value.upper()
+                if not PRODUCTO_PATTERN.match(value):
+                    raise ToolArgumentError(f"Código de producto inválido: {value}")
+        clean[key] = value
+
+    return clean
+
+
+def _to_jsonable(value):
+    """Convierte valores de pandas/numpy/Decimal a tipos serializables"""
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return value.isoformat()[:10]
+    if isinstance(value, Decimal):
+        return round(float(value), 2)
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, (np.floating, float)):
+        return None if np.isnan(value) else round(float(value), 2)
+    return value
+
+
+def _cap_result(result, max_rows, max_chars):
+    """
+    Convierte el resultado de un lector a dict acotado en filas y caracteres
+
+    Returns:
+        dict con 'rows' (o 'data'), 'total_rows' y 'truncated'
+    """
+    if isinstance(result, pd.DataFrame):
+        # Columnas internas que no aportan al modelo
+        df = result.drop(columns=[c for c in ('id', 'created_at') if c in result.columns])
+        total = len(df)
+        rows = [
+            {k: _to_jsonable(v) for k, v in record.items()}
+            for record in df.head(max_rows).to_dict(orient='records')
+        ]
+        payload = {'rows': rows, 'total_rows': total, 'truncated': total > max_rows}
+    else:
+        payload = {'data': {k: _to_jsonable(v) for k, v in (result or {}).items()}, 'truncated': False}
+
+    # Recorte adicional por tamaño serializado
+    while payload.get('rows') and len(json.dumps(payload, ensure_ascii=False)) > max_chars:
+        payload['rows'] = payload['rows'][:len(payload['rows']) // 2]
+        payload['truncated'] = True
+
+    return payload
+
+
+def execute_tool(name, args, max_rows=None, max_chars=None):
+    """
+    Ejecuta una herramienta validando argumentos y acotando el resultado
+
+    Nunca lanza excepciones: los errores se devuelven como {'error': ...} para
+    que el modelo pueda corregir la llamada.
+
+    Args:
+        name: Nombre de la herramienta
+        args: Argumentos entregados por el modelo
+        max_rows: Máximo de filas (por defecto config.COPILOT_TOOL_MAX_ROWS)
+        max_chars: Máximo de caracteres serializados (por defecto config.COPILOT_TOOL_MAX_CHARS)
+
+    Returns:
+        dict serializable a JSON
+    """
+    max_rows = max_rows or config.COPILOT_TOOL_MAX_ROWS
+    max_chars = max_chars or config.COPILOT_TOOL_MAX_CHARS
+
+    try:
+        clean_args = validate_args(name, args)
+    except ToolArgumentError as e:
+        logger.warning(f"Llamada inválida a {name}({args}): {e}")
+        return {'error': str(e)}
+
+    try:
+        result = TOOL_SPECS[name]['handler'](**clean_args)
+    except Exception as e:
+        logger.error(f"Error ejecutando herramienta {name}: {e}", exc_info=True)
+        return {'error': 'Error consultando la base de datos'}
+
+    return _cap_result(result, max_rows, max_chars)
+
+
+def _function_calls(response):
+    """Extrae las llamadas a función de una respuesta de Gemini"""
+    calls = []
+    try:
+        parts = response.candidates[0].content.parts
+    except (AttributeError, IndexError):
+        return calls
+    for part in parts:
+        fn = getattr(part, 'function_call', None)
+        if fn is not None and getattr(fn, 'name', ''):
+            calls.append((fn.name, {k: v for k, v in dict(fn.args or {}).items()}))
+    return calls
+
+
+def _function_response_parts(results):
+    """Construye las partes de respuesta de función para el SDK activo"""
+    if config.USE_VERTEX_AI:
+        from vertexai.preview.generative_models import Part
+        return [Part.from_function_response(name=name, response={'content': result})
+                for name, result in results]
+
+    import google.ai.generativelanguage as glm
+    return glm.Content(parts=[
+        glm.Part(function_response=glm.FunctionResponse(name=name, response={'content': result}))
+        for name, result in results
+    ])
+
+
+def run_tool_chat(chat_session, user_query, generation_config=None, max_calls=None):
+    """
+    Ejecuta un turno de chat resolviendo las llamadas a herramientas del modelo
+
+    Args:
+        chat_session: Sesión de chat creada con un modelo que declara build_tools()
+        user_query: Pregunta del usuario
+        generation_config: Configuración de generación de Gemini
+        max_calls: Máximo de rondas de llamadas (por defecto config.COPILOT_MAX_TOOL_CALLS)
+
+    Si se agotan las rondas y el modelo sigue pidiendo herramientas, las llamadas
+    pendientes se responden con TOOL_LIMIT_RESULT para que conteste con lo que ya
+    tiene; si aun así no entrega texto se retorna TOOL_LIMIT_FALLBACK.
+
+    Returns:
+        (response_text, tool_log): texto de la respuesta final y lista de llamadas ejecutadas
+    """
+    max_calls = max_calls or config.COPILOT_MAX_TOOL_CALLS
+    tool_log = []
+
+    response = chat_session.send_message(user_query, generation_config=generation_config)
+
+    for _ in range(max_calls):
+        calls = _function_calls(response)
+        if not calls:
+            break
+
+        results = []
+        for name, args in calls:
+            result = execute_tool(name, args)
+            tool_log.append({
+                'name': name,
+                'args': args,
+                'rows': len(result.get('rows', [])),
+                'error': result.get('error')
+            })
+            results.append((name, result))
+
+        logger.info(f"Herramientas ejecutadas: {[c['name'] for c in tool_log]}")
+        response = chat_session.send_message(
+            _function_response_parts(results),
+            generation_config=generation_config
+        )
+
+    pending = _function_calls(response)
+    if pending:
+        logger.warning(f"Se alcanzó el máximo de {max_calls} rondas de herramientas")
+        response = chat_session.send_message(
+            _function_response_parts([(name, TOOL_LIMIT_RESULT) for name, _ in pending]),
+            generation_config=generation_config
+        )
+        if _function_calls(response):
+            logger.warning("El modelo siguió pidiendo herramientas tras el límite; se usa la respuesta por defecto")
+            return TOOL_LIMIT_FALLBACK, tool_log
+
+    return response.text, tool_log
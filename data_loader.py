@@ -0,0 +1,223 @@
+"""
+Carga de datos de entrenamiento agregados en SQL
+
+El modelo solo necesita la cantidad por hospital × producto × mes, así que la
+agregación se hace en PostgreSQL (SUM(cantidad) por mes y serie) y el resultado
+se lee en bloques con un cursor del lado del servidor. Los bloques se convierten
+a tipos compactos (categóricos + enteros reducidos) a medida que llegan, sin
+materializar nunca el historial completo como strings de pandas.
+"""
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+from psycopg2 import sql
+
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Filas por viaje al servidor (cursor con nombre)
+DEFAULT_CHUNK_SIZE = 100_000
+
+AGGREGATE_QUERY = """
+SELECT
+    date_trunc('month', fecha_orden)::date AS fecha_orden,
+    nombre_organismo AS hospital,
+    producto_estandarizado,
+    SUM(cantidad) AS cantidad
+FROM {table}
+WHERE fecha_orden IS NOT NULL
+  AND nombre_organismo IS NOT NULL
+  AND producto_estandarizado IS NOT NULL
+  AND (%(fecha_desde)s::date IS NULL OR fecha_orden >= %(fecha_desde)s)
+  AND (%(fecha_hasta)s::date IS NULL OR fecha_orden < %(fecha_hasta)s)
+  AND (%(since)s::timestamp IS NULL OR created_at > %(since)s)
+  AND (%(until)s::timestamp IS NULL OR created_at <= %(until)s)
+GROUP BY 1, 2, 3
+ORDER BY 1
+"""
+
+# Celdas (serie × mes) tocadas por órdenes nuevas: delta y total anterior para
+# poder actualizar estadísticos suficientes de forma exacta
+DELTA_QUERY = """
+WITH tocadas AS (
+    SELECT DISTINCT
+        date_trunc('month', fecha_orden)::date AS mes,
+        nombre_organismo,
+        producto_estandarizado
+    FROM {table}
+    WHERE created_at > %(since)s
+      AND (%(until)s::timestamp IS NULL OR created_at <= %(until)s)
+      AND fecha_orden IS NOT NULL
+      AND nombre_organismo IS NOT NULL
+      AND producto_estandarizado IS NOT NULL
+)
+SELECT
+    t.mes AS fecha_orden,
+    t.nombre_organismo AS hospital,
+    t.producto_estandarizado,
+    SUM(o.cantidad) FILTER (WHERE o.created_at > %(since)s) AS cantidad,
+    SUM(o.cantidad) FILTER (WHERE o.created_at <= %(since)s) AS cantidad_anterior
+FROM tocadas t
+JOIN {table} o
+  ON o.nombre_organismo = t.nombre_organismo
+ AND o.producto_estandarizado = t.producto_estandarizado
+ AND o.fecha_orden >= t.mes
+ AND o.fecha_orden < t.mes + INTERVAL '1 month'
+WHERE (%(until)s::timestamp IS NULL OR o.created_at <= %(until)s)
+GROUP BY 1, 2, 3
+ORDER BY 1
+"""
+
+
+class _CategoryAccumulator:
+    """Vocabulario global que crece bloque a bloque y entrega códigos int32"""
+
+    def __init__(self):
+        self.mapping = {}
+
+    def encode(self, values):
+        codes, uniques = pd.factorize(values)
+        lookup = np.fromiter(
+            (self.mapping.setdefault(u, len(self.mapping)) for u in uniques),
+            dtype=np.int32, count=len(uniques)
+        )
+        return lookup[codes]
+
+    def categories(self):
+        return pd.Index(list(self.mapping), dtype=object)
+
+
+def _compact_quantity(values):
+    """Convierte cantidades al entero más chico posible (float64 si hay nulos)"""
+    array = pd.to_numeric(pd.Series(values, copy=False))
+    if array.isna().any():
+        return array.to_numpy(dtype=np.float64)
+    return pd.to_numeric(array, downcast='integer').to_numpy()
+
+
+def iter_training_chunks(query=AGGREGATE_QUERY, chunk_size=DEFAULT_CHUNK_SIZE, table='ordenes_compra',
+                         fecha_desde=None, fecha_hasta=None, since=None, until=None):
+    """
+    Ejecuta una consulta agregada y entrega las filas en bloques (tuplas crudas)
+
+    Usa un cursor con nombre (server-side): PostgreSQL mantiene el resultado y
+    el cliente nunca tiene más de chunk_size filas en memoria.
+
+    Args:
+        query: Consulta con placeholder {table} y parámetros con nombre
+        chunk_size: Filas por bloque
+        table: Tabla de órdenes (permite benchmarks sobre tablas sintéticas)
+        fecha_desde: Opcional - fecha_orden >= fecha_desde
+        fecha_hasta: Opcional - fecha_orden < fecha_hasta
+        since: Opcional - watermark inferior, created_at > since
+        until: Opcional - watermark superior, created_at <= until
+
+    Yields:
+        Listas de tuplas (fecha_orden, hospital, producto_estandarizado, cantidad, ...)
+    """
+    params = {
+        'fecha_desde': fecha_desde, 'fecha_hasta': fecha_hasta,
+        'since': since, 'until': until
+    }
+    conn = get_connection()
+    try:
+        with conn.cursor(name='training_loader') as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(sql.SQL(query).format(table=sql.Identifier(table)), params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+    finally:
+        conn.close()
+
+
+def _collect(chunks, extra_columns=()):
+    """
+    Convierte bloques de tuplas a un único DataFrame con tipos compactos
+
+    Hospital y producto se codifican contra un vocabulario global a medida que
+    llegan los bloques, de modo que solo se guardan arrays int32 por bloque.
+    """
+    hospitales = _CategoryAccumulator()
+    productos = _CategoryAccumulator()
+    parts = {name: [] for name in ('fecha_orden', 'hospital', 'producto_estandarizado', 'cantidad', *extra_columns)}
+
+    for rows in chunks:
+        columns = list(zip(*rows))
+        parts['fecha_orden'].append(np.array(columns[0], dtype='datetime64[D]'))
+        parts['hospital'].append(hospitales.encode(np.asarray(columns[1], dtype=object)))
+        parts['producto_estandarizado'].append(productos.encode(np.asarray(columns[2], dtype=object)))
+        for i, name in enumerate(('cantidad', *extra_columns), start=3):
+            parts[name].append(np.array(columns[i], dtype=np.float64))
+
+    if not parts['fecha_orden']:
+        return pd.DataFrame({
+            'fecha_orden': pd.Series(dtype='datetime64[ns]'),
+            'hospital': pd.Categorical([]),
+            'producto_estandarizado': pd.Categorical([]),
+            'cantidad': pd.Series(dtype=np.int32),
+            **{name: pd.Series(dtype=np.float64) for name in extra_columns}
+        })
+
+    df = pd.DataFrame({
+        'fecha_orden': np.concatenate(parts['fecha_orden']).astype('datetime64[ns]'),
+        'hospital': pd.Categorical.from_codes(np.concatenate(parts['hospital']), hospitales.categories()),
+        'producto_estandarizado': pd.Categorical.from_codes(
+            np.concatenate(parts['producto_estandarizado']), productos.categories()),
+    })
+    for name in ('cantidad', *extra_columns):
+        df[name] = _compact_quantity(np.concatenate(parts[name]))
+    return df
+
+
+def load_training_aggregates(fecha_desde=None, fecha_hasta=None, since=None, until=None,
+                             chunk_size=DEFAULT_CHUNK_SIZE, table='ordenes_compra'):
+    """
+    Carga la demanda mensual por hospital × producto agregada en SQL
+
+    Args:
+        fecha_desde: Opcional - fecha_orden >= fecha_desde (ventana de fechas)
+        fecha_hasta: Opcional - fecha_orden < fecha_hasta
+        since: Opcional - solo órdenes con created_at > since (watermark)
+        until: Opcional - solo órdenes con created_at <= until
+        chunk_size: Filas por bloque del cursor del servidor
+        table: Tabla de órdenes
+
+    Returns:
+        DataFrame [fecha_orden (datetime64, primer día del mes), hospital (category),
+        producto_estandarizado (category), cantidad (entero reducido)]
+    """
+    t0 = time.perf_counter()
+    df = _collect(iter_training_chunks(
+        AGGREGATE_QUERY, chunk_size, table,
+        fecha_desde=fecha_desde, fecha_hasta=fecha_hasta, since=since, until=until
+    ))
+    logger.info(f"✅ {len(df)} filas agregadas (serie × mes) cargadas en {time.perf_counter() - t0:.1f}s "
+                f"({df.memory_usage(deep=True).sum() / 1e6:.1f} MB)")
+    return df
+
+
+def load_aggregate_deltas(since, until=None, chunk_size=DEFAULT_CHUNK_SIZE, table='ordenes_compra'):
+    """
+    Carga los cambios en la demanda mensual producidos por órdenes nuevas
+
+    Para cada celda serie × mes con órdenes creadas después de `since` retorna
+    la suma nueva (cantidad) y la suma que ya estaba incluida en el modelo
+    (cantidad_anterior, NaN si la celda no existía). DemandPredictor.update usa
+    ambas para actualizar los estadísticos de forma exacta.
+
+    Returns:
+        DataFrame como load_training_aggregates + columna cantidad_anterior
+    """
+    t0 = time.perf_counter()
+    df = _collect(
+        iter_training_chunks(DELTA_QUERY, chunk_size, table, since=since, until=until),
+        extra_columns=('cantidad_anterior',)
+    )
+    logger.info(f"✅ {len(df)} celdas serie × mes con órdenes nuevas ({time.perf_counter() - t0:.1f}s)")
+    return df
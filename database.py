@@ -2,6 +2,7 @@
 Configuración de conexión a base de datos PostgreSQL (AWS RDS)
 """
 import os
+from contextlib import contextmanager
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import psycopg2
@@ -66,6 +67,39 @@ def get_connection():
         print(f"Error al conectar a la base de datos: {e}")
         raise
 
+@contextmanager
+def advisory_lock(key):
+    """
+    Advisory lock de sesión de PostgreSQL, sin esperar
+    
+    El lock vive en una conexión dedicada mientras dura el bloque: si el proceso
+    muere, PostgreSQL lo libera al cerrarse la sesión.
+    
+    Args:
+        key: Clave entera (bigint) del lock
+    
+    Yields:
+        True si se obtuvo el lock, False si otra sesión lo tiene
+    """
+    conn = get_connection()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+        acquired = cursor.fetchone()[0]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", (key,))
+                except psycopg2.Error:
+                    # Conexión perdida: el lock se liberó junto con la sesión
+                    pass
+    finally:
+        cursor.close()
+        conn.close()
+
 # Test de conexión
 def test_connection():
     """Prueba la conexión a la base de datos"""
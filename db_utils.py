@@ -6,6 +6,9 @@ from database import get_connection, get_session, get_engine
 from sqlalchemy import text
 import pandas as pd
 
+from dimensions import SCHEMA_SQL as DIMENSIONS_SCHEMA, backfill_missing_ids
+from prediction_store import PREDICTIONS_SOURCE, SCHEMA_SQL as PREDICTION_STORE_SCHEMA
+
 def create_tables():
     """Crea las tablas necesarias para el proyecto"""
     engine = get_engine()
@@ -25,6 +28,76 @@ def create_tables():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
+    CREATE INDEX IF NOT EXISTS idx_ordenes_cambio ON ordenes_compra((COALESCE(updated_at, created_at)));
+    """
+    
+    # Diccionario de descripciones distintas (ver descriptions.py)
+    create_descripciones = """
+    CREATE TABLE IF NOT EXISTS descripciones (
+        id SERIAL PRIMARY KEY,
+        hash BIGINT UNIQUE NOT NULL,
+        texto_normalizado TEXT NOT NULL,
+        producto_estandarizado VARCHAR(200),
+        metodo_estandarizacion VARCHAR(20),
+        estandarizado_en TIMESTAMP,
+        marca VARCHAR(100),
+        embedding_fila INTEGER,
+        fabricante VARCHAR(100),
+        marca_detectada_en TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    ALTER TABLE ordenes_compra ADD COLUMN IF NOT EXISTS descripcion_id INTEGER REFERENCES descripciones(id);
+    CREATE INDEX IF NOT EXISTS idx_ordenes_descripcion ON ordenes_compra(descripcion_id);
+    CREATE INDEX IF NOT EXISTS idx_descripciones_pendientes ON descripciones(id) WHERE estandarizado_en IS NULL;
+
+    -- Agregado marca × hospital × producto × mes (ver brands.py)
+    CREATE TABLE IF NOT EXISTS competencia_mensual (
+        producto VARCHAR(200) NOT NULL,
+        mes DATE NOT NULL,
+        hospital VARCHAR(500) NOT NULL,
+        marca VARCHAR(100) NOT NULL,
+        fabricante VARCHAR(100) NOT NULL,
+        ordenes INTEGER NOT NULL,
+        cantidad BIGINT NOT NULL,
+        monto DECIMAL(18,2) NOT NULL,
+        actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (producto, mes, hospital, marca)
+    );
+    CREATE INDEX IF NOT EXISTS idx_competencia_corte ON competencia_mensual(hospital, mes);
+    CREATE INDEX IF NOT EXISTS idx_ordenes_organismo_fecha ON ordenes_compra(nombre_organismo, fecha_orden);
+
+    -- Watermark de cambios de ordenes_compra de cada `python brands.py refresh`
+    CREATE TABLE IF NOT EXISTS refrescos_competencia (
+        id SERIAL PRIMARY KEY,
+        watermark TIMESTAMP,
+        modo VARCHAR(20) NOT NULL,
+        cortes INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Ítems extraídos de bases de licitación en PDF (ver tenders.py)
+    CREATE TABLE IF NOT EXISTS licitaciones_items (
+        id SERIAL PRIMARY KEY,
+        archivo_hash CHAR(64) NOT NULL,
+        linea INTEGER NOT NULL,
+        licitacion_id VARCHAR(50),
+        archivo VARCHAR(500),
+        pagina INTEGER,
+        item VARCHAR(50),
+        nombre_organismo VARCHAR(500),
+        fecha_publicacion DATE,
+        descripcion_item TEXT,
+        producto_estandarizado VARCHAR(200),
+        cantidad INTEGER,
+        unidad_medida VARCHAR(50),
+        monto_total DECIMAL(15,2),
+        descripcion_id INTEGER REFERENCES descripciones(id),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (archivo_hash, linea)
+    );
+    CREATE INDEX IF NOT EXISTS idx_licitaciones_licitacion ON licitaciones_items(licitacion_id);
+    CREATE INDEX IF NOT EXISTS idx_licitaciones_producto ON licitaciones_items(producto_estandarizado);
     """
     
     # Tabla para predicciones de demanda
@@ -35,11 +108,41 @@ def create_tables():
         producto VARCHAR(200),
         fecha_prediccion DATE,
         demanda_estimada INTEGER,
+        demanda_inferior INTEGER,
+        demanda_superior INTEGER,
         confidence_score DECIMAL(5,2),
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
     """
     
+    # Columnas de intervalo para tablas creadas antes de su introducción
+    migrate_predicciones = """
+    ALTER TABLE predicciones_demanda
+        ADD COLUMN IF NOT EXISTS demanda_inferior INTEGER,
+        ADD COLUMN IF NOT EXISTS demanda_superior INTEGER;
+    """
+    
+    # Registro de ejecuciones de predicción (ver dirty_series.py)
+    create_ejecuciones = """
+    CREATE TABLE IF NOT EXISTS ejecuciones_prediccion (
+        id SERIAL PRIMARY KEY,
+        model_run_id VARCHAR(100),
+        model_key VARCHAR(100),
+        watermark TIMESTAMP,
+        horizonte_desde DATE,
+        n_meses INTEGER,
+        modo VARCHAR(20),
+        motivo TEXT,
+        series_total INTEGER,
+        series_recalculadas INTEGER,
+        series_omitidas INTEGER,
+        filas INTEGER,
+        hospitales TEXT[],
+        productos TEXT[],
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    
     # Tabla para catálogo de productos Solventum
     create_productos = """
     CREATE TABLE IF NOT EXISTS productos_solventum (
@@ -66,11 +169,21 @@ def create_tables():
     
     with engine.connect() as conn:
         conn.execute(text(create_ordenes_compra))
+        conn.execute(text(create_descripciones))
         conn.execute(text(create_predicciones))
+        conn.execute(text(migrate_predicciones))
+        conn.execute(text(create_ejecuciones))
+        # Dimensiones de hospitales y productos con ids enteros (ver dimensions.py)
+        conn.execute(text(DIMENSIONS_SCHEMA))
+        # Formato de predicciones por serie y su vista (ver prediction_store.py)
+        conn.execute(text(PREDICTION_STORE_SCHEMA))
         conn.execute(text(create_productos))
         conn.execute(text(create_consultas))
         conn.commit()
     
+    # BD existente: filas anteriores a las dimensiones sin ids
+    backfill_missing_ids()
+    
     print("✅ Tablas creadas exitosamente")
 
 def insert_orden_compra(data):
@@ -92,22 +205,32 @@ def insert_orden_compra(data):
     cursor.close()
     conn.close()
 
+# Tabla o vista de predicciones según PREDICTIONS_LAYOUT (ver prediction_store.py)
+PREDICCIONES = PREDICTIONS_SOURCE
+
+# Columnas de predicciones_demanda que retornan los lectores fila a fila (sin los ids)
+PREDICCIONES_COLUMNS = """
+    id, hospital, producto, fecha_prediccion, demanda_estimada,
+    demanda_inferior, demanda_superior, confidence_score, created_at
+"""
+
 def get_predicciones_hospital(hospital, producto=None):
     """Obtiene predicciones para un hospital específico"""
     conn = get_connection()
     
     if producto:
-        query = """
-        SELECT * FROM predicciones_demanda 
-        WHERE hospital = %s AND producto = %s
+        query = f"""
+        SELECT {PREDICCIONES_COLUMNS} FROM {PREDICCIONES} 
+        WHERE hospital_id = (SELECT id FROM hospitales WHERE nombre = %s)
+          AND producto_id = (SELECT id FROM productos WHERE codigo = %s)
         ORDER BY fecha_prediccion DESC
         LIMIT 10
         """
         df = pd.read_sql_query(query, conn, params=(hospital, producto))
     else:
-        query = """
-        SELECT * FROM predicciones_demanda 
-        WHERE hospital = %s
+        query = f"""
+        SELECT {PREDICCIONES_COLUMNS} FROM {PREDICCIONES} 
+        WHERE hospital_id = (SELECT id FROM hospitales WHERE nombre = %s)
         ORDER BY fecha_prediccion DESC
         LIMIT 10
         """
@@ -120,13 +243,21 @@ def get_top_demanda_producto(producto, limit=5):
     """Obtiene los hospitales con mayor demanda estimada para un producto"""
     conn = get_connection()
     
-    query = """
-    SELECT hospital, producto, SUM(demanda_estimada) as demanda_total
-    FROM predicciones_demanda
-    WHERE producto = %s
-    GROUP BY hospital, producto
-    ORDER BY demanda_total DESC
-    LIMIT %s
+    # Se agrega por id y solo las filas del top se unen con los nombres
+    query = f"""
+    WITH top AS (
+        SELECT hospital_id, producto_id, SUM(demanda_estimada) as demanda_total
+        FROM {PREDICCIONES}
+        WHERE producto_id = (SELECT id FROM productos WHERE codigo = %s)
+        GROUP BY hospital_id, producto_id
+        ORDER BY demanda_total DESC
+        LIMIT %s
+    )
+    SELECT h.nombre AS hospital, p.codigo AS producto, t.demanda_total
+    FROM top t
+    JOIN hospitales h ON h.id = t.hospital_id
+    JOIN productos p ON p.id = t.producto_id
+    ORDER BY t.demanda_total DESC
     """
     
     df = pd.read_sql_query(query, conn, params=(producto, limit))
@@ -177,19 +308,22 @@ def get_predicciones_producto_mes(producto, limit=10):
         limit: Número máximo de hospitales a retornar
         
     Returns:
-        DataFrame con columnas: hospital, producto, fecha_prediccion, demanda_estimada, confidence_score
+        DataFrame con columnas: hospital, producto, fecha_prediccion, demanda_estimada,
+        demanda_inferior, demanda_superior, confidence_score
     """
     conn = get_connection()
     
-    query = """
+    query = f"""
     SELECT 
         hospital,
         producto,
         fecha_prediccion,
         demanda_estimada,
+        demanda_inferior,
+        demanda_superior,
         confidence_score
-    FROM predicciones_demanda
-    WHERE producto = %s
+    FROM {PREDICCIONES}
+    WHERE producto_id = (SELECT id FROM productos WHERE codigo = %s)
     ORDER BY fecha_prediccion, demanda_estimada DESC
     LIMIT %s
     """
@@ -198,54 +332,52 @@ def get_predicciones_producto_mes(producto, limit=10):
     conn.close()
     return df
 
-def get_all_hospitales_ranking(producto=None):
+def get_all_hospitales_ranking(producto=None, limit=None):
     """
     Obtiene ranking de TODOS los hospitales con su demanda total estimada
     
     Args:
         producto: Opcional - filtrar por producto específico
+        limit: Opcional - máximo de hospitales a retornar (None = todos)
         
     Returns:
         DataFrame con columnas: hospital, demanda_total, num_predicciones
     """
     conn = get_connection()
     
-    if producto:
-        query = """
+    # Se agrega por hospital_id y solo las filas del ranking se unen con los nombres
+    query = f"""
+    WITH ranking AS (
         SELECT 
-            hospital,
+            hospital_id,
             SUM(demanda_estimada) as demanda_total,
             COUNT(*) as num_predicciones,
             AVG(confidence_score) as confidence_promedio
-        FROM predicciones_demanda
-        WHERE producto = %s
-        GROUP BY hospital
+        FROM {PREDICCIONES}
+        WHERE %(producto)s::text IS NULL
+           OR producto_id = (SELECT id FROM productos WHERE codigo = %(producto)s)
+        GROUP BY hospital_id
         ORDER BY demanda_total DESC
-        """
-        df = pd.read_sql_query(query, conn, params=(producto,))
-    else:
-        query = """
-        SELECT 
-            hospital,
-            SUM(demanda_estimada) as demanda_total,
-            COUNT(*) as num_predicciones,
-            AVG(confidence_score) as confidence_promedio
-        FROM predicciones_demanda
-        GROUP BY hospital
-        ORDER BY demanda_total DESC
-        """
-        df = pd.read_sql_query(query, conn)
+        LIMIT %(limit)s
+    )
+    SELECT h.nombre AS hospital, r.demanda_total, r.num_predicciones, r.confidence_promedio
+    FROM ranking r
+    JOIN hospitales h ON h.id = r.hospital_id
+    ORDER BY r.demanda_total DESC
+    """
+    df = pd.read_sql_query(query, conn, params={'producto': producto or None, 'limit': limit})
     
     conn.close()
     return df
 
-def get_predicciones_proximas(dias=30, producto=None):
+def get_predicciones_proximas(dias=30, producto=None, limit=None):
     """
     Obtiene predicciones para los próximos N días
     
     Args:
         dias: Número de días hacia adelante
         producto: Opcional - filtrar por producto
+        limit: Opcional - máximo de filas a retornar (None = todas)
         
     Returns:
         DataFrame con todas las predicciones en el rango de fechas
@@ -253,32 +385,38 @@ def get_predicciones_proximas(dias=30, producto=None):
     conn = get_connection()
     
     if producto:
-        query = """
+        query = f"""
         SELECT 
             hospital,
             producto,
             fecha_prediccion,
             demanda_estimada,
+            demanda_inferior,
+            demanda_superior,
             confidence_score
-        FROM predicciones_demanda
+        FROM {PREDICCIONES}
         WHERE fecha_prediccion <= CURRENT_DATE + INTERVAL '%s days'
-          AND producto = %s
+          AND producto_id = (SELECT id FROM productos WHERE codigo = %s)
         ORDER BY fecha_prediccion, hospital
+        LIMIT %s
         """
-        df = pd.read_sql_query(query, conn, params=(dias, producto))
+        df = pd.read_sql_query(query, conn, params=(dias, producto, limit))
     else:
-        query = """
+        query = f"""
         SELECT 
             hospital,
             producto,
             fecha_prediccion,
             demanda_estimada,
+            demanda_inferior,
+            demanda_superior,
             confidence_score
-        FROM predicciones_demanda
+        FROM {PREDICCIONES}
         WHERE fecha_prediccion <= CURRENT_DATE + INTERVAL '%s days'
         ORDER BY fecha_prediccion, producto, hospital
+        LIMIT %s
         """
-        df = pd.read_sql_query(query, conn, params=(dias,))
+        df = pd.read_sql_query(query, conn, params=(dias, limit))
     
     conn.close()
     return df
@@ -295,16 +433,16 @@ def get_resumen_producto(producto):
     """
     conn = get_connection()
     
-    query = """
+    query = f"""
     SELECT 
-        COUNT(DISTINCT hospital) as num_hospitales,
+        COUNT(DISTINCT hospital_id) as num_hospitales,
         SUM(demanda_estimada) as demanda_total,
         AVG(demanda_estimada) as demanda_promedio,
         MIN(fecha_prediccion) as fecha_inicio,
         MAX(fecha_prediccion) as fecha_fin,
         AVG(confidence_score) as confidence_promedio
-    FROM predicciones_demanda
-    WHERE producto = %s
+    FROM {PREDICCIONES}
+    WHERE producto_id = (SELECT id FROM productos WHERE codigo = %s)
     """
     
     df = pd.read_sql_query(query, conn, params=(producto,))
@@ -314,6 +452,44 @@ def get_resumen_producto(producto):
         return df.iloc[0].to_dict()
     return {}
 
+def get_competencia_producto(producto=None, hospital=None, meses=12):
+    """
+    Participación de mercado por fabricante en las órdenes de compra (competencia_mensual)
+
+    Args:
+        producto: Opcional - código del producto estandarizado
+        hospital: Opcional - nombre exacto del hospital
+        meses: Meses hacia atrás desde el mes actual (default: 12)
+
+    Returns:
+        DataFrame con columnas: producto, fabricante, marcas, ordenes, cantidad, monto,
+        participacion_cantidad, participacion_monto (% dentro de cada producto)
+    """
+    conn = get_connection()
+    
+    query = """
+    SELECT 
+        producto,
+        fabricante,
+        STRING_AGG(DISTINCT marca, ', ') as marcas,
+        SUM(ordenes) as ordenes,
+        SUM(cantidad) as cantidad,
+        SUM(monto) as monto,
+        ROUND(100.0 * SUM(cantidad) / NULLIF(SUM(SUM(cantidad)) OVER (PARTITION BY producto), 0), 1) as participacion_cantidad,
+        ROUND(100.0 * SUM(monto) / NULLIF(SUM(SUM(monto)) OVER (PARTITION BY producto), 0), 1) as participacion_monto
+    FROM competencia_mensual
+    WHERE mes >= date_trunc('month', CURRENT_DATE) - make_interval(months => %(meses)s)
+      AND (%(producto)s IS NULL OR producto = %(producto)s)
+      AND (%(hospital)s IS NULL OR hospital = %(hospital)s)
+    GROUP BY producto, fabricante
+    ORDER BY producto, cantidad DESC
+    """
+    
+    params = {'producto': producto, 'hospital': hospital, 'meses': meses}
+    df = pd.read_sql_query(query, conn, params=params)
+    conn.close()
+    return df
+
 if __name__ == "__main__":
     # Crear tablas
     create_tables()
@@ -0,0 +1,344 @@
+"""
+Diccionario de Descripciones
+
+ordenes_compra guarda descripcion_item como TEXT en cada fila y las mismas
+descripciones se repiten miles de veces. La tabla descripciones es la
+dimensión de textos distintos (por hash del texto normalizado) y
+ordenes_compra.descripcion_id apunta a ella:
+
+    descripciones (id, hash, texto_normalizado, producto_estandarizado,
+                   metodo_estandarizacion, estandarizado_en, marca, embedding_fila)
+
+Cada etapa de procesamiento de texto corre una vez por descripción distinta:
+
+- backfill: enlaza las órdenes sin descripcion_id (ingest.py ya enlaza las nuevas)
+- standardize: clasifica las descripciones pendientes (reglas y, con --semantic,
+  embeddings) y propaga producto_estandarizado a las órdenes que no lo tienen
+- embed: guarda la fila del cache de embeddings (semantic_standardizer.py)
+- stats: razón de deduplicación (órdenes enlazadas / descripciones)
+"""
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+import config
+from database import get_connection
+from semantic_standardizer import text_keys
+from standardizer import normalize_descriptions
+
+logger = logging.getLogger(__name__)
+
+INSERT_DESCRIPTIONS = """
+INSERT INTO descripciones (hash, texto_normalizado)
+VALUES %s
+ON CONFLICT (hash) DO NOTHING
+"""
+
+PENDING_ORDERS_QUERY = """
+SELECT id, descripcion_item
+FROM ordenes_compra
+WHERE id > %(last_id)s
+  AND descripcion_id IS NULL
+  AND descripcion_item IS NOT NULL
+ORDER BY id
+LIMIT %(limit)s
+"""
+
+# descripcion_id es derivado de descripcion_item: no mueve updated_at (no es un cambio de la orden)
+LINK_ORDERS = """
+UPDATE ordenes_compra AS o
+SET descripcion_id = v.descripcion_id
+FROM (VALUES %s) AS v(id, descripcion_id)
+WHERE o.id = v.id
+"""
+
+PENDING_DESCRIPTIONS_QUERY = """
+SELECT id, texto_normalizado
+FROM descripciones
+WHERE id > %(last_id)s
+  {pending}
+ORDER BY id
+LIMIT %(limit)s
+"""
+
+UPDATE_STANDARDIZED = """
+UPDATE descripciones AS d
+SET producto_estandarizado = v.producto,
+    metodo_estandarizacion = v.metodo,
+    estandarizado_en = CURRENT_TIMESTAMP
+FROM (VALUES %s) AS v(id, producto, metodo)
+WHERE d.id = v.id
+"""
+
+# Propagación a las órdenes del rango de descripciones recién clasificado
+PROPAGATE_STANDARDIZED = """
+UPDATE ordenes_compra AS o
+SET producto_estandarizado = d.producto_estandarizado, updated_at = CURRENT_TIMESTAMP
+FROM descripciones d
+WHERE o.descripcion_id = d.id
+  AND d.id BETWEEN %(first_id)s AND %(last_id)s
+  AND d.producto_estandarizado IS NOT NULL
+  AND {condition}
+"""
+
+UPDATE_EMBEDDINGS = """
+UPDATE descripciones AS d
+SET embedding_fila = v.fila
+FROM (VALUES %s) AS v(id, fila)
+WHERE d.id = v.id
+"""
+
+STATS_QUERY = """
+SELECT
+    (SELECT COUNT(*) FROM ordenes_compra WHERE descripcion_item IS NOT NULL) AS ordenes_con_descripcion,
+    (SELECT COUNT(*) FROM ordenes_compra WHERE descripcion_id IS NOT NULL) AS ordenes_enlazadas,
+    COUNT(*) AS descripciones,
+    COUNT(*) FILTER (WHERE estandarizado_en IS NULL) AS pendientes_estandarizar,
+    COUNT(*) FILTER (WHERE producto_estandarizado IS NOT NULL) AS estandarizadas,
+    COUNT(*) FILTER (WHERE marca IS NOT NULL) AS con_marca,
+    COUNT(*) FILTER (WHERE embedding_fila IS NOT NULL) AS con_embedding
+FROM descripciones
+"""
+
+
+def normalize_and_hash(descriptions):
+    """
+    Texto normalizado y hash (BIGINT) de cada descripción
+
+    Args:
+        descriptions: Series / lista de strings
+
+    Returns:
+        (ndarray object de textos normalizados, ndarray int64 de hashes); None / 0
+        para las descripciones que quedan vacías
+    """
+    values = descriptions if isinstance(descriptions, pd.Series) else pd.Series(descriptions, dtype=object)
+    codes, uniques = pd.factorize(values)
+    normalized = np.asarray(normalize_descriptions(np.asarray(uniques, dtype=object)).to_pylist(), dtype=object)
+    empty = np.array([not text for text in normalized], dtype=bool)
+    hashes = np.zeros(len(uniques), dtype=np.int64)
+    if (~empty).any():
+        # Mismos 64 bits que las llaves del cache de embeddings, como BIGINT con signo
+        hashes[~empty] = text_keys(list(normalized[~empty])).view(np.int64)
+    normalized[empty] = None
+    return np.append(normalized, None)[codes], np.append(hashes, 0)[codes]
+
+
+def register_descriptions(cursor, descriptions):
+    """
+    Inserta las descripciones nuevas en el diccionario y retorna sus ids
+
+    Args:
+        cursor: Cursor psycopg2 (la transacción la maneja quien llama)
+        descriptions: Series / lista de strings
+
+    Returns:
+        ndarray object de ids alineado con la entrada (None si la descripción queda vacía)
+    """
+    normalized, hashes = normalize_and_hash(descriptions)
+    present = pd.notna(normalized)
+    unique = pd.DataFrame({'hash': hashes[present], 'texto': normalized[present]}).drop_duplicates('hash')
+    if unique.empty:
+        return np.full(len(hashes), None, dtype=object)
+
+    rows = [(int(h), t) for h, t in zip(unique['hash'], unique['texto'])]
+    execute_values(cursor, INSERT_DESCRIPTIONS, rows, page_size=10000)
+    cursor.execute("SELECT hash, id FROM descripciones WHERE hash = ANY(%s)", ([h for h, _ in rows],))
+    ids = dict(cursor.fetchall())
+    return np.array([ids[int(h)] if ok else None for h, ok in zip(hashes, present)], dtype=object)
+
+
+def backfill(batch_size=None):
+    """
+    Enlaza las órdenes sin descripcion_id, por lotes de id (keyset) con un commit por lote
+
+    Returns:
+        dict con filas leídas, órdenes enlazadas y filas/s
+    """
+    batch_size = batch_size or config.STANDARDIZER_BATCH_SIZE
+    stats = {'rows': 0, 'linked': 0}
+    last_id = 0
+    t0 = time.perf_counter()
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        while True:
+            cursor.execute(PENDING_ORDERS_QUERY, {'last_id': last_id, 'limit': batch_size})
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            ids, textos = zip(*rows)
+            last_id = ids[-1]
+            descripcion_ids = register_descriptions(cursor, list(textos))
+            links = [(i, d) for i, d in zip(ids, descripcion_ids) if d is not None]
+            if links:
+                execute_values(cursor, LINK_ORDERS, links, page_size=10000)
+            conn.commit()
+
+            stats['rows'] += len(rows)
+            stats['linked'] += len(links)
+            logger.info(f"🔗 Hasta id {last_id}: {stats['linked']:,} órdenes enlazadas "
+                        f"({stats['rows'] / (time.perf_counter() - t0):,.0f} filas/s)")
+        cursor.close()
+    finally:
+        conn.close()
+
+    stats['seconds'] = time.perf_counter() - t0
+    stats['rows_per_s'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
+def standardize_pending(standardizer, batch_size=None, reprocess=False, overwrite=False):
+    """
+    Clasifica cada descripción distinta una vez y propaga el producto a sus órdenes
+
+    Args:
+        standardizer: ProductStandardizer o HybridStandardizer
+        batch_size: Descripciones por lote (default: STANDARDIZER_BATCH_SIZE)
+        reprocess: Reclasificar también las descripciones ya procesadas
+        overwrite: Reemplazar producto_estandarizado distinto en las órdenes
+            (default: solo se completan las órdenes sin producto)
+
+    Returns:
+        dict con descripciones procesadas, clasificadas y órdenes actualizadas
+    """
+    batch_size = batch_size or config.STANDARDIZER_BATCH_SIZE
+    query = PENDING_DESCRIPTIONS_QUERY.format(pending='' if reprocess else 'AND estandarizado_en IS NULL')
+    propagate = PROPAGATE_STANDARDIZED.format(
+        condition=('o.producto_estandarizado IS DISTINCT FROM d.producto_estandarizado' if overwrite
+                   else 'o.producto_estandarizado IS NULL')
+    )
+    stats = {'descriptions': 0, 'classified': 0, 'orders_updated': 0}
+    last_id = 0
+    t0 = time.perf_counter()
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        while True:
+            cursor.execute(query, {'last_id': last_id, 'limit': batch_size})
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            ids, textos = zip(*rows)
+            first_id, last_id = ids[0], ids[-1]
+            result = standardizer.classify(list(textos))
+            productos = result['producto_estandarizado'].to_numpy()
+            metodos = (result['metodo'].to_numpy() if 'metodo' in result
+                       else np.where(pd.notna(productos), 'reglas', None))
+            execute_values(cursor, UPDATE_STANDARDIZED, list(zip(ids, productos, metodos)), page_size=10000)
+            cursor.execute(propagate, {'first_id': first_id, 'last_id': last_id})
+            stats['orders_updated'] += cursor.rowcount
+            conn.commit()
+
+            stats['descriptions'] += len(rows)
+            stats['classified'] += int(pd.notna(productos).sum())
+            logger.info(f"🏷️  Hasta descripción {last_id}: {stats['classified']:,}/{stats['descriptions']:,} "
+                        f"clasificadas, {stats['orders_updated']:,} órdenes actualizadas")
+        cursor.close()
+    finally:
+        conn.close()
+
+    stats['seconds'] = time.perf_counter() - t0
+    return stats
+
+
+def embed_pending(semantic, batch_size=None):
+    """
+    Guarda en embedding_fila la fila del cache de embeddings de cada descripción sin ella
+
+    Args:
+        semantic: EmbeddingStandardizer (su cache es el que referencia embedding_fila)
+        batch_size: Descripciones por lote (default: STANDARDIZER_BATCH_SIZE)
+
+    Returns:
+        dict con descripciones procesadas y textos codificados (no estaban en cache)
+    """
+    batch_size = batch_size or config.STANDARDIZER_BATCH_SIZE
+    query = PENDING_DESCRIPTIONS_QUERY.format(pending='AND embedding_fila IS NULL')
+    misses = semantic.cache.misses
+    stats = {'descriptions': 0}
+    last_id = 0
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        while True:
+            cursor.execute(query, {'last_id': last_id, 'limit': batch_size})
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            ids, textos = zip(*rows)
+            last_id = ids[-1]
+            filas = semantic.embedding_rows(list(textos))
+            values = [(i, int(f)) for i, f in zip(ids, filas) if f >= 0]
+            if values:
+                execute_values(cursor, UPDATE_EMBEDDINGS, values, page_size=10000)
+            conn.commit()
+            stats['descriptions'] += len(rows)
+        cursor.close()
+    finally:
+        conn.close()
+
+    stats['encoded'] = semantic.cache.misses - misses
+    return stats
+
+
+def dedup_stats():
+    """
+    Estado del diccionario
+
+    Returns:
+        dict con órdenes con descripción / enlazadas, descripciones distintas,
+        razón de deduplicación (órdenes enlazadas por descripción) y pendientes
+    """
+    conn = get_connection()
+    stats = pd.read_sql_query(STATS_QUERY, conn).iloc[0].to_dict()
+    conn.close()
+    stats = {key: int(value) for key, value in stats.items()}
+    stats['dedup_ratio'] = stats['ordenes_enlazadas'] / stats['descripciones'] if stats['descripciones'] else 0.0
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Diccionario de descripciones de ordenes_compra")
+    parser.add_argument('command', choices=['backfill', 'standardize', 'embed', 'stats'])
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--semantic', action='store_true', help='standardize: embeddings para lo que las reglas no clasifican')
+    parser.add_argument('--reprocess', action='store_true', help='standardize: reclasificar también las ya procesadas')
+    parser.add_argument('--overwrite', action='store_true', help='standardize: reemplazar producto distinto en las órdenes')
+    args = parser.parse_args()
+
+    if args.command == 'backfill':
+        stats = backfill(batch_size=args.batch_size)
+        print(f"✅ {stats['linked']:,} órdenes enlazadas ({stats['rows_per_s']:,.0f} filas/s)")
+    elif args.command == 'standardize':
+        if args.semantic:
+            from semantic_standardizer import HybridStandardizer
+            standardizer = HybridStandardizer.from_db()
+        else:
+            from standardizer import ProductStandardizer
+            standardizer = ProductStandardizer.from_db()
+        stats = standardize_pending(standardizer, batch_size=args.batch_size, reprocess=args.reprocess,
+                                    overwrite=args.overwrite)
+        print(f"✅ {stats['descriptions']:,} descripciones, {stats['classified']:,} clasificadas, "
+              f"{stats['orders_updated']:,} órdenes actualizadas ({stats['seconds']:.1f}s)")
+    elif args.command == 'embed':
+        from semantic_standardizer import EmbeddingStandardizer
+        stats = embed_pending(EmbeddingStandardizer(), batch_size=args.batch_size)
+        print(f"✅ {stats['descriptions']:,} descripciones, {stats['encoded']:,} codificadas")
+
+    stats = dedup_stats()
+    print("\n📚 Diccionario de descripciones")
+    print(f"   • Órdenes enlazadas: {stats['ordenes_enlazadas']:,} de {stats['ordenes_con_descripcion']:,} con descripción")
+    print(f"   • Descripciones distintas: {stats['descripciones']:,} "
+          f"(razón de deduplicación {stats['dedup_ratio']:,.1f}x)")
+    print(f"   • Estandarizadas: {stats['estandarizadas']:,}  |  pendientes: {stats['pendientes_estandarizar']:,}  |  "
+          f"con marca: {stats['con_marca']:,}  |  con embedding: {stats['con_embedding']:,}")
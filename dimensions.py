@@ -0,0 +1,424 @@
+"""
+Dimensiones de hospitales y productos con claves sustitutas enteras
+
+ordenes_compra y predicciones_demanda guardan el hospital (VARCHAR(500)) y el
+producto (VARCHAR(200)) como texto en cada fila. Las dimensiones asignan a
+cada nombre un id entero (hospitales.id INTEGER, productos.id SMALLINT) y las
+tablas de hechos lo guardan en hospital_id / producto_id:
+
+- Los índices, GROUP BY y joins trabajan sobre 4 + 2 bytes en vez de strings
+  de decenas de caracteres.
+- Los lectores de db_utils agregan por id y recién al final unen los nombres
+  de las filas que se retornan (top-k), ver get_all_hospitales_ranking.
+
+Las columnas de texto se mantienen (los escritores y el snapshot las siguen
+usando); un trigger BEFORE INSERT/UPDATE completa los ids de cualquier
+escritor que solo entregue nombres. Los escritores masivos (ingest.py,
+train_model.py) resuelven los ids por conjunto antes de insertar y el trigger
+no hace la búsqueda fila a fila.
+
+Migración de una BD existente (idempotente, por lotes; create_tables y
+setup_database.py completan los ids pendientes sin tocar los índices, y
+dirty_series.plan_refresh se niega a planificar mientras falten):
+
+    python dimensions.py migrate [--batch-size 50000] [--keep-legacy-indexes]
+    python dimensions.py sizes
+"""
+import argparse
+import logging
+import time
+
+import pandas as pd
+from psycopg2 import sql
+
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Filas por UPDATE del backfill (cada lote se confirma por separado)
+DEFAULT_BATCH_SIZE = 50_000
+
+# Tablas de hechos: (tabla, columna de hospital, columna de producto)
+FACT_TABLES = [
+    ('ordenes_compra', 'nombre_organismo', 'producto_estandarizado'),
+    ('predicciones_demanda', 'hospital', 'producto'),
+]
+
+# Índices sobre texto reemplazados por los de ids (idx_ordenes_organismo_fecha
+# se mantiene: lo usa el recálculo de cortes de competencia_mensual)
+LEGACY_INDEXES = ['idx_ordenes_organismo', 'idx_ordenes_producto',
+                  'idx_pred_hospital', 'idx_pred_producto', 'idx_pred_serie']
+
+# Las funciones buscan antes de insertar: un INSERT ... ON CONFLICT DO NOTHING
+# consume un valor de la secuencia aunque el nombre ya exista (y productos.id
+# es SMALLINT)
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS hospitales (
+    id SERIAL PRIMARY KEY,
+    nombre VARCHAR(500) UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS productos (
+    id SMALLSERIAL PRIMARY KEY,
+    codigo VARCHAR(200) UNIQUE NOT NULL
+);
+
+ALTER TABLE ordenes_compra
+    ADD COLUMN IF NOT EXISTS hospital_id INTEGER REFERENCES hospitales(id),
+    ADD COLUMN IF NOT EXISTS producto_id SMALLINT REFERENCES productos(id);
+ALTER TABLE predicciones_demanda
+    ADD COLUMN IF NOT EXISTS hospital_id INTEGER REFERENCES hospitales(id),
+    ADD COLUMN IF NOT EXISTS producto_id SMALLINT REFERENCES productos(id);
+
+CREATE OR REPLACE FUNCTION dim_hospital_id(p_nombre TEXT) RETURNS INTEGER AS $$
+DECLARE
+    v_id INTEGER;
+BEGIN
+    IF p_nombre IS NULL THEN
+        RETURN NULL;
+    END IF;
+    SELECT id INTO v_id FROM hospitales WHERE nombre = p_nombre;
+    IF v_id IS NULL THEN
+        INSERT INTO hospitales (nombre) VALUES (p_nombre)
+        ON CONFLICT (nombre) DO NOTHING
+        RETURNING id INTO v_id;
+        IF v_id IS NULL THEN
+            SELECT id INTO v_id FROM hospitales WHERE nombre = p_nombre;
+        END IF;
+    END IF;
+    RETURN v_id;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION dim_producto_id(p_codigo TEXT) RETURNS SMALLINT AS $$
+DECLARE
+    v_id SMALLINT;
+BEGIN
+    IF p_codigo IS NULL THEN
+        RETURN NULL;
+    END IF;
+    SELECT id INTO v_id FROM productos WHERE codigo = p_codigo;
+    IF v_id IS NULL THEN
+        INSERT INTO productos (codigo) VALUES (p_codigo)
+        ON CONFLICT (codigo) DO NOTHING
+        RETURNING id INTO v_id;
+        IF v_id IS NULL THEN
+            SELECT id INTO v_id FROM productos WHERE codigo = p_codigo;
+        END IF;
+    END IF;
+    RETURN v_id;
+END
+$$ LANGUAGE plpgsql;
+
+-- Un id entregado por el escritor se respeta; se resuelve si falta o si el
+-- nombre cambió sin que cambiara el id
+CREATE OR REPLACE FUNCTION ordenes_compra_dimensiones() RETURNS trigger AS $$
+BEGIN
+    IF NEW.hospital_id IS NULL
+       OR (TG_OP = 'UPDATE' AND NEW.nombre_organismo IS DISTINCT FROM OLD.nombre_organismo
+           AND NEW.hospital_id IS NOT DISTINCT FROM OLD.hospital_id) THEN
+        NEW.hospital_id := dim_hospital_id(NEW.nombre_organismo);
+    END IF;
+    IF NEW.producto_id IS NULL
+       OR (TG_OP = 'UPDATE' AND NEW.producto_estandarizado IS DISTINCT FROM OLD.producto_estandarizado
+           AND NEW.producto_id IS NOT DISTINCT FROM OLD.producto_id) THEN
+        NEW.producto_id := dim_producto_id(NEW.producto_estandarizado);
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION predicciones_demanda_dimensiones() RETURNS trigger AS $$
+BEGIN
+    IF NEW.hospital_id IS NULL
+       OR (TG_OP = 'UPDATE' AND NEW.hospital IS DISTINCT FROM OLD.hospital
+           AND NEW.hospital_id IS NOT DISTINCT FROM OLD.hospital_id) THEN
+        NEW.hospital_id := dim_hospital_id(NEW.hospital);
+    END IF;
+    IF NEW.producto_id IS NULL
+       OR (TG_OP = 'UPDATE' AND NEW.producto IS DISTINCT FROM OLD.producto
+           AND NEW.producto_id IS NOT DISTINCT FROM OLD.producto_id) THEN
+        NEW.producto_id := dim_producto_id(NEW.producto);
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_ordenes_dimensiones ON ordenes_compra;
+CREATE TRIGGER trg_ordenes_dimensiones
+    BEFORE INSERT OR UPDATE OF nombre_organismo, producto_estandarizado ON ordenes_compra
+    FOR EACH ROW EXECUTE FUNCTION ordenes_compra_dimensiones();
+DROP TRIGGER IF EXISTS trg_predicciones_dimensiones ON predicciones_demanda;
+CREATE TRIGGER trg_predicciones_dimensiones
+    BEFORE INSERT OR UPDATE OF hospital, producto ON predicciones_demanda
+    FOR EACH ROW EXECUTE FUNCTION predicciones_demanda_dimensiones();
+
+CREATE INDEX IF NOT EXISTS idx_ordenes_hospital_id ON ordenes_compra(hospital_id);
+CREATE INDEX IF NOT EXISTS idx_ordenes_producto_id ON ordenes_compra(producto_id);
+CREATE INDEX IF NOT EXISTS idx_pred_hospital_id ON predicciones_demanda(hospital_id, fecha_prediccion);
+CREATE INDEX IF NOT EXISTS idx_pred_serie_id ON predicciones_demanda(producto_id, hospital_id, fecha_prediccion);
+"""
+
+# Nombres que faltan en las dimensiones (sin pasar por la secuencia si ya existen)
+REGISTER_QUERY = """
+WITH nuevos_hospitales AS (
+    INSERT INTO hospitales (nombre)
+    SELECT DISTINCT n FROM unnest(%(hospitales)s::text[]) AS n
+    WHERE n IS NOT NULL AND NOT EXISTS (SELECT 1 FROM hospitales h WHERE h.nombre = n)
+    ORDER BY 1
+    ON CONFLICT (nombre) DO NOTHING
+)
+INSERT INTO productos (codigo)
+SELECT DISTINCT n FROM unnest(%(productos)s::text[]) AS n
+WHERE n IS NOT NULL AND NOT EXISTS (SELECT 1 FROM productos p WHERE p.codigo = n)
+ORDER BY 1
+ON CONFLICT (codigo) DO NOTHING
+"""
+
+# Lo mismo desde una tabla (staging de ingest.py o las tablas de hechos en la migración)
+REGISTER_FROM_TABLE_QUERY = """
+WITH nuevos_hospitales AS (
+    INSERT INTO hospitales (nombre)
+    SELECT DISTINCT t.{hospital} FROM {table} t
+    WHERE t.{hospital} IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM hospitales h WHERE h.nombre = t.{hospital})
+    ORDER BY 1
+    ON CONFLICT (nombre) DO NOTHING
+)
+INSERT INTO productos (codigo)
+SELECT DISTINCT t.{producto} FROM {table} t
+WHERE t.{producto} IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM productos p WHERE p.codigo = t.{producto})
+ORDER BY 1
+ON CONFLICT (codigo) DO NOTHING
+"""
+
+LOOKUP_QUERY = """
+SELECT 'hospital' AS dimension, nombre AS valor, id FROM hospitales WHERE nombre = ANY(%(hospitales)s)
+UNION ALL
+SELECT 'producto', codigo, id FROM productos WHERE codigo = ANY(%(productos)s)
+"""
+
+# Backfill por rango de id; el UPDATE no toca las columnas de texto, así que
+# no dispara el trigger
+BACKFILL_QUERY = """
+UPDATE {table} t
+SET hospital_id = (SELECT h.id FROM hospitales h WHERE h.nombre = t.{hospital}),
+    producto_id = (SELECT p.id FROM productos p WHERE p.codigo = t.{producto})
+WHERE t.id >= %(desde)s AND t.id < %(hasta)s
+  AND ((t.hospital_id IS NULL AND t.{hospital} IS NOT NULL)
+       OR (t.producto_id IS NULL AND t.{producto} IS NOT NULL))
+"""
+
+# Filas que los lectores por id no verían (hay nombre pero no id)
+MISSING_IDS_QUERY = """
+SELECT EXISTS (
+    SELECT 1 FROM {table}
+    WHERE (hospital_id IS NULL AND {hospital} IS NOT NULL)
+       OR (producto_id IS NULL AND {producto} IS NOT NULL)
+)
+"""
+
+INDEX_SIZES_QUERY = """
+SELECT c.relname AS tabla, i.relname AS indice, pg_relation_size(i.oid) AS bytes
+FROM pg_index x
+JOIN pg_class i ON i.oid = x.indexrelid
+JOIN pg_class c ON c.oid = x.indrelid
+WHERE c.relname = ANY(%(tablas)s)
+ORDER BY c.relname, i.relname
+"""
+
+
+def register_from_table(cursor, table, hospital_column, producto_column):
+    """
+    Agrega a las dimensiones los hospitales y productos de una tabla
+
+    Args:
+        cursor: Cursor psycopg2 (la inserción queda en su transacción)
+        table: Tabla de origen (ej. 'ordenes_compra_staging')
+        hospital_column: Columna con el nombre del hospital
+        producto_column: Columna con el código de producto
+    """
+    cursor.execute(sql.SQL(REGISTER_FROM_TABLE_QUERY).format(
+        table=sql.Identifier(table),
+        hospital=sql.Identifier(hospital_column),
+        producto=sql.Identifier(producto_column),
+    ))
+
+
+def resolve_ids(cursor, hospitales, productos):
+    """
+    Ids de un conjunto de hospitales y productos, registrando los que falten
+
+    Args:
+        cursor: Cursor psycopg2 (la inserción queda en su transacción)
+        hospitales: Nombres de hospitales (se ignoran repetidos y None)
+        productos: Códigos de producto
+
+    Returns:
+        (dict hospital -> id, dict producto -> id)
+    """
+    params = {
+        'hospitales': sorted({h for h in hospitales if h is not None}),
+        'productos': sorted({p for p in productos if p is not None}),
+    }
+    cursor.execute(REGISTER_QUERY, params)
+    cursor.execute(LOOKUP_QUERY, params)
+    ids = {'hospital': {}, 'producto': {}}
+    for dimension, valor, id_ in cursor.fetchall():
+        ids[dimension][valor] = id_
+    return ids['hospital'], ids['producto']
+
+
+def tables_missing_ids():
+    """
+    Tablas de hechos con filas sin hospital_id / producto_id (BD sin migrar)
+
+    Returns:
+        Lista de tablas (vacía si todas las filas tienen ids)
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    missing = []
+    for table, hospital_column, producto_column in FACT_TABLES:
+        cursor.execute(sql.SQL(MISSING_IDS_QUERY).format(
+            table=sql.Identifier(table),
+            hospital=sql.Identifier(hospital_column),
+            producto=sql.Identifier(producto_column),
+        ))
+        if cursor.fetchone()[0]:
+            missing.append(table)
+    cursor.close()
+    conn.close()
+    return missing
+
+
+def backfill_missing_ids(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Completa los ids de una BD existente si hay filas sin ellos (sin tocar los índices)
+
+    Returns:
+        Reporte de migrate() o None si no había filas pendientes
+    """
+    missing = tables_missing_ids()
+    if not missing:
+        return None
+    logger.info(f"🔑 Filas sin ids de dimensiones en {', '.join(missing)}: completando...")
+    return migrate(batch_size, drop_legacy_indexes=False)
+
+
+def get_index_sizes(tables=None):
+    """
+    Tamaño de los índices de las tablas de hechos y dimensiones
+
+    Args:
+        tables: Tablas a reportar (default: tablas de hechos + dimensiones)
+
+    Returns:
+        DataFrame [tabla, indice, bytes]
+    """
+    tables = tables or [table for table, _, _ in FACT_TABLES] + ['hospitales', 'productos']
+    conn = get_connection()
+    df = pd.read_sql_query(INDEX_SIZES_QUERY, conn, params={'tablas': list(tables)})
+    conn.close()
+    return df
+
+
+def migrate(batch_size=DEFAULT_BATCH_SIZE, drop_legacy_indexes=True):
+    """
+    Crea las dimensiones, completa los ids de las filas existentes y
+    reemplaza los índices sobre texto
+
+    Idempotente: solo actualiza filas sin id, así que puede reanudarse si se
+    interrumpe.
+
+    Args:
+        batch_size: Filas por lote del backfill
+        drop_legacy_indexes: Eliminar los índices sobre hospital/producto en texto
+
+    Returns:
+        dict con filas actualizadas por tabla, tamaños de índices antes y
+        después (bytes) y duración
+    """
+    t0 = time.perf_counter()
+    before = get_index_sizes()
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    report = {'filas': {}}
+    try:
+        logger.info("🧱 Creando dimensiones, columnas de ids y triggers...")
+        cursor.execute(SCHEMA_SQL)
+        for table, hospital_column, producto_column in FACT_TABLES:
+            register_from_table(cursor, table, hospital_column, producto_column)
+        conn.commit()
+        cursor.execute("SELECT (SELECT COUNT(*) FROM hospitales), (SELECT COUNT(*) FROM productos)")
+        report['hospitales'], report['productos'] = cursor.fetchone()
+        logger.info(f"  ✓ {report['hospitales']:,} hospitales y {report['productos']:,} productos")
+
+        for table, hospital_column, producto_column in FACT_TABLES:
+            cursor.execute(sql.SQL("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM {}").format(
+                sql.Identifier(table)))
+            first, last = cursor.fetchone()
+            query = sql.SQL(BACKFILL_QUERY).format(
+                table=sql.Identifier(table),
+                hospital=sql.Identifier(hospital_column),
+                producto=sql.Identifier(producto_column),
+            )
+            updated = 0
+            for desde in range(first, last + 1, batch_size):
+                cursor.execute(query, {'desde': desde, 'hasta': desde + batch_size})
+                updated += cursor.rowcount
+                conn.commit()
+            report['filas'][table] = updated
+            logger.info(f"  ✓ {table}: {updated:,} filas con ids completados")
+
+        if drop_legacy_indexes:
+            for index in LEGACY_INDEXES:
+                cursor.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(index)))
+            conn.commit()
+            logger.info(f"  🗑️ Índices sobre texto eliminados: {', '.join(LEGACY_INDEXES)}")
+
+        for table in [table for table, _, _ in FACT_TABLES] + ['hospitales', 'productos']:
+            cursor.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(table)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    report['indices_antes'] = before
+    report['indices_despues'] = get_index_sizes()
+    report['total_s'] = time.perf_counter() - t0
+    return report
+
+
+def print_index_sizes(before, after=None):
+    """Imprime el tamaño de los índices en MB por tabla (y el antes/después de una migración)"""
+    frames = {'MB': before} if after is None else {'antes MB': before, 'después MB': after}
+    table = pd.concat({name: df.set_index(['tabla', 'indice'])['bytes'] / 1e6 for name, df in frames.items()}, axis=1)
+    totals = table.groupby(level='tabla').sum(min_count=1)
+    totals.index = pd.MultiIndex.from_arrays([totals.index, ['(total)'] * len(totals)], names=['tabla', 'indice'])
+    print(pd.concat([table, totals]).sort_index().round(2).to_string(na_rep='-'))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Dimensiones de hospitales y productos")
+    parser.add_argument('command', choices=['migrate', 'sizes'])
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='migrate: filas por lote')
+    parser.add_argument('--keep-legacy-indexes', action='store_true',
+                        help='migrate: no eliminar los índices sobre texto')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        report = migrate(batch_size=args.batch_size, drop_legacy_indexes=not args.keep_legacy_indexes)
+        print(f"\n✅ Migración completada en {report['total_s']:.1f}s "
+              f"({report['hospitales']:,} hospitales, {report['productos']:,} productos)")
+        for table, updated in report['filas'].items():
+            print(f"   • {table}: {updated:,} filas actualizadas")
+        print("\n📏 Índices:")
+        print_index_sizes(report['indices_antes'], report['indices_despues'])
+    else:
+        print_index_sizes(get_index_sizes())
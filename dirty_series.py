@@ -0,0 +1,315 @@
+"""
+Seguimiento de Series Modificadas para Re-forecast Incremental
+
+Cada generación de predicciones queda registrada en ejecuciones_prediccion con
+el watermark de cambios de ordenes_compra (máximo COALESCE(updated_at,
+created_at)) que alcanzó a ver. La siguiente ejecución solo recalcula las
+series hospital × producto con órdenes creadas o modificadas después de ese
+watermark, más las combinaciones nuevas de la grilla (hospitales o productos
+que no tenían predicciones); el resto de predicciones_demanda no se toca.
+
+Se hace un refresco completo cuando:
+- no hay ejecuciones anteriores o se pide explícitamente (--full-predictions)
+- el horizonte cambió (nuevo mes) o cambió la clase/backend del modelo
+- la fracción de series modificadas supera PREDICTIONS_FULL_REFRESH_FRACTION
+
+Con el modelo global los coeficientes compartidos (tendencia, estacionalidad,
+intercept) se mueven un poco con cada reentrenamiento: las series omitidas
+conservan la predicción del modelo con que se calcularon hasta el siguiente
+refresco completo (a más tardar, el cambio de mes).
+
+Las filas de ejecuciones_prediccion también sirven de registro de
+invalidación: context_cache descarta solo las entradas de los hospitales y
+productos recalculados.
+"""
+import logging
+
+import pandas as pd
+
+import config
+from database import get_connection
+from dimensions import tables_missing_ids
+from prediction_store import PREDICTIONS_SOURCE
+
+logger = logging.getLogger(__name__)
+
+# Series con órdenes creadas o modificadas en (since, until]
+DIRTY_SERIES_QUERY = """
+SELECT DISTINCT nombre_organismo AS hospital, producto_estandarizado AS producto
+FROM ordenes_compra
+WHERE COALESCE(updated_at, created_at) > %(since)s
+  AND COALESCE(updated_at, created_at) <= %(until)s
+  AND nombre_organismo IS NOT NULL
+  AND producto_estandarizado IS NOT NULL
+"""
+
+LAST_RUN_QUERY = """
+SELECT id, model_key, watermark, horizonte_desde, n_meses
+FROM ejecuciones_prediccion
+ORDER BY id DESC
+LIMIT 1
+"""
+
+INSERT_RUN_QUERY = """
+INSERT INTO ejecuciones_prediccion
+    (model_run_id, model_key, watermark, horizonte_desde, n_meses, modo, motivo,
+     series_total, series_recalculadas, series_omitidas, filas, hospitales, productos)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+RETURNING id
+"""
+
+
+def model_key(model_class, estimator='linear'):
+    """Identifica clase y backend del modelo: si cambian, todas las series cambian"""
+    return f"{model_class}:{estimator}"
+
+
+def horizon_dates(n_months, today=None):
+    """
+    Fechas del horizonte: primer día de cada uno de los próximos n_months meses
+
+    Fijar las fechas al mes (en vez de hoy + 30 días) mantiene estables las filas
+    de predicciones_demanda entre ejecuciones del mismo mes, lo que permite
+    reemplazar solo las series modificadas.
+    """
+    start = (pd.Timestamp(today or pd.Timestamp.now()).to_period('M') + 1).to_timestamp()
+    return [(start + pd.DateOffset(months=k)).to_pydatetime() for k in range(n_months)]
+
+
+def get_series_grid():
+    """
+    Hospitales y productos de la grilla de predicción (todos los de ordenes_compra)
+
+    Returns:
+        (lista de hospitales, lista de productos), ordenadas
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    # Un índice por id y una fila por nombre en las dimensiones (ver dimensions.py)
+    cursor.execute("""
+        SELECT h.nombre FROM hospitales h
+        WHERE EXISTS (SELECT 1 FROM ordenes_compra o WHERE o.hospital_id = h.id)
+        ORDER BY h.nombre
+    """)
+    hospitales = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute("""
+        SELECT p.codigo FROM productos p
+        WHERE EXISTS (SELECT 1 FROM ordenes_compra o WHERE o.producto_id = p.id)
+        ORDER BY p.codigo
+    """)
+    productos = [row[0] for row in cursor.fetchall()]
+
+    cursor.close()
+    conn.close()
+    return hospitales, productos
+
+
+def get_change_watermark():
+    """Máximo COALESCE(updated_at, created_at) de ordenes_compra (None si está vacía)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(COALESCE(updated_at, created_at)) FROM ordenes_compra")
+    watermark = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return watermark
+
+
+def get_last_prediction_run():
+    """Última ejecución registrada en ejecuciones_prediccion (dict) o None"""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(LAST_RUN_QUERY)
+        row = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return dict(zip(('id', 'model_key', 'watermark', 'horizonte_desde', 'n_meses'), row))
+
+
+def get_dirty_series(since, until):
+    """
+    Series con órdenes creadas o modificadas después de `since`
+
+    Una orden a la que se le cambió el hospital o el producto solo marca su
+    serie nueva; la anterior se corrige en el siguiente refresco completo.
+
+    Returns:
+        DataFrame [hospital, producto]
+    """
+    conn = get_connection()
+    df = pd.read_sql_query(DIRTY_SERIES_QUERY, conn, params={'since': since, 'until': until})
+    conn.close()
+    return df
+
+
+def _predicted_entities():
+    """Hospitales y productos que ya tienen predicciones (en el formato configurado)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT h.nombre FROM hospitales h
+        WHERE EXISTS (SELECT 1 FROM {PREDICTIONS_SOURCE} p WHERE p.hospital_id = h.id)
+    """)
+    hospitales = {row[0] for row in cursor.fetchall()}
+    cursor.execute(f"""
+        SELECT d.codigo FROM productos d
+        WHERE EXISTS (SELECT 1 FROM {PREDICTIONS_SOURCE} p WHERE p.producto_id = d.id)
+    """)
+    productos = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    conn.close()
+    return hospitales, productos
+
+
+def plan_refresh(key, n_months=3, full=False, today=None, watermark=None):
+    """
+    Decide qué series recalcular en esta ejecución
+
+    No necesita el modelo entrenado (solo su clase y backend), así que puede
+    calcularse mientras se entrena.
+
+    Args:
+        key: model_key() del modelo que generará las predicciones
+        n_months: Meses del horizonte
+        full: Forzar refresco completo
+        today: Fecha de referencia del horizonte (default: hoy)
+        watermark: Watermark de cambios leído antes de cargar los datos del
+            modelo (default: el actual). Así las órdenes que lleguen durante el
+            entrenamiento quedan marcadas para la próxima ejecución.
+
+    Returns:
+        dict con hospitales/productos de la grilla, fechas, watermark, mode
+        ('full' o 'incremental'), reason y series (DataFrame [hospital,
+        producto] a recalcular; None = toda la grilla)
+
+    Raises:
+        RuntimeError: Si hay órdenes o predicciones sin ids de dimensiones
+            (BD sin migrar, ver dimensions.py)
+    """
+    # La grilla y las predicciones conocidas se leen por id: filas sin ids las achicarían sin aviso
+    missing = tables_missing_ids()
+    if missing:
+        raise RuntimeError(f"Hay filas sin hospital_id/producto_id en {', '.join(missing)}: "
+                           f"ejecuta 'python dimensions.py migrate' antes de generar predicciones")
+
+    hospitales, productos = get_series_grid()
+    fechas = horizon_dates(n_months, today)
+    refresh = {
+        'hospitales': hospitales,
+        'productos': productos,
+        'fechas': fechas,
+        'watermark': get_change_watermark() if watermark is None else watermark,
+        'model_key': key,
+        'series_total': len(hospitales) * len(productos),
+        'mode': 'full',
+        'series': None,
+    }
+
+    last = None if full else get_last_prediction_run()
+    if full:
+        refresh['reason'] = 'solicitado'
+    elif last is None or last['watermark'] is None:
+        refresh['reason'] = 'sin ejecución anterior'
+    elif pd.Timestamp(last['horizonte_desde']) != pd.Timestamp(fechas[0]) or last['n_meses'] != n_months:
+        refresh['reason'] = 'horizonte nuevo'
+    elif last['model_key'] != refresh['model_key']:
+        refresh['reason'] = f"modelo distinto ({last['model_key']} → {refresh['model_key']})"
+    else:
+        dirty = get_dirty_series(last['watermark'], refresh['watermark'])
+
+        # Combinaciones nuevas de la grilla: hospitales o productos sin predicciones
+        known_h, known_p = _predicted_entities()
+        new_h = [h for h in hospitales if h not in known_h]
+        new_p = [p for p in productos if p not in known_p]
+        extra = []
+        if new_h:
+            extra.append(pd.MultiIndex.from_product([new_h, productos], names=['hospital', 'producto']).to_frame(index=False))
+        if new_p:
+            extra.append(pd.MultiIndex.from_product([hospitales, new_p], names=['hospital', 'producto']).to_frame(index=False))
+        series = pd.concat([dirty, *extra], ignore_index=True).drop_duplicates(ignore_index=True)
+
+        fraction = len(series) / refresh['series_total'] if refresh['series_total'] else 1.0
+        if fraction > config.PREDICTIONS_FULL_REFRESH_FRACTION:
+            refresh['reason'] = f"{fraction:.0%} de las series modificadas"
+        else:
+            refresh.update({'mode': 'incremental', 'series': series,
+                            'reason': f"{len(dirty)} series con órdenes nuevas, {len(new_h)} hospitales "
+                                      f"y {len(new_p)} productos nuevos"})
+
+    n_series = refresh['series_total'] if refresh['series'] is None else len(refresh['series'])
+    refresh['series_recalculadas'] = n_series
+    refresh['series_omitidas'] = refresh['series_total'] - n_series
+    logger.info(f"🧮 Re-forecast {refresh['mode']} ({refresh['reason']}): {n_series} series a recalcular, "
+                f"{refresh['series_omitidas']} omitidas")
+    return refresh
+
+
+def record_refresh(cursor, refresh, n_rows, model_run_id=None):
+    """
+    Registra la ejecución en ejecuciones_prediccion (dentro de la transacción de las predicciones)
+
+    Args:
+        cursor: Cursor de la transacción que escribió las predicciones
+        refresh: Plan de plan_refresh
+        n_rows: Filas escritas
+        model_run_id: Run del registro de modelos que generó las predicciones
+
+    Returns:
+        id de la ejecución
+    """
+    series = refresh['series']
+    cursor.execute(INSERT_RUN_QUERY, (
+        model_run_id,
+        refresh['model_key'],
+        refresh['watermark'],
+        refresh['fechas'][0] if refresh['fechas'] else None,
+        len(refresh['fechas']),
+        refresh['mode'],
+        refresh['reason'],
+        refresh['series_total'],
+        refresh['series_recalculadas'],
+        refresh['series_omitidas'],
+        n_rows,
+        None if series is None else series['hospital'].tolist(),
+        None if series is None else series['producto'].tolist(),
+    ))
+    return cursor.fetchone()[0]
+
+
+def list_prediction_runs(limit=20):
+    """Últimas ejecuciones de predicción (más reciente primero)"""
+    conn = get_connection()
+    df = pd.read_sql_query("""
+        SELECT id, created_at, modo, motivo, model_run_id, watermark,
+               series_total, series_recalculadas, series_omitidas, filas
+        FROM ejecuciones_prediccion
+        ORDER BY id DESC
+        LIMIT %s
+    """, conn, params=(limit,))
+    conn.close()
+    return df
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ejecuciones de predicción y series pendientes de recalcular")
+    parser.add_argument('command', choices=['runs', 'pending'])
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == 'runs':
+        print(list_prediction_runs(args.limit).to_string(index=False))
+    else:
+        last = get_last_prediction_run()
+        if last is None:
+            print("Sin ejecuciones registradas: la próxima será un refresco completo.")
+        else:
+            pending = get_dirty_series(last['watermark'], get_change_watermark())
+            print(f"{len(pending)} series con órdenes nuevas o modificadas desde {last['watermark']}")
+            print(pending.head(args.limit).to_string(index=False))
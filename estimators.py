@@ -0,0 +1,280 @@
+"""
+Backends de Estimación para DemandPredictor
+
+DemandPredictor construye siempre la misma matriz CSR de features
+(_prepare_features: dias, mes_sin, mes_cos, hospital y producto en one-hot) y
+delega el ajuste a un backend:
+
+- linear: mínimos cuadrados exactos desde estadísticos suficientes (default).
+- ridge: mínimos cuadrados con penalización L2 (alpha); encoge los efectos de
+  hospitales y productos con pocas órdenes hacia el promedio.
+- hgb: HistGradientBoostingRegressor multihilo (OpenMP) sobre features
+  compactas: tendencia, estacionalidad y target encoding suavizado de
+  hospital, producto y serie. Captura interacciones (ej. estacionalidad propia
+  de cada serie) que el modelo lineal aditivo no puede.
+
+linear y ridge se resuelven desde estadísticos suficientes: admiten update()
+incremental y el cubo de predicciones en forma cerrada. hgb no es aditivo ni
+incremental: forecast_cube evalúa la grilla fila por fila y update() requiere
+reentrenar.
+
+Para agregar un backend basta una subclase de EstimatorBackend registrada en
+ESTIMATORS.
+"""
+import json
+
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingRegressor
+from threadpoolctl import threadpool_limits
+
+# Umbral relativo de autovalores (matriz escalada) considerados nulos al resolver
+# las ecuaciones normales: el one-hot de hospital y de producto es colineal con el intercept
+EIGEN_RCOND = 1e-10
+
+# Valores por fila en la matriz CSR de DemandPredictor._prepare_features
+ROW_NNZ = 5
+
+
+def solve_normal_equations(stats, alpha=0.0):
+    """
+    Resuelve mínimos cuadrados con intercept a partir de estadísticos suficientes
+
+    Centra las ecuaciones normales igual que LinearRegression/Ridge (el intercept
+    no se penaliza). Sin penalización retorna la solución de norma mínima, es
+    decir, el mismo resultado que un ajuste completo sobre todos los datos
+    acumulados; se escala por la diagonal antes de descomponer para que
+    categorías raras no se confundan con el espacio nulo. Con alpha > 0 el
+    sistema es definido positivo y se resuelve directo.
+
+    Args:
+        stats: dict con n, sum_x, xtx, sum_y, xty (ver DemandPredictor._compute_stats)
+        alpha: Penalización L2 sobre los coeficientes
+
+    Returns:
+        (coef, intercept)
+    """
+    n = stats['n']
+    mean_x = stats['sum_x'] / n
+    mean_y = stats['sum_y'] / n
+
+    A = stats['xtx'] - n * np.outer(mean_x, mean_x)
+    b = stats['xty'] - n * mean_x * mean_y
+
+    if alpha > 0:
+        A = A + alpha * np.eye(len(A))
+        coef = np.linalg.solve(A, b)
+        return coef, float(mean_y - mean_x @ coef)
+
+    scale = np.sqrt(np.clip(np.diag(A), 0, None))
+    scale[scale == 0] = 1.0
+    eigvals, eigvecs = np.linalg.eigh(A / np.outer(scale, scale))
+    keep = eigvals > EIGEN_RCOND * max(eigvals.max(), 0.0)
+
+    V = eigvecs[:, keep]
+    coef = (V @ ((V.T @ (b / scale)) / eigvals[keep])) / scale
+
+    # Proyectar fuera del espacio nulo (en coordenadas originales) -> norma mínima
+    null_basis = eigvecs[:, ~keep] / scale[:, None]
+    if null_basis.shape[1]:
+        Q, _ = np.linalg.qr(null_basis)
+        coef -= Q @ (Q.T @ coef)
+
+    return coef, float(mean_y - mean_x @ coef)
+
+
+def split_features(X):
+    """
+    Separa la matriz CSR de _prepare_features en sus partes
+
+    Returns:
+        (numericas (n, 3), columna de hospital, columna de producto); -1 = desconocido
+    """
+    n = X.shape[0]
+    if X.nnz != ROW_NNZ * n:
+        raise ValueError("La matriz no tiene el formato de DemandPredictor._prepare_features.")
+    data = X.data.reshape(n, ROW_NNZ)
+    cols = X.indices.reshape(n, ROW_NNZ).astype(np.int64)
+    hosp = np.where(data[:, 3] != 0, cols[:, 3], -1)
+    prod = np.where(data[:, 4] != 0, cols[:, 4], -1)
+    return data[:, :3], hosp, prod
+
+
+class EstimatorBackend:
+    """
+    Interfaz de un backend de estimación
+
+    Un backend con sufficient_stats=True implementa solve(stats) y el predictor
+    guarda coeficientes (modelo lineal aditivo). Los demás implementan
+    fit(X, y) y retornan un modelo con predict(X) sobre la misma matriz CSR.
+    """
+
+    name = None
+    sufficient_stats = False
+    DEFAULTS = {}
+
+    def __init__(self, **params):
+        unknown = set(params) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError(f"Parámetros desconocidos para el backend '{self.name}': {sorted(unknown)}")
+        self.params = {**self.DEFAULTS, **params}
+
+    def solve(self, stats):
+        """(coef, intercept) desde estadísticos suficientes"""
+        raise NotImplementedError
+
+    def fit(self, X, y):
+        """Modelo ajustado con predict(X)"""
+        raise NotImplementedError
+
+
+class LinearBackend(EstimatorBackend):
+    """Mínimos cuadrados ordinarios (solución de norma mínima)"""
+
+    name = 'linear'
+    sufficient_stats = True
+
+    def solve(self, stats):
+        return solve_normal_equations(stats)
+
+
+class RidgeBackend(EstimatorBackend):
+    """Mínimos cuadrados con penalización L2"""
+
+    name = 'ridge'
+    sufficient_stats = True
+    DEFAULTS = {'alpha': 1.0}
+
+    def solve(self, stats):
+        return solve_normal_equations(stats, alpha=float(self.params['alpha']))
+
+
+class TargetEncodedGBM:
+    """
+    HistGradientBoostingRegressor sobre features compactas de la matriz CSR
+
+    Features: dias, mes_sin, mes_cos y el promedio de demanda (suavizado hacia
+    el global con `smoothing` observaciones virtuales) del hospital, del
+    producto y de la serie. Las categorías no vistas quedan como NaN, que el
+    gradient boosting trata como valor faltante.
+    """
+
+    def __init__(self, smoothing=5.0, n_threads=None, **hgb_params):
+        self.smoothing = smoothing
+        self.n_threads = n_threads
+        self.hgb_params = hgb_params
+        self.column_means = None
+        self.series_keys = None
+        self.series_means = None
+        self.n_columns = None
+        self.model = None
+
+    def _smoothed(self, sums, counts, global_mean):
+        return (sums + self.smoothing * global_mean) / (counts + self.smoothing)
+
+    def _series_keys(self, hosp, prod):
+        known = (hosp >= 0) & (prod >= 0)
+        return np.where(known, hosp * self.n_columns + prod, -1)
+
+    def _compact(self, X):
+        """Matriz densa (n, 6) de features compactas"""
+        numeric, hosp, prod = split_features(X)
+        features = np.full((len(hosp), 6), np.nan)
+        features[:, :3] = numeric
+        features[hosp >= 0, 3] = self.column_means[hosp[hosp >= 0]]
+        features[prod >= 0, 4] = self.column_means[prod[prod >= 0]]
+
+        keys = self._series_keys(hosp, prod)
+        pos = np.minimum(np.searchsorted(self.series_keys, keys), max(len(self.series_keys) - 1, 0))
+        found = (keys >= 0) & (len(self.series_keys) > 0)
+        found[found] = self.series_keys[pos[found]] == keys[found]
+        features[found, 5] = self.series_means[pos[found]]
+        return features
+
+    def fit(self, X, y):
+        _, hosp, prod = split_features(X)
+        self.n_columns = X.shape[1]
+        global_mean = float(y.mean()) if len(y) else 0.0
+
+        # Hospitales y productos ocupan columnas distintas: un solo arreglo por columna
+        sums = np.zeros(self.n_columns)
+        counts = np.zeros(self.n_columns)
+        for cols in (hosp, prod):
+            known = cols >= 0
+            sums += np.bincount(cols[known], weights=y[known], minlength=self.n_columns)
+            counts += np.bincount(cols[known], minlength=self.n_columns)
+        self.column_means = np.where(counts > 0, self._smoothed(sums, counts, global_mean), np.nan)
+
+        keys = self._series_keys(hosp, prod)
+        known = keys >= 0
+        self.series_keys, inverse = np.unique(keys[known], return_inverse=True)
+        self.series_means = self._smoothed(
+            np.bincount(inverse, weights=y[known], minlength=len(self.series_keys)),
+            np.bincount(inverse, minlength=len(self.series_keys)),
+            global_mean
+        )
+
+        self.model = HistGradientBoostingRegressor(**self.hgb_params)
+        with threadpool_limits(limits=self.n_threads, user_api='openmp'):
+            self.model.fit(self._compact(X), y)
+        return self
+
+    def predict(self, X):
+        with threadpool_limits(limits=self.n_threads, user_api='openmp'):
+            return self.model.predict(self._compact(X))
+
+
+class HistGradientBoostingBackend(EstimatorBackend):
+    """Gradient boosting por histogramas, multihilo (n_threads; None = todos los cores)"""
+
+    name = 'hgb'
+    DEFAULTS = {
+        'max_iter': 300,
+        'learning_rate': 0.1,
+        'max_leaf_nodes': 63,
+        'min_samples_leaf': 20,
+        'l2_regularization': 0.0,
+        'smoothing': 5.0,
+        'n_threads': None,
+        'random_state': 42,
+    }
+
+    def fit(self, X, y):
+        return TargetEncodedGBM(**self.params).fit(X, y)
+
+
+ESTIMATORS = {cls.name: cls for cls in (LinearBackend, RidgeBackend, HistGradientBoostingBackend)}
+
+
+def get_estimator(name='linear', **params):
+    """
+    Crea un backend por nombre
+
+    Args:
+        name: 'linear', 'ridge' o 'hgb'
+        **params: Parámetros del backend (ej. alpha para ridge, n_threads para hgb)
+
+    Returns:
+        EstimatorBackend
+    """
+    if name not in ESTIMATORS:
+        raise ValueError(f"Backend desconocido: {name!r} (opciones: {', '.join(ESTIMATORS)})")
+    return ESTIMATORS[name](**params)
+
+
+def parse_estimator_params(pairs):
+    """
+    Convierte argumentos CLI 'clave=valor' en parámetros de backend
+
+    Los valores se interpretan como JSON cuando es posible (números, null, true),
+    si no quedan como texto: ['alpha=10', 'n_threads=8'] -> {'alpha': 10, 'n_threads': 8}
+    """
+    params = {}
+    for pair in pairs or []:
+        key, sep, value = pair.partition('=')
+        if not sep or not key:
+            raise ValueError(f"Parámetro inválido {pair!r}: se espera clave=valor")
+        try:
+            params[key] = json.loads(value)
+        except json.JSONDecodeError:
+            params[key] = value
+    return params
@@ -0,0 +1,797 @@
+"""
+Ingesta Masiva de Órdenes de Compra de ChileCompra
+
+Carga exportaciones CSV, JSON / JSON Lines o ZIP (con archivos de esos
+formatos) en ordenes_compra con memoria constante:
+
+1. Lectura en streaming: los CSV y JSON Lines se cortan en bloques de
+   INGEST_CHUNK_MB en un límite de fila (sin cortar campos entre comillas);
+   los JSON (arreglo u objeto {"Listado": [...]} de la API) se decodifican
+   orden por orden
+2. Parseo y validación en un pool de procesos: cada bloque se parsea con
+   pandas, se mapean los encabezados de ChileCompra (Codigo, IDItem,
+   FechaEnvio, OrganismoPublico, EspecificacionComprador, ...) a las columnas
+   de ordenes_compra y se validan fechas, cantidades y largos; el worker
+   entrega el bloque listo para COPY y las filas rechazadas con su motivo
+3. Carga: COPY de cada bloque a una tabla de staging temporal mientras los
+   workers procesan los siguientes (a lo más 2 bloques en vuelo por worker)
+4. Un único upsert set-based desde staging: DISTINCT ON (orden_id) se queda con
+   la última aparición en la entrada, y las órdenes existentes solo se
+   actualizan (y solo cambia su updated_at) si algún campo cambió, para no
+   marcar series como modificadas sin motivo (ver dirty_series.py)
+
+Las columnas que el archivo no trae (ej. producto_estandarizado) quedan en
+NULL en las órdenes nuevas y no pisan el valor de las existentes. Con un
+ProductStandardizer (default en la CLI) los workers completan
+producto_estandarizado desde descripcion_item (ver standardizer.py). Las
+descripciones nuevas entran al diccionario descripciones y cada orden queda
+enlazada por descripcion_id (ver descriptions.py) con la marca detectada; los
+cortes hospital × mes que toca la carga se recalculan en competencia_mensual
+(ver brands.py) y el commit avisa a los workers de la app (change_feed.py).
+Los hospitales y productos nuevos entran a las dimensiones y las órdenes
+quedan con hospital_id / producto_id (ver dimensions.py).
+"""
+import csv
+import io
+import json
+import logging
+import re
+import time
+import unicodedata
+import zipfile
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from psycopg2 import sql
+
+import config
+from database import get_connection
+from brands import CREATE_AFFECTED, BrandExtractor, publish_slices, refresh_slices
+from descriptions import normalize_and_hash
+from dimensions import register_from_table
+
+logger = logging.getLogger(__name__)
+
+# Estandarizador del proceso worker (lo fija _init_worker)
+_STANDARDIZER = None
+
+# Descripciones ya procesadas por el worker: descripcion_item -> (normalizada, hash, producto, marca, fabricante)
+_DESCRIPTIONS = {}
+_BRANDS = None
+
+COLUMNS = ['orden_id', 'fecha_orden', 'nombre_organismo', 'descripcion_item',
+           'producto_estandarizado', 'cantidad', 'unidad_medida', 'monto_total']
+
+# Encabezados aceptados por columna (normalizados: minúsculas, sin tildes ni
+# separadores), en orden de preferencia. 'linea' identifica el ítem dentro de
+# la orden: orden_id = <codigo>-<linea>, una fila de ordenes_compra por ítem.
+HEADER_ALIASES = {
+    'orden_id': ['ordenid', 'codigo', 'codigooc', 'codigoorden'],
+    'linea': ['iditem', 'correlativo', 'codigoitem', 'item'],
+    'fecha_orden': ['fechaorden', 'fechaenvio', 'fechacreacion', 'fecha'],
+    'nombre_organismo': ['nombreorganismo', 'organismopublico', 'organismo', 'unidadcompra'],
+    'descripcion_item': ['descripcionitem', 'especificacioncomprador', 'nombreproductogenerico', 'descripcion'],
+    'producto_estandarizado': ['productoestandarizado'],
+    'cantidad': ['cantidad'],
+    'unidad_medida': ['unidadmedida', 'unidad'],
+    'monto_total': ['montototal', 'totallineaneto', 'total'],
+}
+
+# Largos máximos de las columnas VARCHAR de ordenes_compra
+MAX_LENGTHS = {'orden_id': 100, 'nombre_organismo': 500, 'producto_estandarizado': 200, 'unidad_medida': 50}
+
+MAX_CANTIDAD = 2 ** 31 - 1
+MAX_MONTO = 1e13  # DECIMAL(15,2)
+
+# Texto normalizado, hash y marca de descripcion_item para el diccionario de descripciones (ver descriptions.py)
+STAGING_COLUMNS = ['lote', 'fila'] + COLUMNS + ['descripcion_hash', 'descripcion_normalizada', 'marca', 'fabricante']
+
+# Archivo de rechazados: columnas de la entrada ya mapeadas + motivo
+REJECT_COLUMNS = list(HEADER_ALIASES) + ['motivo']
+
+CREATE_STAGING = """
+CREATE TEMP TABLE ordenes_compra_staging (
+    lote INTEGER,
+    fila INTEGER,
+    orden_id TEXT,
+    fecha_orden DATE,
+    nombre_organismo TEXT,
+    descripcion_item TEXT,
+    producto_estandarizado TEXT,
+    cantidad INTEGER,
+    unidad_medida TEXT,
+    monto_total NUMERIC(15, 2),
+    descripcion_hash BIGINT,
+    descripcion_normalizada TEXT,
+    marca TEXT,
+    fabricante TEXT
+) ON COMMIT DROP
+"""
+
+COPY_STAGING = f"COPY ordenes_compra_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+
+# Última aparición de cada orden_id; solo se tocan las órdenes que cambiaron.
+# Los ids de hospital y producto salen de las dimensiones (los nombres del
+# archivo se registran antes, ver dimensions.register_from_table)
+UPSERT_QUERY = """
+WITH fuente AS (
+    SELECT DISTINCT ON (orden_id)
+           orden_id, fecha_orden, nombre_organismo, descripcion_item,
+           producto_estandarizado, cantidad, unidad_medida, monto_total
+    FROM ordenes_compra_staging
+    ORDER BY orden_id, lote DESC, fila DESC
+), upsert AS (
+    INSERT INTO {table} AS o
+        (orden_id, fecha_orden, nombre_organismo, descripcion_item,
+         producto_estandarizado, cantidad, unidad_medida, monto_total,
+         hospital_id, producto_id)
+    SELECT f.*, h.id, p.id
+    FROM fuente f
+    LEFT JOIN hospitales h ON h.nombre = f.nombre_organismo
+    LEFT JOIN productos p ON p.codigo = f.producto_estandarizado
+    ON CONFLICT (orden_id) DO UPDATE SET
+        fecha_orden = EXCLUDED.fecha_orden,
+        nombre_organismo = EXCLUDED.nombre_organismo,
+        hospital_id = EXCLUDED.hospital_id,
+        descripcion_item = COALESCE(EXCLUDED.descripcion_item, o.descripcion_item),
+        producto_estandarizado = COALESCE(EXCLUDED.producto_estandarizado, o.producto_estandarizado),
+        producto_id = COALESCE(EXCLUDED.producto_id, o.producto_id),
+        cantidad = EXCLUDED.cantidad,
+        unidad_medida = COALESCE(EXCLUDED.unidad_medida, o.unidad_medida),
+        monto_total = COALESCE(EXCLUDED.monto_total, o.monto_total),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE (o.fecha_orden, o.nombre_organismo, o.descripcion_item, o.producto_estandarizado,
+           o.cantidad, o.unidad_medida, o.monto_total)
+          IS DISTINCT FROM
+          (EXCLUDED.fecha_orden, EXCLUDED.nombre_organismo,
+           COALESCE(EXCLUDED.descripcion_item, o.descripcion_item),
+           COALESCE(EXCLUDED.producto_estandarizado, o.producto_estandarizado),
+           EXCLUDED.cantidad,
+           COALESCE(EXCLUDED.unidad_medida, o.unidad_medida),
+           COALESCE(EXCLUDED.monto_total, o.monto_total))
+    RETURNING (xmax = 0) AS insertada
+)
+SELECT COUNT(*) FILTER (WHERE insertada), COUNT(*) FILTER (WHERE NOT insertada) FROM upsert
+"""
+
+# Descripciones nuevas al diccionario y descripcion_id de las órdenes del archivo
+# (de la última aparición de cada orden_id, la misma que dejó el upsert). La
+# inserción se formatea con la tabla de staging (también la usa tenders.py).
+INSERT_DESCRIPTIONS_QUERY = """
+INSERT INTO descripciones (hash, texto_normalizado, marca, fabricante, marca_detectada_en)
+SELECT DISTINCT ON (descripcion_hash) descripcion_hash, descripcion_normalizada, marca, fabricante, CURRENT_TIMESTAMP
+FROM {staging}
+WHERE descripcion_hash IS NOT NULL
+ORDER BY descripcion_hash
+ON CONFLICT (hash) DO NOTHING
+"""
+
+LINK_DESCRIPTIONS_QUERY = """
+WITH fuente AS (
+    SELECT DISTINCT ON (orden_id) orden_id, descripcion_hash
+    FROM ordenes_compra_staging
+    ORDER BY orden_id, lote DESC, fila DESC
+)
+UPDATE {table} AS o
+SET descripcion_id = d.id
+FROM fuente f
+JOIN descripciones d ON d.hash = f.descripcion_hash
+WHERE o.orden_id = f.orden_id
+  AND o.descripcion_id IS DISTINCT FROM d.id
+"""
+
+# Cortes hospital × mes de competencia_mensual que toca la carga: los valores
+# anteriores de las órdenes existentes (antes del upsert) y los nuevos
+OLD_SLICES_QUERY = """
+INSERT INTO competencia_cortes (hospital, mes)
+SELECT DISTINCT o.nombre_organismo, date_trunc('month', o.fecha_orden)::date
+FROM ordenes_compra o
+JOIN ordenes_compra_staging s ON s.orden_id = o.orden_id
+WHERE o.nombre_organismo IS NOT NULL AND o.fecha_orden IS NOT NULL
+ON CONFLICT DO NOTHING
+"""
+
+NEW_SLICES_QUERY = """
+INSERT INTO competencia_cortes (hospital, mes)
+SELECT DISTINCT nombre_organismo, date_trunc('month', fecha_orden)::date
+FROM ordenes_compra_staging
+ON CONFLICT DO NOTHING
+"""
+
+# Órdenes de la API por bloque JSON enviado a los workers
+JSON_BATCH = 5000
+
+_JSON_SKIP = re.compile(r'[\s,]*')
+
+
+def _normalize_header(name):
+    name = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+def map_headers(headers):
+    """
+    Encabezados del archivo -> columnas de ordenes_compra
+
+    Returns:
+        dict columna -> encabezado original (solo las columnas encontradas)
+
+    Raises:
+        ValueError: si faltan orden_id, fecha_orden, nombre_organismo o cantidad
+    """
+    normalized = {}
+    for header in headers:
+        normalized.setdefault(_normalize_header(header), header)
+    mapping = {}
+    for column, aliases in HEADER_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                mapping[column] = normalized[alias]
+                break
+    missing = [c for c in ('orden_id', 'fecha_orden', 'nombre_organismo', 'cantidad') if c not in mapping]
+    if missing:
+        raise ValueError(f"Columnas requeridas no encontradas: {missing} (encabezados: {list(headers)[:20]})")
+    return mapping
+
+
+# --------------------------------------------------------------------- validación (workers)
+
+def _parse_dates(values):
+    """Fechas ISO (con o sin hora) y, para el resto, formato chileno día-mes-año"""
+    dates = pd.to_datetime(values, format='ISO8601', errors='coerce')
+    retry = dates.isna() & (values != '')
+    if retry.any():
+        dates[retry] = pd.to_datetime(values[retry], format='mixed', dayfirst=True, errors='coerce')
+    return dates
+
+
+def _parse_numbers(values):
+    """Números con punto o coma decimal ('' -> NaN)"""
+    return pd.to_numeric(values.str.replace(',', '.', regex=False), errors='coerce')
+
+
+def validate_frame(raw, lote):
+    """
+    Valida y normaliza un bloque de filas
+
+    Args:
+        raw: DataFrame de strings con las columnas de HEADER_ALIASES presentes
+        lote: Número del bloque (orden de la entrada, para quedarse con la última aparición)
+
+    Returns:
+        (DataFrame válido con STAGING_COLUMNS, DataFrame rechazado con columna 'motivo')
+    """
+    n = len(raw)
+    text = {c: (raw[c].fillna('').astype(str).str.strip() if c in raw else pd.Series('', index=raw.index))
+            for c in HEADER_ALIASES}
+
+    orden_id = text['orden_id']
+    linea = text['linea']
+    orden_id = orden_id.where((linea == '') | (orden_id == ''), orden_id + '-' + linea)
+    fechas = _parse_dates(text['fecha_orden'])
+    cantidad = _parse_numbers(text['cantidad'])
+    monto = _parse_numbers(text['monto_total'])
+
+    too_long = np.zeros(n, dtype=bool)
+    for column, limit in MAX_LENGTHS.items():
+        values = orden_id if column == 'orden_id' else text[column]
+        too_long |= (values.str.len() > limit).to_numpy()
+
+    # Primer motivo de rechazo de cada fila
+    checks = [
+        (orden_id == '').to_numpy(), 'orden_id vacío',
+        (text['nombre_organismo'] == '').to_numpy(), 'organismo vacío',
+        fechas.isna().to_numpy(), 'fecha inválida',
+        (cantidad.isna() | (cantidad <= 0) | (cantidad > MAX_CANTIDAD)).to_numpy(), 'cantidad inválida',
+        ((text['monto_total'] != '') & (monto.isna() | (monto.abs() >= MAX_MONTO))).to_numpy(), 'monto inválido',
+        too_long, 'texto demasiado largo',
+    ]
+    conditions, reasons = checks[0::2], checks[1::2]
+    motivo = np.select(conditions, reasons, default='')
+    ok = motivo == ''
+
+    def optional(values):
+        values = values[ok]
+        return values.mask(values == '')
+
+    valid = pd.DataFrame({
+        'lote': lote,
+        'fila': np.flatnonzero(ok),
+        'orden_id': orden_id[ok],
+        'fecha_orden': fechas[ok].dt.strftime('%Y-%m-%d'),
+        'nombre_organismo': text['nombre_organismo'][ok],
+        'descripcion_item': optional(text['descripcion_item']),
+        'producto_estandarizado': optional(text['producto_estandarizado']),
+        'cantidad': cantidad[ok].round().astype('int64'),
+        'unidad_medida': optional(text['unidad_medida']),
+        'monto_total': monto[ok].round(2),
+    })
+    rejected = raw[~ok].reindex(columns=REJECT_COLUMNS[:-1])
+    rejected['motivo'] = motivo[~ok]
+    return valid, rejected
+
+
+def _to_copy_csv(frame):
+    """CSV para COPY ... (FORMAT csv): NULL como campo vacío sin comillas (escritor de Arrow, ~10x to_csv)"""
+    if frame.empty:
+        return b''
+    sink = io.BytesIO()
+    pacsv.write_csv(pa.Table.from_pandas(frame, preserve_index=False), sink,
+                    pacsv.WriteOptions(include_header=False))
+    return sink.getvalue()
+
+
+def _init_worker(standardizer):
+    """Initializer del pool: el estandarizador se recibe una vez por proceso, no por bloque"""
+    global _STANDARDIZER
+    _STANDARDIZER = standardizer
+
+
+def _describe(descriptions):
+    """
+    Texto normalizado, hash, producto estandarizado, marca y fabricante de cada descripción
+
+    Las descripciones se repiten entre bloques: el worker solo normaliza y
+    clasifica las que no ha visto (hasta INGEST_DESCRIPTION_CACHE distintas).
+
+    Returns:
+        (normalizadas, hashes, productos, marcas, fabricantes): ndarrays object
+        alineados (None si vacía)
+    """
+    global _BRANDS
+    if _BRANDS is None:
+        _BRANDS = BrandExtractor()
+    codes, uniques = pd.factorize(descriptions)
+    if len(_DESCRIPTIONS) + len(uniques) > config.INGEST_DESCRIPTION_CACHE:
+        _DESCRIPTIONS.clear()
+    new = [text for text in uniques if text not in _DESCRIPTIONS]
+    if new:
+        normalized, hashes = normalize_and_hash(new)
+        hashes = np.where(pd.notna(normalized), hashes.astype(object), None)
+        productos = (_STANDARDIZER.standardize(new).to_numpy() if _STANDARDIZER is not None
+                     else [None] * len(new))
+        brands = _BRANDS.extract(new)
+        _DESCRIPTIONS.update(zip(new, zip(normalized, hashes, productos, brands['marca'], brands['fabricante'])))
+    columns = [np.array(list(column) + [None], dtype=object)
+               for column in zip(*([_DESCRIPTIONS[text] for text in uniques] or [(None,) * 5]))]
+    return tuple(column[codes] for column in columns)
+
+
+def _finish_chunk(raw, lote, extra_rejected=0):
+    """Valida el bloque y lo serializa para COPY (se ejecuta en el worker)"""
+    valid, rejected = validate_frame(raw, lote)
+    rows_valid = len(valid)
+    # Duplicados dentro del bloque: se queda la última aparición (entre bloques lo resuelve el upsert)
+    valid = valid.drop_duplicates('orden_id', keep='last')
+    normalized, hashes, productos, marcas, fabricantes = _describe(valid['descripcion_item'])
+    missing = valid['producto_estandarizado'].isna().to_numpy()
+    fill = missing & pd.notna(productos)
+    valid['producto_estandarizado'] = np.where(fill, productos, valid['producto_estandarizado'].to_numpy(dtype=object))
+    valid['descripcion_hash'] = pd.Series(hashes, index=valid.index, dtype='Int64')
+    valid['descripcion_normalizada'] = pd.Series(normalized, index=valid.index, dtype=object)
+    valid['marca'] = pd.Series(marcas, index=valid.index, dtype=object)
+    valid['fabricante'] = pd.Series(fabricantes, index=valid.index, dtype=object)
+    reasons = Counter(rejected['motivo'])
+    if extra_rejected:
+        reasons['fila malformada'] += extra_rejected
+    return {
+        'lote': lote,
+        'rows': len(raw) + extra_rejected,
+        'valid': rows_valid,
+        'duplicates': rows_valid - len(valid),
+        'standardized': int(fill.sum()),
+        'unclassified': int(missing.sum() - fill.sum()) if _STANDARDIZER is not None else 0,
+        'rejected': dict(reasons),
+        'payload': _to_copy_csv(valid),
+        'rejects': rejected.to_csv(index=False, header=False).encode('utf-8') if len(rejected) else b'',
+    }
+
+
+def process_csv_chunk(chunk, lote, names, mapping, encoding, delimiter):
+    """
+    Parsea y valida un bloque de bytes CSV (sin encabezado)
+
+    Args:
+        chunk: Bytes de filas completas
+        lote: Número del bloque
+        names: Encabezados del archivo
+        mapping: map_headers(names)
+        encoding: Codificación del archivo
+        delimiter: Separador
+    """
+    malformed = 0
+
+    def skip_row(row):
+        nonlocal malformed
+        malformed += 1
+        return 'skip'
+
+    def read(file_encoding):
+        # Lector CSV de Arrow: multihilo deshabilitado (el paralelismo es el pool), saltos de
+        # línea dentro de comillas y filas con otra cantidad de campos contadas como malformadas
+        return pacsv.read_csv(
+            io.BytesIO(chunk),
+            read_options=pacsv.ReadOptions(column_names=names, encoding=file_encoding, use_threads=False),
+            parse_options=pacsv.ParseOptions(delimiter=delimiter, newlines_in_values=True, invalid_row_handler=skip_row),
+            convert_options=pacsv.ConvertOptions(column_types={name: pa.string() for name in names},
+                                                 include_columns=list(mapping.values()), strings_can_be_null=False),
+        ).to_pandas()
+
+    try:
+        raw = read(encoding)
+    except (pa.ArrowInvalid, UnicodeDecodeError):
+        # Exportaciones que mezclan codificaciones: el bloque se lee como latin-1
+        malformed = 0
+        raw = read('latin-1')
+    raw = raw.rename(columns={header: column for column, header in mapping.items()})
+    return _finish_chunk(raw, lote, malformed)
+
+
+def _flatten_order(order):
+    """Una orden de la API (con Items.Listado) -> filas por ítem; un registro plano queda igual"""
+    items = order.get('Items')
+    if not isinstance(items, dict) or 'Listado' not in items:
+        yield order
+        return
+    fechas = order.get('Fechas') or {}
+    comprador = order.get('Comprador') or {}
+    for item in items['Listado']:
+        yield {
+            'Codigo': order.get('Codigo'),
+            'Correlativo': item.get('Correlativo'),
+            'FechaEnvio': fechas.get('FechaEnvio') or fechas.get('FechaCreacion'),
+            'NombreOrganismo': comprador.get('NombreOrganismo'),
+            'EspecificacionComprador': item.get('EspecificacionComprador') or item.get('Producto'),
+            'Cantidad': item.get('Cantidad'),
+            'Unidad': item.get('Unidad'),
+            'Total': item.get('Total'),
+        }
+
+
+def process_records(records, lote):
+    """
+    Valida un bloque de registros JSON (órdenes de la API o filas planas)
+
+    Args:
+        records: Lista de dicts, o de strings JSON (una línea de JSON Lines cada uno)
+        lote: Número del bloque
+    """
+    rows, malformed = [], 0
+    for record in records:
+        if isinstance(record, (str, bytes)):
+            try:
+                record = json.loads(record)
+            except ValueError:
+                malformed += 1
+                continue
+        if not isinstance(record, dict):
+            malformed += 1
+            continue
+        rows.extend(_flatten_order(record))
+    if not rows:
+        return _finish_chunk(pd.DataFrame(columns=list(HEADER_ALIASES)), lote, malformed)
+
+    headers = list(dict.fromkeys(key for row in rows[:100] for key in row))
+    mapping = map_headers(headers)
+    raw = pd.DataFrame.from_records(rows, columns=list(mapping.values()))
+    raw = raw.rename(columns={header: column for column, header in mapping.items()})
+    raw = raw.astype(object).where(raw.notna(), '').astype(str)
+    return _finish_chunk(raw, lote, malformed)
+
+
+# --------------------------------------------------------------------- lectura (proceso principal)
+
+def _open_sources(path):
+    """(nombre, stream binario) de un archivo o de cada CSV/JSON dentro de un ZIP"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                if member.is_dir() or not member.filename.lower().endswith(('.csv', '.txt', '.json', '.jsonl', '.ndjson')):
+                    continue
+                with archive.open(member) as stream:
+                    yield f"{path}:{member.filename}", stream
+    else:
+        with open(path, 'rb') as stream:
+            yield path, stream
+
+
+def _detect_encoding(sample):
+    try:
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # Un carácter multibyte cortado al final de la muestra no cuenta
+        if e.start >= len(sample) - 3:
+            return 'utf-8'
+        return 'latin-1'
+
+
+def iter_row_blocks(stream, chunk_bytes):
+    """
+    Bloques de bytes que terminan en un fin de fila real
+
+    Un salto de línea dentro de un campo entre comillas no corta el bloque: la
+    cantidad de comillas antes del corte debe ser par (las comillas escapadas
+    "" no cambian la paridad).
+    """
+    carry = b''
+    while True:
+        block = stream.read(chunk_bytes)
+        if not block:
+            if carry.strip():
+                yield carry
+            return
+        buf = carry + block
+        cut = buf.rfind(b'\n')
+        while cut >= 0 and buf.count(b'"', 0, cut) % 2:
+            cut = buf.rfind(b'\n', 0, cut)
+        if cut < 0:
+            carry = buf
+            continue
+        yield buf[:cut + 1]
+        carry = buf[cut + 1:]
+
+
+def _iter_json_items(text, chunk_chars):
+    """
+    Elementos de un arreglo JSON (o del arreglo 'Listado' de la API) sin cargar el archivo
+
+    Args:
+        text: Stream de texto
+        chunk_chars: Caracteres leídos por vez
+    """
+    decoder = json.JSONDecoder()
+    buf = text.read(chunk_chars)
+    while True:
+        if buf.lstrip().startswith('['):
+            pos = buf.index('[') + 1
+            break
+        key = buf.find('"Listado"')
+        if key >= 0 and '[' in buf[key:]:
+            pos = buf.index('[', key) + 1
+            break
+        more = text.read(chunk_chars)
+        if not more:
+            raise ValueError("No se encontró un arreglo JSON ni la clave 'Listado'")
+        buf += more
+
+    while True:
+        pos = _JSON_SKIP.match(buf, pos).end()
+        if pos >= len(buf):
+            more = text.read(chunk_chars)
+            if not more:
+                raise ValueError("JSON truncado")
+            buf, pos = buf[pos:] + more, 0
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            more = text.read(chunk_chars)
+            if not more:
+                raise
+            buf, pos = buf[pos:] + more, 0
+            continue
+        yield item
+        pos = end
+        if pos > chunk_chars:
+            buf, pos = buf[pos:], 0
+
+
+def iter_tasks(paths, chunk_bytes, encoding=None, delimiter=None):
+    """
+    Tareas de parseo para el pool, una por bloque
+
+    Args:
+        paths: Archivos CSV / JSON / JSON Lines / ZIP
+        chunk_bytes: Tamaño de bloque
+        encoding: Codificación de los CSV (default: utf-8 si el primer bloque lo es, si no latin-1)
+        delimiter: Separador CSV (default: el más frecuente del encabezado entre ; , y tab)
+
+    Yields:
+        (función del worker, datos del bloque, argumentos después del número de lote)
+    """
+    for path in paths:
+        for name, stream in _open_sources(path):
+            lower = name.lower()
+            if lower.endswith(('.jsonl', '.ndjson')):
+                for block in iter_row_blocks(stream, chunk_bytes):
+                    yield process_records, block.splitlines(), ()
+            elif lower.endswith('.json'):
+                text = io.TextIOWrapper(stream, encoding=encoding or 'utf-8-sig')
+                batch = []
+                for item in _iter_json_items(text, chunk_bytes):
+                    batch.append(item)
+                    if len(batch) >= JSON_BATCH:
+                        yield process_records, batch, ()
+                        batch = []
+                if batch:
+                    yield process_records, batch, ()
+                text.detach()
+            else:
+                header_line = stream.readline()
+                blocks = iter_row_blocks(stream, chunk_bytes)
+                first = next(blocks, b'')
+                file_encoding = encoding or _detect_encoding(header_line + first)
+                header_text = header_line.decode(file_encoding).lstrip('\ufeff').rstrip('\r\n')
+                sep = delimiter or max([';', ',', '\t'], key=header_text.count)
+                names = next(csv.reader([header_text], delimiter=sep))
+                mapping = map_headers(names)
+                logger.info(f"📄 {name}: {file_encoding}, separador {sep!r}, columnas {mapping}")
+                extra = (names, mapping, file_encoding, sep)
+                if first:
+                    yield process_csv_chunk, first, extra
+                for block in blocks:
+                    yield process_csv_chunk, block, extra
+
+
+# --------------------------------------------------------------------- carga
+
+def ingest_files(paths, workers=None, chunk_mb=None, dry_run=False, rejects_path=None,
+                 encoding=None, delimiter=None, table='ordenes_compra', standardizer=None):
+    """
+    Ingesta archivos de órdenes de compra
+
+    Args:
+        paths: Archivos CSV / JSON / JSON Lines / ZIP
+        workers: Procesos de parseo y validación (default: INGEST_WORKERS)
+        chunk_mb: MB por bloque (default: INGEST_CHUNK_MB)
+        dry_run: Solo parsear y validar, sin tocar la BD
+        rejects_path: CSV donde escribir las filas rechazadas con su motivo
+        encoding: Codificación de los archivos (default: detección por archivo)
+        delimiter: Separador CSV (default: detección por archivo)
+        table: Tabla destino (con restricción UNIQUE en orden_id)
+        standardizer: ProductStandardizer para completar producto_estandarizado
+            (None: se deja como viene en el archivo)
+
+    Returns:
+        dict con filas leídas, válidas, rechazadas (por motivo), duplicadas,
+        estandarizadas / sin clasificar, insertadas, actualizadas, sin cambios y tiempos / filas por segundo
+    """
+    workers = workers or config.INGEST_WORKERS
+    chunk_bytes = int((chunk_mb or config.INGEST_CHUNK_MB) * 1024 * 1024)
+    report = {'files': list(paths), 'rows': 0, 'valid': 0, 'rejected': 0, 'rejected_by_reason': Counter(),
+              'duplicates': 0, 'standardized': 0, 'unclassified': 0, 'staged': 0, 'bytes_copied': 0, 'chunks': 0}
+    t0 = time.perf_counter()
+
+    conn = cursor = None
+    if not dry_run:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(CREATE_STAGING)
+    rejects = None
+    if rejects_path:
+        rejects = open(rejects_path, 'wb')
+        rejects.write((','.join(REJECT_COLUMNS) + '\n').encode('utf-8'))
+
+    def collect(result):
+        report['chunks'] += 1
+        report['rows'] += result['rows']
+        report['valid'] += result['valid']
+        report['duplicates'] += result['duplicates']
+        report['standardized'] += result['standardized']
+        report['unclassified'] += result['unclassified']
+        report['rejected_by_reason'].update(result['rejected'])
+        if rejects is not None and result['rejects']:
+            rejects.write(result['rejects'])
+        if cursor is not None and result['payload']:
+            cursor.copy_expert(COPY_STAGING, io.BytesIO(result['payload']))
+            report['staged'] += result['valid'] - result['duplicates']
+            report['bytes_copied'] += len(result['payload'])
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(standardizer,)) as pool:
+            in_flight = set()
+            for lote, (fn, data, extra) in enumerate(iter_tasks(paths, chunk_bytes, encoding, delimiter)):
+                in_flight.add(pool.submit(fn, data, lote, *extra))
+                # Memoria constante: a lo más 2 bloques en vuelo por worker
+                while len(in_flight) >= 2 * workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future.result())
+            for future in in_flight:
+                collect(future.result())
+        report['parse_s'] = time.perf_counter() - t0
+
+        if cursor is not None:
+            t1 = time.perf_counter()
+            cursor.execute("ANALYZE ordenes_compra_staging")
+            cursor.execute("SELECT COUNT(DISTINCT orden_id) FROM ordenes_compra_staging")
+            distinct = cursor.fetchone()[0]
+            report['duplicates'] += report['staged'] - distinct
+            # competencia_mensual agrega ordenes_compra: las tablas de prueba no la tocan
+            maintain_competition = table == 'ordenes_compra'
+            if maintain_competition:
+                cursor.execute(CREATE_AFFECTED)
+                cursor.execute(OLD_SLICES_QUERY)
+            register_from_table(cursor, 'ordenes_compra_staging', 'nombre_organismo', 'producto_estandarizado')
+            cursor.execute(sql.SQL(UPSERT_QUERY).format(table=sql.Identifier(table)))
+            report['inserted'], report['updated'] = cursor.fetchone()
+            report['unchanged'] = distinct - report['inserted'] - report['updated']
+            cursor.execute(sql.SQL(INSERT_DESCRIPTIONS_QUERY).format(staging=sql.Identifier('ordenes_compra_staging')))
+            report['descriptions_new'] = cursor.rowcount
+            cursor.execute(sql.SQL(LINK_DESCRIPTIONS_QUERY).format(table=sql.Identifier(table)))
+            report['descriptions_linked'] = cursor.rowcount
+            if maintain_competition:
+                cursor.execute(NEW_SLICES_QUERY)
+                report['competition_slices'] = refresh_slices(cursor)
+                publish_slices(cursor, 'ingest')
+            conn.commit()
+            report['upsert_s'] = time.perf_counter() - t1
+    except Exception:
+        if conn is not None:
+            conn.rollback()
+        raise
+    finally:
+        if rejects is not None:
+            rejects.close()
+        if cursor is not None:
+            cursor.close()
+            conn.close()
+
+    report['rejected'] = sum(report['rejected_by_reason'].values())
+    report['rejected_by_reason'] = dict(report['rejected_by_reason'])
+    report['total_s'] = time.perf_counter() - t0
+    report['rows_per_s'] = report['rows'] / report['total_s'] if report['total_s'] else 0.0
+    report['parse_rows_per_s'] = report['rows'] / report['parse_s'] if report['parse_s'] else 0.0
+    return report
+
+
+def print_report(report):
+    """Resumen de la ingesta"""
+    print("\n" + "=" * 80)
+    print("  INGESTA DE ÓRDENES DE COMPRA")
+    print("=" * 80)
+    print(f"   • Filas leídas: {report['rows']:,} en {report['chunks']} bloques")
+    print(f"   • Válidas: {report['valid']:,}  |  Rechazadas: {report['rejected']:,}  |  "
+          f"Duplicadas (orden_id): {report['duplicates']:,}")
+    for reason, count in sorted(report['rejected_by_reason'].items(), key=lambda kv: -kv[1]):
+        print(f"       {reason:<24} {count:>12,}")
+    if report['standardized'] or report['unclassified']:
+        print(f"   • Producto estandarizado: {report['standardized']:,} clasificadas, "
+              f"{report['unclassified']:,} sin clasificar")
+    if 'inserted' in report:
+        print(f"   • Upsert: {report['inserted']:,} insertadas, {report['updated']:,} actualizadas, "
+              f"{report['unchanged']:,} sin cambios ({report['upsert_s']:.1f}s)")
+        print(f"   • Descripciones: {report['descriptions_new']:,} nuevas en el diccionario, "
+              f"{report['descriptions_linked']:,} órdenes enlazadas")
+        if 'competition_slices' in report:
+            print(f"   • Competencia: {report['competition_slices']:,} cortes hospital × mes recalculados")
+        print(f"   • COPY a staging: {report['staged']:,} filas, {report['bytes_copied'] / 1e6:,.0f} MB")
+    print(f"   • Parseo + validación{' + COPY' if 'inserted' in report else ''}: {report['parse_s']:.1f}s "
+          f"({report['parse_rows_per_s']:,.0f} filas/s)")
+    print(f"   • Total: {report['total_s']:.1f}s ({report['rows_per_s']:,.0f} filas/s)\n")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Ingesta masiva de órdenes de compra de ChileCompra (CSV, JSON, ZIP)")
+    parser.add_argument('paths', nargs='+', help='Archivos .csv, .json, .jsonl o .zip')
+    parser.add_argument('--workers', type=int, default=None, help='Procesos de parseo (default: INGEST_WORKERS)')
+    parser.add_argument('--chunk-mb', type=float, default=None, help='MB por bloque (default: INGEST_CHUNK_MB)')
+    parser.add_argument('--encoding', default=None, help='Codificación (default: utf-8 o latin-1 según el archivo)')
+    parser.add_argument('--delimiter', default=None, help='Separador CSV (default: detectado del encabezado)')
+    parser.add_argument('--rejects', metavar='CSV', help='Escribe las filas rechazadas con su motivo')
+    parser.add_argument('--dry-run', action='store_true', help='Solo parsear y validar, sin escribir en la BD')
+    parser.add_argument('--table', default='ordenes_compra', help='Tabla destino (default: ordenes_compra)')
+    parser.add_argument('--no-standardize', action='store_true',
+                        help='No completar producto_estandarizado con el catálogo (default: se completa salvo en --dry-run)')
+    args = parser.parse_args()
+
+    standardizer = None
+    if not args.dry_run and not args.no_standardize:
+        from standardizer import ProductStandardizer
+        standardizer = ProductStandardizer.from_db()
+
+    print_report(ingest_files(
+        args.paths, workers=args.workers, chunk_mb=args.chunk_mb, dry_run=args.dry_run,
+        rejects_path=args.rejects, encoding=args.encoding, delimiter=args.delimiter, table=args.table,
+        standardizer=standardizer
+    ))
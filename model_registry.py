@@ -0,0 +1,408 @@
+"""
+Registro de Modelos Versionados
+
+Cada entrenamiento se guarda como un artefacto compacto en su propio directorio
+(models/registry/<run_id>/):
+
+    manifest.json        metadatos: clase, vocabularios, métricas, watermark, arrays
+    coef.npy, ...        arrays NumPy sin comprimir (memory-mappable)
+
+Cargar un modelo es leer un JSON pequeño y abrir los .npy con mmap_mode='r':
+no se deserializan objetos de sklearn y los workers del servidor comparten las
+mismas páginas del page cache del sistema operativo.
+
+El archivo LATEST apunta al run vigente. Opcionalmente el registro se sincroniza
+con un object store (GCS o un directorio local que lo simula, ver MODEL_STORE_URI).
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+import logging
+
+import config
+from predictor import DemandPredictor
+from series_predictor import SeriesDemandPredictor
+
+logger = logging.getLogger(__name__)
+
+# Versión del formato de artefacto (cambia si cambia el layout)
+ARTIFACT_FORMAT = 1
+
+MANIFEST_FILE = 'manifest.json'
+LATEST_FILE = 'LATEST'
+
+# Clases que se pueden reconstruir desde un artefacto
+MODEL_CLASSES = {cls.__name__: cls for cls in (DemandPredictor, SeriesDemandPredictor)}
+
+
+def _json_default(value):
+    """Serializa escalares NumPy y fechas en el manifest"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"No serializable: {type(value).__name__}")
+
+
+def _write_atomic(path, content):
+    """Escribe un archivo de texto completo o nada (write + rename)"""
+    tmp = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+    with open(tmp, 'w') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def _file_size(directory, spec):
+    """Tamaño en bytes del archivo de un array del manifest"""
+    return os.path.getsize(os.path.join(directory, spec['file']))
+
+
+def save_artifact(predictor, directory, run_id=None, include_stats=True):
+    """
+    Escribe un predictor como artefacto (manifest JSON + arrays .npy)
+
+    Args:
+        predictor: DemandPredictor o SeriesDemandPredictor entrenado
+        directory: Directorio destino (se crea)
+        run_id: Identificador del run (se guarda en el manifest)
+        include_stats: Incluir estadísticos suficientes (para update())
+
+    Returns:
+        dict con el manifest
+    """
+    meta, arrays = predictor.export_artifact(include_stats=include_stats)
+    os.makedirs(directory, exist_ok=True)
+
+    files = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(directory, f'{name}.npy'), array, allow_pickle=False)
+        files[name] = {'file': f'{name}.npy', 'dtype': str(array.dtype), 'shape': list(array.shape)}
+
+    manifest = {
+        'format': ARTIFACT_FORMAT,
+        'run_id': run_id,
+        'model_class': type(predictor).__name__,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'arrays': files,
+        **meta
+    }
+    _write_atomic(os.path.join(directory, MANIFEST_FILE),
+                  json.dumps(manifest, ensure_ascii=False, indent=1, default=_json_default))
+    return manifest
+
+
+def load_artifact(directory, mmap=True):
+    """
+    Reconstruye un predictor desde un artefacto
+
+    Args:
+        directory: Directorio del artefacto
+        mmap: Abrir los arrays con memory mapping (solo lectura, páginas compartidas)
+
+    Returns:
+        Predictor entrenado (la clase indicada en el manifest)
+    """
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != ARTIFACT_FORMAT:
+        raise ValueError(f"Formato de artefacto no soportado: {manifest.get('format')}")
+
+    arrays = {
+        name: np.load(os.path.join(directory, spec['file']), mmap_mode='r' if mmap else None, allow_pickle=False)
+        for name, spec in manifest['arrays'].items()
+    }
+    predictor = MODEL_CLASSES[manifest['model_class']].from_artifact(manifest, arrays)
+    predictor.run_id = manifest.get('run_id')
+    return predictor
+
+
+class LocalObjectStore:
+    """Object store sobre un directorio local (stand-in de GCS para desarrollo y pruebas)"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def __repr__(self):
+        return f"LocalObjectStore({self.root!r})"
+
+    def upload(self, local_path, key):
+        dest = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.tmp-{uuid.uuid4().hex[:8]}"
+        shutil.copyfile(local_path, tmp)
+        os.replace(tmp, dest)
+
+    def download(self, key, local_path):
+        shutil.copyfile(os.path.join(self.root, key), local_path)
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.root, key))
+
+    def read_text(self, key):
+        path = os.path.join(self.root, key)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read()
+
+    def write_text(self, key, content):
+        dest = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        _write_atomic(dest, content)
+
+
+class GCSObjectStore:
+    """Object store sobre un bucket de Google Cloud Storage"""
+
+    def __init__(self, bucket_name, prefix=''):
+        from google.cloud import storage
+
+        self.bucket = storage.Client().bucket(bucket_name)
+        self.prefix = prefix.strip('/')
+
+    def __repr__(self):
+        return f"GCSObjectStore(gs://{self.bucket.name}/{self.prefix})"
+
+    def _blob(self, key):
+        return self.bucket.blob(f"{self.prefix}/{key}" if self.prefix else key)
+
+    def upload(self, local_path, key):
+        self._blob(key).upload_from_filename(local_path)
+
+    def download(self, key, local_path):
+        self._blob(key).download_to_filename(local_path)
+
+    def exists(self, key):
+        return self._blob(key).exists()
+
+    def read_text(self, key):
+        blob = self._blob(key)
+        return blob.download_as_text() if blob.exists() else None
+
+    def write_text(self, key, content):
+        self._blob(key).upload_from_string(content)
+
+
+def get_object_store(uri=None):
+    """
+    Crea el object store configurado en MODEL_STORE_URI
+
+    Returns:
+        LocalObjectStore, GCSObjectStore o None si no hay sincronización
+    """
+    uri = config.MODEL_STORE_URI if uri is None else uri
+    if not uri:
+        return None
+    if uri == 'gcs':
+        return GCSObjectStore(config.GCS_BUCKET_NAME, 'models/registry')
+    if uri.startswith('gs://'):
+        bucket, _, prefix = uri[len('gs://'):].partition('/')
+        return GCSObjectStore(bucket, prefix)
+    return LocalObjectStore(uri)
+
+
+class ModelRegistry:
+    """
+    Registro local de modelos versionados con sincronización opcional
+
+    Uso:
+        registry = ModelRegistry()
+        run_id = registry.register(predictor)
+        predictor = registry.load()          # último run, arrays memory-mapped
+        registry.push(run_id)                # sube al object store (si hay)
+    """
+
+    def __init__(self, root=None, store='config'):
+        """
+        Args:
+            root: Directorio del registro (por defecto MODEL_REGISTRY_DIR)
+            store: Object store para sincronizar; 'config' = según MODEL_STORE_URI, None = sin sync
+        """
+        self.root = root or config.MODEL_REGISTRY_DIR
+        self.store = get_object_store() if store == 'config' else store
+        os.makedirs(self.root, exist_ok=True)
+
+    def run_dir(self, run_id):
+        return os.path.join(self.root, run_id)
+
+    def register(self, predictor, include_stats=True, promote=True):
+        """
+        Guarda un predictor como nuevo run versionado
+
+        El artefacto se escribe en un directorio temporal y se renombra al
+        final, así un lector nunca ve un run a medio escribir.
+
+        Args:
+            predictor: Predictor entrenado
+            include_stats: Incluir estadísticos suficientes (para update())
+            promote: Apuntar LATEST al nuevo run
+
+        Returns:
+            run_id
+        """
+        run_id = f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+        tmp_dir = os.path.join(self.root, f'.tmp-{run_id}')
+        manifest = save_artifact(predictor, tmp_dir, run_id=run_id, include_stats=include_stats)
+        os.rename(tmp_dir, self.run_dir(run_id))
+        predictor.run_id = run_id
+
+        size_mb = sum(_file_size(self.run_dir(run_id), spec) for spec in manifest['arrays'].values()) / 1e6
+        logger.info(f"📦 Modelo registrado: {run_id} ({manifest['model_class']}, {size_mb:.1f} MB)")
+
+        if promote:
+            self.promote(run_id)
+        return run_id
+
+    def promote(self, run_id):
+        """Marca un run como vigente (LATEST)"""
+        if not os.path.exists(os.path.join(self.run_dir(run_id), MANIFEST_FILE)):
+            raise FileNotFoundError(f"No existe el run {run_id} en {self.root}")
+        _write_atomic(os.path.join(self.root, LATEST_FILE), run_id)
+
+    def latest_run_id(self):
+        """run_id vigente o None"""
+        path = os.path.join(self.root, LATEST_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read().strip() or None
+
+    def get_manifest(self, run_id):
+        with open(os.path.join(self.run_dir(run_id), MANIFEST_FILE)) as f:
+            return json.load(f)
+
+    def list_runs(self):
+        """
+        Lista los runs registrados (más reciente primero)
+
+        Returns:
+            Lista de dicts con run_id, model_class, created_at, watermark, data_version y metrics
+        """
+        runs = []
+        for name in os.listdir(self.root):
+            if name.startswith('.') or not os.path.exists(os.path.join(self.run_dir(name), MANIFEST_FILE)):
+                continue
+            manifest = self.get_manifest(name)
+            runs.append({key: manifest.get(key) for key in
+                         ('run_id', 'model_class', 'created_at', 'watermark', 'data_version', 'metrics')})
+        return sorted(runs, key=lambda r: r['run_id'], reverse=True)
+
+    def load(self, run_id=None, mmap=True):
+        """
+        Carga un run (por defecto LATEST)
+
+        Args:
+            run_id: Run a cargar
+            mmap: Arrays memory-mapped de solo lectura (False para modificarlos, ej. update())
+
+        Returns:
+            Predictor entrenado
+        """
+        run_id = run_id or self.latest_run_id()
+        if run_id is None:
+            raise FileNotFoundError(f"No hay modelos registrados en {self.root}")
+
+        t0 = time.perf_counter()
+        predictor = load_artifact(self.run_dir(run_id), mmap=mmap)
+        logger.info(f"✅ Modelo {run_id} cargado en {(time.perf_counter() - t0) * 1000:.1f} ms")
+        return predictor
+
+    def push(self, run_id=None):
+        """
+        Sube un run al object store y apunta su LATEST a ese run
+
+        Los arrays se suben antes que el manifest y el manifest antes que LATEST,
+        así otro nodo nunca ve un run incompleto. El LATEST del store se escribe
+        para el run entregado sin compararlo con el LATEST local (un pull() de
+        otro proceso puede moverlo entre register() y push()).
+
+        Args:
+            run_id: Run a publicar (default: LATEST local)
+        """
+        if self.store is None:
+            return False
+        run_id = run_id or self.latest_run_id()
+        manifest = self.get_manifest(run_id)
+
+        for spec in manifest['arrays'].values():
+            self.store.upload(os.path.join(self.run_dir(run_id), spec['file']), f"{run_id}/{spec['file']}")
+        self.store.upload(os.path.join(self.run_dir(run_id), MANIFEST_FILE), f"{run_id}/{MANIFEST_FILE}")
+        self.store.write_text(LATEST_FILE, run_id)
+
+        logger.info(f"☁️  Run {run_id} sincronizado con {self.store!r}")
+        return True
+
+    def pull(self, run_id=None):
+        """
+        Descarga un run del object store (por defecto su LATEST) si no está local
+
+        Sin run_id, un LATEST local más nuevo que el del store (registrado y aún
+        no subido) se conserva: los run_id empiezan con la fecha y se ordenan
+        cronológicamente.
+
+        Returns:
+            run_id vigente (descargado/presente), o None si el store no tiene modelos
+        """
+        if self.store is None:
+            return self.latest_run_id()
+        if run_id is None:
+            run_id = (self.store.read_text(LATEST_FILE) or '').strip() or None
+            if run_id is None:
+                return None
+            local = self.latest_run_id()
+            if local is not None and local > run_id:
+                return local
+
+        if not os.path.exists(os.path.join(self.run_dir(run_id), MANIFEST_FILE)):
+            tmp_dir = os.path.join(self.root, f'.tmp-{run_id}-{uuid.uuid4().hex[:6]}')
+            os.makedirs(tmp_dir)
+            self.store.download(f"{run_id}/{MANIFEST_FILE}", os.path.join(tmp_dir, MANIFEST_FILE))
+            with open(os.path.join(tmp_dir, MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+            for spec in manifest['arrays'].values():
+                self.store.download(f"{run_id}/{spec['file']}", os.path.join(tmp_dir, spec['file']))
+            try:
+                os.rename(tmp_dir, self.run_dir(run_id))
+            except OSError:
+                # Otro proceso (ej. otro worker) descargó el mismo run primero
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                if not os.path.exists(os.path.join(self.run_dir(run_id), MANIFEST_FILE)):
+                    raise
+            else:
+                logger.info(f"⬇️  Run {run_id} descargado desde {self.store!r}")
+
+        if self.latest_run_id() != run_id:
+            self.promote(run_id)
+        return run_id
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Registro de modelos de demanda")
+    parser.add_argument('command', choices=['list', 'push', 'pull', 'promote'])
+    parser.add_argument('run_id', nargs='?')
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    if args.command == 'list':
+        latest = registry.latest_run_id()
+        for run in registry.list_runs():
+            metrics = run['metrics'] or {}
+            r2 = metrics.get('backtest_r2', metrics.get('test_r2'))
+            print(f"{'*' if run['run_id'] == latest else ' '} {run['run_id']}  {run['model_class']:<22} "
+                  f"watermark={run['watermark']}  datos={run['data_version'] or 'bd'}  R²={r2 if r2 is None else round(r2, 3)}")
+    elif args.command == 'push':
+        registry.push(args.run_id)
+    elif args.command == 'pull':
+        print(registry.pull(args.run_id))
+    elif args.command == 'promote':
+        registry.promote(args.run_id)
+        # Con object store el LATEST del store también cambia (si no, el próximo pull lo revierte)
+        registry.push(args.run_id)
@@ -0,0 +1,350 @@
+"""
+Servicio de Modelo en Caliente para la App Web
+
+Mantiene en memoria el predictor vigente del registro (model_registry) y lo
+reemplaza sin reiniciar el servidor cuando aparece un run nuevo:
+
+- Un hilo daemon por proceso revisa LATEST cada MODEL_POLL_SECONDS (con jitter)
+  y, si cambió, descarga y carga el nuevo run en segundo plano.
+- El cambio es un único reemplazo de referencia (_state): cada request toma el
+  estado una vez y lo usa completo, así nunca mezcla dos versiones y ningún
+  request espera a que termine una carga.
+- Si la carga falla se conserva el modelo anterior y se reintenta en el
+  siguiente ciclo.
+
+Con Gunicorn cada worker tiene su propio hilo (se inicia de forma perezosa
+según el PID, también con --preload), y todos leen el mismo LATEST, por lo
+que convergen al mismo run en a lo más un intervalo de polling. Con el canal
+de cambios conectado (change_feed.py) la recarga la dispara el evento
+model_published y el polling se espacia a CHANGE_FEED_FALLBACK_SECONDS.
+/health reporta el run activo de cada worker.
+
+MicroBatcher responde /api/forecast: una consulta sola va directo al camino
+escalar del predictor; si llegan varias a la vez, se juntan durante unos
+milisegundos y se evalúan en una sola llamada vectorizada (forecast_points).
+"""
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import logging
+
+import config
+from change_feed import fallback_interval
+from model_registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+# Columnas de la respuesta de forecast_points, en orden
+FORECAST_COLUMNS = ['demanda_estimada', 'demanda_inferior', 'demanda_superior', 'confidence_score']
+
+# Fracción del intervalo usada como jitter, para que los workers no consulten el store a la vez
+POLL_JITTER = 0.2
+
+ModelState = namedtuple('ModelState', ['predictor', 'run_id', 'loaded_at', 'load_ms'])
+
+
+class ModelHolder:
+    """Predictor vigente del registro con recarga en caliente"""
+
+    def __init__(self, registry=None, poll_seconds=None, hot_reload=None):
+        """
+        Args:
+            registry: ModelRegistry a usar (por defecto el de config)
+            poll_seconds: Intervalo de revisión de LATEST (default: MODEL_POLL_SECONDS)
+            hot_reload: Iniciar el hilo de recarga (default: MODEL_HOT_RELOAD)
+        """
+        self._registry = registry
+        self.poll_seconds = config.MODEL_POLL_SECONDS if poll_seconds is None else poll_seconds
+        self.hot_reload = config.MODEL_HOT_RELOAD if hot_reload is None else hot_reload
+
+        self._state = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.swaps = 0
+        self.last_check = None
+        self.last_error = None
+
+    @property
+    def registry(self):
+        if self._registry is None:
+            self._registry = ModelRegistry()
+        return self._registry
+
+    def ensure_started(self):
+        """
+        Carga el modelo inicial e inicia el hilo de recarga en este proceso
+
+        Es idempotente y seguro tras un fork: si el PID cambió (worker de
+        Gunicorn creado desde un master con --preload) se vuelve a iniciar.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # Los locks heredados del master podrían quedar tomados tras el fork
+            self._load_lock = threading.Lock()
+            self._stop = threading.Event()
+
+            try:
+                self.refresh()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"❌ No se pudo cargar el modelo inicial: {e}")
+            # Se marca al final: los requests concurrentes esperan la carga inicial en el lock
+            self._pid = os.getpid()
+
+            if self.hot_reload and self.poll_seconds > 0:
+                self._thread = threading.Thread(target=self._poll_loop, name='model-reloader', daemon=True)
+                self._thread.start()
+                logger.info(f"🔄 Recarga de modelo activa (pid {self._pid}, cada {self.poll_seconds:.0f}s)")
+
+    def refresh(self):
+        """
+        Revisa LATEST y carga el run si cambió
+
+        Returns:
+            True si se cambió el modelo activo
+        """
+        with self._load_lock:
+            self.last_check = datetime.now()
+            run_id = self.registry.pull()
+            state = self._state
+            if run_id is None or (state is not None and state.run_id == run_id):
+                return False
+
+            t0 = time.perf_counter()
+            predictor = self.registry.load(run_id, mmap=True)
+            load_ms = (time.perf_counter() - t0) * 1000
+
+            # Reemplazo atómico: los requests en curso terminan con el modelo anterior
+            self._state = ModelState(predictor, run_id, datetime.now(), load_ms)
+            self.last_error = None
+            if state is not None:
+                self.swaps += 1
+                logger.info(f"🔁 Modelo actualizado: {state.run_id} → {run_id} (pid {os.getpid()})")
+            return True
+
+    def _safe_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # Se mantiene el modelo anterior; se reintenta en el siguiente ciclo
+            self.last_error = str(e)
+            logger.warning(f"⚠️  Error recargando modelo (se mantiene {self.run_id}): {e}")
+
+    def _poll_loop(self):
+        """Ciclo del hilo de recarga"""
+        while True:
+            interval = fallback_interval(self.poll_seconds)
+            if self._stop.wait(interval * (1 + random.uniform(-POLL_JITTER, POLL_JITTER))):
+                return
+            self._safe_refresh()
+
+    def refresh_in_background(self):
+        """Revisa LATEST en un hilo aparte (evento del canal de cambios: la carga no bloquea al listener)"""
+        if self._pid != os.getpid():
+            return
+        threading.Thread(target=self._safe_refresh, name='model-reloader-event', daemon=True).start()
+
+    def stop(self):
+        """Detiene el hilo de recarga"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def current(self):
+        """Estado vigente (predictor, run_id, ...) o None si no hay modelo registrado"""
+        self.ensure_started()
+        return self._state
+
+    @property
+    def predictor(self):
+        state = self.current()
+        return state.predictor if state else None
+
+    @property
+    def run_id(self):
+        state = self._state
+        return state.run_id if state else None
+
+    def status(self):
+        """Resumen para /health"""
+        state = self.current()
+        status = {
+            'loaded': state is not None,
+            'run_id': None,
+            'pid': os.getpid(),
+            'hot_reload': self.hot_reload,
+            'swaps': self.swaps,
+            'last_check': self.last_check.isoformat() if self.last_check else None,
+            'last_error': self.last_error,
+        }
+        if state is not None:
+            predictor = state.predictor
+            status.update({
+                'run_id': state.run_id,
+                'model_class': type(predictor).__name__,
+                'watermark': str(predictor.watermark) if predictor.watermark is not None else None,
+                'loaded_at': state.loaded_at.isoformat(),
+                'load_ms': round(state.load_ms, 1),
+            })
+        return status
+
+
+class _PendingForecast:
+    """Consulta encolada en el MicroBatcher (una o varias filas)"""
+
+    __slots__ = ('items', 'result', 'error', 'done')
+
+    def __init__(self, items):
+        self.items = items
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Agrupa consultas de forecast concurrentes en una sola evaluación vectorizada
+
+    Si no hay otra consulta en curso se evalúa de inmediato (sin espera). Con
+    consultas concurrentes, la primera que encuentra la cola vacía actúa de
+    líder: espera hasta window_ms, hasta max_batch filas o hasta que todas las
+    consultas en curso estén encoladas y no haya otro lote evaluándose (lo que
+    ocurra primero, como un group commit), toma la cola completa y la evalúa con un único estado del ModelHolder, así todas las
+    filas del lote usan la misma versión del modelo. Las demás esperan su
+    resultado.
+    """
+
+    def __init__(self, holder, window_ms=None, max_batch=None):
+        """
+        Args:
+            holder: ModelHolder con el predictor vigente
+            window_ms: Espera máxima del líder para juntar consultas (default: FORECAST_BATCH_WINDOW_MS)
+            max_batch: Filas máximas por lote (default: FORECAST_MAX_BATCH)
+        """
+        self.holder = holder
+        self.window = (config.FORECAST_BATCH_WINDOW_MS if window_ms is None else window_ms) / 1000
+        self.max_batch = config.FORECAST_MAX_BATCH if max_batch is None else max_batch
+
+        self._cond = threading.Condition()
+        self._pending = []
+        self._pending_rows = 0
+        self._leader = False
+        self._in_flight = 0
+        # Consultas en evaluación (tomadas por un lote o en el camino directo)
+        self._busy = 0
+
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_rows = 0
+
+    def forecast(self, items):
+        """
+        Predice una lista de (hospital, producto, fecha)
+
+        Returns:
+            (run_id, lista de dicts con las columnas de FORECAST_COLUMNS disponibles)
+        """
+        pending = _PendingForecast(items)
+        with self._cond:
+            self._in_flight += 1
+            self.n_requests += 1
+            direct = self._in_flight == 1
+            lead = False
+            if direct:
+                self._busy += 1
+            else:
+                self._pending.append(pending)
+                self._pending_rows += len(items)
+                if not self._leader:
+                    self._leader = lead = True
+                elif self._batch_ready():
+                    self._cond.notify()
+
+        try:
+            if direct:
+                self._evaluate([pending])
+            elif lead:
+                self._evaluate(self._collect())
+            else:
+                pending.done.wait()
+        finally:
+            with self._cond:
+                # Al salir, toda consulta ya fue tomada (directa o en un lote)
+                self._in_flight -= 1
+                self._busy -= 1
+                if self._leader and self._batch_ready():
+                    self._cond.notify()
+
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _batch_ready(self):
+        """Lote lleno, o nada más que esperar: sin otro lote en evaluación y todo lo en curso encolado"""
+        return self._pending_rows >= self.max_batch or (
+            self._busy == 0 and len(self._pending) >= self._in_flight)
+
+    def _collect(self):
+        """El líder espera la ventana (o un lote listo) y toma la cola completa"""
+        deadline = time.perf_counter() + self.window
+        with self._cond:
+            while not self._batch_ready():
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._pending, self._pending_rows = self._pending, [], 0
+            self._busy += len(batch)
+            self._leader = False
+        return batch
+
+    def _evaluate(self, batch):
+        """Una llamada a forecast_points para todas las filas del lote"""
+        try:
+            state = self.holder.current()
+            if state is None:
+                raise LookupError("No hay un modelo de demanda cargado en el registro.")
+
+            hospitals, products, dates = [], [], []
+            for pending in batch:
+                for hospital, producto, fecha in pending.items:
+                    hospitals.append(hospital)
+                    products.append(producto)
+                    dates.append(fecha)
+
+            values = state.predictor.forecast_points(hospitals, products, dates)
+            columns = [c for c in FORECAST_COLUMNS if c in values]
+            rows = [dict(zip(columns, row)) for row in zip(*(values[c].tolist() for c in columns))]
+
+            offset = 0
+            for pending in batch:
+                pending.result = (state.run_id, rows[offset:offset + len(pending.items)])
+                offset += len(pending.items)
+            self.n_batches += 1
+            self.n_rows += len(rows)
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+    def status(self):
+        """Contadores para monitoreo"""
+        return {
+            'requests': self.n_requests,
+            'batches': self.n_batches,
+            'rows': self.n_rows,
+            'rows_per_batch': round(self.n_rows / self.n_batches, 2) if self.n_batches else 0.0,
+        }
@@ -0,0 +1,346 @@
+"""
+Pipeline por Etapas con Checkpoints y Reporte de Ejecución
+
+Un pipeline es un conjunto de etapas con dependencias explícitas. Cada etapa
+recibe las salidas de las etapas de las que depende y retorna (salidas,
+filas procesadas). Al terminar una etapa:
+
+- sus salidas se guardan en <run_dir>/<etapa>.joblib
+- el estado (etapas completas) se guarda en state.json
+- report.json se actualiza con tiempo de pared, filas, filas/s y RSS peak
+
+Las etapas cuyas dependencias ya están listas corren en paralelo (hilos: las
+etapas son E/S de BD o NumPy/sklearn, que liberan el GIL). Si una etapa falla,
+las que están corriendo terminan, las dependientes no se inician y el run
+queda como 'failed'; `resume()` lo retoma cargando desde disco las salidas de
+las etapas completas y ejecutando solo las pendientes.
+
+El RSS peak de una etapa se muestrea desde /proc/self/statm mientras corre;
+con etapas en paralelo es el peak del proceso durante la ventana de la etapa.
+"""
+import json
+import logging
+import os
+import resource
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import joblib
+
+import config
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = 'state.json'
+REPORT_FILE = 'report.json'
+
+# Intervalo de muestreo del RSS (segundos)
+RSS_SAMPLE_SECONDS = 0.05
+
+
+class StopPipeline(Exception):
+    """Una etapa decide terminar el run sin error (ej. datos insuficientes)"""
+
+
+class Stage:
+    """Etapa del pipeline"""
+
+    def __init__(self, name, fn, deps=(), persist=True):
+        """
+        Args:
+            name: Nombre único de la etapa
+            fn: Función (inputs: dict) -> (salidas: dict, filas: int); inputs
+                reúne las salidas de todas las etapas de las que depende
+                (directa o indirectamente)
+            deps: Nombres de las etapas de las que depende
+            persist: Guardar las salidas en disco (False para etapas sin
+                salidas útiles, que igual quedan marcadas como completas)
+        """
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.persist = persist
+
+
+def _current_rss_mb():
+    """RSS actual del proceso en MB (ru_maxrss si no hay /proc)"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError):
+        # ru_maxrss está en KB en Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _RssSampler:
+    """Hilo que registra el RSS máximo mientras hay etapas corriendo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._peaks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='pipeline-rss', daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            rss = _current_rss_mb()
+            with self._lock:
+                for name in self._peaks:
+                    self._peaks[name] = max(self._peaks[name], rss)
+
+    def start(self, name):
+        with self._lock:
+            self._peaks[name] = _current_rss_mb()
+
+    def finish(self, name):
+        rss = _current_rss_mb()
+        with self._lock:
+            return max(self._peaks.pop(name, rss), rss)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=1)
+
+
+class Pipeline:
+    """Ejecuta etapas con dependencias, checkpoints por etapa y reporte JSON"""
+
+    def __init__(self, name, stages, root=None, max_workers=None):
+        """
+        Args:
+            name: Nombre del pipeline (subdirectorio de PIPELINE_DIR)
+            stages: Lista de Stage
+            root: Directorio base (default: PIPELINE_DIR)
+            max_workers: Etapas simultáneas (default: PIPELINE_MAX_WORKERS)
+        """
+        self.name = name
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Nombres de etapa duplicados.")
+        for stage in stages:
+            missing = [d for d in stage.deps if d not in self.stages]
+            if missing:
+                raise ValueError(f"La etapa '{stage.name}' depende de etapas inexistentes: {missing}")
+        self.root = os.path.join(root or config.PIPELINE_DIR, name)
+        self.max_workers = max_workers or config.PIPELINE_MAX_WORKERS
+
+    # ------------------------------------------------------------------ runs
+
+    def run_dir(self, run_id):
+        return os.path.join(self.root, run_id)
+
+    def list_runs(self):
+        """Estados de los runs (más reciente primero)"""
+        if not os.path.isdir(self.root):
+            return []
+        runs = []
+        for run_id in sorted(os.listdir(self.root), reverse=True):
+            path = os.path.join(self.run_dir(run_id), STATE_FILE)
+            if os.path.exists(path):
+                with open(path) as f:
+                    runs.append(json.load(f))
+        return runs
+
+    def last_resumable(self):
+        """El último run si no terminó ('failed' o interrumpido), o None"""
+        runs = self.list_runs()
+        if runs and runs[0]['status'] not in ('completed', 'stopped'):
+            return runs[0]['run_id']
+        return None
+
+    def _write_json(self, run_id, filename, payload):
+        path = os.path.join(self.run_dir(run_id), filename)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(payload, f, indent=1, default=str)
+        os.replace(tmp, path)
+
+    def _ancestors(self, name):
+        seen, pending = set(), list(self.stages[name].deps)
+        while pending:
+            dep = pending.pop()
+            if dep not in seen:
+                seen.add(dep)
+                pending.extend(self.stages[dep].deps)
+        return seen
+
+    # ------------------------------------------------------------------ ejecución
+
+    def run(self, params=None, run_id=None):
+        """
+        Ejecuta un run nuevo
+
+        Args:
+            params: Parámetros del run (se guardan en state.json; resume() los reutiliza)
+            run_id: Id del run (default: timestamp + sufijo)
+
+        Returns:
+            (estado final, salidas de todas las etapas)
+        """
+        run_id = run_id or f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+        os.makedirs(self.run_dir(run_id), exist_ok=True)
+        state = {
+            'run_id': run_id,
+            'pipeline': self.name,
+            'status': 'running',
+            'params': params or {},
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'completed': [],
+            'stages': {},
+        }
+        return self._execute(state, {})
+
+    def resume(self, run_id=None):
+        """
+        Retoma un run desde su última etapa completa
+
+        Args:
+            run_id: Run a retomar (default: el último que no terminó)
+
+        Returns:
+            (estado final, salidas de todas las etapas)
+        """
+        run_id = run_id or self.last_resumable()
+        if run_id is None:
+            raise FileNotFoundError(f"No hay runs de '{self.name}' para retomar en {self.root}")
+        with open(os.path.join(self.run_dir(run_id), STATE_FILE)) as f:
+            state = json.load(f)
+        if state['status'] == 'completed':
+            raise ValueError(f"El run {run_id} ya está completo.")
+
+        outputs = {}
+        for name in state['completed']:
+            path = os.path.join(self.run_dir(run_id), f'{name}.joblib')
+            outputs[name] = joblib.load(path) if os.path.exists(path) else {}
+            state['stages'][name]['resumed'] = True
+        logger.info(f"⏯️  Retomando {self.name} {run_id}: {len(state['completed'])} etapas completas "
+                    f"({', '.join(state['completed']) or '-'})")
+        state['status'] = 'running'
+        state['resumed_at'] = datetime.now().isoformat(timespec='seconds')
+        return self._execute(state, outputs)
+
+    def _run_stage(self, state, stage, outputs, sampler):
+        inputs = dict(state['params'])
+        for dep in self._ancestors(stage.name):
+            inputs.update(outputs.get(dep, {}))
+
+        sampler.start(stage.name)
+        started = datetime.now()
+        t0 = time.perf_counter()
+        try:
+            result, rows = stage.fn(inputs)
+        finally:
+            wall = time.perf_counter() - t0
+            peak = sampler.finish(stage.name)
+        result = result or {}
+        if stage.persist and result:
+            joblib.dump(result, os.path.join(self.run_dir(state['run_id']), f'{stage.name}.joblib'))
+        return result, {
+            'status': 'completed',
+            'started_at': started.isoformat(timespec='seconds'),
+            'wall_s': round(wall, 3),
+            'rows': int(rows or 0),
+            'rows_per_s': round(rows / wall, 1) if rows and wall > 0 else None,
+            'peak_rss_mb': round(peak, 1),
+        }
+
+    def _save(self, state, elapsed):
+        """Escribe state.json y report.json"""
+        state['wall_s'] = round(state.get('previous_wall_s', 0.0) + elapsed, 3)
+        # ru_maxrss está en KB en Linux
+        state['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        self._write_json(state['run_id'], STATE_FILE, state)
+        report = {key: state.get(key) for key in
+                  ('run_id', 'pipeline', 'status', 'error', 'created_at', 'resumed_at', 'wall_s', 'peak_rss_mb')}
+        report['stages'] = state['stages']
+        self._write_json(state['run_id'], REPORT_FILE, report)
+
+    def _execute(self, state, outputs):
+        """Planifica las etapas listas en un pool de hilos hasta terminar o fallar"""
+        done = set(state['completed'])
+        running = {}
+        failed = None
+        t0 = time.perf_counter()
+        sampler = _RssSampler()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pipeline') as pool:
+            while True:
+                if failed is None:
+                    for name, stage in self.stages.items():
+                        if name in done or name in running.values() or not set(stage.deps) <= done:
+                            continue
+                        logger.info(f"▶️  Etapa {name}")
+                        running[pool.submit(self._run_stage, state, stage, outputs, sampler)] = name
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        result, report = future.result()
+                    except StopPipeline as e:
+                        failed = failed or ('stopped', str(e))
+                        state['stages'][name] = {'status': 'stopped', 'message': str(e)}
+                        logger.warning(f"⏹️  Etapa {name}: {e}")
+                    except Exception as e:
+                        failed = failed or ('failed', f"{name}: {e}")
+                        state['stages'][name] = {'status': 'failed', 'error': f"{type(e).__name__}: {e}"}
+                        logger.error(f"❌ Etapa {name} falló: {e}", exc_info=True)
+                    else:
+                        outputs[name] = result
+                        done.add(name)
+                        state['completed'].append(name)
+                        state['stages'][name] = report
+                        logger.info(f"✅ Etapa {name}: {report['wall_s']:.2f}s, {report['rows']:,} filas, "
+                                    f"RSS peak {report['peak_rss_mb']:.0f} MB")
+                    self._save(state, time.perf_counter() - t0)
+        sampler.close()
+
+        if failed is None:
+            state['status'] = 'completed'
+            state.pop('error', None)
+        else:
+            state['status'], state['error'] = failed
+        elapsed = time.perf_counter() - t0
+        self._save(state, elapsed)
+        state['previous_wall_s'] = state['wall_s']
+        self._write_json(state['run_id'], STATE_FILE, state)
+        logger.info(f"📄 Reporte del run: {os.path.join(self.run_dir(state['run_id']), REPORT_FILE)}")
+
+        merged = {}
+        for name in self.stages:
+            merged.update(outputs.get(name, {}))
+        return state, merged
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Runs del pipeline por etapas y sus reportes")
+    parser.add_argument('command', choices=['runs', 'report'])
+    parser.add_argument('run_id', nargs='?', help='Run del reporte (default: el más reciente)')
+    parser.add_argument('--pipeline', default='train', help='Nombre del pipeline (default: train)')
+    args = parser.parse_args()
+
+    root = os.path.join(config.PIPELINE_DIR, args.pipeline)
+    runs = sorted(os.listdir(root), reverse=True) if os.path.isdir(root) else []
+    if not runs:
+        print(f"Sin runs en {root}")
+    elif args.command == 'runs':
+        for run_id in runs:
+            path = os.path.join(root, run_id, REPORT_FILE)
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                report = json.load(f)
+            print(f"{run_id}  {report['status']:<10} {report['wall_s'] or 0:>8.1f}s  "
+                  f"{len(report['stages'])} etapas  {report.get('error') or ''}")
+    else:
+        with open(os.path.join(root, args.run_id or runs[0], REPORT_FILE)) as f:
+            print(json.dumps(json.load(f), indent=2))
@@ -0,0 +1,330 @@
+"""
+Almacenamiento de Predicciones por Serie
+
+predicciones_demanda guarda una fila por hospital × producto × mes: cada mes
+del horizonte repite los nombres, created_at y la confianza, y el overhead por
+fila (cabecera de tupla + entradas de índices) domina el tamaño y el costo de
+los scans a medida que crece el horizonte.
+
+Con PREDICTIONS_LAYOUT='series' las predicciones van a predicciones_series,
+una fila por serie (hospital_id, producto_id) escrita por la ejecución que la
+recalculó, con el horizonte como arreglos desde fecha_inicio (un elemento por
+mes): demanda, demanda_inferior, demanda_superior y confianza (centésimas en
+SMALLINT).
+
+Para que las consultas no cambien:
+
+- desempacar_serie(fecha_inicio, demanda, inferior, superior, confianza):
+  función set-returning que devuelve las filas mensuales de una serie
+- vista predicciones_demanda_series: mismas columnas que predicciones_demanda
+  (los nombres se unen desde las dimensiones, id es NULL); los lectores de
+  db_utils y app.py consultan PREDICTIONS_SOURCE
+- predicciones_serie(hospital, producto): filas de una serie por nombre
+
+Uso:
+    python prediction_store.py pack    # copia predicciones_demanda al formato por series
+    python prediction_store.py sizes   # tamaño de ambos formatos
+"""
+import argparse
+import datetime
+import logging
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+import config
+from database import get_connection
+from dimensions import resolve_ids
+
+logger = logging.getLogger(__name__)
+
+ROWS_TABLE = 'predicciones_demanda'
+SERIES_TABLE = 'predicciones_series'
+SERIES_VIEW = 'predicciones_demanda_series'
+
+# Tabla o vista que leen db_utils / app.py / dirty_series según el formato configurado
+PREDICTIONS_SOURCE = SERIES_VIEW if config.PREDICTIONS_LAYOUT == 'series' else ROWS_TABLE
+
+# Requiere las dimensiones (dimensions.py) y ejecuciones_prediccion
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS predicciones_series (
+    producto_id SMALLINT NOT NULL REFERENCES productos(id),
+    hospital_id INTEGER NOT NULL REFERENCES hospitales(id),
+    ejecucion_id INTEGER REFERENCES ejecuciones_prediccion(id),
+    fecha_inicio DATE NOT NULL,
+    demanda INTEGER[] NOT NULL,
+    demanda_inferior INTEGER[],
+    demanda_superior INTEGER[],
+    confianza SMALLINT[],
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (producto_id, hospital_id)
+);
+CREATE INDEX IF NOT EXISTS idx_pred_series_hospital ON predicciones_series(hospital_id);
+
+CREATE OR REPLACE FUNCTION desempacar_serie(
+    p_inicio DATE, p_demanda INTEGER[], p_inferior INTEGER[], p_superior INTEGER[], p_confianza SMALLINT[]
+) RETURNS TABLE (
+    fecha_prediccion DATE, demanda_estimada INTEGER, demanda_inferior INTEGER,
+    demanda_superior INTEGER, confidence_score DECIMAL(5,2)
+) AS $$
+    SELECT (p_inicio + (u.i - 1) * INTERVAL '1 month')::date, u.d, u.inf, u.sup, (u.c / 100.0)::decimal(5,2)
+    FROM unnest(p_demanda, p_inferior, p_superior, p_confianza) WITH ORDINALITY AS u(d, inf, sup, c, i)
+$$ LANGUAGE sql IMMUTABLE;
+
+-- LEFT JOIN a las dimensiones: si la consulta no usa los nombres, el planner omite el join
+CREATE OR REPLACE VIEW predicciones_demanda_series AS
+SELECT
+    NULL::integer AS id,
+    h.nombre AS hospital,
+    p.codigo AS producto,
+    u.fecha_prediccion,
+    u.demanda_estimada,
+    u.demanda_inferior,
+    u.demanda_superior,
+    u.confidence_score,
+    s.created_at,
+    s.hospital_id,
+    s.producto_id,
+    s.ejecucion_id
+FROM predicciones_series s
+LEFT JOIN hospitales h ON h.id = s.hospital_id
+LEFT JOIN productos p ON p.id = s.producto_id
+CROSS JOIN LATERAL desempacar_serie(
+    s.fecha_inicio, s.demanda, s.demanda_inferior, s.demanda_superior, s.confianza
+) AS u;
+
+CREATE OR REPLACE FUNCTION predicciones_serie(p_hospital TEXT, p_producto TEXT)
+RETURNS SETOF predicciones_demanda_series AS $$
+    SELECT * FROM predicciones_demanda_series
+    WHERE hospital_id = (SELECT id FROM hospitales WHERE nombre = p_hospital)
+      AND producto_id = (SELECT id FROM productos WHERE codigo = p_producto)
+    ORDER BY fecha_prediccion
+$$ LANGUAGE sql STABLE;
+"""
+
+DELETE_SERIES_QUERY = """
+DELETE FROM predicciones_series s
+USING unnest(%s::text[], %s::text[]) AS x(hospital, producto)
+JOIN hospitales h ON h.nombre = x.hospital
+JOIN productos d ON d.codigo = x.producto
+WHERE s.hospital_id = h.id AND s.producto_id = d.id
+"""
+
+INSERT_SERIES_QUERY = """
+INSERT INTO predicciones_series
+    (hospital_id, producto_id, ejecucion_id, fecha_inicio, demanda, demanda_inferior, demanda_superior, confianza)
+VALUES %s
+ON CONFLICT (producto_id, hospital_id) DO UPDATE SET
+    ejecucion_id = EXCLUDED.ejecucion_id,
+    fecha_inicio = EXCLUDED.fecha_inicio,
+    demanda = EXCLUDED.demanda,
+    demanda_inferior = EXCLUDED.demanda_inferior,
+    demanda_superior = EXCLUDED.demanda_superior,
+    confianza = EXCLUDED.confianza,
+    created_at = CURRENT_TIMESTAMP
+"""
+
+# Series contiguas de predicciones_demanda (un mes tras otro, día 1) empaquetadas
+PACK_QUERY = """
+INSERT INTO predicciones_series
+    (hospital_id, producto_id, fecha_inicio, demanda, demanda_inferior, demanda_superior, confianza, created_at)
+SELECT
+    hospital_id,
+    producto_id,
+    MIN(fecha_prediccion),
+    array_agg(demanda_estimada ORDER BY fecha_prediccion),
+    array_agg(demanda_inferior ORDER BY fecha_prediccion),
+    array_agg(demanda_superior ORDER BY fecha_prediccion),
+    array_agg(round(confidence_score * 100)::smallint ORDER BY fecha_prediccion),
+    MAX(created_at)
+FROM predicciones_demanda
+WHERE hospital_id IS NOT NULL AND producto_id IS NOT NULL
+GROUP BY hospital_id, producto_id
+HAVING bool_and(EXTRACT(DAY FROM fecha_prediccion) = 1)
+   AND COUNT(DISTINCT fecha_prediccion) = COUNT(*)
+   AND COUNT(*) = (EXTRACT(YEAR FROM age(MAX(fecha_prediccion), MIN(fecha_prediccion))) * 12
+                   + EXTRACT(MONTH FROM age(MAX(fecha_prediccion), MIN(fecha_prediccion))) + 1)
+ON CONFLICT (producto_id, hospital_id) DO NOTHING
+"""
+
+SIZES_QUERY = """
+SELECT relname AS tabla,
+       pg_relation_size(oid) AS tabla_bytes,
+       pg_indexes_size(oid) AS indices_bytes,
+       pg_total_relation_size(oid) AS total_bytes,
+       reltuples::bigint AS filas_estimadas
+FROM pg_class
+WHERE relname = ANY(%s) AND relkind = 'r'
+ORDER BY relname
+"""
+
+
+def _first_of_month(month_index):
+    return datetime.date(int(month_index) // 12, int(month_index) % 12 + 1, 1)
+
+
+def pack_predictions(predictions_df, confidence_score, hospital_ids, producto_ids, run_id=None):
+    """
+    Agrupa predicciones mensuales en una fila por serie
+
+    Args:
+        predictions_df: DataFrame [hospital, producto_estandarizado, fecha_prediccion,
+            demanda_estimada] (+ demanda_inferior, demanda_superior, confidence_score)
+        confidence_score: Confianza global para filas sin confianza propia
+        hospital_ids: dict hospital -> id (dimensions.resolve_ids)
+        producto_ids: dict producto -> id
+        run_id: Ejecución de ejecuciones_prediccion que generó las series
+
+    Returns:
+        Lista de tuplas (hospital_id, producto_id, ejecucion_id, fecha_inicio,
+        demanda, demanda_inferior, demanda_superior, confianza) para INSERT_SERIES_QUERY
+
+    Raises:
+        ValueError: si una serie no tiene fechas mensuales contiguas en día 1
+    """
+    if predictions_df.empty:
+        return []
+    fechas = pd.to_datetime(predictions_df['fecha_prediccion'])
+    if (fechas.dt.day != 1).any():
+        raise ValueError("El formato por series requiere fechas de predicción el día 1 de cada mes")
+
+    hospital = predictions_df['hospital'].astype(str).map(hospital_ids).to_numpy(dtype=np.int64)
+    producto = predictions_df['producto_estandarizado'].astype(str).map(producto_ids).to_numpy(dtype=np.int64)
+    month = (fechas.dt.year * 12 + fechas.dt.month - 1).to_numpy(dtype=np.int64)
+    order = np.lexsort((month, hospital, producto))
+    hospital, producto, month = hospital[order], producto[order], month[order]
+
+    new_series = np.r_[True, (hospital[1:] != hospital[:-1]) | (producto[1:] != producto[:-1])]
+    if np.any(np.diff(month)[~new_series[1:]] != 1):
+        raise ValueError("El formato por series requiere meses contiguos y sin repetir en cada serie")
+    starts = np.flatnonzero(new_series)
+
+    def split(values):
+        return [chunk.tolist() for chunk in np.split(values[order], starts[1:])]
+
+    has_intervals = 'demanda_inferior' in predictions_df.columns
+    demanda = split(predictions_df['demanda_estimada'].to_numpy(dtype=np.int64))
+    inferior = (split(predictions_df['demanda_inferior'].to_numpy(dtype=np.int64)) if has_intervals
+                else [None] * len(starts))
+    superior = (split(predictions_df['demanda_superior'].to_numpy(dtype=np.int64)) if has_intervals
+                else [None] * len(starts))
+    confidence = (predictions_df['confidence_score'].to_numpy(dtype=float) if has_intervals
+                  else np.full(len(predictions_df), float(confidence_score)))
+    confianza = split(np.rint(confidence * 100).astype(np.int64))
+
+    return [
+        (int(hospital[start]), int(producto[start]), run_id, _first_of_month(month[start]),
+         demanda[i], inferior[i], superior[i], confianza[i])
+        for i, start in enumerate(starts)
+    ]
+
+
+def save_series(cursor, predictions_df, confidence_score, series=None, run_id=None):
+    """
+    Reemplaza series en predicciones_series (dentro de la transacción de quien llama)
+
+    Args:
+        cursor: Cursor psycopg2
+        predictions_df: DataFrame de predicciones (ver pack_predictions)
+        confidence_score: Confianza global para filas sin confianza propia
+        series: DataFrame [hospital, producto] de las series a reemplazar (None = todas)
+        run_id: Ejecución que generó las predicciones
+
+    Returns:
+        Número de series escritas
+    """
+    if series is None:
+        cursor.execute("DELETE FROM predicciones_series")
+        logger.info("  🗑️ Series antiguas eliminadas")
+    else:
+        cursor.execute(DELETE_SERIES_QUERY, (series['hospital'].tolist(), series['producto'].tolist()))
+        logger.info(f"  🗑️ {cursor.rowcount} de {len(series)} series reemplazadas")
+
+    hospital_ids, producto_ids = resolve_ids(
+        cursor, predictions_df['hospital'].astype(str).unique(),
+        predictions_df['producto_estandarizado'].astype(str).unique()
+    )
+    rows = pack_predictions(predictions_df, confidence_score, hospital_ids, producto_ids, run_id=run_id)
+    execute_values(cursor, INSERT_SERIES_QUERY, rows, page_size=1000)
+    return len(rows)
+
+
+def get_serie(hospital, producto):
+    """
+    Predicciones de una serie en filas mensuales (formato por series)
+
+    Returns:
+        DataFrame con las columnas de predicciones_demanda
+    """
+    conn = get_connection()
+    df = pd.read_sql_query("SELECT * FROM predicciones_serie(%s, %s)", conn, params=(hospital, producto))
+    conn.close()
+    return df
+
+
+def pack_existing():
+    """
+    Copia predicciones_demanda a predicciones_series (series que aún no estén)
+
+    Las series con meses no contiguos se omiten y se cuentan.
+
+    Returns:
+        dict con series empaquetadas y omitidas
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SCHEMA_SQL)
+        cursor.execute(PACK_QUERY)
+        packed = cursor.rowcount
+        cursor.execute("""
+            SELECT COUNT(*) FROM (
+                SELECT DISTINCT hospital_id, producto_id FROM predicciones_demanda
+                WHERE hospital_id IS NOT NULL AND producto_id IS NOT NULL
+            ) d
+            WHERE NOT EXISTS (
+                SELECT 1 FROM predicciones_series s
+                WHERE s.hospital_id = d.hospital_id AND s.producto_id = d.producto_id
+            )
+        """)
+        skipped = cursor.fetchone()[0]
+        cursor.execute("ANALYZE predicciones_series")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+    return {'packed': packed, 'skipped': skipped}
+
+
+def get_layout_sizes(tables=(ROWS_TABLE, SERIES_TABLE)):
+    """
+    Tamaño de tabla, índices y filas de cada formato
+
+    Returns:
+        DataFrame [tabla, tabla_bytes, indices_bytes, total_bytes, filas_estimadas]
+    """
+    conn = get_connection()
+    df = pd.read_sql_query(SIZES_QUERY, conn, params=(list(tables),))
+    conn.close()
+    return df
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Almacenamiento de predicciones por serie")
+    parser.add_argument('command', choices=['pack', 'sizes'])
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        result = pack_existing()
+        print(f"✅ {result['packed']:,} series empaquetadas en {SERIES_TABLE}")
+        if result['skipped']:
+            print(f"⚠️  {result['skipped']:,} series omitidas (meses no contiguos o fuera del día 1)")
+    sizes = get_layout_sizes()
+    for column in ('tabla_bytes', 'indices_bytes', 'total_bytes'):
+        sizes[column] = (sizes[column] / 1e6).round(2)
+    print(sizes.rename(columns=lambda c: c.replace('_bytes', ' MB')).to_string(index=False))
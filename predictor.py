@@ -1,19 +1,22 @@
 """
 Modelo Predictivo de Demanda para Insumos Médicos
 Utiliza Regresión Lineal con scikit-learn para predecir demanda futura
-basada en datos históricos de órdenes de compra.
+basada en datos históricos de órdenes de compra. El estimador es intercambiable
+(ver estimators.py): lineal, ridge o gradient boosting.
 """
 import os
+import pickle
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
+from scipy import sparse
 from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-from sklearn.preprocessing import OneHotEncoder
 import joblib
 import logging
 
+from estimators import get_estimator, solve_normal_equations
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,10 +25,27 @@ logger = logging.getLogger(__name__)
 MODELS_DIR = os.path.join(os.path.dirname(__file__), 'models')
 os.makedirs(MODELS_DIR, exist_ok=True)
 
+# Columnas agregadas por predict_batch / forecast_cube con intervals=True
+INTERVAL_COLUMNS = ['demanda_inferior', 'demanda_superior', 'confidence_score']
+
+# Features numéricas (columnas 0-2 de X); luego vienen hospitales y productos
+NUMERIC_FEATURES = ['dias_desde_inicio', 'mes_sin', 'mes_cos']
+
+# Máximo de fechas distintas que se mantienen parseadas en cache
+DATE_CACHE_MAX_SIZE = 100_000
+
+# Intervalos de predicción: nivel, remuestreos bootstrap de los residuos
+# estandarizados (y máximo de residuos por remuestreo) y observaciones "virtuales"
+# con la varianza global que se suman a cada serie (series cortas -> varianza global)
+INTERVAL_LEVEL = 0.90
+BOOTSTRAP_SAMPLES = 1000
+BOOTSTRAP_POOL_SIZE = 2000
+RESIDUAL_SHRINKAGE = 5
+
 
 class DemandPredictor:
     """
-    Modelo de predicción de demanda usando regresión lineal
+    Modelo de predicción de demanda usando regresión lineal (u otro backend de estimators)
     
     Features:
     - Tendencia temporal (días desde inicio)
@@ -34,118 +54,425 @@ class DemandPredictor:
     - Producto (one-hot encoding)
     """
     
-    def __init__(self, fecha_referencia='2024-01-01'):
+    # Archivo por defecto en MODELS_DIR (save_model / load_model)
+    MODEL_FILENAME = 'demand_model.pkl'
+    
+    def __init__(self, fecha_referencia='2024-01-01', estimator='linear', estimator_params=None):
         """
         Inicializa el predictor
         
         Args:
             fecha_referencia: Fecha base para calcular días transcurridos
+            estimator: Backend de estimación ('linear', 'ridge' o 'hgb', ver estimators.py)
+            estimator_params: Parámetros del backend (ej. {'alpha': 10.0} para ridge)
         """
+        self.estimator = estimator
+        self.estimator_params = dict(estimator_params or {})
+        self.backend = get_estimator(estimator, **self.estimator_params)
         self.model = LinearRegression()
         self.fecha_referencia = pd.to_datetime(fecha_referencia)
-        self.hospital_encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-        self.producto_encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
         self.is_trained = False
         self.hospital_categories = None
         self.producto_categories = None
+        self._hospital_index = None
+        self._producto_index = None
+        self._date_cache = {}
+        # Estadísticos suficientes acumulados (X^T X, X^T y, ...) para entrenamiento incremental
+        self.stats = None
+        # Máximo created_at de ordenes_compra incluido en el modelo
+        self.watermark = None
+        # Versión del snapshot local con que se entrenó (ver snapshot.py); None = leído de la BD
+        self.data_version = None
+        self.metrics = None
+        # Dispersión de residuos por serie (matriz hospital × producto) y cuantiles
+        # de los residuos estandarizados para los intervalos (ver fit_intervals)
+        self.residual_std = None
+        self.residual_std_global = None
+        self.interval_quantiles = None
+        self.interval_level = None
+        # Run del registro de modelos del que proviene (ver model_registry)
+        self.run_id = None
+    
+    def __getstate__(self):
+        # La cache de fechas es solo un acelerador: no se persiste con el modelo
+        state = self.__dict__.copy()
+        state['_date_cache'] = {}
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault('_date_cache', {})
+        self.__dict__.setdefault('stats', None)
+        self.__dict__.setdefault('watermark', None)
+        self.__dict__.setdefault('metrics', None)
+        for key in ('residual_std', 'residual_std_global', 'interval_quantiles', 'interval_level', 'run_id',
+                    'data_version'):
+            self.__dict__.setdefault(key, None)
+        if 'backend' not in self.__dict__:
+            self.estimator, self.estimator_params = 'linear', {}
+            self.backend = get_estimator('linear')
+        if self.__dict__.get('_hospital_index') is None and self.hospital_categories is not None:
+            self._set_categories(self.hospital_categories, self.producto_categories)
+    
+    def _set_categories(self, hospitales, productos):
+        """Fija el vocabulario de hospitales y productos (orden = columna en X)"""
+        self.hospital_categories = list(hospitales)
+        self.producto_categories = list(productos)
+        self._hospital_index = {h: i for i, h in enumerate(self.hospital_categories)}
+        self._producto_index = {p: i for i, p in enumerate(self.producto_categories)}
+    
+    def _date_features(self, fechas):
+        """
+        Calcula días desde la referencia y mes para una columna de fechas
         
-    def _prepare_features(self, df, fit_encoders=False):
+        Las fechas se parsean una sola vez por valor distinto (pd.factorize) y el
+        resultado queda en cache entre llamadas, así que 10M filas con unas pocas
+        miles de fechas distintas solo parsean esas miles.
+        
+        Args:
+            fechas: Serie/array de fechas (datetime64, date o string)
+            
+        Returns:
+            (dias, mes): arrays int32 de largo len(fechas)
+        """
+        if pd.api.types.is_datetime64_any_dtype(fechas):
+            fechas = pd.DatetimeIndex(fechas)
+            dias = ((fechas - self.fecha_referencia) // pd.Timedelta(days=1)).to_numpy(dtype=np.int32)
+            return dias, fechas.month.to_numpy(dtype=np.int32)
+        
+        codes, uniques = pd.factorize(np.asarray(fechas, dtype=object))
+        pendientes = [u for u in uniques if u not in self._date_cache]
+        if pendientes:
+            if len(self._date_cache) + len(pendientes) > DATE_CACHE_MAX_SIZE:
+                self._date_cache.clear()
+            parsed = pd.to_datetime(pd.Index(pendientes, dtype=object))
+            dias_nuevos = (parsed - self.fecha_referencia) // pd.Timedelta(days=1)
+            self._date_cache.update(zip(pendientes, zip(dias_nuevos, parsed.month)))
+        
+        lookup = np.array([self._date_cache[u] for u in uniques], dtype=np.int32).reshape(-1, 2)
+        return lookup[codes, 0], lookup[codes, 1]
+    
+    @staticmethod
+    def _encode(values, index):
+        """
+        Convierte una columna categórica a códigos enteros según un vocabulario
+        
+        Args:
+            values: Serie/array de strings (o Categorical)
+            index: dict categoría -> código
+            
+        Returns:
+            array int32 con -1 para categorías desconocidas
+        """
+        codes, uniques = pd.factorize(values)
+        lookup = np.fromiter((index.get(u, -1) for u in uniques), dtype=np.int32, count=len(uniques))
+        # pd.factorize marca nulos con -1: se mapean también a desconocido
+        lookup = np.append(lookup, np.int32(-1))
+        return lookup[codes]
+    
+    def _prepare_features(self, df, fit_encoders=False, fecha_col='fecha_orden'):
         """
         Prepara features para entrenamiento o predicción
         
+        No modifica ni copia el DataFrame de entrada: lee las columnas y construye
+        directamente una matriz CSR con 5 valores por fila
+        [dias, mes_sin, mes_cos, hospital=1, producto=1]. Hospitales y productos
+        desconocidos quedan como ceros explícitos (equivalente a handle_unknown='ignore').
+        
         Args:
             df: DataFrame con columnas [fecha_orden, hospital, producto_estandarizado, cantidad]
-            fit_encoders: Si es True, ajusta los encoders (solo en entrenamiento)
+            fit_encoders: Si es True, ajusta los vocabularios (solo en entrenamiento)
+            fecha_col: Columna de fecha a usar ('fecha_orden' o 'fecha_prediccion')
             
         Returns:
-            X: Features procesadas
+            X: scipy.sparse.csr_matrix de shape (n, 3 + n_hospitales + n_productos)
             y: Target (demanda) si existe en df
         """
-        # 1. Tendencia temporal: días desde fecha de referencia
-        df['dias_desde_inicio'] = (pd.to_datetime(df['fecha_orden']) - self.fecha_referencia).dt.days
+        if fit_encoders:
+            self._set_categories(
+                np.sort(np.asarray(pd.factorize(df['hospital'])[1], dtype=object)),
+                np.sort(np.asarray(pd.factorize(df['producto_estandarizado'])[1], dtype=object))
+            )
         
-        # 2. Estacionalidad: mes del año
-        df['mes'] = pd.to_datetime(df['fecha_orden']).dt.month
+        # 1 y 2. Tendencia temporal y estacionalidad (componentes sinusoidales)
+        dias, mes = self._date_features(df[fecha_col])
         
-        # Componentes sinusoidales para capturar ciclos (opcional pero mejor)
-        df['mes_sin'] = np.sin(2 * np.pi * df['mes'] / 12)
-        df['mes_cos'] = np.cos(2 * np.pi * df['mes'] / 12)
+        # 3 y 4. Hospital y producto como códigos enteros
+        h_codes = self._encode(df['hospital'], self._hospital_index)
+        p_codes = self._encode(df['producto_estandarizado'], self._producto_index)
         
-        # 3 y 4. One-hot encoding para hospital y producto
-        if fit_encoders:
-            hospital_encoded = self.hospital_encoder.fit_transform(df[['hospital']])
-            producto_encoded = self.producto_encoder.fit_transform(df[['producto_estandarizado']])
-            
-            # Guardar categorías para referencia
-            self.hospital_categories = self.hospital_encoder.categories_[0].tolist()
-            self.producto_categories = self.producto_encoder.categories_[0].tolist()
-        else:
-            hospital_encoded = self.hospital_encoder.transform(df[['hospital']])
-            producto_encoded = self.producto_encoder.transform(df[['producto_estandarizado']])
-        
-        # Combinar todas las features
-        X = np.column_stack([
-            df['dias_desde_inicio'].values,
-            df['mes_sin'].values,
-            df['mes_cos'].values,
-            hospital_encoded,
-            producto_encoded
-        ])
+        X = self._build_matrix(h_codes, p_codes, dias, mes)
         
         # Target (si existe)
-        y = df['cantidad'].values if 'cantidad' in df.columns else None
+        y = df['cantidad'].to_numpy(dtype=np.float64) if 'cantidad' in df.columns else None
         
         return X, y
     
-    def train(self, historical_data, test_size=0.2, random_state=42):
+    def _build_matrix(self, h_codes, p_codes, dias, mes):
+        """Matriz CSR de features desde códigos (-1 = desconocido) y términos de fecha"""
+        n = len(h_codes)
+        n_hosp = len(self.hospital_categories)
+        n_prod = len(self.producto_categories)
+        angulo = (2 * np.pi / 12) * mes
+        
+        data = np.empty((n, 5), dtype=np.float64)
+        data[:, 0] = dias
+        data[:, 1] = np.sin(angulo)
+        data[:, 2] = np.cos(angulo)
+        data[:, 3] = h_codes >= 0
+        data[:, 4] = p_codes >= 0
+        
+        # Columnas ordenadas dentro de cada fila; desconocidos apuntan a la primera
+        # columna de su bloque con valor 0 para mantener 5 entradas por fila
+        indices = np.empty((n, 5), dtype=np.int32)
+        indices[:, 0] = 0
+        indices[:, 1] = 1
+        indices[:, 2] = 2
+        indices[:, 3] = 3 + np.maximum(h_codes, 0)
+        indices[:, 4] = 3 + n_hosp + np.maximum(p_codes, 0)
+        
+        indptr = np.arange(0, 5 * n + 1, 5, dtype=np.int64 if 5 * n >= 2**31 else np.int32)
+        X = sparse.csr_matrix(
+            (data.ravel(), indices.ravel(), indptr),
+            shape=(n, len(NUMERIC_FEATURES) + n_hosp + n_prod)
+        )
+        X.has_sorted_indices = True
+        return X
+    
+    @staticmethod
+    def _compute_stats(X, y):
+        """
+        Calcula estadísticos suficientes de mínimos cuadrados para un bloque de datos
+        
+        Son aditivos: los de dos bloques se combinan sumándolos (ver _merge_stats).
+        
+        Args:
+            X: Matriz de features (CSR)
+            y: Target
+            
+        Returns:
+            dict con n, sum_x, xtx, sum_y, xty, sum_yy
+        """
+        return {
+            'n': int(X.shape[0]),
+            'sum_x': np.asarray(X.sum(axis=0), dtype=np.float64).ravel(),
+            'xtx': (X.T @ X).toarray(),
+            'sum_y': float(y.sum()),
+            'xty': np.asarray(X.T @ y, dtype=np.float64).ravel(),
+            'sum_yy': float(y @ y)
+        }
+    
+    @staticmethod
+    def _merge_stats(a, b):
+        """Combina estadísticos suficientes de dos bloques con las mismas columnas"""
+        return {key: a[key] + b[key] for key in a}
+    
+    def _grow_stats(self, n_hosp_old, n_prod_old):
+        """
+        Reubica los estadísticos acumulados tras agregar hospitales/productos nuevos
+        
+        Las categorías nuevas se agregan al final de su bloque, por lo que las
+        columnas existentes solo se desplazan y las nuevas parten en cero.
+        """
+        n_num = len(NUMERIC_FEATURES)
+        n_hosp = len(self.hospital_categories)
+        n_prod = len(self.producto_categories)
+        
+        # Posición nueva de cada columna antigua
+        old_to_new = np.concatenate([
+            np.arange(n_num),
+            n_num + np.arange(n_hosp_old),
+            n_num + n_hosp + np.arange(n_prod_old)
+        ])
+        d = n_num + n_hosp + n_prod
+        
+        stats = dict(self.stats)
+        for key in ('sum_x', 'xty'):
+            grown = np.zeros(d)
+            grown[old_to_new] = stats[key]
+            stats[key] = grown
+        xtx = np.zeros((d, d))
+        xtx[np.ix_(old_to_new, old_to_new)] = stats['xtx']
+        stats['xtx'] = xtx
+        self.stats = stats
+    
+    @staticmethod
+    def _solve_stats(stats):
+        """Mínimos cuadrados ordinarios desde estadísticos suficientes (ver estimators.solve_normal_equations)"""
+        return solve_normal_equations(stats)
+    
+    def _set_coefficients(self, coef, intercept):
+        """Instala coeficientes resueltos en un LinearRegression para predict()"""
+        model = LinearRegression()
+        model.coef_ = coef
+        model.intercept_ = intercept
+        model.n_features_in_ = len(coef)
+        self.model = model
+        self.is_trained = True
+    
+    @staticmethod
+    def _regression_metrics(y_true, y_pred, prefix):
+        return {
+            f'{prefix}_mae': mean_absolute_error(y_true, y_pred),
+            f'{prefix}_rmse': float(np.sqrt(mean_squared_error(y_true, y_pred))),
+            f'{prefix}_r2': r2_score(y_true, y_pred) if len(y_true) > 1 else float('nan')
+        }
+    
+    def train(self, historical_data, test_size=0.2, random_state=42, watermark=None):
         """
         Entrena el modelo con datos históricos
         
+        Las métricas se calculan con un modelo ajustado sobre el split de
+        entrenamiento; el modelo final se ajusta con todos los datos y guarda sus
+        estadísticos suficientes para poder actualizarse con update(). El split
+        es temporal (ver temporal_split): el test son las fechas más recientes.
+        
         Args:
             historical_data: DataFrame con columnas [fecha_orden, hospital, producto_estandarizado, cantidad]
             test_size: Proporción de datos para validación
-            random_state: Semilla para reproducibilidad
+            random_state: Sin efecto (el split es temporal); se mantiene por compatibilidad
+            watermark: Máximo created_at de las órdenes incluidas (opcional)
             
         Returns:
             dict con métricas de evaluación
         """
-        logger.info(f"Entrenando modelo con {len(historical_data)} registros históricos")
+        logger.info(f"Entrenando modelo ({self.estimator}) con {len(historical_data)} registros históricos")
         
         # Preparar features
         X, y = self._prepare_features(historical_data, fit_encoders=True)
         
-        # Split train/test
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=test_size, random_state=random_state
-        )
+        # Split train/test temporal (sin fuga de datos futuros al entrenamiento)
+        test_mask = temporal_split(historical_data['fecha_orden'], test_size)
+        X_train, X_test = X[~test_mask], X[test_mask]
+        y_train, y_test = y[~test_mask], y[test_mask]
         
-        # Entrenar modelo
-        self.model.fit(X_train, y_train)
-        self.is_trained = True
-        
-        # Evaluar
-        y_pred_train = self.model.predict(X_train)
-        y_pred_test = self.model.predict(X_test)
+        # Entrenar modelo con el split de entrenamiento y evaluar
+        if self.backend.sufficient_stats:
+            stats_train = self._compute_stats(X_train, y_train)
+            self._set_coefficients(*self.backend.solve(stats_train))
+        else:
+            self.model = self.backend.fit(X_train, y_train)
         
         metrics = {
-            'train_mae': mean_absolute_error(y_train, y_pred_train),
-            'train_rmse': np.sqrt(mean_squared_error(y_train, y_pred_train)),
-            'train_r2': r2_score(y_train, y_pred_train),
-            'test_mae': mean_absolute_error(y_test, y_pred_test),
-            'test_rmse': np.sqrt(mean_squared_error(y_test, y_pred_test)),
-            'test_r2': r2_score(y_test, y_pred_test),
+            **self._regression_metrics(y_train, self.model.predict(X_train), 'train'),
+            **self._regression_metrics(y_test, self.model.predict(X_test), 'test'),
             'n_samples': len(historical_data),
             'n_features': X.shape[1]
         }
         
+        # Modelo final: todos los datos (los estadísticos son aditivos)
+        if self.backend.sufficient_stats:
+            self.stats = self._merge_stats(stats_train, self._compute_stats(X_test, y_test))
+            self._set_coefficients(*self.backend.solve(self.stats))
+        else:
+            self.stats = None
+            self.model = self.backend.fit(X, y)
+            self.is_trained = True
+        self.watermark = watermark
+        self.metrics = metrics
+        
+        # Intervalos con residuos dentro de muestra (train_model.py los reemplaza
+        # por los residuos fuera de muestra del backtesting)
+        self.fit_intervals(historical_data, self.model.predict(X))
+        
         logger.info(f"✅ Modelo entrenado - R² Test: {metrics['test_r2']:.3f}, MAE Test: {metrics['test_mae']:.1f}")
         
         return metrics
     
+    def update(self, new_data, watermark=None):
+        """
+        Actualiza el modelo con órdenes nuevas sin releer el historial
+        
+        Suma los estadísticos suficientes del bloque nuevo a los acumulados y
+        vuelve a resolver: el resultado es el mismo que reentrenar con todos los
+        datos. Hospitales y productos nuevos se agregan al vocabulario.
+        
+        Si new_data trae la columna 'cantidad_anterior' (ver
+        data_loader.load_aggregate_deltas), las filas con valor corresponden a
+        celdas serie × mes ya incluidas en el modelo: 'cantidad' es el incremento
+        y solo se actualizan X^T y (la fila de X no cambia).
+        
+        Args:
+            new_data: DataFrame con órdenes nuevas [fecha_orden, hospital, producto_estandarizado, cantidad]
+            watermark: Nuevo máximo created_at incluido (opcional)
+            
+        Returns:
+            dict con métricas del modelo anterior sobre los datos nuevos (fuera de muestra)
+        """
+        if not self.backend.sufficient_stats:
+            raise ValueError(f"El backend '{self.estimator}' no es incremental: reentrena con train().")
+        if self.stats is None:
+            raise ValueError("El modelo no tiene estadísticos acumulados. Llama a train() primero.")
+        
+        metrics = {'n_new': len(new_data), 'new_hospitals': 0, 'new_productos': 0}
+        if len(new_data) == 0:
+            if watermark is not None:
+                self.watermark = watermark
+            metrics['n_total'] = self.stats['n']
+            return metrics
+        
+        # Extender vocabularios con categorías no vistas
+        n_hosp_old = len(self.hospital_categories)
+        n_prod_old = len(self.producto_categories)
+        new_hosp = sorted(set(pd.factorize(new_data['hospital'])[1]) - set(self._hospital_index))
+        new_prod = sorted(set(pd.factorize(new_data['producto_estandarizado'])[1]) - set(self._producto_index))
+        if new_hosp or new_prod:
+            self._set_categories(self.hospital_categories + new_hosp, self.producto_categories + new_prod)
+            self._grow_stats(n_hosp_old, n_prod_old)
+            logger.info(f"  ➕ Vocabulario extendido: {len(new_hosp)} hospitales, {len(new_prod)} productos nuevos")
+        
+        X, delta = self._prepare_features(new_data, fit_encoders=False)
+        if 'cantidad_anterior' in new_data.columns:
+            anterior = new_data['cantidad_anterior'].to_numpy(dtype=np.float64)
+        else:
+            anterior = np.full(len(new_data), np.nan)
+        existing = ~np.isnan(anterior)
+        y = delta + np.where(existing, anterior, 0.0)
+        
+        # Evaluar el modelo vigente sobre los datos nuevos (categorías nuevas = coeficiente 0)
+        coef = np.zeros(X.shape[1])
+        n_num = len(NUMERIC_FEATURES)
+        n_hosp = len(self.hospital_categories)
+        old_coef = np.asarray(self.model.coef_)
+        coef[:n_num + n_hosp_old] = old_coef[:n_num + n_hosp_old]
+        coef[n_num + n_hosp:n_num + n_hosp + n_prod_old] = old_coef[n_num + n_hosp_old:]
+        metrics.update(self._regression_metrics(y, X @ coef + self.model.intercept_, 'holdout'))
+        
+        # Filas nuevas: se agregan completas
+        stats = self.stats
+        if (~existing).any():
+            stats = self._merge_stats(stats, self._compute_stats(X[~existing], y[~existing]))
+        
+        # Celdas existentes: misma fila de X, solo cambia el target
+        if existing.any():
+            stats = dict(stats)
+            stats['xty'] = stats['xty'] + np.asarray(X[existing].T @ delta[existing]).ravel()
+            stats['sum_y'] += float(delta[existing].sum())
+            stats['sum_yy'] += float((y[existing] ** 2 - anterior[existing] ** 2).sum())
+        
+        self.stats = stats
+        self._set_coefficients(*self.backend.solve(self.stats))
+        if watermark is not None:
+            self.watermark = watermark
+        
+        metrics.update({
+            'n_total': self.stats['n'],
+            'n_updated_cells': int(existing.sum()),
+            'new_hospitals': len(new_hosp),
+            'new_productos': len(new_prod),
+            'n_features': X.shape[1]
+        })
+        logger.info(f"✅ Modelo actualizado con {len(new_data)} registros nuevos (total: {self.stats['n']})")
+        
+        return metrics
+    
     def predict(self, hospital, producto, fecha_prediccion):
         """
         Predice la demanda para un hospital, producto y fecha específicos
         
+        Usa el camino escalar (_raw_points): búsqueda de coeficientes por índice,
+        sin construir DataFrames ni matrices de features.
+        
         Args:
             hospital: Nombre del hospital
             producto: Código del producto
@@ -157,51 +484,287 @@ class DemandPredictor:
         if not self.is_trained:
             raise ValueError("El modelo no ha sido entrenado. Llama a train() primero.")
         
-        # Crear DataFrame con los datos de entrada
-        df = pd.DataFrame([{
-            'fecha_orden': pd.to_datetime(fecha_prediccion),
-            'hospital': hospital,
-            'producto_estandarizado': producto,
-            'cantidad': 0  # Dummy, no se usa
-        }])
-        
-        # Preparar features
-        X, _ = self._prepare_features(df, fit_encoders=False)
-        
-        # Predecir
-        demanda = self.model.predict(X)[0]
+        dias, mes = self._date_point(fecha_prediccion)
+        demanda = self._raw_points(
+            np.array([self._hospital_index.get(hospital, -1)]),
+            np.array([self._producto_index.get(producto, -1)]),
+            np.array([dias]), np.array([mes])
+        )[0]
         
         # No permitir demandas negativas
-        demanda = max(0, demanda)
+        return int(round(max(0, demanda)))
+    
+    def _predict_frame(self, df):
+        """Predicción sin recortar para un DataFrame [hospital, producto_estandarizado, fecha_prediccion]"""
+        if not self.is_trained:
+            raise ValueError("El modelo no ha sido entrenado. Llama a train() primero.")
         
-        return int(round(demanda))
+        X, _ = self._prepare_features(df, fit_encoders=False, fecha_col='fecha_prediccion')
+        return self.model.predict(X)
     
-    def predict_batch(self, predictions_df):
+    def predict_batch(self, predictions_df, intervals=False):
         """
         Predice demanda para múltiples combinaciones hospital-producto-fecha
         
         Args:
             predictions_df: DataFrame con columnas [hospital, producto_estandarizado, fecha_prediccion]
+            intervals: Si es True agrega demanda_inferior, demanda_superior y confidence_score
             
         Returns:
             DataFrame con columna adicional 'demanda_estimada'
         """
+        raw = self._predict_frame(predictions_df)
+        
+        df = predictions_df[['hospital', 'producto_estandarizado', 'fecha_prediccion']].copy()
+        df['demanda_estimada'] = np.rint(np.maximum(0, raw)).astype(int)  # No negativas, redondeo como predict()
+        
+        if intervals:
+            std = self._residual_std_for(
+                self._encode(predictions_df['hospital'], self._hospital_index),
+                self._encode(predictions_df['producto_estandarizado'], self._producto_index)
+            )
+            for name, values in zip(INTERVAL_COLUMNS, self._interval_bounds(raw, std)):
+                df[name] = values
+        
+        return df
+    
+    def _coef_blocks(self):
+        """
+        Separa los coeficientes del modelo lineal en bloques
+
+        Returns:
+            (intercept, coef_numericos[3], coef_hospitales[H], coef_productos[P])
+        """
+        if not hasattr(self.model, 'coef_'):
+            raise ValueError("forecast_cube requiere un modelo lineal aditivo (coef_ / intercept_).")
+
+        coef = np.asarray(self.model.coef_, dtype=np.float64)
+        n_num = len(NUMERIC_FEATURES)
+        n_hosp = len(self.hospital_categories)
+        return (
+            float(self.model.intercept_),
+            coef[:n_num],
+            coef[n_num:n_num + n_hosp],
+            coef[n_num + n_hosp:]
+        )
+
+    def _raw_cube(self, h_codes, p_codes, dates):
+        """
+        Grilla sin recortar (n_hospitals, n_products, n_dates) en forma cerrada
+
+        Como el modelo es aditivo, cada celda es la suma de un término por hospital,
+        uno por producto y uno por fecha (intercept + tendencia + estacionalidad):
+        la grilla se obtiene por broadcasting sin construir filas ni matrices de features.
+        Con un backend no aditivo (hgb) se evalúan las filas de la grilla.
+        """
+        if not hasattr(self.model, 'coef_'):
+            dias, mes = self._date_features(dates)
+            n_h, n_p, n_d = len(h_codes), len(p_codes), len(dias)
+            raw = self._raw_points(
+                np.repeat(h_codes, n_p * n_d), np.tile(np.repeat(p_codes, n_d), n_h),
+                np.tile(dias, n_h * n_p), np.tile(mes, n_h * n_p)
+            )
+            return raw.reshape(n_h, n_p, n_d)
+        
+        intercept, c_num, c_hosp, c_prod = self._coef_blocks()
+
+        # Término por hospital y por producto (0 para categorías desconocidas)
+        h_term = np.where(h_codes >= 0, c_hosp[np.maximum(h_codes, 0)], 0.0) if len(c_hosp) else np.zeros(len(h_codes))
+        p_term = np.where(p_codes >= 0, c_prod[np.maximum(p_codes, 0)], 0.0) if len(c_prod) else np.zeros(len(p_codes))
+
+        # Término por fecha
+        dias, mes = self._date_features(dates)
+        angulo = (2 * np.pi / 12) * mes
+        t_term = intercept + c_num[0] * dias + c_num[1] * np.sin(angulo) + c_num[2] * np.cos(angulo)
+
+        return h_term[:, None, None] + p_term[None, :, None] + t_term[None, None, :]
+
+    def forecast_cube(self, hospitals, products, dates, as_frame=False, intervals=False):
+        """
+        Predice la grilla completa hospital × producto × fecha
+
+        Args:
+            hospitals: Lista de hospitales (sin duplicados)
+            products: Lista de productos (sin duplicados)
+            dates: Lista de fechas de predicción (cualquier horizonte)
+            as_frame: Si es True retorna formato largo igual a predict_batch
+            intervals: Si es True agrega los límites del intervalo y la confianza por celda
+
+        Returns:
+            np.ndarray de shape (n_hospitals, n_products, n_dates) con la demanda
+            (no negativa), o DataFrame [hospital, producto_estandarizado,
+            fecha_prediccion, demanda_estimada] si as_frame=True. Con intervals=True
+            el ndarray es una tupla (demanda, inferior, superior, confianza) y el
+            DataFrame incluye demanda_inferior, demanda_superior y confidence_score.
+        """
         if not self.is_trained:
             raise ValueError("El modelo no ha sido entrenado. Llama a train() primero.")
+
+        hospitals = pd.Index(hospitals)
+        products = pd.Index(products)
+        dates = pd.Series(dates)
+        h_codes = self._encode(hospitals, self._hospital_index)
+        p_codes = self._encode(products, self._producto_index)
+
+        raw = self._raw_cube(h_codes, p_codes, dates)
+        cube = np.maximum(raw, 0)  # No negativas
+
+        extra = {}
+        if intervals:
+            std = self._residual_std_for(h_codes[:, None], p_codes[None, :])[:, :, None]
+            extra = dict(zip(INTERVAL_COLUMNS, self._interval_bounds(raw, std)))
+
+        if not as_frame:
+            return (cube, *extra.values()) if intervals else cube
+
+        return cube_to_frame(cube, hospitals, products, dates, extra)
+
+    def _date_point(self, fecha):
+        """(dias, mes) de una fecha escalar, compartiendo la cache de _date_features"""
+        cached = self._date_cache.get(fecha)
+        if cached is None:
+            parsed = pd.Timestamp(fecha)
+            cached = ((parsed - self.fecha_referencia).days, parsed.month)
+            if len(self._date_cache) >= DATE_CACHE_MAX_SIZE:
+                self._date_cache.clear()
+            self._date_cache[fecha] = cached
+        return cached
+
+    def _raw_points(self, h_codes, p_codes, dias, mes):
+        """
+        Predicción sin recortar para puntos sueltos (arrays alineados)
+
+        Suma los coeficientes del hospital y del producto (búsqueda por índice)
+        y los términos de la fecha, sin construir la matriz de features (salvo
+        con un backend no aditivo, que evalúa la matriz de esos puntos).
+        """
+        if not hasattr(self.model, 'coef_'):
+            return self.model.predict(self._build_matrix(h_codes, p_codes, dias, mes))
+        
+        intercept, c_num, c_hosp, c_prod = self._coef_blocks()
+        angulo = (2 * np.pi / 12) * mes
+        raw = intercept + c_num[0] * dias + c_num[1] * np.sin(angulo) + c_num[2] * np.cos(angulo)
+        if len(c_hosp):
+            raw += np.where(h_codes >= 0, c_hosp[np.maximum(h_codes, 0)], 0.0)
+        if len(c_prod):
+            raw += np.where(p_codes >= 0, c_prod[np.maximum(p_codes, 0)], 0.0)
+        return raw
+
+    def forecast_points(self, hospitals, products, dates, intervals=True):
+        """
+        Predice combinaciones arbitrarias hospital-producto-fecha (listas alineadas)
+
+        Pensado para consultas en línea de pocos puntos (ver model_service.MicroBatcher):
+        los códigos salen de los vocabularios con búsquedas en dict y las fechas
+        de la cache, así que el costo es casi independiente del tamaño del modelo.
+
+        Args:
+            hospitals: Hospital de cada punto
+            products: Producto de cada punto
+            dates: Fecha de predicción de cada punto (cualquier horizonte)
+            intervals: Agregar demanda_inferior, demanda_superior y confidence_score
+                (si el modelo tiene intervalos ajustados)
+
+        Returns:
+            dict columna -> ndarray con demanda_estimada (no negativa, igual
+            que forecast_cube) y, si corresponde, las columnas del intervalo
+        """
+        if not self.is_trained:
+            raise ValueError("El modelo no ha sido entrenado. Llama a train() primero.")
+
+        n = len(hospitals)
+        h_codes = np.fromiter((self._hospital_index.get(h, -1) for h in hospitals), dtype=np.int64, count=n)
+        p_codes = np.fromiter((self._producto_index.get(p, -1) for p in products), dtype=np.int64, count=n)
+        fechas = np.array([self._date_point(d) for d in dates], dtype=np.int64).reshape(-1, 2)
+
+        raw = self._raw_points(h_codes, p_codes, fechas[:, 0], fechas[:, 1])
+        result = {'demanda_estimada': np.rint(np.maximum(raw, 0)).astype(int)}
+        if intervals and self.residual_std is not None:
+            bounds = self._interval_bounds(raw, self._residual_std_for(h_codes, p_codes))
+            result.update(zip(INTERVAL_COLUMNS, bounds))
+        return result
+
+    def fit_intervals(self, frame, predictions=None, level=INTERVAL_LEVEL,
+                      n_bootstrap=BOOTSTRAP_SAMPLES, random_state=42):
+        """
+        Estima la dispersión de los residuos para los intervalos de predicción
         
-        df = predictions_df.copy()
-        df['fecha_orden'] = df['fecha_prediccion']
-        df['cantidad'] = 0  # Dummy
+        La varianza por serie (hospital × producto) se contrae hacia la global con
+        RESIDUAL_SHRINKAGE observaciones virtuales. Los cuantiles del intervalo
+        salen de remuestrear (bootstrap) los residuos estandarizados: una matriz
+        (n_bootstrap, tamaño) en NumPy, sin loops por fila.
         
-        X, _ = self._prepare_features(df, fit_encoders=False)
+        Args:
+            frame: DataFrame [hospital, producto_estandarizado, cantidad] y,
+                si predictions es None, 'prediccion' (ej. backtest['predictions'])
+            predictions: Predicciones alineadas con frame (opcional)
+            level: Cobertura nominal del intervalo
+            n_bootstrap: Remuestreos bootstrap
+            random_state: Semilla
+        """
+        y = frame['cantidad'].to_numpy(dtype=np.float64)
+        pred = frame['prediccion'].to_numpy(dtype=np.float64) if predictions is None else np.asarray(predictions, dtype=np.float64)
+        residuals = y - pred
+        
+        n_hosp, n_prod = len(self.hospital_categories), len(self.producto_categories)
+        h_codes = self._encode(frame['hospital'], self._hospital_index)
+        p_codes = self._encode(frame['producto_estandarizado'], self._producto_index)
+        known = (h_codes >= 0) & (p_codes >= 0)
+        keys = h_codes[known].astype(np.int64) * n_prod + p_codes[known]
+        
+        global_var = float(np.mean(residuals ** 2)) if len(residuals) else 0.0
+        sum_sq = np.bincount(keys, weights=residuals[known] ** 2, minlength=n_hosp * n_prod)
+        counts = np.bincount(keys, minlength=n_hosp * n_prod)
+        var = (sum_sq + RESIDUAL_SHRINKAGE * global_var) / (counts + RESIDUAL_SHRINKAGE)
+        
+        self.residual_std = np.sqrt(var).reshape(n_hosp, n_prod).astype(np.float32)
+        self.residual_std_global = float(np.sqrt(global_var))
+        
+        # Cuantiles bootstrap de los residuos estandarizados
+        std_rows = self._residual_std_for(h_codes, p_codes).astype(np.float64)
+        z = np.divide(residuals, std_rows, out=np.zeros_like(residuals), where=std_rows > 0)
+        alpha = 1 - level
+        if len(z):
+            rng = np.random.default_rng(random_state)
+            samples = z[rng.integers(0, len(z), size=(n_bootstrap, min(len(z), BOOTSTRAP_POOL_SIZE)))]
+            q_lo, q_hi = np.quantile(samples, [alpha / 2, 1 - alpha / 2], axis=1).mean(axis=1)
+        else:
+            q_lo, q_hi = 0.0, 0.0
+        self.interval_quantiles = (float(q_lo), float(q_hi))
+        self.interval_level = level
         
-        demandas = self.model.predict(X)
-        demandas = np.maximum(0, demandas)  # No negativas
+        logger.info(f"📏 Intervalos {level:.0%}: σ global {self.residual_std_global:.1f}, "
+                    f"cuantiles estandarizados [{q_lo:.2f}, {q_hi:.2f}]")
+    
+    def _residual_std_for(self, h_codes, p_codes):
+        """σ de residuos por celda (σ global para series fuera de la matriz); admite broadcasting"""
+        if self.residual_std is None:
+            raise ValueError("El modelo no tiene intervalos: llama a fit_intervals() o reentrena.")
+        
+        h_codes, p_codes = np.broadcast_arrays(h_codes, p_codes)
+        n_hosp, n_prod = self.residual_std.shape
+        known = (h_codes >= 0) & (p_codes >= 0) & (h_codes < n_hosp) & (p_codes < n_prod)
+        std = np.full(h_codes.shape, self.residual_std_global, dtype=np.float32)
+        std[known] = self.residual_std[h_codes[known], p_codes[known]]
+        return std
+    
+    def _interval_bounds(self, raw, std):
+        """
+        Límites del intervalo y confianza por fila/celda (vectorizado)
         
-        df['demanda_estimada'] = demandas.astype(int)
+        La confianza es 100 × (1 - semiancho relativo del intervalo), acotada a
+        [0, 100]: 100 = intervalo de ancho cero, 0 = semiancho >= demanda estimada.
         
-        return df[['hospital', 'producto_estandarizado', 'fecha_prediccion', 'demanda_estimada']]
-    
+        Returns:
+            (inferior int, superior int, confidence_score float)
+        """
+        q_lo, q_hi = self.interval_quantiles
+        lower = np.maximum(0, raw + std * q_lo)
+        upper = np.maximum(0, raw + std * q_hi)
+        half_width = (upper - lower) / (2 * np.maximum(np.maximum(raw, 0), 1))
+        confidence = np.round(100 * np.clip(1 - half_width, 0, 1), 2)
+        return np.floor(lower).astype(int), np.ceil(upper).astype(int), confidence
+
     def get_feature_importance(self):
         """
         Retorna los coeficientes del modelo (importancia de features)
@@ -211,8 +774,10 @@ class DemandPredictor:
         """
         if not self.is_trained:
             raise ValueError("El modelo no ha sido entrenado.")
+        if not hasattr(self.model, 'coef_'):
+            raise ValueError(f"El backend '{self.estimator}' no tiene coeficientes.")
         
-        feature_names = ['dias_desde_inicio', 'mes_sin', 'mes_cos']
+        feature_names = list(NUMERIC_FEATURES)
         
         # Agregar nombres de hospitales y productos
         feature_names += [f'hospital_{h}' for h in self.hospital_categories]
@@ -220,6 +785,92 @@ class DemandPredictor:
         
         return dict(zip(feature_names, self.model.coef_))
     
+    def export_artifact(self, include_stats=True):
+        """
+        Separa el modelo en metadatos JSON y arrays NumPy (ver model_registry)
+        
+        Args:
+            include_stats: Incluir estadísticos suficientes (necesarios para update())
+            
+        Returns:
+            (meta, arrays): dict serializable a JSON y dict nombre -> ndarray
+        """
+        if not self.is_trained:
+            raise ValueError("No se puede exportar un modelo no entrenado.")
+        
+        meta = {
+            'params': self._artifact_params(),
+            'hospitales': list(self.hospital_categories),
+            'productos': list(self.producto_categories),
+            'watermark': self.watermark.isoformat() if self.watermark is not None else None,
+            'data_version': self.data_version,
+            'metrics': self.metrics,
+            'residual_std_global': self.residual_std_global,
+            'interval_quantiles': list(self.interval_quantiles) if self.interval_quantiles else None,
+            'interval_level': self.interval_level,
+        }
+        arrays = {}
+        if self.residual_std is not None:
+            arrays['residual_std'] = self.residual_std
+        meta.update(self._export_model(arrays, include_stats))
+        return meta, arrays
+    
+    def _artifact_params(self):
+        """Argumentos del constructor para reconstruir el modelo"""
+        return {
+            'fecha_referencia': self.fecha_referencia.isoformat(),
+            'estimator': self.estimator,
+            'estimator_params': self.estimator_params
+        }
+    
+    def _export_model(self, arrays, include_stats):
+        """Agrega a arrays los coeficientes y retorna los metadatos propios del modelo"""
+        if not hasattr(self.model, 'coef_'):
+            # Backend no lineal: el estimador serializado como bytes (no es memory-mappable)
+            arrays['estimator'] = np.frombuffer(pickle.dumps(self.model, protocol=pickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+            return {'intercept': None, 'stats': None}
+        arrays['coef'] = np.asarray(self.model.coef_, dtype=np.float64)
+        meta = {'intercept': float(self.model.intercept_), 'stats': None}
+        if include_stats and self.stats is not None:
+            for key in ('sum_x', 'xtx', 'xty'):
+                arrays[f'stats_{key}'] = self.stats[key]
+            meta['stats'] = {key: self.stats[key] for key in ('n', 'sum_y', 'sum_yy')}
+        return meta
+    
+    def _import_model(self, meta, arrays):
+        """Instala coeficientes (y estadísticos si existen) desde un artefacto"""
+        if 'estimator' in arrays:
+            self.model = pickle.loads(np.asarray(arrays['estimator']).tobytes())
+            self.is_trained = True
+            return
+        if meta.get('stats') is not None:
+            self.stats = {**meta['stats'], **{key: arrays[f'stats_{key}'] for key in ('sum_x', 'xtx', 'xty')}}
+        self._set_coefficients(arrays['coef'], meta['intercept'])
+    
+    @classmethod
+    def from_artifact(cls, meta, arrays):
+        """
+        Reconstruye un predictor desde metadatos y arrays (posiblemente memory-mapped)
+        
+        Args:
+            meta: dict de export_artifact (leído del manifest JSON)
+            arrays: dict nombre -> ndarray
+            
+        Returns:
+            Predictor entrenado
+        """
+        predictor = cls(**meta['params'])
+        predictor._set_categories(meta['hospitales'], meta['productos'])
+        predictor.watermark = datetime.fromisoformat(meta['watermark']) if meta.get('watermark') else None
+        predictor.data_version = meta.get('data_version')
+        predictor.metrics = meta.get('metrics')
+        predictor.residual_std = arrays.get('residual_std')
+        predictor.residual_std_global = meta.get('residual_std_global')
+        predictor.interval_quantiles = tuple(meta['interval_quantiles']) if meta.get('interval_quantiles') else None
+        predictor.interval_level = meta.get('interval_level')
+        predictor._import_model(meta, arrays)
+        return predictor
+    
     def save_model(self, filepath=None):
         """
         Guarda el modelo entrenado en disco
@@ -231,7 +882,7 @@ class DemandPredictor:
             raise ValueError("No se puede guardar un modelo no entrenado.")
         
         if filepath is None:
-            filepath = os.path.join(MODELS_DIR, 'demand_model.pkl')
+            filepath = os.path.join(MODELS_DIR, self.MODEL_FILENAME)
         
         # Guardar todo el objeto
         joblib.dump(self, filepath)
@@ -251,7 +902,7 @@ class DemandPredictor:
             DemandPredictor cargado
         """
         if filepath is None:
-            filepath = os.path.join(MODELS_DIR, 'demand_model.pkl')
+            filepath = os.path.join(MODELS_DIR, cls.MODEL_FILENAME)
         
         if not os.path.exists(filepath):
             raise FileNotFoundError(f"No se encontró el modelo en: {filepath}")
@@ -262,23 +913,60 @@ class DemandPredictor:
         return predictor
 
 
-def calculate_confidence_score(model, X):
+def temporal_split(fechas, test_size=0.2):
+    """
+    Separa train/test por fecha: el test son las fechas más recientes
+    
+    Una fecha nunca queda repartida entre ambos lados. El corte es la primera
+    fecha a partir de la cual queda a lo más test_size de las filas (y al menos
+    una fecha en test).
+    
+    Args:
+        fechas: Serie/array de fechas
+        test_size: Proporción aproximada de filas en test
+        
+    Returns:
+        array bool, True para filas de test
+    """
+    fechas = pd.to_datetime(pd.Series(fechas)).to_numpy()
+    uniques, counts = np.unique(fechas, return_counts=True)
+    if len(uniques) < 2:
+        raise ValueError("Se necesitan al menos 2 fechas distintas para un split temporal.")
+    
+    # Proporción de filas anteriores a cada fecha
+    before = (np.cumsum(counts) - counts) / len(fechas)
+    cut = min(max(int(np.searchsorted(before, 1 - test_size)), 1), len(uniques) - 1)
+    return fechas >= uniques[cut]
+
+
+def cube_to_frame(cube, hospitals, products, dates, extra=None):
     """
-    Calcula un score de confianza simple basado en la predicción
+    Convierte una grilla (n_hospitals, n_products, n_dates) al formato largo de predict_batch
     
     Args:
-        model: Modelo entrenado
-        X: Features
+        cube: ndarray de demandas
+        hospitals: Hospitales (sin duplicados), en el orden del eje 0
+        products: Productos (sin duplicados), en el orden del eje 1
+        dates: Fechas de predicción, en el orden del eje 2
+        extra: dict opcional columna -> ndarray de la misma forma que cube
         
     Returns:
-        Score de confianza entre 0 y 100
+        DataFrame [hospital, producto_estandarizado, fecha_prediccion, demanda_estimada]
     """
-    # Método simple: usar R² del modelo como proxy de confianza
-    # En un modelo real podrías usar validación cruzada o intervalos de confianza
+    hospitals = pd.Index(hospitals)
+    products = pd.Index(products)
+    if hospitals.has_duplicates or products.has_duplicates:
+        raise ValueError("hospitals y products no deben tener duplicados en formato largo.")
     
-    # Por ahora retornamos un valor fijo basado en la calidad general del modelo
-    # que se puede ajustar después según métricas reales
-    return 90.0  # Placeholder - en train_model.py usaremos el R² real
+    n_h, n_p, n_d = cube.shape
+    return pd.DataFrame({
+        'hospital': pd.Categorical.from_codes(np.repeat(np.arange(n_h), n_p * n_d), categories=hospitals),
+        'producto_estandarizado': pd.Categorical.from_codes(
+            np.tile(np.repeat(np.arange(n_p), n_d), n_h), categories=products),
+        'fecha_prediccion': np.tile(pd.DatetimeIndex(dates).to_numpy(), n_h * n_p),
+        'demanda_estimada': np.rint(cube.ravel()).astype(int),
+        **{name: np.broadcast_to(values, cube.shape).ravel() for name, values in (extra or {}).items()}
+    })
 
 
 if __name__ == "__main__":
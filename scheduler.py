@@ -0,0 +1,371 @@
+"""
+Scheduler de Entrenamiento y Re-forecast
+
+Proceso de larga duración que corre el pipeline de train_model.py cuando:
+
+- pasaron SCHEDULER_INTERVAL_MINUTES desde el último forecast exitoso, o
+- hay SCHEDULER_MIN_NEW_ORDERS órdenes nuevas o modificadas desde ese forecast
+  (y pasaron al menos SCHEDULER_MIN_GAP_MINUTES)
+
+El último forecast exitoso y su watermark se leen de ejecuciones_prediccion, así
+que todos los nodos ven el mismo estado. Antes de correr se toma el advisory
+lock FORECAST_LOCK_KEY (el mismo que toma train_model.py manual): si otro nodo
+lo tiene, este espera al siguiente ciclo; con el lock se vuelve a evaluar el
+disparo, porque el otro nodo pudo terminar recién.
+
+Si un run falla, el siguiente intento espera un backoff exponencial con jitter
+(SCHEDULER_BACKOFF_SECONDS, duplicándose hasta SCHEDULER_BACKOFF_MAX_SECONDS) y
+retoma el run fallido desde su última etapa completa (ver pipeline.py).
+
+Métricas en formato Prometheus en http://<host>:SCHEDULER_METRICS_PORT/metrics
+(y JSON en /status): duración de los runs, runs por resultado, lag desde el
+último forecast exitoso y cola de órdenes pendientes.
+"""
+import json
+import logging
+import random
+import shlex
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+from database import advisory_lock, get_connection
+from train_model import build_parser, build_training_pipeline, run_training
+
+logger = logging.getLogger(__name__)
+
+# Último forecast exitoso, su antigüedad (reloj de la BD) y órdenes pendientes desde su watermark
+STATUS_QUERY = """
+WITH ultima AS (
+    SELECT watermark, created_at
+    FROM ejecuciones_prediccion
+    ORDER BY id DESC
+    LIMIT 1
+)
+SELECT (SELECT created_at FROM ultima),
+       EXTRACT(EPOCH FROM LOCALTIMESTAMP - (SELECT created_at FROM ultima)),
+       (SELECT COUNT(*) FROM ordenes_compra
+        WHERE COALESCE(updated_at, created_at) > COALESCE((SELECT watermark FROM ultima), '-infinity'::timestamp))
+"""
+
+
+def get_forecast_status():
+    """
+    Estado del forecast según la BD
+
+    Returns:
+        dict con last_forecast_at (None si nunca hubo), lag_seconds y
+        queue_depth (órdenes nuevas o modificadas desde el último forecast)
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(STATUS_QUERY)
+    last_forecast_at, lag_seconds, queue_depth = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return {
+        'last_forecast_at': last_forecast_at,
+        'lag_seconds': None if lag_seconds is None else float(lag_seconds),
+        'queue_depth': int(queue_depth),
+    }
+
+
+def due_reason(status, interval_minutes, min_new_orders, min_gap_minutes):
+    """
+    Motivo para correr ahora, o None si no corresponde
+
+    Args:
+        status: get_forecast_status()
+        interval_minutes: Antigüedad máxima del último forecast
+        min_new_orders: Órdenes pendientes que adelantan el run (0 = desactivado)
+        min_gap_minutes: Antigüedad mínima del último forecast para el disparo por volumen
+    """
+    if status['last_forecast_at'] is None:
+        return 'sin forecast anterior'
+    lag_minutes = status['lag_seconds'] / 60
+    if lag_minutes >= interval_minutes:
+        return f"programado (último forecast hace {lag_minutes:.0f} min)"
+    if min_new_orders and status['queue_depth'] >= min_new_orders and lag_minutes >= min_gap_minutes:
+        return f"{status['queue_depth']:,} órdenes nuevas o modificadas"
+    return None
+
+
+def backoff_seconds(failures, base=None, cap=None):
+    """Espera antes del reintento número `failures` (exponencial con jitter)"""
+    base = config.SCHEDULER_BACKOFF_SECONDS if base is None else base
+    cap = config.SCHEDULER_BACKOFF_MAX_SECONDS if cap is None else cap
+    delay = min(cap, base * 2 ** max(failures - 1, 0))
+    # Jitter: nodos que fallan juntos (ej. BD caída) no reintentan a la vez
+    return delay * random.uniform(0.5, 1.0)
+
+
+class SchedulerMetrics:
+    """Contadores y gauges del scheduler (thread-safe, expuestos por HTTP)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = {'success': 0, 'failed': 0}
+        self.lock_busy = 0
+        self.duration_sum = 0.0
+        self.duration_count = 0
+        self.last_duration = None
+        self.last_status = None
+        self.last_success_at = None
+        self.consecutive_failures = 0
+        self.running = False
+        self.next_retry_at = None
+        self.lag_seconds = None
+        self.queue_depth = None
+
+    def observe_status(self, status):
+        with self._lock:
+            self.lag_seconds = status['lag_seconds']
+            self.queue_depth = status['queue_depth']
+
+    def record_lock_busy(self):
+        with self._lock:
+            self.lock_busy += 1
+
+    def set_running(self, running):
+        with self._lock:
+            self.running = running
+
+    def record_run(self, ok, seconds):
+        with self._lock:
+            self.running = False
+            status = 'success' if ok else 'failed'
+            self.runs[status] += 1
+            self.duration_sum += seconds
+            self.duration_count += 1
+            self.last_duration = seconds
+            self.last_status = status
+            if ok:
+                self.last_success_at = time.time()
+                self.consecutive_failures = 0
+            else:
+                self.consecutive_failures += 1
+
+    def snapshot(self):
+        """Estado para /status"""
+        with self._lock:
+            return {
+                'runs': dict(self.runs),
+                'duration_sum_s': self.duration_sum,
+                'duration_count': self.duration_count,
+                'lock_busy': self.lock_busy,
+                'running': self.running,
+                'last_status': self.last_status,
+                'last_duration_s': self.last_duration,
+                'last_success_at': self.last_success_at,
+                'consecutive_failures': self.consecutive_failures,
+                'next_retry_at': self.next_retry_at,
+                'forecast_lag_s': self.lag_seconds,
+                'queue_depth': self.queue_depth,
+            }
+
+    def render_prometheus(self):
+        """Métricas en el formato de texto de Prometheus"""
+        s = self.snapshot()
+        lines = [
+            '# HELP forecast_scheduler_runs_total Runs de entrenamiento y re-forecast por resultado',
+            '# TYPE forecast_scheduler_runs_total counter',
+        ]
+        lines += [f'forecast_scheduler_runs_total{{status="{k}"}} {v}' for k, v in s['runs'].items()]
+        lines += [
+            '# HELP forecast_scheduler_lock_busy_total Disparos omitidos porque otro proceso tenía el lock',
+            '# TYPE forecast_scheduler_lock_busy_total counter',
+            f"forecast_scheduler_lock_busy_total {s['lock_busy']}",
+            '# HELP forecast_scheduler_run_duration_seconds Duración de los runs',
+            '# TYPE forecast_scheduler_run_duration_seconds summary',
+            f"forecast_scheduler_run_duration_seconds_sum {s['duration_sum_s']:.3f}",
+            f"forecast_scheduler_run_duration_seconds_count {s['duration_count']}",
+        ]
+        gauges = {
+            'forecast_scheduler_last_run_duration_seconds': ('Duración del último run', s['last_duration_s']),
+            'forecast_scheduler_last_success_timestamp_seconds': ('Fin del último run exitoso de este proceso', s['last_success_at']),
+            'forecast_scheduler_forecast_lag_seconds': ('Antigüedad del último forecast exitoso (cualquier nodo)', s['forecast_lag_s']),
+            'forecast_scheduler_queue_depth': ('Órdenes nuevas o modificadas desde el último forecast', s['queue_depth']),
+            'forecast_scheduler_consecutive_failures': ('Runs fallidos seguidos', s['consecutive_failures']),
+            'forecast_scheduler_running': ('1 si hay un run en curso en este proceso', int(s['running'])),
+        }
+        for name, (help_text, value) in gauges.items():
+            if value is None:
+                continue
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+def serve_metrics(metrics, port):
+    """Sirve /metrics (Prometheus) y /status (JSON) en un hilo daemon"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = metrics.render_prometheus(), 'text/plain; version=0.0.4'
+            elif self.path == '/status':
+                body, content_type = json.dumps(metrics.snapshot(), default=str), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            data = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+    threading.Thread(target=server.serve_forever, name='scheduler-metrics', daemon=True).start()
+    logger.info(f"📈 Métricas del scheduler en http://0.0.0.0:{port}/metrics")
+    return server
+
+
+class ForecastScheduler:
+    """Dispara train_model por horario o volumen de órdenes, con lock y backoff"""
+
+    def __init__(self, train_argv=(), interval_minutes=None, min_new_orders=None,
+                 min_gap_minutes=None, poll_seconds=None, metrics=None):
+        """
+        Args:
+            train_argv: Argumentos de train_model.py para cada run (ej. ['--estimator', 'hgb'])
+            interval_minutes: default SCHEDULER_INTERVAL_MINUTES
+            min_new_orders: default SCHEDULER_MIN_NEW_ORDERS
+            min_gap_minutes: default SCHEDULER_MIN_GAP_MINUTES
+            poll_seconds: Intervalo de revisión (default SCHEDULER_POLL_SECONDS)
+            metrics: SchedulerMetrics compartido (default: uno nuevo)
+        """
+        self.train_argv = list(train_argv)
+        build_parser().parse_args(self.train_argv)  # validar antes de arrancar
+        self.interval_minutes = config.SCHEDULER_INTERVAL_MINUTES if interval_minutes is None else interval_minutes
+        self.min_new_orders = config.SCHEDULER_MIN_NEW_ORDERS if min_new_orders is None else min_new_orders
+        self.min_gap_minutes = config.SCHEDULER_MIN_GAP_MINUTES if min_gap_minutes is None else min_gap_minutes
+        self.poll_seconds = config.SCHEDULER_POLL_SECONDS if poll_seconds is None else poll_seconds
+        self.metrics = metrics or SchedulerMetrics()
+
+        self._stop = threading.Event()
+        self._retry_at = 0.0
+        self._last_attempt = None
+
+    def stop(self):
+        """Termina después del run en curso (si hay)"""
+        self._stop.set()
+
+    def _reason(self):
+        status = get_forecast_status()
+        self.metrics.observe_status(status)
+        return due_reason(status, self.interval_minutes, self.min_new_orders, self.min_gap_minutes)
+
+    def tick(self):
+        """
+        Una revisión: corre el pipeline si corresponde
+
+        Returns:
+            True si se ejecutó un run exitoso, False si falló, None si no se ejecutó
+        """
+        now = time.monotonic()
+        if now < self._retry_at:
+            return None
+        # Un run que terminó sin forecast (ej. datos insuficientes) no se repite en cada revisión
+        if (self.metrics.consecutive_failures == 0 and self._last_attempt is not None
+                and now - self._last_attempt < self.min_gap_minutes * 60):
+            return None
+
+        reason = self._reason()
+        if reason is None:
+            return None
+
+        with advisory_lock(config.FORECAST_LOCK_KEY) as locked:
+            if not locked:
+                self.metrics.record_lock_busy()
+                logger.info(f"🔒 Disparo ({reason}) omitido: otro proceso tiene el lock de forecast")
+                return None
+            # Con el lock: otro nodo pudo terminar un run justo antes
+            reason = self._reason()
+            if reason is None:
+                return None
+            return self._run(reason)
+
+    def _run(self, reason):
+        args = build_parser().parse_args(self.train_argv)
+        resumable = build_training_pipeline().last_resumable() if self.metrics.consecutive_failures else None
+        if resumable:
+            args.resume = resumable
+        logger.info(f"⏰ Run de forecast: {reason}" + (f" (retomando {resumable})" if resumable else ""))
+
+        self.metrics.set_running(True)
+        self._last_attempt = time.monotonic()
+        t0 = time.perf_counter()
+        try:
+            ok = run_training(args) == 0
+        except Exception as e:
+            logger.error(f"❌ Run de forecast falló: {e}", exc_info=True)
+            ok = False
+        seconds = time.perf_counter() - t0
+        self.metrics.record_run(ok, seconds)
+
+        if ok:
+            self._retry_at = 0.0
+            self.metrics.next_retry_at = None
+            logger.info(f"✅ Run de forecast completado en {seconds:.1f}s")
+        else:
+            wait = backoff_seconds(self.metrics.consecutive_failures)
+            self._retry_at = time.monotonic() + wait
+            self.metrics.next_retry_at = time.time() + wait
+            logger.warning(f"⚠️  Run de forecast falló ({self.metrics.consecutive_failures} seguidos); "
+                           f"reintento en {wait:.0f}s")
+        return ok
+
+    def run_forever(self):
+        """Revisa cada poll_seconds hasta stop() (SIGTERM/SIGINT)"""
+        logger.info(f"🗓️  Scheduler: cada {self.interval_minutes:g} min o {self.min_new_orders:,} órdenes nuevas "
+                    f"(mínimo {self.min_gap_minutes:g} min), revisión cada {self.poll_seconds:g}s")
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                # BD inaccesible al revisar: se reintenta en la próxima revisión
+                logger.error(f"❌ Error revisando el estado del forecast: {e}")
+            self._stop.wait(self.poll_seconds)
+        logger.info("👋 Scheduler detenido")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Scheduler de entrenamiento y re-forecast")
+    parser.add_argument('command', nargs='?', choices=['run', 'once', 'status'], default='run',
+                        help='run: proceso continuo; once: una revisión (para cron); status: estado en la BD')
+    parser.add_argument('--train-args', default='',
+                        help='Argumentos de train_model.py para cada run (ej. "--estimator hgb --n-jobs 4")')
+    parser.add_argument('--interval-minutes', type=float, default=None)
+    parser.add_argument('--min-new-orders', type=int, default=None)
+    parser.add_argument('--poll-seconds', type=float, default=None)
+    parser.add_argument('--metrics-port', type=int, default=config.SCHEDULER_METRICS_PORT,
+                        help='Puerto de /metrics y /status (0 = desactivado)')
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        status = get_forecast_status()
+        print(f"Último forecast: {status['last_forecast_at'] or '-'}")
+        if status['lag_seconds'] is not None:
+            print(f"Lag: {status['lag_seconds'] / 60:.0f} min")
+        print(f"Órdenes pendientes: {status['queue_depth']:,}")
+        raise SystemExit(0)
+
+    scheduler = ForecastScheduler(
+        train_argv=shlex.split(args.train_args), interval_minutes=args.interval_minutes,
+        min_new_orders=args.min_new_orders, poll_seconds=args.poll_seconds
+    )
+    if args.command == 'once':
+        raise SystemExit(0 if scheduler.tick() is not False else 1)
+
+    if args.metrics_port:
+        serve_metrics(scheduler.metrics, args.metrics_port)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: scheduler.stop())
+    scheduler.run_forever()
@@ -0,0 +1,415 @@
+"""
+Estandarización Semántica de Productos (embeddings)
+
+Para las descripciones que las palabras clave (standardizer.py) no logran
+clasificar: cada descripción se codifica con el modelo multilingüe MiniLM
+(sentence-transformers, en CPU) y se asigna a la categoría cuyo centroide es
+más cercano (similitud coseno), si supera EMBEDDING_MIN_SIMILARITY.
+
+Los centroides salen de los productos del catálogo (nombre, descripción y
+palabras clave) y de una muestra de descripciones ya etiquetadas por categoría.
+
+Las descripciones de ChileCompra se repiten mucho, así que los embeddings se
+guardan en un cache en disco (EmbeddingCache) con llave = hash del texto
+normalizado: solo se codifican los textos nunca vistos.
+
+    models/embeddings/<modelo>/
+        meta.json        modelo y dimensión
+        keys.u64         hash (blake2b 64 bits) de cada texto, en orden de inserción
+        vectors.f16      embeddings float16 normalizados (n × dim), memory-mapped
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+
+import config
+from database import get_connection
+from standardizer import ProductStandardizer, load_catalog, normalize_descriptions
+
+logger = logging.getLogger(__name__)
+
+LABELED_QUERY = """
+SELECT producto_estandarizado, descripcion_item
+FROM (
+    SELECT producto_estandarizado, descripcion_item,
+           ROW_NUMBER() OVER (PARTITION BY producto_estandarizado ORDER BY COUNT(*) DESC) AS rn
+    FROM ordenes_compra
+    WHERE producto_estandarizado IS NOT NULL
+      AND descripcion_item IS NOT NULL
+    GROUP BY producto_estandarizado, descripcion_item
+) t
+WHERE rn <= %s
+"""
+
+
+def text_keys(texts):
+    """
+    Llave de cache de cada texto (ya normalizado)
+
+    64 bits de blake2b: con 10 millones de textos distintos la probabilidad
+    de una colisión es ~3e-6.
+
+    Returns:
+        ndarray uint64
+    """
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little') for text in texts),
+        dtype=np.uint64, count=len(texts)
+    )
+
+
+class EmbeddingCache:
+    """Cache append-only de embeddings float16 por hash de texto"""
+
+    def __init__(self, directory, dim, model_name=None):
+        """
+        Args:
+            directory: Directorio del cache (uno por modelo)
+            dim: Dimensión de los embeddings
+            model_name: Modelo que los genera (se verifica contra meta.json)
+        """
+        self.directory = directory
+        self.dim = dim
+        self.keys_path = os.path.join(directory, 'keys.u64')
+        self.vectors_path = os.path.join(directory, 'vectors.f16')
+        os.makedirs(directory, exist_ok=True)
+
+        meta_path = os.path.join(directory, 'meta.json')
+        meta = {'model': model_name, 'dim': dim}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                stored = json.load(f)
+            if stored != meta:
+                raise ValueError(f"El cache {directory} es de {stored}, no de {meta}.")
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+
+        self._keys = np.empty(0, dtype=np.uint64)
+        self._order = np.empty(0, dtype=np.int64)
+        self._vectors = np.empty((0, dim), dtype=np.float16)
+        self.hits = 0
+        self.misses = 0
+        self._refresh()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _lock(self):
+        """Lock exclusivo del cache entre procesos (se libera al cerrar el archivo)"""
+        handle = open(os.path.join(self.directory, '.lock'), 'w')
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def _refresh(self):
+        """Relee llaves y mapea los vectores (incluye lo que agregaron otros procesos)"""
+        keys = np.fromfile(self.keys_path, dtype=np.uint64) if os.path.exists(self.keys_path) else self._keys[:0]
+        if len(keys) == len(self._keys):
+            return
+        self._keys = keys
+        self._order = np.argsort(keys, kind='stable')
+        # keys.u64 se escribe después de vectors.f16: define cuántas filas son válidas
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float16, mode='r', shape=(len(keys), self.dim))
+
+    def lookup(self, keys):
+        """
+        Fila del cache de cada llave
+
+        Returns:
+            ndarray int64 (-1 si la llave no está)
+        """
+        if not len(self._keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        sorted_keys = self._keys[self._order]
+        position = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        return np.where(sorted_keys[position] == keys, self._order[position], -1)
+
+    def get(self, rows):
+        """Embeddings (float32) de filas del cache"""
+        return np.asarray(self._vectors[rows], dtype=np.float32)
+
+    def append(self, keys, vectors):
+        """
+        Agrega embeddings nuevos (las llaves que otro proceso ya agregó se omiten)
+
+        Args:
+            keys: ndarray uint64 (sin repetidos)
+            vectors: ndarray (n × dim)
+        """
+        with self._lock():
+            self._refresh()
+            new = self.lookup(keys) < 0
+            if not new.any():
+                return
+            size = len(self._keys) * self.dim * 2
+            with open(self.vectors_path, 'ab') as f:
+                # Cola de un append interrumpido (vectores sin llave): se descarta
+                f.truncate(size)
+                f.write(np.ascontiguousarray(vectors[new], dtype=np.float16).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_path, 'ab') as f:
+                f.write(np.ascontiguousarray(keys[new], dtype=np.uint64).tobytes())
+            self._refresh()
+
+    def stats(self):
+        """Entradas, MB en disco y aciertos / fallos de esta instancia"""
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        total = self.hits + self.misses
+        return {'entries': len(self), 'mb': size / 1e6, 'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0}
+
+
+def _model_slug(model_name):
+    """Nombre de directorio para el cache de un modelo"""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+
+
+class SentenceEncoder:
+    """Modelo sentence-transformers en CPU, cargado al primer uso"""
+
+    def __init__(self, model_name=None, batch_size=None, threads=None):
+        self.model_name = model_name or config.SEMANTIC_EMBEDDING_MODEL
+        self.batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+        self.threads = threads or config.EMBEDDING_THREADS
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            import torch
+            from sentence_transformers import SentenceTransformer
+
+            torch.set_num_threads(self.threads)
+            logger.info(f"🧠 Cargando {self.model_name} (CPU, {self.threads} hilos)...")
+            self._model = SentenceTransformer(self.model_name, device='cpu')
+        return self._model
+
+    @property
+    def dim(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def __call__(self, texts):
+        """Embeddings normalizados (ndarray float32 n × dim)"""
+        return self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                 normalize_embeddings=True, show_progress_bar=False)
+
+
+class EmbeddingStandardizer:
+    """Clasificador por centroide más cercano con cache de embeddings"""
+
+    def __init__(self, encoder=None, cache_dir=None, min_similarity=None):
+        """
+        Args:
+            encoder: Callable textos -> embeddings normalizados, con atributos
+                model_name y dim (default: SentenceEncoder())
+            cache_dir: Directorio raíz del cache (default: EMBEDDING_CACHE_DIR)
+            min_similarity: Similitud coseno mínima al centroide (default: EMBEDDING_MIN_SIMILARITY)
+        """
+        self.encoder = encoder or SentenceEncoder()
+        self.min_similarity = config.EMBEDDING_MIN_SIMILARITY if min_similarity is None else min_similarity
+        directory = os.path.join(cache_dir or config.EMBEDDING_CACHE_DIR, _model_slug(self.encoder.model_name))
+        self.cache = EmbeddingCache(directory, self.encoder.dim, self.encoder.model_name)
+        self.categorias = np.empty(0, dtype=object)
+        self.centroids = np.empty((0, self.encoder.dim), dtype=np.float32)
+
+    def cache_rows(self, texts):
+        """
+        Fila del cache de cada texto ya normalizado; solo se codifican los que no están
+
+        Args:
+            texts: Lista / array de strings (sin repetidos ni None)
+
+        Returns:
+            ndarray int64
+        """
+        keys = text_keys(texts)
+        rows = self.cache.lookup(keys)
+        missing = np.flatnonzero(rows < 0)
+        self.cache.hits += len(texts) - len(missing)
+        self.cache.misses += len(missing)
+        if len(missing):
+            t0 = time.perf_counter()
+            vectors = self.encoder([texts[i] for i in missing])
+            self.cache.append(keys[missing], vectors)
+            logger.info(f"🧠 {len(missing):,} textos nuevos codificados en {time.perf_counter() - t0:.1f}s "
+                        f"({len(texts) - len(missing):,} desde cache)")
+            rows = self.cache.lookup(keys)
+        return rows
+
+    def embed(self, texts):
+        """Embeddings (float32 n × dim) de textos ya normalizados, ver cache_rows"""
+        return self.cache.get(self.cache_rows(texts))
+
+    def embedding_rows(self, descriptions):
+        """
+        Fila del cache de cada descripción (la codifica si hace falta)
+
+        Returns:
+            ndarray int64 alineado con la entrada (-1 si la descripción queda vacía)
+        """
+        codes, uniques = pd.factorize(self._prepare(descriptions))
+        rows = self.cache_rows(list(uniques)) if len(uniques) else np.empty(0, dtype=np.int64)
+        return np.append(rows, -1)[codes]
+
+    def _prepare(self, descriptions):
+        """Textos normalizados para el modelo (minúsculas, sin tildes ni puntuación)"""
+        values = descriptions if isinstance(descriptions, pd.Series) else pd.Series(descriptions, dtype=object)
+        normalized = pc.utf8_lower(normalize_descriptions(values))
+        prepared = pd.Series(normalized.to_numpy(zero_copy_only=False), index=values.index, dtype=object)
+        return prepared.mask(prepared == '', None)
+
+    def fit(self, catalog, labeled=None):
+        """
+        Calcula un centroide por categoría
+
+        Args:
+            catalog: DataFrame con categoria y nombre_producto / descripcion / palabras_clave
+            labeled: DataFrame opcional [producto_estandarizado, descripcion_item] con
+                descripciones ya clasificadas
+
+        Returns:
+            self
+        """
+        catalog = pd.DataFrame(catalog)
+        parts = [catalog[col].fillna('').astype(str) for col in ('nombre_producto', 'descripcion') if col in catalog]
+        if 'palabras_clave' in catalog:
+            parts.append(catalog['palabras_clave'].map(lambda kws: ' '.join(kws) if kws is not None else ''))
+        texts = pd.concat([pd.Series(catalog['categoria'].to_numpy(), dtype=object),
+                           pd.Series([' '.join(p) for p in zip(*parts)], dtype=object)], axis=1)
+        texts.columns = ['categoria', 'texto']
+        if labeled is not None and len(labeled):
+            texts = pd.concat([texts, pd.DataFrame({'categoria': labeled['producto_estandarizado'].to_numpy(),
+                                                    'texto': labeled['descripcion_item'].to_numpy()})],
+                              ignore_index=True)
+        texts['texto'] = self._prepare(texts['texto']).to_numpy()
+        texts = texts.dropna().drop_duplicates()
+        if texts.empty:
+            raise ValueError("No hay textos para calcular centroides.")
+
+        codes, uniques = pd.factorize(texts['texto'])
+        vectors = self.embed(list(uniques))[codes]
+        self.categorias, category = np.unique(texts['categoria'].to_numpy(dtype=str), return_inverse=True)
+        self.categorias = self.categorias.astype(object)
+        centroids = np.zeros((len(self.categorias), vectors.shape[1]), dtype=np.float32)
+        np.add.at(centroids, category, vectors)
+        self.centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+        return self
+
+    @classmethod
+    def from_db(cls, labeled_per_category=None, **kwargs):
+        """Standardizer con centroides del catálogo y de las descripciones más frecuentes ya etiquetadas"""
+        labeled_per_category = config.EMBEDDING_LABELED_SAMPLE if labeled_per_category is None else labeled_per_category
+        catalog = load_catalog()
+        labeled = None
+        if labeled_per_category:
+            conn = get_connection()
+            labeled = pd.read_sql_query(LABELED_QUERY, conn, params=(labeled_per_category,))
+            conn.close()
+        return cls(**kwargs).fit(catalog, labeled)
+
+    def classify(self, descriptions, batch_size=None):
+        """
+        Clasifica por centroide más cercano
+
+        Args:
+            descriptions: Series / lista de strings
+            batch_size: Textos distintos por lote (default: STANDARDIZER_BATCH_SIZE)
+
+        Returns:
+            DataFrame [producto_estandarizado, similitud] alineado con la entrada
+        """
+        batch_size = batch_size or config.STANDARDIZER_BATCH_SIZE
+        prepared = self._prepare(descriptions)
+        codes, uniques = pd.factorize(prepared)
+        best = np.full(len(uniques), -1, dtype=np.int64)
+        similarity = np.zeros(len(uniques), dtype=np.float32)
+        for start in range(0, len(uniques), batch_size):
+            scores = self.embed(list(uniques[start:start + batch_size])) @ self.centroids.T
+            best[start:start + batch_size] = scores.argmax(axis=1)
+            similarity[start:start + batch_size] = scores.max(axis=1)
+        best[similarity < self.min_similarity] = -1
+
+        categorias = np.append(self.categorias, None)
+        return pd.DataFrame({
+            'producto_estandarizado': pd.Series(categorias[np.append(best, -1)[codes]], index=prepared.index,
+                                                dtype=object),
+            'similitud': pd.Series(np.append(similarity, np.nan)[codes], index=prepared.index),
+        })
+
+    def standardize(self, descriptions):
+        """producto_estandarizado de cada descripción (None bajo el umbral)"""
+        return self.classify(descriptions)['producto_estandarizado']
+
+
+class HybridStandardizer:
+    """Palabras clave primero; embeddings solo para lo que las reglas no clasifican"""
+
+    def __init__(self, rules, semantic):
+        self.rules = rules
+        self.semantic = semantic
+
+    @classmethod
+    def from_db(cls):
+        return cls(ProductStandardizer.from_db(), EmbeddingStandardizer.from_db())
+
+    def classify(self, descriptions):
+        """
+        Returns:
+            DataFrame [producto_estandarizado, metodo] ('reglas', 'embedding' o None)
+        """
+        result = self.rules.classify(descriptions)[['producto_estandarizado']]
+        result['metodo'] = pd.Series(np.where(result['producto_estandarizado'].notna(), 'reglas', None),
+                                     index=result.index, dtype=object)
+        pending = result['producto_estandarizado'].isna()
+        if pending.any():
+            values = descriptions if isinstance(descriptions, pd.Series) else pd.Series(descriptions, dtype=object)
+            semantic = self.semantic.standardize(values[pending.to_numpy()])
+            result.loc[pending, 'producto_estandarizado'] = semantic.to_numpy()
+            result.loc[pending & result['producto_estandarizado'].notna(), 'metodo'] = 'embedding'
+        return result
+
+    def standardize(self, descriptions):
+        return self.classify(descriptions)['producto_estandarizado']
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from standardizer import backfill, evaluate
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Estandarización de productos por reglas + embeddings")
+    parser.add_argument('command', choices=['classify', 'backfill', 'evaluate', 'cache'])
+    parser.add_argument('texts', nargs='*', help='Descripciones a clasificar (classify)')
+    parser.add_argument('--all', action='store_true', help='backfill: reclasificar también filas con producto')
+    parser.add_argument('--batch-size', type=int, default=None, help='Textos por lote del modelo')
+    parser.add_argument('--threads', type=int, default=None, help='Hilos de torch (default: EMBEDDING_THREADS)')
+    args = parser.parse_args()
+
+    encoder = SentenceEncoder(batch_size=args.batch_size, threads=args.threads)
+    if args.command == 'cache':
+        cache = EmbeddingStandardizer(encoder).cache
+        print(f"🗄️  {cache.directory}: {cache.stats()['entries']:,} embeddings, {cache.stats()['mb']:,.1f} MB")
+    else:
+        standardizer = HybridStandardizer(ProductStandardizer.from_db(), EmbeddingStandardizer.from_db(encoder=encoder))
+        if args.command == 'classify':
+            result = standardizer.classify(args.texts)
+            result.insert(0, 'descripcion', args.texts)
+            print(result.to_string(index=False))
+        elif args.command == 'backfill':
+            stats = backfill(standardizer, only_missing=not args.all)
+            print(f"✅ {stats['rows']:,} filas ({stats['rows_per_s']:,.0f}/s): {stats['classified']:,} clasificadas, "
+                  f"{stats['updated']:,} actualizadas")
+        else:
+            stats = evaluate(standardizer)
+            print(f"📊 {stats['rows']:,} filas: cobertura {stats['coverage']:.1%}, precisión {stats['accuracy']:.1%}")
+        print(f"🗄️  Cache: {standardizer.semantic.cache.stats()}")
@@ -0,0 +1,295 @@
+"""
+Modelo de Demanda por Serie (hospital × producto)
+
+Cada serie tiene su propia regresión con tendencia y estacionalidad
+(intercept + años desde la referencia + sin/cos del mes), con penalización
+ridge sobre los términos no constantes para que las series cortas no
+sobreajusten. Las series se reparten en bloques entre procesos (joblib) y
+dentro de cada bloque se resuelven todas juntas con operaciones vectorizadas.
+
+Series no vistas en el entrenamiento usan un modelo agrupado (pooled) ajustado
+con todos los datos.
+"""
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+import logging
+
+from predictor import DemandPredictor, temporal_split
+
+logger = logging.getLogger(__name__)
+
+# Términos por serie: [intercept, tendencia (años), mes_sin, mes_cos]
+SERIES_FEATURES = ['intercept', 'tendencia_anual', 'mes_sin', 'mes_cos']
+
+# Series por tarea enviada al pool (amortiza el costo de despacho y serialización)
+SERIES_PER_CHUNK = 2000
+
+# Penalización ridge por defecto sobre tendencia y estacionalidad
+DEFAULT_ALPHA = 1.0
+
+
+def _fit_chunk(Z, y, starts, alpha):
+    """
+    Ajusta las regresiones de un bloque de series contiguas
+
+    Args:
+        Z: Matriz de diseño (m, 4) ordenada por serie
+        y: Target (m,)
+        starts: Índice de la primera fila de cada serie dentro del bloque
+        alpha: Penalización ridge (no se aplica al intercept)
+
+    Returns:
+        (coefs (k, 4), xtx total (4, 4), xty total (4,)) - los totales sirven
+        para el modelo agrupado
+    """
+    xtx = np.add.reduceat(Z[:, :, None] * Z[:, None, :], starts, axis=0)
+    xty = np.add.reduceat(Z * y[:, None], starts, axis=0)
+
+    penalized = xtx.copy()
+    penalized[:, 1:, 1:] += alpha * np.eye(Z.shape[1] - 1)
+    # pinv: solución de norma mínima incluso con alpha=0 y series de 1-2 puntos
+    coefs = np.einsum('kij,kj->ki', np.linalg.pinv(penalized), xty)
+
+    return coefs, xtx.sum(axis=0), xty.sum(axis=0)
+
+
+class SeriesDemandPredictor(DemandPredictor):
+    """
+    Modelo de predicción de demanda con una regresión por serie hospital × producto
+
+    Misma interfaz que DemandPredictor (train, predict, predict_batch,
+    forecast_cube, save_model, load_model). No soporta update(): cada
+    entrenamiento es completo.
+    """
+
+    MODEL_FILENAME = 'series_demand_model.pkl'
+
+    def __init__(self, fecha_referencia='2024-01-01', alpha=DEFAULT_ALPHA, n_jobs=-1,
+                 series_per_chunk=SERIES_PER_CHUNK):
+        """
+        Inicializa el predictor
+
+        Args:
+            fecha_referencia: Fecha base para calcular la tendencia
+            alpha: Penalización ridge sobre tendencia y estacionalidad
+            n_jobs: Procesos para el ajuste (-1 = todos los cores, 1 = secuencial)
+            series_per_chunk: Series por tarea del pool
+        """
+        super().__init__(fecha_referencia=fecha_referencia)
+        self.model = None
+        self.alpha = alpha
+        self.n_jobs = n_jobs
+        self.series_per_chunk = series_per_chunk
+        # Matriz (n_hospitales, n_productos) -> índice de serie, -1 si no existe
+        self.series_index = None
+        self.series_coefs = None
+        self.pooled_coef = None
+
+    def _series_design(self, fechas):
+        """Matriz de diseño (n, 4) con intercept, tendencia en años y estacionalidad"""
+        dias, mes = self._date_features(fechas)
+        angulo = (2 * np.pi / 12) * mes
+        Z = np.empty((len(dias), len(SERIES_FEATURES)), dtype=np.float64)
+        Z[:, 0] = 1.0
+        Z[:, 1] = dias / 365.25
+        Z[:, 2] = np.sin(angulo)
+        Z[:, 3] = np.cos(angulo)
+        return Z
+
+    def _fit_series(self, Z, y, series_ids, n_series):
+        """
+        Ajusta todas las series en paralelo por bloques
+
+        Args:
+            Z: Matriz de diseño (n, 4)
+            y: Target (n,)
+            series_ids: Serie de cada fila (0..n_series-1)
+            n_series: Total de series (las que no tienen filas usan el modelo agrupado)
+
+        Returns:
+            (coefs (n_series, 4), pooled_coef (4,))
+        """
+        order = np.argsort(series_ids, kind='stable')
+        Z, y, series_ids = Z[order], y[order], series_ids[order]
+        present, starts = np.unique(series_ids, return_index=True)
+        ends = np.append(starts[1:], len(series_ids))
+
+        n_jobs = effective_n_jobs(self.n_jobs)
+        # Al menos un bloque por proceso, sin pasar de series_per_chunk series por bloque
+        per_chunk = max(1, min(self.series_per_chunk, -(-len(present) // n_jobs)))
+        bounds = range(0, len(present), per_chunk)
+
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_fit_chunk)(
+                Z[starts[i]:ends[min(i + per_chunk, len(present)) - 1]],
+                y[starts[i]:ends[min(i + per_chunk, len(present)) - 1]],
+                starts[i:i + per_chunk] - starts[i],
+                self.alpha
+            )
+            for i in bounds
+        )
+
+        xtx = sum(r[1] for r in results)
+        xty = sum(r[2] for r in results)
+        pooled = np.linalg.pinv(xtx + np.diag([0.0] + [self.alpha] * (len(SERIES_FEATURES) - 1))) @ xty
+
+        coefs = np.tile(pooled, (n_series, 1))
+        coefs[present] = np.concatenate([r[0] for r in results])
+        return coefs, pooled
+
+    def _index_series(self, historical_data):
+        """
+        Fija vocabularios y la matriz de series a partir de los datos de entrenamiento
+
+        Returns:
+            (series_ids por fila, n_series)
+        """
+        self._set_categories(
+            np.sort(np.asarray(pd.factorize(historical_data['hospital'])[1], dtype=object)),
+            np.sort(np.asarray(pd.factorize(historical_data['producto_estandarizado'])[1], dtype=object))
+        )
+        h_codes = self._encode(historical_data['hospital'], self._hospital_index)
+        p_codes = self._encode(historical_data['producto_estandarizado'], self._producto_index)
+
+        n_prod = len(self.producto_categories)
+        keys, series_ids = np.unique(h_codes.astype(np.int64) * n_prod + p_codes, return_inverse=True)
+        self.series_index = np.full((len(self.hospital_categories), n_prod), -1, dtype=np.int32)
+        self.series_index[keys // n_prod, keys % n_prod] = np.arange(len(keys), dtype=np.int32)
+        return series_ids, len(keys)
+
+    def _row_series(self, df):
+        """Índice de serie de cada fila (-1 si la serie no fue vista)"""
+        h_codes = self._encode(df['hospital'], self._hospital_index)
+        p_codes = self._encode(df['producto_estandarizado'], self._producto_index)
+        known = (h_codes >= 0) & (p_codes >= 0)
+        series = np.full(len(h_codes), -1, dtype=np.int64)
+        series[known] = self.series_index[h_codes[known], p_codes[known]]
+        return series
+
+    def _coefs_for(self, series):
+        """Coeficientes por fila, con el modelo agrupado para series desconocidas"""
+        coefs = self.series_coefs[np.maximum(series, 0)]
+        coefs[series < 0] = self.pooled_coef
+        return coefs
+
+    def _predict_rows(self, Z, series):
+        return np.einsum('ij,ij->i', Z, self._coefs_for(series))
+
+    def train(self, historical_data, test_size=0.2, random_state=42, watermark=None):
+        """
+        Entrena una regresión por serie con datos históricos
+
+        Las métricas se calculan ajustando sobre el split de entrenamiento
+        (temporal, ver predictor.temporal_split); el modelo final se ajusta con
+        todos los datos.
+
+        Args:
+            historical_data: DataFrame con columnas [fecha_orden, hospital, producto_estandarizado, cantidad]
+            test_size: Proporción de datos para validación
+            random_state: Sin efecto (el split es temporal); se mantiene por compatibilidad
+            watermark: Máximo created_at de las órdenes incluidas (opcional)
+
+        Returns:
+            dict con métricas de evaluación
+        """
+        logger.info(f"Entrenando modelo por serie con {len(historical_data)} registros históricos "
+                    f"(n_jobs={effective_n_jobs(self.n_jobs)})")
+
+        series_ids, n_series = self._index_series(historical_data)
+        Z = self._series_design(historical_data['fecha_orden'])
+        y = historical_data['cantidad'].to_numpy(dtype=np.float64)
+
+        # Ajuste sobre el split de entrenamiento para las métricas
+        test_mask = temporal_split(historical_data['fecha_orden'], test_size)
+        idx_train, idx_test = np.flatnonzero(~test_mask), np.flatnonzero(test_mask)
+        self.series_coefs, self.pooled_coef = self._fit_series(
+            Z[idx_train], y[idx_train], series_ids[idx_train], n_series
+        )
+        metrics = {
+            **self._regression_metrics(
+                y[idx_train], self._predict_rows(Z[idx_train], series_ids[idx_train]), 'train'),
+            **self._regression_metrics(
+                y[idx_test], self._predict_rows(Z[idx_test], series_ids[idx_test]), 'test'),
+            'n_samples': len(historical_data),
+            'n_features': n_series * len(SERIES_FEATURES),
+            'n_series': n_series
+        }
+
+        # Modelo final: todos los datos
+        self.series_coefs, self.pooled_coef = self._fit_series(Z, y, series_ids, n_series)
+        self.is_trained = True
+        self.watermark = watermark
+        self.metrics = metrics
+        self.fit_intervals(historical_data, self._predict_rows(Z, series_ids))
+
+        logger.info(f"✅ Modelo por serie entrenado ({n_series} series) - "
+                    f"R² Test: {metrics['test_r2']:.3f}, MAE Test: {metrics['test_mae']:.1f}")
+
+        return metrics
+
+    def update(self, new_data, watermark=None):
+        raise ValueError("El modelo por serie no soporta actualización incremental: usa train().")
+
+    def _predict_frame(self, df):
+        if not self.is_trained:
+            raise ValueError("El modelo no ha sido entrenado. Llama a train() primero.")
+        return self._predict_rows(self._series_design(df['fecha_prediccion']), self._row_series(df))
+
+    def _raw_cube(self, h_codes, p_codes, dates):
+        """
+        Grilla sin recortar (n_hospitals, n_products, n_dates)
+
+        Cada celda es el producto de los coeficientes de su serie (o los del
+        modelo agrupado) por los términos de la fecha: (H, P, 4) @ (4, D).
+        """
+        series = np.full((len(h_codes), len(p_codes)), -1, dtype=np.int64)
+        known_h, known_p = h_codes >= 0, p_codes >= 0
+        series[np.ix_(known_h, known_p)] = self.series_index[np.ix_(h_codes[known_h], p_codes[known_p])]
+
+        coefs = self._coefs_for(series.ravel()).reshape(len(h_codes), len(p_codes), -1)
+        return coefs @ self._series_design(dates).T
+
+    def _raw_points(self, h_codes, p_codes, dias, mes):
+        """Predicción sin recortar para puntos sueltos: coeficientes de la serie por índice"""
+        known = (h_codes >= 0) & (p_codes >= 0)
+        series = np.full(len(h_codes), -1, dtype=np.int64)
+        series[known] = self.series_index[h_codes[known], p_codes[known]]
+
+        coefs = self._coefs_for(series)
+        angulo = (2 * np.pi / 12) * mes
+        return (coefs[:, 0] + coefs[:, 1] * (dias / 365.25)
+                + coefs[:, 2] * np.sin(angulo) + coefs[:, 3] * np.cos(angulo))
+
+    def _artifact_params(self):
+        return {
+            'fecha_referencia': self.fecha_referencia.isoformat(),
+            'alpha': self.alpha,
+            'series_per_chunk': self.series_per_chunk
+        }
+
+    def _export_model(self, arrays, include_stats):
+        arrays['series_index'] = self.series_index
+        arrays['series_coefs'] = self.series_coefs
+        arrays['pooled_coef'] = self.pooled_coef
+        return {}
+
+    def _import_model(self, meta, arrays):
+        self.series_index = arrays['series_index']
+        self.series_coefs = arrays['series_coefs']
+        self.pooled_coef = arrays['pooled_coef']
+        self.is_trained = True
+
+    def get_feature_importance(self):
+        """
+        Retorna los coeficientes promedio entre series y los del modelo agrupado
+
+        Returns:
+            dict con nombres de términos y sus coeficientes
+        """
+        if not self.is_trained:
+            raise ValueError("El modelo no ha sido entrenado.")
+
+        importance = {f'promedio_{name}': value for name, value in zip(SERIES_FEATURES, self.series_coefs.mean(axis=0))}
+        importance.update({f'agrupado_{name}': value for name, value in zip(SERIES_FEATURES, self.pooled_coef)})
+        return importance
@@ -12,6 +12,9 @@ import psycopg2
 from psycopg2 import sql
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 
+from dimensions import SCHEMA_SQL as DIMENSIONS_SCHEMA, backfill_missing_ids
+from prediction_store import SCHEMA_SQL as PREDICTION_STORE_SCHEMA
+
 load_dotenv()
 
 # Credenciales del usuario admin (postgres)
@@ -166,8 +169,86 @@ def create_tables():
         # Índices para optimización
         cursor.execute("""
         CREATE INDEX IF NOT EXISTS idx_ordenes_fecha ON ordenes_compra(fecha_orden);
-        CREATE INDEX IF NOT EXISTS idx_ordenes_organismo ON ordenes_compra(nombre_organismo);
-        CREATE INDEX IF NOT EXISTS idx_ordenes_producto ON ordenes_compra(producto_estandarizado);
+        CREATE INDEX IF NOT EXISTS idx_ordenes_cambio ON ordenes_compra((COALESCE(updated_at, created_at)));
+        """)
+        
+        # Diccionario de descripciones distintas (ver descriptions.py)
+        print("  → Creando tabla 'descripciones'...")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS descripciones (
+            id SERIAL PRIMARY KEY,
+            hash BIGINT UNIQUE NOT NULL,
+            texto_normalizado TEXT NOT NULL,
+            producto_estandarizado VARCHAR(200),
+            metodo_estandarizacion VARCHAR(20),
+            estandarizado_en TIMESTAMP,
+            marca VARCHAR(100),
+            embedding_fila INTEGER,
+            fabricante VARCHAR(100),
+            marca_detectada_en TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+        
+        cursor.execute("""
+        ALTER TABLE ordenes_compra ADD COLUMN IF NOT EXISTS descripcion_id INTEGER REFERENCES descripciones(id);
+        CREATE INDEX IF NOT EXISTS idx_ordenes_descripcion ON ordenes_compra(descripcion_id);
+        CREATE INDEX IF NOT EXISTS idx_descripciones_pendientes ON descripciones(id) WHERE estandarizado_en IS NULL;
+        """)
+        
+        # Agregado marca × hospital × producto × mes (ver brands.py)
+        print("  → Creando tabla 'competencia_mensual'...")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS competencia_mensual (
+            producto VARCHAR(200) NOT NULL,
+            mes DATE NOT NULL,
+            hospital VARCHAR(500) NOT NULL,
+            marca VARCHAR(100) NOT NULL,
+            fabricante VARCHAR(100) NOT NULL,
+            ordenes INTEGER NOT NULL,
+            cantidad BIGINT NOT NULL,
+            monto DECIMAL(18,2) NOT NULL,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (producto, mes, hospital, marca)
+        );
+        CREATE INDEX IF NOT EXISTS idx_competencia_corte ON competencia_mensual(hospital, mes);
+        CREATE INDEX IF NOT EXISTS idx_ordenes_organismo_fecha ON ordenes_compra(nombre_organismo, fecha_orden);
+
+        -- Watermark de cambios de ordenes_compra de cada `python brands.py refresh`
+        CREATE TABLE IF NOT EXISTS refrescos_competencia (
+            id SERIAL PRIMARY KEY,
+            watermark TIMESTAMP,
+            modo VARCHAR(20) NOT NULL,
+            cortes INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+        
+        # Ítems extraídos de bases de licitación en PDF (ver tenders.py)
+        print("  → Creando tabla 'licitaciones_items'...")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS licitaciones_items (
+            id SERIAL PRIMARY KEY,
+            archivo_hash CHAR(64) NOT NULL,
+            linea INTEGER NOT NULL,
+            licitacion_id VARCHAR(50),
+            archivo VARCHAR(500),
+            pagina INTEGER,
+            item VARCHAR(50),
+            nombre_organismo VARCHAR(500),
+            fecha_publicacion DATE,
+            descripcion_item TEXT,
+            producto_estandarizado VARCHAR(200),
+            cantidad INTEGER,
+            unidad_medida VARCHAR(50),
+            monto_total DECIMAL(15,2),
+            descripcion_id INTEGER REFERENCES descripciones(id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (archivo_hash, linea)
+        );
+        CREATE INDEX IF NOT EXISTS idx_licitaciones_licitacion ON licitaciones_items(licitacion_id);
+        CREATE INDEX IF NOT EXISTS idx_licitaciones_producto ON licitaciones_items(producto_estandarizado);
         """)
         
         # Tabla para predicciones de demanda
@@ -179,17 +260,54 @@ def create_tables():
             producto VARCHAR(200),
             fecha_prediccion DATE,
             demanda_estimada INTEGER,
+            demanda_inferior INTEGER,
+            demanda_superior INTEGER,
             confidence_score DECIMAL(5,2),
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         """)
         
+        # Columnas de intervalo para tablas creadas antes de su introducción
+        cursor.execute("""
+        ALTER TABLE predicciones_demanda
+            ADD COLUMN IF NOT EXISTS demanda_inferior INTEGER,
+            ADD COLUMN IF NOT EXISTS demanda_superior INTEGER;
+        """)
+        
         cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_pred_hospital ON predicciones_demanda(hospital);
-        CREATE INDEX IF NOT EXISTS idx_pred_producto ON predicciones_demanda(producto);
         CREATE INDEX IF NOT EXISTS idx_pred_fecha ON predicciones_demanda(fecha_prediccion);
         """)
         
+        # Dimensiones de hospitales y productos con ids enteros (ver dimensions.py)
+        print("  → Creando tablas 'hospitales' y 'productos'...")
+        cursor.execute(DIMENSIONS_SCHEMA)
+        
+        # Registro de ejecuciones de predicción (re-forecast incremental e invalidación de caches)
+        print("  → Creando tabla 'ejecuciones_prediccion'...")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ejecuciones_prediccion (
+            id SERIAL PRIMARY KEY,
+            model_run_id VARCHAR(100),
+            model_key VARCHAR(100),
+            watermark TIMESTAMP,
+            horizonte_desde DATE,
+            n_meses INTEGER,
+            modo VARCHAR(20),
+            motivo TEXT,
+            series_total INTEGER,
+            series_recalculadas INTEGER,
+            series_omitidas INTEGER,
+            filas INTEGER,
+            hospitales TEXT[],
+            productos TEXT[],
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+        
+        # Predicciones en formato por serie y vista compatible (ver prediction_store.py)
+        print("  → Creando tabla 'predicciones_series'...")
+        cursor.execute(PREDICTION_STORE_SCHEMA)
+        
         # Tabla para catálogo de productos Solventum
         print("  → Creando tabla 'productos_solventum'...")
         cursor.execute("""
@@ -228,6 +346,12 @@ def create_tables():
         cursor.close()
         conn.close()
         
+        # BD existente: filas anteriores a las dimensiones sin ids
+        report = backfill_missing_ids()
+        if report is not None:
+            print(f"  → Ids de dimensiones completados: "
+                  f"{', '.join(f'{t} {n:,}' for t, n in report['filas'].items())}")
+        
         print("✅ Todas las tablas creadas exitosamente\n")
         return True
         
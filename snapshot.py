@@ -0,0 +1,472 @@
+"""
+Snapshot Columnar Local de ordenes_compra
+
+Copia local de ordenes_compra en archivos Arrow IPC (Feather v2, sin
+compresión) particionados por mes de fecha_orden:
+
+    data/snapshot/
+        mes=2024-01/v000003.arrow     una versión de la partición (inmutable)
+        versions/v000003.json         versión del dataset: partición -> archivo
+        CURRENT                       versión vigente
+
+- Sincronización incremental por updated_at: solo se leen de la BD las filas
+  modificadas desde la última versión y solo se reescriben sus meses. Una fila
+  que cambió de mes se elimina de su partición anterior.
+- Lectura con poda de particiones (rango de meses) y de columnas sobre archivos
+  memory-mapped: Arrow IPC sin compresión se lee sin copiar ni decodificar, a
+  diferencia de Parquet.
+- Cada sincronización registra una versión con sus archivos; entrenar o hacer
+  backtesting sobre una versión es reproducible sin tocar la base de datos
+  (los archivos de versiones antiguas se borran solo con prune()).
+
+Los borrados físicos en ordenes_compra no se detectan por updated_at: se
+reflejan con una sincronización completa (sync(full=True)).
+"""
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+import config
+from database import get_connection
+from data_loader import DEFAULT_CHUNK_SIZE, _CategoryAccumulator, _compact_quantity, iter_training_chunks
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = 'CURRENT'
+VERSIONS_DIR = 'versions'
+
+# Partición de filas sin fecha_orden (el entrenamiento las ignora)
+NULL_PARTITION = 'sin_fecha'
+
+SNAPSHOT_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('orden_id', pa.string()),
+    ('fecha_orden', pa.date32()),
+    ('nombre_organismo', pa.dictionary(pa.int32(), pa.string())),
+    ('descripcion_item', pa.string()),
+    ('producto_estandarizado', pa.dictionary(pa.int32(), pa.string())),
+    ('cantidad', pa.int64()),
+    ('unidad_medida', pa.dictionary(pa.int32(), pa.string())),
+    ('monto_total', pa.float64()),
+    ('created_at', pa.timestamp('us')),
+    ('updated_at', pa.timestamp('us')),
+])
+
+# Filas modificadas en (since, until], ordenadas por mes para escribir una partición a la vez
+SYNC_QUERY = """
+SELECT id, orden_id, fecha_orden, nombre_organismo, descripcion_item, producto_estandarizado,
+       cantidad, unidad_medida, monto_total::float8, created_at, COALESCE(updated_at, created_at)
+FROM {table}
+WHERE (%(since)s::timestamp IS NULL OR COALESCE(updated_at, created_at) > %(since)s)
+  AND COALESCE(updated_at, created_at) <= %(until)s
+ORDER BY date_trunc('month', fecha_orden) NULLS LAST, id
+"""
+
+TRAINING_COLUMNS = ['nombre_organismo', 'producto_estandarizado', 'cantidad', 'created_at']
+
+
+def _partition_keys(fechas):
+    """Mes (YYYY-MM) de cada fecha_orden; NULL_PARTITION para fechas nulas"""
+    months = fechas.to_numpy(zero_copy_only=False).astype('datetime64[M]')
+    keys = np.datetime_as_string(months, unit='M').astype(object)
+    keys[np.isnat(months)] = NULL_PARTITION
+    return keys
+
+
+def _partition_month(key):
+    return None if key == NULL_PARTITION else pd.Timestamp(f"{key}-01")
+
+
+def _date_mask(table, fecha_desde=None, fecha_hasta=None):
+    """Máscara fecha_orden en [fecha_desde, fecha_hasta) (None = todo)"""
+    mask = pa.array(np.ones(table.num_rows, dtype=bool))
+    if fecha_desde is not None:
+        mask = pc.and_(mask, pc.greater_equal(table['fecha_orden'], pa.scalar(pd.Timestamp(fecha_desde).date())))
+    if fecha_hasta is not None:
+        mask = pc.and_(mask, pc.less(table['fecha_orden'], pa.scalar(pd.Timestamp(fecha_hasta).date())))
+    return mask
+
+
+def _write_atomic(path, content):
+    tmp = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+    with open(tmp, 'w') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def _rows_to_table(rows):
+    """Tuplas de SYNC_QUERY -> tabla Arrow con el esquema del snapshot"""
+    columns = list(zip(*rows))
+    arrays = []
+    for field, values in zip(SNAPSHOT_SCHEMA, columns):
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=SNAPSHOT_SCHEMA)
+
+
+class Snapshot:
+    """Snapshot versionado de ordenes_compra en un directorio local"""
+
+    def __init__(self, root=None, table='ordenes_compra'):
+        """
+        Args:
+            root: Directorio del snapshot (por defecto SNAPSHOT_DIR)
+            table: Tabla de origen en PostgreSQL
+        """
+        self.root = root or config.SNAPSHOT_DIR
+        self.table = table
+        os.makedirs(os.path.join(self.root, VERSIONS_DIR), exist_ok=True)
+
+    # ------------------------------------------------------------------ versiones
+
+    def current_version(self):
+        """Id de la versión vigente o None si el snapshot está vacío"""
+        path = os.path.join(self.root, CURRENT_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read().strip() or None
+
+    def get_version(self, version=None):
+        """
+        Metadatos de una versión (por defecto la vigente)
+
+        Returns:
+            dict con version, synced_at, until (updated_at máximo incluido),
+            max_created_at (watermark para el modelo), rows y partitions
+        """
+        version = version or self.current_version()
+        if version is None:
+            raise FileNotFoundError(f"El snapshot en {self.root} está vacío: ejecuta `python snapshot.py sync`")
+        with open(os.path.join(self.root, VERSIONS_DIR, f'{version}.json')) as f:
+            return json.load(f)
+
+    def list_versions(self):
+        """Versiones registradas (más reciente primero)"""
+        names = sorted(os.listdir(os.path.join(self.root, VERSIONS_DIR)), reverse=True)
+        return [self.get_version(name[:-5]) for name in names if name.endswith('.json')]
+
+    def _next_version(self):
+        current = self.current_version()
+        return f"v{(int(current[1:]) if current else 0) + 1:06d}"
+
+    # ------------------------------------------------------------------ lectura
+
+    def _partition_path(self, key, filename):
+        return os.path.join(self.root, f'mes={key}', filename)
+
+    def _read_partition(self, key, filename, columns=None):
+        """Lee una partición memory-mapped (solo las columnas pedidas)"""
+        return feather.read_table(self._partition_path(key, filename), columns=columns, memory_map=True)
+
+    def partitions(self, version=None, fecha_desde=None, fecha_hasta=None):
+        """
+        Particiones de una versión que se cruzan con [fecha_desde, fecha_hasta)
+
+        Returns:
+            Lista ordenada de (mes, archivo)
+        """
+        meta = self.get_version(version)
+        desde = pd.Timestamp(fecha_desde).to_period('M').to_timestamp() if fecha_desde is not None else None
+        hasta = pd.Timestamp(fecha_hasta) if fecha_hasta is not None else None
+
+        selected = []
+        for key, spec in sorted(meta['partitions'].items()):
+            month = _partition_month(key)
+            if (desde is not None or hasta is not None) and month is None:
+                continue
+            if desde is not None and month < desde:
+                continue
+            if hasta is not None and month >= hasta:
+                continue
+            selected.append((key, spec['file']))
+        return selected
+
+    def read(self, columns=None, version=None, fecha_desde=None, fecha_hasta=None):
+        """
+        Lee el snapshot como tabla Arrow
+
+        Args:
+            columns: Columnas a leer (None = todas)
+            version: Versión del dataset (None = vigente)
+            fecha_desde: Opcional - fecha_orden >= fecha_desde
+            fecha_hasta: Opcional - fecha_orden < fecha_hasta
+
+        Returns:
+            pyarrow.Table
+        """
+        tables = []
+        for key, filename in self.partitions(version, fecha_desde, fecha_hasta):
+            if fecha_desde is None and fecha_hasta is None:
+                tables.append(self._read_partition(key, filename, columns=columns))
+                continue
+            # Solo los meses de los extremos necesitan filtrarse por fecha exacta
+            table = self._read_partition(key, filename, columns=sorted({*(columns or []), 'fecha_orden'}) or None)
+            table = table.filter(_date_mask(table, fecha_desde, fecha_hasta))
+            tables.append(table.select(columns) if columns else table)
+        if not tables:
+            schema = SNAPSHOT_SCHEMA if columns is None else pa.schema([SNAPSHOT_SCHEMA.field(c) for c in columns])
+            return schema.empty_table()
+        return pa.concat_tables(tables, promote_options='permissive')
+
+    # ------------------------------------------------------------------ sincronización
+
+    def _db_until(self):
+        """Máximo updated_at actual de la tabla de origen (límite superior de la sincronización)"""
+        conn = get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT MAX(COALESCE(updated_at, created_at)) FROM {self.table}")
+                return cursor.fetchone()[0]
+        finally:
+            conn.close()
+
+    def _write_partition(self, key, table, version):
+        """Escribe una partición nueva (inmutable) y retorna su spec"""
+        directory = os.path.join(self.root, f'mes={key}')
+        os.makedirs(directory, exist_ok=True)
+        filename = f'{version}.arrow'
+        tmp = os.path.join(directory, f'.{filename}.tmp-{uuid.uuid4().hex[:6]}')
+        table = table.sort_by('id').combine_chunks()
+        feather.write_feather(table, tmp, compression='uncompressed')
+        os.replace(tmp, os.path.join(directory, filename))
+        return {'file': filename, 'rows': table.num_rows}
+
+    def _merge_partition(self, key, previous, changed, version):
+        """Partición anterior sin las filas modificadas + sus versiones nuevas"""
+        if previous is None:
+            return self._write_partition(key, changed, version)
+        old = self._read_partition(key, previous['file'])
+        keep = pc.invert(pc.is_in(old['id'], value_set=changed['id']))
+        merged = pa.concat_tables([old.filter(keep), changed], promote_options='permissive')
+        return self._write_partition(key, merged, version)
+
+    def sync(self, full=False, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Sincroniza el snapshot con la BD y registra una versión nueva
+
+        Lee solo las filas con updated_at posterior a la versión vigente. Llegan
+        ordenadas por mes, así que se acumula un mes a la vez y cada mes tocado
+        se reescribe una sola vez (partición anterior sin esas filas + las filas
+        nuevas). Las particiones no tocadas se comparten con la versión anterior.
+
+        Args:
+            full: Reescribir todo desde cero (refleja también filas borradas)
+            chunk_size: Filas por bloque del cursor del servidor
+
+        Returns:
+            dict de la versión registrada (o la vigente si no hubo cambios)
+        """
+        t0 = time.perf_counter()
+        previous = None if full or self.current_version() is None else self.get_version()
+        since = datetime.fromisoformat(previous['until']) if previous else None
+        until = self._db_until()
+        if until is None or (since is not None and until <= since):
+            logger.info(f"✅ Snapshot al día ({self.current_version()}): sin filas modificadas")
+            return previous
+
+        version = self._next_version()
+        old_partitions = previous['partitions'] if previous else {}
+        partitions = dict(old_partitions)
+        changed_ids, changed_keys = [], []
+
+        def flush(key, pieces):
+            table = pa.concat_tables(pieces)
+            partitions[key] = self._merge_partition(key, old_partitions.get(key), table, version)
+            changed_ids.append(table['id'].to_numpy())
+            changed_keys.append(np.full(table.num_rows, key, dtype=object))
+
+        buffer_key, buffer = None, []
+        for rows in iter_training_chunks(SYNC_QUERY, chunk_size, self.table, since=since, until=until):
+            table = _rows_to_table(rows)
+            keys = _partition_keys(table['fecha_orden'])
+            # Cortes de mes dentro del bloque (las filas vienen ordenadas por mes)
+            bounds = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+            for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(keys)]):
+                if keys[start] != buffer_key and buffer:
+                    flush(buffer_key, buffer)
+                    buffer = []
+                buffer_key = keys[start]
+                buffer.append(table.slice(start, end - start))
+        if buffer:
+            flush(buffer_key, buffer)
+
+        n_changed = int(sum(len(ids) for ids in changed_ids))
+        n_moved = 0
+        if old_partitions and n_changed:
+            # Filas que cambiaron de mes: quitar su copia de la partición anterior
+            ids = np.concatenate(changed_ids)
+            keys = np.concatenate(changed_keys)
+            order = np.argsort(ids)
+            ids, keys = ids[order], keys[order]
+            for key in old_partitions:
+                current = partitions[key]
+                part_ids = self._read_partition(key, current['file'], columns=['id'])['id'].to_numpy()
+                pos = np.minimum(np.searchsorted(ids, part_ids), len(ids) - 1)
+                stale = (ids[pos] == part_ids) & (keys[pos] != key)
+                if stale.any():
+                    table = self._read_partition(key, current['file']).filter(pa.array(~stale))
+                    partitions[key] = self._write_partition(key, table, version)
+                    n_moved += int(stale.sum())
+
+        meta = {
+            'version': version,
+            'previous': previous['version'] if previous else None,
+            'synced_at': datetime.now().isoformat(timespec='seconds'),
+            'since': since.isoformat() if since else None,
+            'until': until.isoformat(),
+            'changed_rows': n_changed,
+            'moved_rows': n_moved,
+            'rewritten_partitions': sorted(k for k, spec in partitions.items() if spec['file'] == f'{version}.arrow'),
+            'rows': sum(spec['rows'] for spec in partitions.values()),
+            'partitions': partitions,
+        }
+        meta['max_created_at'] = self._max_created_at(meta)
+        _write_atomic(os.path.join(self.root, VERSIONS_DIR, f'{version}.json'), json.dumps(meta, indent=1))
+        _write_atomic(os.path.join(self.root, CURRENT_FILE), version)
+
+        logger.info(f"✅ Snapshot {version}: {n_changed} filas modificadas ({n_moved} cambiaron de mes), "
+                    f"{len(meta['rewritten_partitions'])} meses reescritos, {meta['rows']} filas en total "
+                    f"({time.perf_counter() - t0:.1f}s)")
+        return meta
+
+    def _max_created_at(self, meta):
+        """Máximo created_at de una versión (watermark del modelo entrenado con ella)"""
+        latest = None
+        for key, spec in meta['partitions'].items():
+            column = self._read_partition(key, spec['file'], columns=['created_at'])['created_at']
+            value = pc.max(column).as_py()
+            if value is not None and (latest is None or value > latest):
+                latest = value
+        return latest.isoformat() if latest else None
+
+    def prune(self, keep=10):
+        """
+        Borra archivos de partición que no usa ninguna de las últimas `keep` versiones
+
+        Las versiones más antiguas dejan de ser reproducibles (su json se borra también).
+        """
+        versions = self.list_versions()
+        kept, dropped = versions[:keep], versions[keep:]
+        referenced = {(key, spec['file']) for meta in kept for key, spec in meta['partitions'].items()}
+
+        n_files = 0
+        for name in os.listdir(self.root):
+            if not name.startswith('mes='):
+                continue
+            key = name[4:]
+            for filename in os.listdir(os.path.join(self.root, name)):
+                if (key, filename) not in referenced:
+                    os.remove(os.path.join(self.root, name, filename))
+                    n_files += 1
+            if not os.listdir(os.path.join(self.root, name)):
+                shutil.rmtree(os.path.join(self.root, name))
+        for meta in dropped:
+            os.remove(os.path.join(self.root, VERSIONS_DIR, f"{meta['version']}.json"))
+
+        logger.info(f"🧹 Snapshot: {n_files} archivos y {len(dropped)} versiones eliminados")
+        return n_files
+
+
+def load_snapshot_aggregates(version=None, fecha_desde=None, fecha_hasta=None, until=None, snapshot=None):
+    """
+    Demanda mensual por hospital × producto desde el snapshot local
+
+    Mismo resultado y formato que data_loader.load_training_aggregates, sin tocar
+    la BD: cada partición ya es un mes, así que se agrega por (hospital, producto)
+    leyendo solo las columnas necesarias.
+
+    Args:
+        version: Versión del dataset (None = vigente)
+        fecha_desde: Opcional - fecha_orden >= fecha_desde
+        fecha_hasta: Opcional - fecha_orden < fecha_hasta
+        until: Opcional - solo órdenes con created_at <= until
+        snapshot: Snapshot a usar (por defecto el de config)
+
+    Returns:
+        DataFrame [fecha_orden, hospital (category), producto_estandarizado (category), cantidad]
+    """
+    t0 = time.perf_counter()
+    snapshot = snapshot or Snapshot()
+    meta = snapshot.get_version(version)
+    hospitales = _CategoryAccumulator()
+    productos = _CategoryAccumulator()
+    parts = {'fecha_orden': [], 'hospital': [], 'producto_estandarizado': [], 'cantidad': []}
+
+    columns = TRAINING_COLUMNS + (['fecha_orden'] if fecha_desde is not None or fecha_hasta is not None else [])
+    for key, filename in snapshot.partitions(meta['version'], fecha_desde, fecha_hasta):
+        if key == NULL_PARTITION:
+            continue
+        table = snapshot._read_partition(key, filename, columns=columns)
+        mask = pc.and_(pc.is_valid(table['nombre_organismo']), pc.is_valid(table['producto_estandarizado']))
+        if until is not None:
+            mask = pc.and_(mask, pc.less_equal(
+                table['created_at'], pa.scalar(pd.Timestamp(until).to_pydatetime(), type=pa.timestamp('us'))))
+        if 'fecha_orden' in table.column_names:
+            mask = pc.and_(mask, _date_mask(table, fecha_desde, fecha_hasta))
+        grouped = (table.filter(mask)
+                   .group_by(['nombre_organismo', 'producto_estandarizado'])
+                   .aggregate([('cantidad', 'sum')]))
+        if grouped.num_rows == 0:
+            continue
+        parts['fecha_orden'].append(np.full(grouped.num_rows, np.datetime64(f'{key}-01'), dtype='datetime64[D]'))
+        parts['hospital'].append(hospitales.encode(
+            np.asarray(grouped['nombre_organismo'].cast(pa.string()).to_pylist(), dtype=object)))
+        parts['producto_estandarizado'].append(productos.encode(
+            np.asarray(grouped['producto_estandarizado'].cast(pa.string()).to_pylist(), dtype=object)))
+        parts['cantidad'].append(grouped['cantidad_sum'].to_numpy(zero_copy_only=False).astype(np.float64))
+
+    if not parts['fecha_orden']:
+        df = pd.DataFrame({
+            'fecha_orden': pd.Series(dtype='datetime64[ns]'),
+            'hospital': pd.Categorical([]),
+            'producto_estandarizado': pd.Categorical([]),
+            'cantidad': pd.Series(dtype=np.int32),
+        })
+    else:
+        df = pd.DataFrame({
+            'fecha_orden': np.concatenate(parts['fecha_orden']).astype('datetime64[ns]'),
+            'hospital': pd.Categorical.from_codes(np.concatenate(parts['hospital']), hospitales.categories()),
+            'producto_estandarizado': pd.Categorical.from_codes(
+                np.concatenate(parts['producto_estandarizado']), productos.categories()),
+            'cantidad': _compact_quantity(np.concatenate(parts['cantidad'])),
+        })
+
+    logger.info(f"✅ {len(df)} filas agregadas (serie × mes) desde el snapshot {meta['version']} "
+                f"en {time.perf_counter() - t0:.1f}s")
+    return df
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Snapshot columnar local de ordenes_compra")
+    parser.add_argument('command', choices=['sync', 'list', 'prune'])
+    parser.add_argument('--full', action='store_true', help='sync: reescribir todo (refleja filas borradas)')
+    parser.add_argument('--keep', type=int, default=10, help='prune: versiones a conservar')
+    parser.add_argument('--table', default='ordenes_compra')
+    args = parser.parse_args()
+
+    snapshot = Snapshot(table=args.table)
+    if args.command == 'sync':
+        snapshot.sync(full=args.full)
+    elif args.command == 'list':
+        current = snapshot.current_version()
+        for meta in snapshot.list_versions():
+            print(f"{'*' if meta['version'] == current else ' '} {meta['version']}  {meta['synced_at']}  "
+                  f"filas={meta['rows']:,}  modificadas={meta['changed_rows']:,}  "
+                  f"meses={len(meta['partitions'])}  max_created_at={meta['max_created_at']}")
+    elif args.command == 'prune':
+        snapshot.prune(keep=args.keep)
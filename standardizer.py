@@ -0,0 +1,402 @@
+"""
+Estandarización de Productos por Reglas
+
+Asigna producto_estandarizado (categoría del catálogo, ej. APOSITOS) a las
+descripciones en texto libre de ordenes_compra usando las palabras clave de
+productos_solventum:
+
+1. Normalización vectorizada (pyarrow.compute): mayúsculas, sin tildes, coma
+   decimal, unidades (CMS/CENTIMETROS -> CM, CC -> ML, ...) y medidas
+   (5 X 5,7 CMS -> 5X5.7CM), puntuación a espacios
+2. Matcher multi-patrón compilado una vez: las palabras clave (normalizadas
+   igual) se agrupan por largo y cada token distinto del lote se compara por
+   prefijo contra todas a la vez (un lookup hash por largo). 'absorb' reconoce
+   ABSORBENTE; gana la palabra clave más larga. Las de varias palabras ('sin
+   polvo') se unen en un token antes de separar
+3. Puntaje vectorizado: matriz dispersa descripción × palabra clave por matriz
+   palabra clave × producto. La primera palabra clave de cada producto es su
+   ancla (el sustantivo: 'apósito', 'guante') y es obligatoria. La categoría
+   es la del producto con más palabras clave; un empate entre categorías deja
+   la descripción sin clasificar, un empate entre productos de la misma
+   categoría deja codigo_producto vacío
+
+Las descripciones repetidas (muy frecuentes en ChileCompra) se clasifican una
+sola vez por lote.
+"""
+import logging
+import re
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from psycopg2.extras import execute_values
+from scipy import sparse
+
+import config
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Reglas de normalización (sintaxis RE2, se aplican en orden sobre el texto en
+# mayúsculas y sin tildes). Los decimales se protegen con '_' mientras la
+# puntuación pasa a espacios.
+UNIT_RULES = [
+    (r'(\d),(\d)', r'\1.\2'),
+    (r'(\d)\s*(?:CENTIMETROS?|CMS?)\b', r'\1CM'),
+    (r'(\d)\s*(?:MILIMETROS?|MMS?)\b', r'\1MM'),
+    (r'(\d)\s*(?:METROS?|MTS?)\b', r'\1M'),
+    (r'(\d)\s*(?:MILILITROS?|MLS?|CC)\b', r'\1ML'),
+    (r'(\d)\s*(?:LITROS?|LTS?)\b', r'\1L'),
+    (r'(\d)\s*(?:GRAMOS?|GRS?)\b', r'\1G'),
+    (r'(\d)\s*(?:KILOS?|KILOGRAMOS?|KGS?)\b', r'\1KG'),
+    (r'(\d)\s*(?:PULGADAS?|PULG)\b', r'\1IN'),
+    # Medidas: 5 X 5.7CM -> 5X5.7CM (dos veces para 10 X 10 X 2CM)
+    (r'(\d[\d.]*[A-Z]{0,2})\s*[X×*]\s*(\d)', r'\1X\2'),
+    (r'(\d[\d.]*[A-Z]{0,2})\s*[X×*]\s*(\d)', r'\1X\2'),
+    (r'(\d)\.(\d)', r'\1_\2'),
+    (r'[^A-Z0-9_]+', ' '),
+    (r'_', '.'),
+    (r'^ +| +$', ''),
+]
+
+CATALOG_QUERY = """
+SELECT codigo_producto, categoria, palabras_clave
+FROM productos_solventum
+WHERE categoria IS NOT NULL
+  AND palabras_clave IS NOT NULL
+ORDER BY categoria, codigo_producto
+"""
+
+BACKFILL_QUERY = """
+SELECT id, descripcion_item, producto_estandarizado
+FROM ordenes_compra
+WHERE id > %(last_id)s
+  AND descripcion_item IS NOT NULL
+  {missing}
+ORDER BY id
+LIMIT %(limit)s
+"""
+
+UPDATE_QUERY = """
+UPDATE ordenes_compra AS o
+SET producto_estandarizado = v.producto, updated_at = CURRENT_TIMESTAMP
+FROM (VALUES %s) AS v(id, producto)
+WHERE o.id = v.id
+  AND o.producto_estandarizado IS DISTINCT FROM v.producto
+"""
+
+
+def normalize_descriptions(values):
+    """
+    Normaliza descripciones (vectorizado)
+
+    Args:
+        values: Array / lista / Series de strings (None se mantiene)
+
+    Returns:
+        pyarrow.StringArray normalizado
+    """
+    array = values if isinstance(values, pa.Array) else pa.array(values, type=pa.string(), from_pandas=True)
+    array = pc.utf8_normalize(array, form='NFKD')
+    array = pc.replace_substring_regex(array, r'\p{Mn}', '')
+    array = pc.utf8_upper(array)
+    for pattern, replacement in UNIT_RULES:
+        array = pc.replace_substring_regex(array, pattern, replacement)
+    return array
+
+
+def tokenize(normalized, phrases=()):
+    """
+    Tokens de descripciones normalizadas (las frases de varias palabras quedan unidas por '_')
+
+    Args:
+        normalized: pyarrow.StringArray de normalize_descriptions
+        phrases: Frases normalizadas a tratar como un solo token
+
+    Returns:
+        (parents, vocabulary, indices): descripción de cada token, tokens distintos
+        (pyarrow.StringArray) e índice de cada token en vocabulary
+    """
+    for phrase in phrases:
+        normalized = pc.replace_substring_regex(normalized, rf'\b{re.escape(phrase)}\b', phrase.replace(' ', '_'))
+    tokens = pc.split_pattern(pc.fill_null(normalized, ''), ' ')
+    encoded = pc.dictionary_encode(pc.list_flatten(tokens))
+    return pc.list_parent_indices(tokens).to_numpy(), encoded.dictionary, encoded.indices.to_numpy()
+
+
+def load_catalog():
+    """Catálogo de productos_solventum (DataFrame [codigo_producto, categoria, palabras_clave])"""
+    conn = get_connection()
+    df = pd.read_sql_query(CATALOG_QUERY, conn)
+    conn.close()
+    return df
+
+
+class ProductStandardizer:
+    """Clasificador de descripciones por palabras clave del catálogo"""
+
+    def __init__(self, catalog, min_score=None):
+        """
+        Args:
+            catalog: DataFrame o lista de dicts con codigo_producto, categoria y
+                palabras_clave (la primera es el ancla del producto)
+            min_score: Palabras clave mínimas del producto ganador (default: STANDARDIZER_MIN_SCORE)
+        """
+        catalog = pd.DataFrame(catalog)
+        catalog = catalog[catalog['palabras_clave'].map(lambda kw: kw is not None and len(kw) > 0)]
+        if catalog.empty:
+            raise ValueError("El catálogo no tiene productos con palabras clave.")
+        self.min_score = config.STANDARDIZER_MIN_SCORE if min_score is None else min_score
+
+        # Palabras clave normalizadas igual que las descripciones (las que quedan vacías se descartan)
+        flat = [kw for kws in catalog['palabras_clave'] for kw in kws]
+        normalized = normalize_descriptions(flat).to_pylist()
+        bounds = np.r_[0, np.cumsum(catalog['palabras_clave'].map(len).to_numpy())]
+        catalog = catalog.assign(normalizadas=[[kw for kw in normalized[start:end] if kw]
+                                               for start, end in zip(bounds[:-1], bounds[1:])])
+        invalid = catalog['normalizadas'].map(len) == 0
+        if invalid.any():
+            logger.warning(f"⚠️  Productos sin palabras clave válidas tras normalizar (se omiten): "
+                           f"{', '.join(map(str, catalog.loc[invalid, 'codigo_producto']))}")
+            catalog = catalog[~invalid]
+            if catalog.empty:
+                raise ValueError("El catálogo no tiene productos con palabras clave válidas.")
+        catalog = catalog.sort_values(['categoria', 'codigo_producto'], kind='stable').reset_index(drop=True)
+
+        self.phrases = sorted({kw for kws in catalog['normalizadas'] for kw in kws if ' ' in kw},
+                              key=len, reverse=True)
+        product_keywords = [[kw.replace(' ', '_') for kw in kws] for kws in catalog['normalizadas']]
+
+        self.keywords = sorted({kw for kws in product_keywords for kw in kws})
+        self._keyword_index = {kw: i for i, kw in enumerate(self.keywords)}
+
+        # Matriz palabra clave × producto y ancla de cada producto
+        rows, cols, anchors = [], [], []
+        for product, kws in enumerate(product_keywords):
+            ids = [self._keyword_index[kw] for kw in kws]
+            anchors.append(ids[0])
+            for kw_id in set(ids):
+                rows.append(kw_id)
+                cols.append(product)
+        self._products = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(self.keywords), len(catalog))
+        )
+        self._anchors = np.asarray(anchors)
+
+        self.codigos = catalog['codigo_producto'].to_numpy(dtype=object)
+        self.categorias, self._category_of = np.unique(catalog['categoria'].to_numpy(dtype=str), return_inverse=True)
+        self.categorias = self.categorias.astype(object)
+        self._category_starts = np.flatnonzero(np.r_[True, np.diff(self._category_of) != 0])
+
+        # Matcher por prefijo: un set de palabras clave por largo
+        self._by_length = {}
+        for kw in self.keywords:
+            self._by_length.setdefault(len(kw), []).append(kw)
+        self._by_length = {
+            length: (pa.array(kws, type=pa.string()), np.array([self._keyword_index[kw] for kw in kws]))
+            for length, kws in sorted(self._by_length.items())
+        }
+
+    @classmethod
+    def from_db(cls, min_score=None):
+        """Standardizer con el catálogo actual de productos_solventum"""
+        return cls(load_catalog(), min_score=min_score)
+
+    def _match_vocabulary(self, tokens):
+        """Palabra clave (id, o -1) de cada token distinto: la más larga que sea prefijo del token"""
+        result = np.full(len(tokens), -1, dtype=np.int64)
+        for length, (value_set, ids) in self._by_length.items():
+            position = pc.index_in(pc.utf8_slice_codeunits(tokens, 0, length), value_set=value_set)
+            position = pc.fill_null(position, -1).to_numpy()
+            found = position >= 0
+            result[found] = ids[position[found]]
+        return result
+
+    def _keyword_matrix(self, texts):
+        """Matriz binaria dispersa descripción × palabra clave"""
+        parents, vocabulary, indices = tokenize(normalize_descriptions(texts), self.phrases)
+        keyword = self._match_vocabulary(vocabulary)[indices]
+        hit = keyword >= 0
+        matrix = sparse.csr_matrix(
+            (np.ones(hit.sum(), dtype=np.int32), (parents[hit], keyword[hit])),
+            shape=(len(texts), len(self.keywords))
+        )
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        return matrix
+
+    def _classify_unique(self, texts):
+        """(índice de categoría o -1, índice de producto o -1, puntaje) por descripción"""
+        matches = self._keyword_matrix(texts)
+        category = np.full(len(texts), -1, dtype=np.int64)
+        product = np.full(len(texts), -1, dtype=np.int64)
+        score = np.zeros(len(texts), dtype=np.int64)
+
+        # Solo se densifican las descripciones que contienen algún ancla
+        anchored = matches[:, self._anchors]
+        rows = np.flatnonzero(anchored.getnnz(axis=1))
+        if not len(rows):
+            return category, product, score
+        scores = (matches[rows] @ self._products).toarray()
+        scores[anchored[rows].toarray() == 0] = 0
+
+        by_category = np.maximum.reduceat(scores, self._category_starts, axis=1)
+        top = by_category.max(axis=1)
+        best = by_category.argmax(axis=1)
+        unique_top = (by_category == top[:, None]).sum(axis=1) == 1
+        classified = (top >= max(self.min_score, 1)) & unique_top
+
+        in_category = np.where(self._category_of[None, :] == best[:, None], scores, -1)
+        best_product = in_category.argmax(axis=1)
+        unique_product = (in_category == top[:, None]).sum(axis=1) == 1
+
+        category[rows] = np.where(classified, best, -1)
+        product[rows] = np.where(classified & unique_product, best_product, -1)
+        score[rows] = np.where(classified, top, 0)
+        return category, product, score
+
+    def classify(self, descriptions, batch_size=None):
+        """
+        Clasifica descripciones
+
+        Args:
+            descriptions: Series / lista / array de strings
+            batch_size: Descripciones distintas por lote (default: STANDARDIZER_BATCH_SIZE)
+
+        Returns:
+            DataFrame [producto_estandarizado, codigo_producto, score] alineado
+            con la entrada (None si no se pudo clasificar)
+        """
+        batch_size = batch_size or config.STANDARDIZER_BATCH_SIZE
+        values = descriptions if isinstance(descriptions, pd.Series) else pd.Series(descriptions, dtype=object)
+        codes, uniques = pd.factorize(values)
+
+        category = np.empty(len(uniques), dtype=np.int64)
+        product = np.empty(len(uniques), dtype=np.int64)
+        score = np.empty(len(uniques), dtype=np.int64)
+        uniques = np.asarray(uniques, dtype=object)
+        for start in range(0, len(uniques), batch_size):
+            end = start + batch_size
+            category[start:end], product[start:end], score[start:end] = self._classify_unique(uniques[start:end])
+
+        # Código -1 (NaN) y no clasificadas -> None
+        categorias = np.append(self.categorias, None)
+        codigos = np.append(self.codigos, None)
+        category = np.append(category, -1)[codes]
+        product = np.append(product, -1)[codes]
+        return pd.DataFrame({
+            'producto_estandarizado': pd.Series(categorias[category], index=values.index, dtype=object),
+            'codigo_producto': pd.Series(codigos[product], index=values.index, dtype=object),
+            'score': pd.Series(np.append(score, 0)[codes], index=values.index),
+        })
+
+    def standardize(self, descriptions):
+        """producto_estandarizado de cada descripción (None si no se pudo clasificar)"""
+        return self.classify(descriptions)['producto_estandarizado']
+
+
+def backfill(standardizer=None, only_missing=True, batch_size=None):
+    """
+    Estandariza las órdenes existentes por lotes de id (keyset), un commit por lote
+
+    Solo escribe las filas cuyo producto cambia (y les mueve updated_at para
+    que el re-forecast y el snapshot las vean).
+
+    Args:
+        standardizer: ProductStandardizer (default: from_db())
+        only_missing: Solo filas con producto_estandarizado NULL
+        batch_size: Filas por lote (default: STANDARDIZER_BATCH_SIZE)
+
+    Returns:
+        dict con filas leídas, clasificadas, actualizadas y filas/s
+    """
+    standardizer = standardizer or ProductStandardizer.from_db()
+    batch_size = batch_size or config.STANDARDIZER_BATCH_SIZE
+    query = BACKFILL_QUERY.format(missing='AND producto_estandarizado IS NULL' if only_missing else '')
+    stats = {'rows': 0, 'classified': 0, 'updated': 0}
+    last_id = 0
+    t0 = time.perf_counter()
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        while True:
+            cursor.execute(query, {'last_id': last_id, 'limit': batch_size})
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            ids, descripciones, actuales = zip(*rows)
+            last_id = ids[-1]
+            productos = standardizer.standardize(list(descripciones)).to_numpy()
+            changed = [(i, p) for i, p, actual in zip(ids, productos, actuales) if p is not None and p != actual]
+            if changed:
+                execute_values(cursor, UPDATE_QUERY, changed, page_size=10000)
+            conn.commit()
+
+            stats['rows'] += len(rows)
+            stats['classified'] += int(sum(p is not None for p in productos))
+            stats['updated'] += len(changed)
+            logger.info(f"🏷️  Hasta id {last_id}: {stats['rows']:,} filas, {stats['classified']:,} clasificadas, "
+                        f"{stats['updated']:,} actualizadas")
+        cursor.close()
+    finally:
+        conn.close()
+
+    stats['seconds'] = time.perf_counter() - t0
+    stats['rows_per_s'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
+def evaluate(standardizer=None, limit=100000):
+    """
+    Compara la clasificación con producto_estandarizado ya asignado
+
+    Returns:
+        dict con filas, cobertura (fracción clasificada) y precisión sobre las clasificadas
+    """
+    standardizer = standardizer or ProductStandardizer.from_db()
+    conn = get_connection()
+    df = pd.read_sql_query("""
+        SELECT descripcion_item, producto_estandarizado
+        FROM ordenes_compra
+        WHERE descripcion_item IS NOT NULL AND producto_estandarizado IS NOT NULL
+        LIMIT %s
+    """, conn, params=(limit,))
+    conn.close()
+
+    predicted = standardizer.standardize(df['descripcion_item'])
+    classified = predicted.notna()
+    return {
+        'rows': len(df),
+        'coverage': float(classified.mean()) if len(df) else 0.0,
+        'accuracy': float((predicted[classified] == df['producto_estandarizado'][classified]).mean()) if classified.any() else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Estandarización de productos por palabras clave del catálogo")
+    parser.add_argument('command', choices=['classify', 'backfill', 'evaluate'])
+    parser.add_argument('texts', nargs='*', help='Descripciones a clasificar (classify)')
+    parser.add_argument('--all', action='store_true', help='backfill: reclasificar también filas con producto')
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--limit', type=int, default=100000, help='evaluate: filas a comparar')
+    args = parser.parse_args()
+
+    if args.command == 'classify':
+        standardizer = ProductStandardizer.from_db()
+        result = standardizer.classify(args.texts)
+        result.insert(0, 'normalizada', normalize_descriptions(args.texts).to_pylist())
+        result.insert(0, 'descripcion', args.texts)
+        print(result.to_string(index=False))
+    elif args.command == 'backfill':
+        stats = backfill(only_missing=not args.all, batch_size=args.batch_size)
+        print(f"✅ {stats['rows']:,} filas ({stats['rows_per_s']:,.0f}/s): {stats['classified']:,} clasificadas, "
+              f"{stats['updated']:,} actualizadas")
+    else:
+        stats = evaluate(limit=args.limit)
+        print(f"📊 {stats['rows']:,} filas: cobertura {stats['coverage']:.1%}, precisión {stats['accuracy']:.1%}")
@@ -0,0 +1,676 @@
+"""
+Extracción de Ítems desde Bases de Licitación (PDF)
+
+Pipeline offline para anticiparse a licitaciones: lee las bases técnicas /
+anexos económicos en PDF de un directorio local y extrae las tablas de ítems
+(descripción, cantidad, unidad, monto) a licitaciones_items.
+
+1. Cada documento se identifica por el sha256 del archivo y se divide en
+   rangos de TENDER_PAGES_PER_TASK páginas que procesa un pool de procesos
+   con pdfplumber (tablas por líneas + código de licitación y fecha de
+   publicación en las primeras páginas)
+2. El resultado de cada página se guarda en un cache en disco por
+   (hash del archivo, página, versión del extractor): volver a correr sobre
+   el mismo directorio solo procesa las páginas de documentos nuevos
+3. Al completar las páginas de un documento se arman sus líneas en orden de
+   página (tablas que cruzan páginas continúan con el encabezado anterior),
+   se validan, se estandarizan (producto, marca, diccionario de descripciones)
+   y se cargan con COPY a staging mientras el pool sigue con los siguientes
+4. Un único upsert set-based por (archivo_hash, linea), como en ingest.py
+
+Las páginas sin texto (escaneadas) se cuentan en el reporte pero no se
+procesan con OCR.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import resource
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from psycopg2 import sql
+
+import config
+from brands import BrandExtractor
+from database import get_connection
+from descriptions import normalize_and_hash
+from ingest import INSERT_DESCRIPTIONS_QUERY, MAX_CANTIDAD, MAX_MONTO, _normalize_header, _to_copy_csv
+
+logger = logging.getLogger(__name__)
+
+# Cambia cuando cambia lo que se extrae de una página (invalida el cache)
+EXTRACTOR_VERSION = 1
+
+# Encabezados de las tablas de ítems (normalizados: minúsculas, sin tildes ni
+# separadores). Los alias de más de 3 letras también aceptan prefijo
+# ('cantidadrequerida', 'descripciondelproducto').
+TABLE_ALIASES = {
+    'item': ['item', 'n', 'no', 'nro', 'numero', 'linea', 'correlativo'],
+    'descripcion_item': ['descripcion', 'producto', 'detalle', 'especificacion', 'nombreproducto',
+                         'insumo', 'articulo', 'glosa'],
+    'cantidad': ['cantidad', 'cant', 'ctd'],
+    'unidad_medida': ['unidad', 'um', 'udm', 'umedida'],
+    'monto_total': ['montototal', 'valortotal', 'total', 'montoestimado', 'presupuesto'],
+}
+
+# Filas donde se busca el encabezado de una tabla
+HEADER_ROWS = 3
+
+# Páginas donde se buscan el código de licitación y la fecha de publicación
+HEADER_PAGES = 3
+
+# Código de licitación de Mercado Público (ej: 1057480-12-LP24)
+CODE_PATTERN = re.compile(r'\b\d{2,7}-\d{1,4}-[A-Z][A-Z0-9]\d{2}\b')
+DATE_PATTERN = re.compile(r'FECHA\s+DE\s+PUBLICACI[OÓ]N\s*:?\s*(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})', re.IGNORECASE)
+
+MAX_LENGTHS = {'licitacion_id': 50, 'item': 50, 'nombre_organismo': 500, 'unidad_medida': 50}
+
+STAGING_COLUMNS = ['archivo_hash', 'linea', 'licitacion_id', 'archivo', 'pagina', 'item', 'nombre_organismo',
+                   'fecha_publicacion', 'descripcion_item', 'producto_estandarizado', 'cantidad',
+                   'unidad_medida', 'monto_total', 'descripcion_hash', 'descripcion_normalizada',
+                   'marca', 'fabricante']
+
+CREATE_STAGING = """
+CREATE TEMP TABLE licitaciones_staging (
+    archivo_hash TEXT,
+    linea INTEGER,
+    licitacion_id TEXT,
+    archivo TEXT,
+    pagina INTEGER,
+    item TEXT,
+    nombre_organismo TEXT,
+    fecha_publicacion DATE,
+    descripcion_item TEXT,
+    producto_estandarizado TEXT,
+    cantidad INTEGER,
+    unidad_medida TEXT,
+    monto_total NUMERIC(15, 2),
+    descripcion_hash BIGINT,
+    descripcion_normalizada TEXT,
+    marca TEXT,
+    fabricante TEXT
+) ON COMMIT DROP
+"""
+
+COPY_STAGING = f"COPY licitaciones_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+
+# Líneas que ya no salen al volver a extraer un documento (nueva versión del extractor)
+DELETE_STALE_QUERY = """
+DELETE FROM licitaciones_items l
+WHERE l.archivo_hash IN (SELECT DISTINCT archivo_hash FROM licitaciones_staging)
+  AND NOT EXISTS (
+      SELECT 1 FROM licitaciones_staging s
+      WHERE s.archivo_hash = l.archivo_hash AND s.linea = l.linea
+  )
+"""
+
+# Solo se tocan las líneas que cambiaron
+UPSERT_QUERY = """
+WITH upsert AS (
+    INSERT INTO licitaciones_items AS l
+        (archivo_hash, linea, licitacion_id, archivo, pagina, item, nombre_organismo, fecha_publicacion,
+         descripcion_item, producto_estandarizado, cantidad, unidad_medida, monto_total)
+    SELECT archivo_hash, linea, licitacion_id, archivo, pagina, item, nombre_organismo, fecha_publicacion,
+           descripcion_item, producto_estandarizado, cantidad, unidad_medida, monto_total
+    FROM licitaciones_staging
+    ON CONFLICT (archivo_hash, linea) DO UPDATE SET
+        licitacion_id = EXCLUDED.licitacion_id,
+        archivo = EXCLUDED.archivo,
+        pagina = EXCLUDED.pagina,
+        item = EXCLUDED.item,
+        nombre_organismo = COALESCE(EXCLUDED.nombre_organismo, l.nombre_organismo),
+        fecha_publicacion = COALESCE(EXCLUDED.fecha_publicacion, l.fecha_publicacion),
+        descripcion_item = EXCLUDED.descripcion_item,
+        producto_estandarizado = COALESCE(EXCLUDED.producto_estandarizado, l.producto_estandarizado),
+        cantidad = EXCLUDED.cantidad,
+        unidad_medida = EXCLUDED.unidad_medida,
+        monto_total = EXCLUDED.monto_total,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE (l.licitacion_id, l.archivo, l.pagina, l.item, l.nombre_organismo, l.fecha_publicacion,
+           l.descripcion_item, l.producto_estandarizado, l.cantidad, l.unidad_medida, l.monto_total)
+          IS DISTINCT FROM
+          (EXCLUDED.licitacion_id, EXCLUDED.archivo, EXCLUDED.pagina, EXCLUDED.item,
+           COALESCE(EXCLUDED.nombre_organismo, l.nombre_organismo),
+           COALESCE(EXCLUDED.fecha_publicacion, l.fecha_publicacion),
+           EXCLUDED.descripcion_item,
+           COALESCE(EXCLUDED.producto_estandarizado, l.producto_estandarizado),
+           EXCLUDED.cantidad, EXCLUDED.unidad_medida, EXCLUDED.monto_total)
+    RETURNING (xmax = 0) AS insertada
+)
+SELECT COUNT(*) FILTER (WHERE insertada), COUNT(*) FILTER (WHERE NOT insertada) FROM upsert
+"""
+
+LINK_DESCRIPTIONS_QUERY = """
+UPDATE licitaciones_items AS l
+SET descripcion_id = d.id
+FROM licitaciones_staging s
+JOIN descripciones d ON d.hash = s.descripcion_hash
+WHERE l.archivo_hash = s.archivo_hash AND l.linea = s.linea
+  AND l.descripcion_id IS DISTINCT FROM d.id
+"""
+
+
+class PageCache:
+    """
+    Resultado de extracción por documento (sha256 del archivo) y página
+
+    Un JSON por página en <directorio>/<hash[:2]>/<hash>/v<EXTRACTOR_VERSION>/,
+    más meta.json con el número de páginas. Las escrituras son atómicas
+    (archivo temporal + os.replace), así los workers escriben sin lock.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or config.TENDER_CACHE_DIR
+
+    def _path(self, file_hash, name):
+        return os.path.join(self.directory, file_hash[:2], file_hash, f'v{EXTRACTOR_VERSION}', name)
+
+    def _read(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write(self, path, value):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def get(self, file_hash, page):
+        """Resultado de la página (1-based) o None si no está en el cache"""
+        return self._read(self._path(file_hash, f'p{page:05d}.json'))
+
+    def put(self, file_hash, page, result):
+        self._write(self._path(file_hash, f'p{page:05d}.json'), result)
+
+    def page_count(self, file_hash):
+        meta = self._read(self._path(file_hash, 'meta.json'))
+        return meta['pages'] if meta else None
+
+    def put_page_count(self, file_hash, pages):
+        self._write(self._path(file_hash, 'meta.json'), {'pages': pages})
+
+
+def file_sha256(path, block_bytes=1024 * 1024):
+    """sha256 hexadecimal del archivo, leído por bloques"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_bytes), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def count_pages(path):
+    """Páginas del PDF (PyPDF2 solo lee el árbol de páginas, sin interpretar contenido)"""
+    from PyPDF2 import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def iter_pdf_paths(paths):
+    """Archivos .pdf de la lista (los directorios se recorren recursivamente, en orden)"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith('.pdf'):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def _peak_rss_mb():
+    """RSS peak del proceso en MB (ru_maxrss viene en KB en Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# --------------------------------------------------------------------- extracción (workers)
+
+def _clean_cell(value):
+    return ' '.join(value.split()) if value else ''
+
+
+def _extract_page(page):
+    """Tablas (celdas limpias, sin filas vacías) y, en las primeras páginas, códigos y fecha"""
+    chars = len(page.chars)
+    tables = []
+    if chars:
+        for table in page.extract_tables():
+            rows = [[_clean_cell(cell) for cell in row] for row in table]
+            rows = [row for row in rows if any(row)]
+            if rows:
+                tables.append(rows)
+
+    codes, fecha = [], None
+    if chars and page.page_number <= HEADER_PAGES:
+        text = page.extract_text() or ''
+        codes = list(dict.fromkeys(CODE_PATTERN.findall(text)))
+        match = DATE_PATTERN.search(text)
+        if match:
+            day, month, year = map(int, match.groups())
+            try:
+                fecha = date(year, month, day).isoformat()
+            except ValueError:
+                pass
+    return {'page': page.page_number, 'chars': chars, 'tables': tables, 'codes': codes, 'fecha': fecha}
+
+
+def extract_pages(path, file_hash, pages, cache_dir):
+    """
+    Extrae un rango de páginas de un PDF y guarda cada resultado en el cache
+
+    Cada tarea abre el documento solo para sus páginas y libera el cache de
+    objetos de cada página al terminarla, así la memoria del worker no crece
+    con el tamaño de las bases.
+
+    Args:
+        path: Ruta del PDF
+        file_hash: sha256 del archivo
+        pages: Números de página (1-based)
+        cache_dir: Directorio del PageCache
+
+    Returns:
+        (lista de resultados por página, RSS peak del worker en MB)
+    """
+    import pdfplumber
+
+    cache = PageCache(cache_dir)
+    results = []
+    with pdfplumber.open(path, pages=list(pages)) as pdf:
+        for page in pdf.pages:
+            try:
+                result = _extract_page(page)
+            except Exception as e:  # pdfminer levanta tipos variados en páginas dañadas
+                logger.warning(f"⚠️ {path} página {page.page_number}: {e}")
+                result = {'page': page.page_number, 'chars': 0, 'tables': [], 'codes': [], 'fecha': None,
+                          'error': str(e)}
+            else:
+                cache.put(file_hash, page.page_number, result)
+            finally:
+                page.flush_cache()
+            results.append(result)
+    return results, _peak_rss_mb()
+
+
+# --------------------------------------------------------------------- armado de líneas (proceso principal)
+
+def _match_alias(name, aliases):
+    return any(name == alias or (len(alias) > 3 and name.startswith(alias)) for alias in aliases)
+
+
+def find_header(table):
+    """
+    Encabezado de una tabla de ítems
+
+    Returns:
+        (fila del encabezado, dict columna -> índice de celda), o (None, None) si
+        ninguna de las primeras HEADER_ROWS filas tiene descripción y cantidad
+    """
+    for r, row in enumerate(table[:HEADER_ROWS]):
+        names = [_normalize_header(cell) for cell in row]
+        mapping = {}
+        for column, aliases in TABLE_ALIASES.items():
+            for i, name in enumerate(names):
+                if name and i not in mapping.values() and _match_alias(name, aliases):
+                    mapping[column] = i
+                    break
+        if 'descripcion_item' in mapping and 'cantidad' in mapping:
+            return r, mapping
+    return None, None
+
+
+def parse_tables(pages):
+    """
+    Líneas de ítems de un documento, en orden de página
+
+    Una tabla sin encabezado con el mismo número de columnas que la última
+    tabla de ítems se toma como su continuación (tablas que cruzan páginas).
+    Una fila sin ítem ni cantidad continúa la descripción de la línea anterior.
+
+    Args:
+        pages: Resultados de extract_pages ordenados por página
+
+    Returns:
+        DataFrame de strings con columnas pagina + TABLE_ALIASES
+    """
+    rows = []
+    mapping = width = last = None
+    for result in pages:
+        for table in result['tables']:
+            header, found = find_header(table)
+            if found is not None:
+                mapping, width, body = found, len(table[header]), table[header + 1:]
+                last = None
+            elif mapping is not None and len(table[0]) == width:
+                body = table
+            else:
+                mapping = None
+                continue
+            for cells in body:
+                line = {column: cells[i] if i < len(cells) else '' for column, i in mapping.items()}
+                if last is not None and not line['cantidad'] and not line.get('item') and line['descripcion_item']:
+                    last['descripcion_item'] += ' ' + line['descripcion_item']
+                    continue
+                line['pagina'] = result['page']
+                rows.append(line)
+                last = line
+    columns = ['pagina'] + list(TABLE_ALIASES)
+    if not rows:
+        # Documento sin tablas de ítems (escaneado, sin tablas o solo encabezado)
+        return pd.DataFrame({column: pd.Series(dtype=object) for column in columns})
+    return pd.DataFrame(rows).reindex(columns=columns).fillna('')
+
+
+def parse_quantities(values):
+    """
+    Cantidades y montos con formato chileno ('1.200' -> 1200, '1.200,50' -> 1200.5, '$ 35.000' -> 35000)
+
+    Returns:
+        Series float (NaN si no hay número)
+    """
+    text = values.str.replace(r'[^\d.,]', '', regex=True)
+    thousands = text.str.contains(',', regex=False) | text.str.fullmatch(r'\d{1,3}(?:\.\d{3})+')
+    text = text.where(~thousands, text.str.replace('.', '', regex=False))
+    return pd.to_numeric(text.str.replace(',', '.', regex=False), errors='coerce')
+
+
+def validate_items(raw):
+    """
+    Valida las líneas de un documento
+
+    Returns:
+        (DataFrame válido con pagina, item, descripcion_item, cantidad, unidad_medida,
+        monto_total; Counter de rechazos por motivo)
+    """
+    cantidad = parse_quantities(raw['cantidad'])
+    monto = parse_quantities(raw['monto_total'])
+    too_long = np.zeros(len(raw), dtype=bool)
+    for column in ('item', 'unidad_medida'):
+        too_long |= (raw[column].str.len() > MAX_LENGTHS[column]).to_numpy()
+
+    checks = [
+        (raw['descripcion_item'] == '').to_numpy(), 'descripción vacía',
+        (cantidad.isna() | (cantidad <= 0) | (cantidad > MAX_CANTIDAD)).to_numpy(), 'cantidad inválida',
+        ((raw['monto_total'] != '') & (monto.isna() | (monto >= MAX_MONTO))).to_numpy(), 'monto inválido',
+        too_long, 'texto demasiado largo',
+    ]
+    motivo = np.select(checks[0::2], checks[1::2], default='')
+    ok = motivo == ''
+
+    def optional(values):
+        values = values[ok]
+        return values.mask(values == '')
+
+    valid = pd.DataFrame({
+        'pagina': raw['pagina'][ok],
+        'item': optional(raw['item']),
+        'descripcion_item': raw['descripcion_item'][ok],
+        'cantidad': cantidad[ok].round().astype('int64'),
+        'unidad_medida': optional(raw['unidad_medida']),
+        'monto_total': monto[ok].round(2),
+    })
+    return valid.reset_index(drop=True), Counter(motivo[~ok])
+
+
+def build_items(path, file_hash, pages, standardizer=None, brands=None, licitacion=None, organismo=None,
+                fecha=None):
+    """
+    Líneas de un documento listas para staging
+
+    Args:
+        path: Ruta del PDF
+        file_hash: sha256 del archivo
+        pages: Resultados por página, ordenados
+        standardizer: ProductStandardizer para producto_estandarizado (None: se deja vacío)
+        brands: BrandExtractor (default: léxico por defecto)
+        licitacion: Código de licitación (default: el primero encontrado en las primeras páginas,
+            si no el nombre del archivo)
+        organismo: Organismo comprador (default: NULL)
+        fecha: Fecha de publicación ISO (default: la encontrada en las primeras páginas)
+
+    Returns:
+        (DataFrame con STAGING_COLUMNS, Counter de rechazos por motivo)
+    """
+    valid, rejected = validate_items(parse_tables(pages))
+    codes = [code for result in pages for code in result['codes']]
+    licitacion = licitacion or (codes[0] if codes else os.path.splitext(os.path.basename(path))[0].upper())
+    fecha = fecha or next((result['fecha'] for result in pages if result['fecha']), None)
+
+    descriptions = valid['descripcion_item']
+    normalized, hashes = normalize_and_hash(descriptions)
+    hashes = np.where(pd.notna(normalized), hashes.astype(object), None)
+    productos = (standardizer.standardize(descriptions).to_numpy(dtype=object) if standardizer is not None
+                 else np.full(len(valid), None, dtype=object))
+    marcas = (brands or BrandExtractor()).extract(descriptions)
+
+    items = pd.DataFrame({
+        'archivo_hash': file_hash,
+        'linea': np.arange(1, len(valid) + 1),
+        'licitacion_id': licitacion[:MAX_LENGTHS['licitacion_id']],
+        'archivo': os.path.basename(path)[:500],
+        'pagina': valid['pagina'],
+        'item': valid['item'],
+        'nombre_organismo': organismo[:MAX_LENGTHS['nombre_organismo']] if organismo else None,
+        'fecha_publicacion': fecha,
+        'descripcion_item': descriptions,
+        'producto_estandarizado': pd.Series(productos, dtype=object),
+        'cantidad': valid['cantidad'],
+        'unidad_medida': valid['unidad_medida'],
+        'monto_total': valid['monto_total'],
+        'descripcion_hash': pd.Series(hashes, dtype='Int64'),
+        'descripcion_normalizada': pd.Series(normalized, dtype=object),
+        'marca': marcas['marca'].to_numpy(dtype=object),
+        'fabricante': marcas['fabricante'].to_numpy(dtype=object),
+    }, columns=STAGING_COLUMNS)
+    return items, rejected
+
+
+# --------------------------------------------------------------------- pipeline
+
+def extract_tenders(paths, workers=None, pages_per_task=None, cache_dir=None, use_cache=True, dry_run=False,
+                    output_path=None, standardizer=None, licitacion=None, organismo=None, fecha=None):
+    """
+    Extrae los ítems de bases de licitación en PDF y los carga en licitaciones_items
+
+    Args:
+        paths: Archivos PDF o directorios
+        workers: Procesos de extracción (default: TENDER_WORKERS)
+        pages_per_task: Páginas por tarea del pool (default: TENDER_PAGES_PER_TASK)
+        cache_dir: Directorio del cache por página (default: TENDER_CACHE_DIR)
+        use_cache: False para volver a extraer todas las páginas (el cache se reescribe)
+        dry_run: Solo extraer y validar, sin tocar la BD
+        output_path: CSV donde escribir las líneas extraídas
+        standardizer: ProductStandardizer para producto_estandarizado
+        licitacion / organismo / fecha: Valores para todos los documentos (ver build_items)
+
+    Returns:
+        dict con documentos, páginas (extraídas / del cache / sin texto / con error),
+        tablas, líneas válidas y rechazadas por motivo, upsert, páginas/s y memoria peak
+    """
+    workers = workers or config.TENDER_WORKERS
+    pages_per_task = pages_per_task or config.TENDER_PAGES_PER_TASK
+    cache = PageCache(cache_dir)
+    brands = BrandExtractor()
+    report = {'files': 0, 'duplicate_files': 0, 'pages': 0, 'pages_cached': 0, 'pages_extracted': 0,
+              'pages_without_text': 0, 'page_errors': 0, 'tables': 0, 'items': 0,
+              'rejected_by_reason': Counter(), 'staged': 0, 'worker_peak_mb': 0.0}
+    t0 = time.perf_counter()
+
+    conn = cursor = None
+    if not dry_run:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(CREATE_STAGING)
+    output = open(output_path, 'w', encoding='utf-8', newline='') if output_path else None
+    if output is not None:
+        output.write(','.join(STAGING_COLUMNS) + '\n')
+
+    def finish(document):
+        """Documento completo: líneas a staging (y al CSV de salida)"""
+        pages = [document['results'][page] for page in sorted(document['results'])]
+        report['pages_without_text'] += sum(1 for result in pages if not result['chars'] and 'error' not in result)
+        report['page_errors'] += sum(1 for result in pages if 'error' in result)
+        report['tables'] += sum(len(result['tables']) for result in pages)
+        items, rejected = build_items(document['path'], document['hash'], pages, standardizer, brands,
+                                      licitacion, organismo, fecha)
+        document['results'] = None
+        report['items'] += len(items)
+        report['rejected_by_reason'].update(rejected)
+        logger.info(f"📑 {document['path']}: {document['pages']} páginas, {len(items)} líneas")
+        if items.empty:
+            return
+        if output is not None:
+            items.to_csv(output, header=False, index=False)
+        if cursor is not None:
+            cursor.copy_expert(COPY_STAGING, io.BytesIO(_to_copy_csv(items)))
+            report['staged'] += len(items)
+
+    def add(document, results):
+        for result in results:
+            document['results'][result['page']] = result
+        if len(document['results']) == document['pages']:
+            finish(document)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = {}
+
+            def collect(done):
+                for future in done:
+                    results, peak_mb = future.result()
+                    report['pages_extracted'] += len(results)
+                    report['worker_peak_mb'] = max(report['worker_peak_mb'], peak_mb)
+                    add(in_flight.pop(future), results)
+
+            seen = set()
+            for path in iter_pdf_paths(paths):
+                file_hash = file_sha256(path)
+                if file_hash in seen:
+                    report['duplicate_files'] += 1
+                    continue
+                seen.add(file_hash)
+                n_pages = cache.page_count(file_hash)
+                if n_pages is None:
+                    n_pages = count_pages(path)
+                    cache.put_page_count(file_hash, n_pages)
+                report['files'] += 1
+                report['pages'] += n_pages
+
+                document = {'path': path, 'hash': file_hash, 'pages': n_pages, 'results': {}}
+                cached = [cache.get(file_hash, page) for page in range(1, n_pages + 1)] if use_cache else [None] * n_pages
+                missing = [page for page, result in enumerate(cached, start=1) if result is None]
+                hits = [result for result in cached if result is not None]
+                report['pages_cached'] += len(hits)
+                add(document, hits)
+
+                for start in range(0, len(missing), pages_per_task):
+                    future = pool.submit(extract_pages, path, file_hash, missing[start:start + pages_per_task],
+                                         cache.directory)
+                    in_flight[future] = document
+                    # Memoria constante: a lo más 2 tareas en vuelo por worker
+                    while len(in_flight) >= 2 * workers:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+        report['extract_s'] = time.perf_counter() - t0
+
+        if cursor is not None:
+            t1 = time.perf_counter()
+            cursor.execute("ANALYZE licitaciones_staging")
+            cursor.execute(DELETE_STALE_QUERY)
+            report['deleted'] = cursor.rowcount
+            cursor.execute(UPSERT_QUERY)
+            report['inserted'], report['updated'] = cursor.fetchone()
+            report['unchanged'] = report['staged'] - report['inserted'] - report['updated']
+            cursor.execute(sql.SQL(INSERT_DESCRIPTIONS_QUERY).format(staging=sql.Identifier('licitaciones_staging')))
+            report['descriptions_new'] = cursor.rowcount
+            cursor.execute(LINK_DESCRIPTIONS_QUERY)
+            conn.commit()
+            report['upsert_s'] = time.perf_counter() - t1
+    except Exception:
+        if conn is not None:
+            conn.rollback()
+        raise
+    finally:
+        if output is not None:
+            output.close()
+        if cursor is not None:
+            cursor.close()
+            conn.close()
+
+    report['rejected'] = sum(report['rejected_by_reason'].values())
+    report['rejected_by_reason'] = dict(report['rejected_by_reason'])
+    report['total_s'] = time.perf_counter() - t0
+    report['pages_per_s'] = report['pages'] / report['total_s'] if report['total_s'] else 0.0
+    report['extract_pages_per_s'] = report['pages_extracted'] / report['extract_s'] if report['extract_s'] else 0.0
+    report['main_peak_mb'] = _peak_rss_mb()
+    return report
+
+
+def print_report(report):
+    """Resumen de la extracción"""
+    print("\n" + "=" * 80)
+    print("  EXTRACCIÓN DE BASES DE LICITACIÓN")
+    print("=" * 80)
+    print(f"   • Documentos: {report['files']:,}" +
+          (f" ({report['duplicate_files']:,} repetidos omitidos)" if report['duplicate_files'] else ""))
+    print(f"   • Páginas: {report['pages']:,}  |  extraídas: {report['pages_extracted']:,}  |  "
+          f"del cache: {report['pages_cached']:,}  |  sin texto: {report['pages_without_text']:,}  |  "
+          f"con error: {report['page_errors']:,}")
+    print(f"   • Tablas: {report['tables']:,}  |  Líneas válidas: {report['items']:,}  |  "
+          f"Rechazadas: {report['rejected']:,}")
+    for reason, count in sorted(report['rejected_by_reason'].items(), key=lambda kv: -kv[1]):
+        print(f"       {reason:<24} {count:>12,}")
+    if 'inserted' in report:
+        print(f"   • Upsert: {report['inserted']:,} insertadas, {report['updated']:,} actualizadas, "
+              f"{report['unchanged']:,} sin cambios, {report['deleted']:,} eliminadas ({report['upsert_s']:.1f}s)")
+        print(f"   • Descripciones: {report['descriptions_new']:,} nuevas en el diccionario")
+    print(f"   • Extracción: {report['extract_s']:.1f}s ({report['extract_pages_per_s']:,.1f} páginas/s extraídas)")
+    print(f"   • Total: {report['total_s']:.1f}s ({report['pages_per_s']:,.1f} páginas/s)")
+    print(f"   • Memoria peak: {report['main_peak_mb']:,.0f} MB proceso principal, "
+          f"{report['worker_peak_mb']:,.0f} MB por worker\n")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Extracción de ítems desde bases de licitación en PDF")
+    parser.add_argument('paths', nargs='+', help='Archivos .pdf o directorios')
+    parser.add_argument('--workers', type=int, default=None, help='Procesos de extracción (default: TENDER_WORKERS)')
+    parser.add_argument('--pages-per-task', type=int, default=None,
+                        help='Páginas por tarea (default: TENDER_PAGES_PER_TASK)')
+    parser.add_argument('--cache-dir', default=None, help='Cache por página (default: TENDER_CACHE_DIR)')
+    parser.add_argument('--no-cache', action='store_true', help='Volver a extraer todas las páginas')
+    parser.add_argument('--output', metavar='CSV', help='Escribe las líneas extraídas')
+    parser.add_argument('--dry-run', action='store_true', help='Solo extraer y validar, sin escribir en la BD')
+    parser.add_argument('--licitacion', default=None, help='Código de licitación (default: detectado del PDF)')
+    parser.add_argument('--organismo', default=None, help='Organismo comprador')
+    parser.add_argument('--fecha', default=None, help='Fecha de publicación YYYY-MM-DD (default: detectada del PDF)')
+    parser.add_argument('--no-standardize', action='store_true',
+                        help='No completar producto_estandarizado (default: se completa salvo en --dry-run)')
+    args = parser.parse_args()
+
+    standardizer = None
+    if not args.dry_run and not args.no_standardize:
+        from standardizer import ProductStandardizer
+        standardizer = ProductStandardizer.from_db()
+
+    print_report(extract_tenders(
+        args.paths, workers=args.workers, pages_per_task=args.pages_per_task, cache_dir=args.cache_dir,
+        use_cache=not args.no_cache, dry_run=args.dry_run, output_path=args.output, standardizer=standardizer,
+        licitacion=args.licitacion, organismo=args.organismo, fecha=args.fecha
+    ))
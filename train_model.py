@@ -2,62 +2,157 @@
 Script para entrenar el modelo de predicción de demanda
 y generar predicciones para los próximos meses
 """
+import argparse
+import os
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from database import get_connection
+from datetime import datetime
+from psycopg2.extras import execute_values
+import config
+from database import advisory_lock, get_connection
+from data_loader import load_training_aggregates, load_aggregate_deltas
+from estimators import ESTIMATORS, parse_estimator_params
 from predictor import DemandPredictor
+from series_predictor import SeriesDemandPredictor
+from backtesting import run_backtest
+from model_registry import ModelRegistry
+from snapshot import Snapshot, load_snapshot_aggregates
+from dirty_series import get_change_watermark, model_key, plan_refresh, record_refresh
+from change_feed import MODEL_PUBLISHED, PREDICTION_RUN, publish, publish_now
+from dimensions import resolve_ids
+from prediction_store import save_series
+from pipeline import REPORT_FILE, Pipeline, Stage, StopPipeline
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-def load_historical_data():
+def get_data_watermark():
     """
-    Carga datos históricos de órdenes de compra desde la BD
+    Obtiene el watermark actual de ordenes_compra (máximo created_at)
+    
+    Se lee ANTES de cargar datos: las órdenes que lleguen durante la carga
+    quedan para la próxima ejecución en lugar de perderse.
     
     Returns:
-        DataFrame con columnas necesarias para el entrenamiento
+        datetime o None si la tabla está vacía
     """
-    logger.info("📊 Cargando datos históricos desde la base de datos...")
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(created_at) FROM ordenes_compra")
+    watermark = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return watermark
+
+
+def count_modified_since(watermark):
+    """
+    Cuenta órdenes ya incluidas en el modelo que fueron modificadas después del watermark
     
+    El entrenamiento incremental solo agrega órdenes nuevas (created_at); una
+    orden modificada requiere un entrenamiento completo para reflejarse.
+    """
     conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT COUNT(*) FROM ordenes_compra WHERE created_at <= %s AND updated_at > %s",
+        (watermark, watermark)
+    )
+    count = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return count
+
+
+def load_historical_data(since=None, until=None, fecha_desde=None, fecha_hasta=None):
+    """
+    Carga la demanda histórica mensual (hospital × producto × mes) desde la BD
     
-    query = """
-    SELECT 
-        fecha_orden,
-        nombre_organismo as hospital,
-        producto_estandarizado,
-        cantidad
-    FROM ordenes_compra
-    ORDER BY fecha_orden
+    La suma por mes se hace en PostgreSQL y se lee en bloques con un cursor del
+    servidor (ver data_loader.load_training_aggregates).
+    
+    Args:
+        since: Opcional - solo órdenes con created_at > since (carga incremental)
+        until: Opcional - solo órdenes con created_at <= until (watermark de la ejecución)
+        fecha_desde: Opcional - ventana de fechas, fecha_orden >= fecha_desde
+        fecha_hasta: Opcional - ventana de fechas, fecha_orden < fecha_hasta
+    
+    Returns:
+        DataFrame con columnas [fecha_orden, hospital, producto_estandarizado, cantidad]
     """
+    logger.info("📊 Cargando datos históricos (agregados por mes) desde la base de datos...")
     
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    df = load_training_aggregates(
+        fecha_desde=fecha_desde, fecha_hasta=fecha_hasta, since=since, until=until
+    )
     
     logger.info(f"✅ {len(df)} registros históricos cargados")
-    logger.info(f"   Rango de fechas: {df['fecha_orden'].min()} a {df['fecha_orden'].max()}")
-    logger.info(f"   Hospitales: {df['hospital'].nunique()}")
-    logger.info(f"   Productos: {df['producto_estandarizado'].nunique()}")
+    if len(df):
+        logger.info(f"   Rango de fechas: {df['fecha_orden'].min()} a {df['fecha_orden'].max()}")
+        logger.info(f"   Hospitales: {df['hospital'].nunique()}")
+        logger.info(f"   Productos: {df['producto_estandarizado'].nunique()}")
     
     return df
 
 
-def train_model(historical_data):
+def load_snapshot_data(version=None, sync=False):
+    """
+    Carga la demanda histórica mensual desde el snapshot local (ver snapshot.py)
+    
+    Con una versión fija no se lee nada de la BD: el mismo entrenamiento se
+    puede repetir más tarde sobre exactamente los mismos datos.
+    
+    Args:
+        version: Versión del dataset (None = vigente)
+        sync: Sincronizar el snapshot con la BD antes de leer (solo sin versión fija)
+    
+    Returns:
+        (DataFrame como load_historical_data, watermark, versión usada)
+    """
+    snapshot = Snapshot()
+    if sync and version is None:
+        snapshot.sync()
+    meta = snapshot.get_version(version)
+    logger.info(f"📊 Cargando datos históricos desde el snapshot local {meta['version']} "
+                f"(sincronizado {meta['synced_at']})...")
+    
+    df = load_snapshot_aggregates(version=meta['version'], snapshot=snapshot)
+    watermark = datetime.fromisoformat(meta['max_created_at']) if meta['max_created_at'] else None
+    
+    logger.info(f"✅ {len(df)} registros históricos cargados")
+    return df, watermark, meta['version']
+
+
+def train_model(historical_data, watermark=None, model_type='global', n_jobs=-1, backtest_folds=6,
+                estimator='linear', estimator_params=None, data_version=None):
     """
     Entrena el modelo de predicción con los datos históricos
     
     Args:
         historical_data: DataFrame con datos históricos
+        watermark: Máximo created_at incluido en historical_data
+        model_type: 'global' (DemandPredictor) o 'series' (una regresión por serie)
+        n_jobs: Procesos para el modelo por serie y el backtesting (-1 = todos los cores)
+        backtest_folds: Folds de backtesting de origen móvil (0 = sin backtesting)
+        estimator: Backend del modelo global ('linear', 'ridge', 'hgb'; ver estimators.py)
+        estimator_params: Parámetros del backend (ej. {'alpha': 10.0})
+        data_version: Versión del snapshot local de historical_data (None = leído de la BD)
         
     Returns:
         DemandPredictor entrenado
     """
-    logger.info("\n🧠 Entrenando modelo de predicción...")
+    logger.info(f"\n🧠 Entrenando modelo de predicción ({model_type if model_type == 'series' else estimator})...")
     
-    predictor = DemandPredictor(fecha_referencia='2024-01-01')
-    metrics = predictor.train(historical_data, test_size=0.2)
+    model_params = None
+    if model_type == 'series':
+        predictor = SeriesDemandPredictor(fecha_referencia='2024-01-01', n_jobs=n_jobs)
+    else:
+        model_params = {'estimator': estimator, 'estimator_params': dict(estimator_params or {})}
+        predictor = DemandPredictor(fecha_referencia='2024-01-01', **model_params)
+    metrics = predictor.train(historical_data, test_size=0.2, watermark=watermark)
+    predictor.data_version = data_version
     
     logger.info("\n📈 Métricas del modelo:")
     logger.info(f"  Train R²: {metrics['train_r2']:.3f}")
@@ -69,107 +164,232 @@ def train_model(historical_data):
     logger.info(f"\n  Features: {metrics['n_features']}")
     logger.info(f"  Samples: {metrics['n_samples']}")
     
-    # Guardar modelo
-    model_path = predictor.save_model()
-    logger.info(f"\n💾 Modelo guardado en: {model_path}")
+    # Backtesting de origen móvil (cache por fold: solo recalcula folds con datos nuevos)
+    if backtest_folds > 0:
+        try:
+            backtest = run_backtest(historical_data, model_type=model_type, model_params=model_params,
+                                    n_folds=backtest_folds,
+                                    n_jobs=n_jobs, watermark=watermark)
+        except ValueError as e:
+            logger.warning(f"⚠️  Backtesting omitido: {e}")
+        else:
+            metrics.update({f'backtest_{k}': v for k, v in backtest['global'].items()})
+            # Intervalos con residuos fuera de muestra
+            predictor.fit_intervals(backtest['predictions'])
+            logger.info(f"\n  Backtesting ({backtest['n_computed']} folds calculados, {backtest['n_cached']} desde cache):")
+            logger.info(f"  MAE: {metrics['backtest_mae']:.1f}  RMSE: {metrics['backtest_rmse']:.1f}  "
+                        f"MAPE: {metrics['backtest_mape']:.1f}%  R²: {metrics['backtest_r2']:.3f}")
+    
+    # Registrar modelo (artefacto versionado) y sincronizar si hay object store
+    publish_model(predictor)
     
     return predictor, metrics
 
 
-def generate_predictions(predictor, n_months=3):
+def publish_model(predictor, registry=None):
     """
-    Genera predicciones para los próximos N meses
+    Registra el modelo como nuevo run del registro y lo sube al object store configurado
+    
+    Returns:
+        run_id
+    """
+    registry = registry or ModelRegistry()
+    # Se sube antes de promover: un pull() concurrente de un worker no puede revertir LATEST a medio publicar
+    run_id = registry.register(predictor, promote=False)
+    registry.push(run_id)
+    registry.promote(run_id)
+    logger.info(f"\n💾 Modelo registrado: {run_id} ({registry.run_dir(run_id)})")
+    # Los workers de la app recargan el modelo sin esperar su polling
+    publish_now(MODEL_PUBLISHED, run_id=run_id)
+    return run_id
+
+
+def load_latest_model():
+    """
+    Carga el último modelo para actualizarlo (registro; si está vacío, el .pkl anterior)
+    
+    Returns:
+        Predictor o None si no hay modelo guardado
+    """
+    registry = ModelRegistry()
+    registry.pull()
+    try:
+        return registry.load(mmap=False)
+    except FileNotFoundError:
+        pass
+    try:
+        return DemandPredictor.load_model()
+    except FileNotFoundError:
+        return None
+
+
+def update_model(predictor, watermark):
+    """
+    Actualiza incrementalmente un modelo guardado con las órdenes nuevas
+    
+    Solo lee las órdenes con created_at posterior al watermark del modelo, por lo
+    que el costo escala con los datos nuevos y no con el historial completo.
     
     Args:
-        predictor: DemandPredictor entrenado
-        n_months: Número de meses a predecir
+        predictor: DemandPredictor cargado con estadísticos suficientes
+        watermark: Watermark actual de ordenes_compra
         
     Returns:
-        DataFrame con predicciones
+        (predictor, metrics): métricas de entrenamiento originales del modelo
     """
-    logger.info(f"\n🔮 Generando predicciones para los próximos {n_months} meses...")
+    logger.info(f"\n🔁 Actualización incremental desde {predictor.watermark}...")
     
-    # Obtener hospitales y productos únicos de la BD
-    conn = get_connection()
+    modified = count_modified_since(predictor.watermark)
+    if modified:
+        logger.warning(f"⚠️  {modified} órdenes ya incluidas fueron modificadas después del watermark.")
+        logger.warning("   Ejecuta un entrenamiento completo para reflejarlas: python train_model.py")
     
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT nombre_organismo FROM ordenes_compra ORDER BY nombre_organismo")
-    hospitales = [row[0] for row in cursor.fetchall()]
+    # Celdas serie × mes tocadas por órdenes nuevas (incremento + total anterior)
+    new_data = load_aggregate_deltas(since=predictor.watermark, until=watermark)
+    update_metrics = predictor.update(new_data, watermark=watermark)
     
-    cursor.execute("SELECT DISTINCT producto_estandarizado FROM ordenes_compra ORDER BY producto_estandarizado")
-    productos = [row[0] for row in cursor.fetchall()]
+    if update_metrics['n_new']:
+        logger.info(f"  Holdout MAE (modelo anterior sobre datos nuevos): {update_metrics['holdout_mae']:.1f}")
+    logger.info(f"  Registros acumulados: {update_metrics['n_total']}")
     
-    cursor.close()
-    conn.close()
+    publish_model(predictor)
     
-    # Generar combinaciones para predicción
-    predictions = []
-    base_date = datetime.now()
+    return predictor, predictor.metrics
+
+
+def generate_predictions(predictor, n_months=3, refresh=None):
+    """
+    Genera predicciones para los próximos N meses
     
-    for month_offset in range(1, n_months + 1):
-        fecha_pred = base_date + timedelta(days=30 * month_offset)
+    Args:
+        predictor: DemandPredictor entrenado
+        n_months: Número de meses a predecir
+        refresh: Plan de dirty_series.plan_refresh (None = toda la grilla)
         
-        for hospital in hospitales:
-            for producto in productos:
-                predictions.append({
-                    'hospital': hospital,
-                    'producto_estandarizado': producto,
-                    'fecha_prediccion': fecha_pred
-                })
-    
-    predictions_df = pd.DataFrame(predictions)
-    
-    # Generar predicciones
-    results = predictor.predict_batch(predictions_df)
+    Returns:
+        DataFrame con predicciones
+    """
+    if refresh is None:
+        refresh = plan_refresh(model_key(type(predictor).__name__, predictor.estimator), n_months=n_months, full=True)
+    hospitales, productos, fechas = refresh['hospitales'], refresh['productos'], refresh['fechas']
+    
+    if refresh['series'] is None:
+        logger.info(f"\n🔮 Generando predicciones para los próximos {n_months} meses...")
+        # Grilla completa hospital × producto × fecha en forma cerrada,
+        # con intervalo y confianza por celda
+        results = predictor.forecast_cube(hospitales, productos, fechas, as_frame=True, intervals=True)
+    else:
+        logger.info(f"\n🔮 Recalculando {len(refresh['series'])} series modificadas "
+                    f"({refresh['series_omitidas']} sin cambios)...")
+        series = refresh['series']
+        n_dates = len(fechas)
+        hosp = np.repeat(series['hospital'].to_numpy(dtype=object), n_dates)
+        prod = np.repeat(series['producto'].to_numpy(dtype=object), n_dates)
+        dates = np.tile(pd.DatetimeIndex(fechas).to_numpy(), len(series))
+        values = predictor.forecast_points(hosp, prod, dates)
+        results = pd.DataFrame({
+            'hospital': pd.Categorical(hosp),
+            'producto_estandarizado': pd.Categorical(prod),
+            'fecha_prediccion': dates,
+            **values
+        })
     
     logger.info(f"✅ {len(results)} predicciones generadas")
     
     return results
 
 
-def save_predictions_to_db(predictions_df, confidence_score):
+def _save_prediction_rows(cursor, predictions_df, confidence_score, series):
+    """Reemplaza series en predicciones_demanda (una fila por hospital × producto × mes)"""
+    if series is None:
+        # Limpiar predicciones antiguas
+        cursor.execute("DELETE FROM predicciones_demanda")
+        logger.info("  🗑️ Predicciones antiguas eliminadas")
+    else:
+        cursor.execute("""
+        DELETE FROM predicciones_demanda p
+        USING unnest(%s::text[], %s::text[]) AS s(hospital, producto)
+        JOIN hospitales h ON h.nombre = s.hospital
+        JOIN productos d ON d.codigo = s.producto
+        WHERE p.hospital_id = h.id AND p.producto_id = d.id
+        """, (series['hospital'].tolist(), series['producto'].tolist()))
+        logger.info(f"  🗑️ {cursor.rowcount} predicciones de {len(series)} series reemplazadas")
+    
+    # Ids de las dimensiones resueltos una vez por nombre (el trigger no busca fila a fila)
+    hospitales = predictions_df['hospital'].astype(str)
+    productos = predictions_df['producto_estandarizado'].astype(str)
+    hospital_ids, producto_ids = resolve_ids(cursor, hospitales.unique(), productos.unique())
+    
+    # Insertar nuevas predicciones
+    has_intervals = 'demanda_inferior' in predictions_df.columns
+    n = len(predictions_df)
+    rows = zip(
+        hospitales.tolist(),
+        productos.tolist(),
+        hospitales.map(hospital_ids).tolist(),
+        productos.map(producto_ids).tolist(),
+        pd.to_datetime(predictions_df['fecha_prediccion']).dt.date.tolist(),
+        predictions_df['demanda_estimada'].astype(int).tolist(),
+        predictions_df['demanda_inferior'].astype(int).tolist() if has_intervals else [None] * n,
+        predictions_df['demanda_superior'].astype(int).tolist() if has_intervals else [None] * n,
+        (predictions_df['confidence_score'].astype(float).round(2).tolist() if has_intervals
+         else [round(confidence_score, 2)] * n),
+    )
+    execute_values(cursor, """
+    INSERT INTO predicciones_demanda 
+    (hospital, producto, hospital_id, producto_id, fecha_prediccion,
+     demanda_estimada, demanda_inferior, demanda_superior, confidence_score)
+    VALUES %s
+    """, rows, page_size=1000)
+
+
+def save_predictions_to_db(predictions_df, confidence_score, refresh=None, model_run_id=None):
     """
-    Guarda las predicciones en la tabla predicciones_demanda
+    Guarda las predicciones en predicciones_demanda (o predicciones_series con PREDICTIONS_LAYOUT='series')
+    
+    Con un refresco incremental solo se reemplazan las filas de las series
+    recalculadas. El reemplazo y el registro en ejecuciones_prediccion van en
+    la misma transacción, así las caches de contexto nunca ven una ejecución
+    registrada con datos a medio escribir.
     
     Args:
-        predictions_df: DataFrame con predicciones
-        confidence_score: Score de confianza del modelo (R² * 100)
+        predictions_df: DataFrame con predicciones (con demanda_inferior,
+            demanda_superior y confidence_score por fila si se generaron con intervalos)
+        confidence_score: Confianza global del modelo (R² * 100), usada para filas sin confianza propia
+        refresh: Plan de dirty_series.plan_refresh (None = reemplazar toda la tabla sin registrar)
+        model_run_id: Run del registro de modelos que generó las predicciones
     """
     logger.info("\n💾 Guardando predicciones en la base de datos...")
     
     conn = get_connection()
     cursor = conn.cursor()
+    n = len(predictions_df)
     
-    # Limpiar predicciones antiguas
-    cursor.execute("DELETE FROM predicciones_demanda")
-    logger.info("  🗑️ Predicciones antiguas eliminadas")
-    
-    # Insertar nuevas predicciones
-    query = """
-    INSERT INTO predicciones_demanda 
-    (hospital, producto, fecha_prediccion, demanda_estimada, confidence_score)
-    VALUES (%s, %s, %s, %s, %s)
-    """
-    
-    total_inserted = 0
-    for _, row in predictions_df.iterrows():
-        try:
-            cursor.execute(query, (
-                row['hospital'],
-                row['producto_estandarizado'],
-                row['fecha_prediccion'],
-                int(row['demanda_estimada']),
-                round(confidence_score, 2)
-            ))
-            total_inserted += 1
-        except Exception as e:
-            logger.error(f"  ✗ Error insertando predicción: {e}")
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
-    
-    logger.info(f"✅ {total_inserted} predicciones guardadas en la BD")
+    try:
+        series = refresh['series'] if refresh is not None else None
+        
+        run_id = None
+        if refresh is not None:
+            run_id = record_refresh(cursor, refresh, n, model_run_id=model_run_id)
+            logger.info(f"  📝 Ejecución de predicción {run_id} registrada ({refresh['mode']})")
+        
+        if config.PREDICTIONS_LAYOUT == 'series':
+            written = save_series(cursor, predictions_df, confidence_score, series=series, run_id=run_id)
+            logger.info(f"  📦 {written} series escritas en predicciones_series")
+        else:
+            _save_prediction_rows(cursor, predictions_df, confidence_score, series)
+        
+        # Aviso a los workers de la app: se entrega con el commit
+        publish(cursor, PREDICTION_RUN, id=run_id, model_run_id=model_run_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+    
+    logger.info(f"✅ {n} predicciones guardadas en la BD")
 
 
 def show_sample_predictions(predictions_df, n_samples=10):
@@ -186,8 +406,10 @@ def show_sample_predictions(predictions_df, n_samples=10):
     sample = predictions_df.head(n_samples)
     
     for _, row in sample.iterrows():
+        intervalo = (f" [{row['demanda_inferior']}, {row['demanda_superior']}] ({row['confidence_score']:.0f}%)"
+                     if 'demanda_inferior' in row else "")
         logger.info(f"  {row['hospital'][:30]:30} | {row['producto_estandarizado']:20} | "
-                   f"{row['fecha_prediccion'].strftime('%Y-%m-%d')} | {row['demanda_estimada']:4d} unidades")
+                   f"{row['fecha_prediccion'].strftime('%Y-%m-%d')} | {row['demanda_estimada']:4d} unidades{intervalo}")
     
     logger.info("=" * 100)
     
@@ -198,62 +420,238 @@ def show_sample_predictions(predictions_df, n_samples=10):
     logger.info(f"  Demanda máxima: {predictions_df['demanda_estimada'].max()} unidades")
 
 
-def main():
+def _stage_load(p):
+    """Etapa load: watermarks y datos (o el modelo guardado en modo incremental)"""
+    use_snapshot = p['snapshot'] or p['snapshot_version'] is not None
+    
+    predictor = None
+    if p['incremental'] and use_snapshot:
+        logger.warning("⚠️  El entrenamiento desde el snapshot no es incremental: se ejecuta entrenamiento completo.")
+    elif p['incremental'] and p['model'] == 'series':
+        logger.warning("⚠️  El modelo por serie no es incremental: se ejecuta entrenamiento completo.")
+    elif p['incremental']:
+        predictor = load_latest_model()
+        if predictor is None:
+            logger.warning("⚠️  No hay modelo guardado: se ejecuta entrenamiento completo.")
+        elif getattr(predictor, 'estimator', 'linear') != p['estimator']:
+            logger.warning(f"⚠️  El modelo guardado usa el backend '{predictor.estimator}', no '{p['estimator']}': "
+                           "se ejecuta entrenamiento completo.")
+            predictor = None
+        elif getattr(predictor, 'stats', None) is None or predictor.watermark is None:
+            logger.warning("⚠️  El modelo guardado no tiene estadísticos acumulados: se ejecuta entrenamiento completo.")
+            predictor = None
+    
+    # Watermark de cambios antes de leer datos: lo que llegue durante el run queda para el siguiente
+    if use_snapshot:
+        historical_data, watermark, data_version = load_snapshot_data(
+            version=p['snapshot_version'], sync=p['snapshot']
+        )
+        change_watermark = datetime.fromisoformat(Snapshot().get_version(data_version)['until'])
+    else:
+        change_watermark = get_change_watermark()
+        watermark = get_data_watermark()
+        data_version = None
+        if predictor is not None:
+            return {'predictor': predictor, 'watermark': watermark, 'change_watermark': change_watermark}, 0
+        historical_data = load_historical_data(until=watermark)
+    
+    if len(historical_data) < 50:
+        logger.warning("   Ejecuta: python seed_data.py")
+        raise StopPipeline("Pocos datos históricos. Se recomienda tener al menos 50 registros.")
+    
+    return {
+        'historical_data': historical_data, 'watermark': watermark,
+        'change_watermark': change_watermark, 'data_version': data_version
+    }, len(historical_data)
+
+
+def _stage_train(p):
+    """Etapa train: entrenamiento completo o actualización incremental (publica el modelo)"""
+    if p.get('predictor') is not None:
+        predictor, metrics = update_model(p['predictor'], p['watermark'])
+        n_registros = predictor.stats['n']
+    else:
+        predictor, metrics = train_model(
+            p['historical_data'], watermark=p['watermark'], model_type=p['model'], n_jobs=p['n_jobs'],
+            backtest_folds=p['backtest_folds'], estimator=p['estimator'], estimator_params=p['estimator_params'],
+            data_version=p['data_version']
+        )
+        n_registros = len(p['historical_data'])
+    
+    # Verificar calidad del modelo
+    if metrics['test_r2'] < 0.5:
+        logger.warning(f"⚠️  R² bajo ({metrics['test_r2']:.3f}). El modelo puede no ser muy preciso.")
+        logger.warning("   Considera agregar más datos históricos o ajustar features.")
+    
+    return {'predictor': predictor, 'metrics': metrics, 'n_registros': n_registros}, n_registros
+
+
+def _stage_plan(p):
+    """Etapa plan: series a recalcular (solo necesita la clase y el backend, corre junto a train)"""
+    if p['model'] == 'series':
+        key = model_key('SeriesDemandPredictor')
+    else:
+        key = model_key('DemandPredictor', p['estimator'])
+    refresh = plan_refresh(key, n_months=p['n_months'], full=p['full_predictions'], watermark=p['change_watermark'])
+    return {'refresh': refresh}, refresh['series_recalculadas']
+
+
+def _stage_predict(p):
+    """Etapa predict: predicciones de las series del plan"""
+    predictions = generate_predictions(p['predictor'], n_months=p['n_months'], refresh=p['refresh'])
+    return {'predictions': predictions}, len(predictions)
+
+
+def _stage_sample(p):
+    """Etapa sample: muestra y estadísticas en el log (corre junto a save)"""
+    show_sample_predictions(p['predictions'])
+    return {}, min(10, len(p['predictions']))
+
+
+def _stage_save(p):
+    """Etapa save: reemplaza las series recalculadas en predicciones_demanda"""
+    # Confianza global = R² fuera de muestra (backtesting si está disponible) en
+    # porcentaje; cada fila guarda además su propia confianza según su intervalo
+    metrics = p['metrics']
+    confidence = max(0, min(100, metrics.get('backtest_r2', metrics['test_r2']) * 100))
+    save_predictions_to_db(p['predictions'], confidence, refresh=p['refresh'], model_run_id=p['predictor'].run_id)
+    return {'confidence': confidence}, len(p['predictions'])
+
+
+def build_training_pipeline(root=None):
+    """
+    Pipeline de entrenamiento por etapas (ver pipeline.py)
+    
+        load ─┬─ train ──┬─ predict ─┬─ sample
+              └─ plan ───┘           └─ save
+    
+    plan (consultas de la grilla y series modificadas) corre en paralelo con
+    train, y sample en paralelo con save.
+    """
+    return Pipeline('train', [
+        Stage('load', _stage_load),
+        Stage('train', _stage_train, deps=['load']),
+        Stage('plan', _stage_plan, deps=['load']),
+        Stage('predict', _stage_predict, deps=['train', 'plan']),
+        Stage('sample', _stage_sample, deps=['predict'], persist=False),
+        Stage('save', _stage_save, deps=['predict']),
+    ], root=root)
+
+
+def build_parser():
+    """Argumentos de línea de comandos del entrenamiento (también los usa scheduler.py)"""
+    parser = argparse.ArgumentParser(description="Entrena el modelo de demanda y genera predicciones")
+    parser.add_argument('--incremental', action='store_true',
+                        help='Actualiza el modelo guardado solo con las órdenes nuevas desde su watermark')
+    parser.add_argument('--model', choices=['global', 'series'], default='global',
+                        help='global: regresión lineal única; series: una regresión por hospital × producto')
+    parser.add_argument('--estimator', choices=list(ESTIMATORS), default='linear',
+                        help='Backend del modelo global: linear (exacto, incremental), ridge (L2) o hgb (gradient boosting multihilo)')
+    parser.add_argument('--estimator-param', action='append', metavar='CLAVE=VALOR',
+                        help='Parámetro del backend, repetible (ej. alpha=10, max_iter=500, n_threads=8)')
+    parser.add_argument('--n-jobs', type=int, default=-1,
+                        help='Procesos para el modelo por serie y el backtesting (-1 = todos los cores)')
+    parser.add_argument('--backtest-folds', type=int, default=6,
+                        help='Folds de backtesting de origen móvil para la confianza (0 = usar el split de train())')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='Sincroniza el snapshot local y entrena desde él (ver snapshot.py)')
+    parser.add_argument('--snapshot-version', metavar='VERSION',
+                        help='Entrena desde una versión registrada del snapshot, sin leer datos de la BD')
+    parser.add_argument('--full-predictions', action='store_true',
+                        help='Recalcula toda la grilla de predicciones aunque solo algunas series hayan cambiado')
+    parser.add_argument('--resume', nargs='?', const='latest', metavar='RUN_ID',
+                        help='Retoma un run fallido desde su última etapa completa (default: el último)')
+    return parser
+
+
+def run_training(args):
     """
     Flujo principal de entrenamiento y generación de predicciones
+    
+    Quien llama debe tener el lock FORECAST_LOCK_KEY (ver main).
+    
+    Args:
+        args: Namespace de build_parser()
+    
+    Returns:
+        Código de salida (0 = completado o detenido sin error)
     """
     print("\n" + "=" * 80)
     print("  ENTRENAMIENTO DE MODELO PREDICTIVO - AGENTE CAPSTONE")
     print("=" * 80 + "\n")
     
+    pipeline = build_training_pipeline()
     try:
-        # 1. Cargar datos históricos
-        historical_data = load_historical_data()
-        
-        if len(historical_data) < 50:
-            logger.warning("⚠️  Pocos datos históricos. Se recomienda tener al menos 50 registros.")
-            logger.warning("   Ejecuta: python seed_data.py")
-            return
-        
-        # 2. Entrenar modelo
-        predictor, metrics = train_model(historical_data)
-        
-        # Verificar calidad del modelo
-        if metrics['test_r2'] < 0.5:
-            logger.warning(f"⚠️  R² bajo ({metrics['test_r2']:.3f}). El modelo puede no ser muy preciso.")
-            logger.warning("   Considera agregar más datos históricos o ajustar features.")
-        
-        # 3. Generar predicciones para próximos 3 meses
-        predictions = generate_predictions(predictor, n_months=3)
-        
-        # 4. Mostrar muestras
-        show_sample_predictions(predictions)
-        
-        # 5. Guardar predicciones en BD
-        # Usar R² del test como confianza (convertir a porcentaje)
-        confidence = max(0, min(100, metrics['test_r2'] * 100))
-        save_predictions_to_db(predictions, confidence)
-        
-        print("\n" + "=" * 80)
-        print("✅ PROCESO COMPLETADO EXITOSAMENTE")
-        print("=" * 80)
-        print(f"\n📊 Resumen:")
-        print(f"   • Modelo entrenado con {len(historical_data)} registros")
-        print(f"   • R² (Test): {metrics['test_r2']:.3f}")
-        print(f"   • MAE (Test): {metrics['test_mae']:.1f} unidades")
-        print(f"   • {len(predictions)} predicciones generadas y guardadas")
-        print(f"   • Confianza promedio: {confidence:.1f}%")
-        print(f"\n🚀 El agente ya puede consultar las predicciones del modelo real")
-        print(f"   Inicia la app: python app.py\n")
-        
+        if args.resume:
+            # Se reutilizan los parámetros guardados del run original
+            state, outputs = pipeline.resume(None if args.resume == 'latest' else args.resume)
+        else:
+            state, outputs = pipeline.run(params={
+                'incremental': args.incremental, 'model': args.model, 'estimator': args.estimator,
+                'estimator_params': parse_estimator_params(args.estimator_param), 'n_jobs': args.n_jobs,
+                'backtest_folds': args.backtest_folds, 'snapshot': args.snapshot,
+                'snapshot_version': args.snapshot_version, 'full_predictions': args.full_predictions,
+                'n_months': 3,
+            })
     except Exception as e:
         logger.error(f"\n❌ Error en el proceso: {e}")
         import traceback
         traceback.print_exc()
         return 1
     
+    if state['status'] == 'stopped':
+        return 0
+    if state['status'] != 'completed':
+        logger.error(f"\n❌ Error en el proceso: {state.get('error')}")
+        logger.error(f"   Retoma desde la última etapa completa: python train_model.py --resume {state['run_id']}")
+        return 1
+    
+    predictor, metrics = outputs['predictor'], outputs['metrics']
+    predictions, refresh, confidence = outputs['predictions'], outputs['refresh'], outputs['confidence']
+    
+    print("\n" + "=" * 80)
+    print("✅ PROCESO COMPLETADO EXITOSAMENTE")
+    print("=" * 80)
+    print(f"\n📊 Resumen:")
+    print(f"   • Modelo entrenado con {outputs['n_registros']} registros")
+    print(f"   • R² (Test): {metrics['test_r2']:.3f}")
+    print(f"   • MAE (Test): {metrics['test_mae']:.1f} unidades")
+    if 'backtest_mae' in metrics:
+        print(f"   • Backtesting: MAE {metrics['backtest_mae']:.1f}, RMSE {metrics['backtest_rmse']:.1f}, "
+              f"MAPE {metrics['backtest_mape']:.1f}%")
+    print(f"   • {len(predictions)} predicciones generadas y guardadas "
+          f"({refresh['mode']}: {refresh['series_recalculadas']} series recalculadas, "
+          f"{refresh['series_omitidas']} omitidas)")
+    if 'confidence_score' in predictions.columns:
+        print(f"   • Confianza promedio: {predictions['confidence_score'].mean():.1f}% "
+              f"(intervalos al {predictor.interval_level:.0%}; R² fuera de muestra {confidence:.1f}%)")
+    else:
+        print(f"   • Confianza promedio: {confidence:.1f}%")
+    print(f"   • Watermark de datos: {predictor.watermark}")
+    if predictor.data_version:
+        print(f"   • Versión del snapshot: {predictor.data_version}")
+    print(f"   • Run del registro: {predictor.run_id}")
+    print(f"   • Etapas ({state['wall_s']:.1f}s en total, reporte en "
+          f"{os.path.join(pipeline.run_dir(state['run_id']), REPORT_FILE)}):")
+    for name, stage in state['stages'].items():
+        print(f"       {name:<8} {stage.get('wall_s', 0):>8.2f}s {stage.get('rows', 0):>12,} filas "
+              f"{stage.get('peak_rss_mb', 0):>8.0f} MB{'  (retomada)' if stage.get('resumed') else ''}")
+    print(f"\n🚀 El agente ya puede consultar las predicciones del modelo real")
+    print(f"   Inicia la app: python app.py\n")
+    
     return 0
 
 
+def main(argv=None):
+    """Entrenamiento manual: toma el lock de forecast para no correr junto a otro proceso"""
+    args = build_parser().parse_args(argv)
+    with advisory_lock(config.FORECAST_LOCK_KEY) as locked:
+        if not locked:
+            logger.error("❌ Otro proceso está entrenando o guardando predicciones (advisory lock "
+                         f"{config.FORECAST_LOCK_KEY}). Reintenta cuando termine.")
+            return 1
+        return run_training(args)
+
+
 if __name__ == "__main__":
     exit(main())